@@ -0,0 +1,23 @@
+// Dashboard buttons; translated strings and URLs come from data- attributes
+var deleteBtn = document.querySelector('.delete-btn');
+if (deleteBtn) {
+    deleteBtn.addEventListener('click', async function () {
+        if (confirm(deleteBtn.dataset.confirm)) {
+            await fetch(deleteBtn.dataset.url, { method: 'DELETE' });
+            location.reload();
+        }
+    });
+}
+
+var copyBtn = document.querySelector('.copy-btn');
+copyBtn.addEventListener('click', function () {
+    var linkText = document.getElementById('dashboardUrl').innerText;
+    navigator.clipboard.writeText(linkText).then(function () {
+        copyBtn.innerText = copyBtn.dataset.copied;
+        copyBtn.style.background = '#22c55e';
+        setTimeout(function () {
+            copyBtn.innerText = copyBtn.dataset.label;
+            copyBtn.style.background = '';
+        }, 2000);
+    });
+});
@@ -0,0 +1,10 @@
+// Long lists render their first page; the button fetches the next page's
+// rows (plus the next button) and swaps itself out for them.
+document.addEventListener('click', function (e) {
+    var button = e.target.closest('.load-more');
+    if (!button) return;
+    button.disabled = true;
+    fetch(button.dataset.url).then(function (r) { return r.text(); }).then(function (html) {
+        button.outerHTML = html;
+    }).catch(function () { button.disabled = false; });
+});
@@ -0,0 +1,176 @@
+// Workout page: route map, elevation chart and the share/delete buttons.
+// Data comes from the page's JSON script blocks and data- attributes.
+// Buttons are wired first so they work even if a map library failed to load.
+const copyBtn = document.getElementById('copyLinkBtn');
+copyBtn.addEventListener('click', function() {
+    const url = window.location.href;
+    navigator.clipboard.writeText(url).then(() => {
+        const text = document.getElementById('copyLinkText');
+        copyBtn.classList.add('copied');
+        text.textContent = copyBtn.dataset.copied;
+        setTimeout(() => {
+            copyBtn.classList.remove('copied');
+            text.textContent = copyBtn.dataset.label;
+        }, 2000);
+    });
+});
+
+const deleteBtn = document.querySelector('.delete-btn');
+deleteBtn.addEventListener('click', async function() {
+    if (confirm(deleteBtn.dataset.confirm)) {
+        try {
+            const response = await fetch(deleteBtn.dataset.url, { method: 'DELETE' });
+            if (response.ok) {
+                window.location.href = deleteBtn.dataset.redirect;
+            }
+        } catch (e) {
+            console.error(e);
+        }
+    }
+});
+
+// Initialize Leaflet map if route data exists
+const routeData = JSON.parse(document.getElementById('route-data').textContent);
+if (routeData.length > 0) {
+    const map = L.map('map', {
+        zoomControl: true,
+        attributionControl: false
+    });
+
+    // Define tile layers
+    const standardLayer = L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
+        maxZoom: 19
+    });
+
+    const satelliteLayer = L.tileLayer('https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}', {
+        maxZoom: 19
+    });
+
+    const terrainOverlay = L.tileLayer('https://{s}.tile.opentopomap.org/{z}/{x}/{y}.png', {
+        maxZoom: 17,
+        opacity: 0.6
+    });
+
+    // Add default layer
+    standardLayer.addTo(map);
+    let currentBaseLayer = standardLayer;
+    let is3DActive = false;
+
+    // Create polyline from route
+    const polyline = L.polyline(routeData, {
+        color: '#ff3333',
+        weight: 4,
+        opacity: 0.9,
+        lineCap: 'round',
+        lineJoin: 'round'
+    }).addTo(map);
+
+    // Add start marker (green)
+    const startIcon = L.divIcon({
+        html: '<div style="background:#22c55e;width:16px;height:16px;border-radius:50%;border:3px solid white;box-shadow:0 2px 6px rgba(0,0,0,0.4);"></div>',
+        className: '',
+        iconSize: [16, 16],
+        iconAnchor: [8, 8]
+    });
+    L.marker(routeData[0], {icon: startIcon}).addTo(map);
+
+    // Add end marker (red)
+    const endIcon = L.divIcon({
+        html: '<div style="background:#ef4444;width:16px;height:16px;border-radius:50%;border:3px solid white;box-shadow:0 2px 6px rgba(0,0,0,0.4);"></div>',
+        className: '',
+        iconSize: [16, 16],
+        iconAnchor: [8, 8]
+    });
+    L.marker(routeData[routeData.length - 1], {icon: endIcon}).addTo(map);
+
+    // Fit map to route bounds with padding
+    map.fitBounds(polyline.getBounds(), {
+        padding: [30, 30]
+    });
+
+    // Base layer switching (Map / Satellite)
+    const baseLayers = {
+        'standard': standardLayer,
+        'satellite': satelliteLayer
+    };
+
+    document.querySelectorAll('.map-btn[data-layer]').forEach(btn => {
+        btn.addEventListener('click', function() {
+            const layerName = this.dataset.layer;
+            const newLayer = baseLayers[layerName];
+
+            if (newLayer && newLayer !== currentBaseLayer) {
+                map.removeLayer(currentBaseLayer);
+                newLayer.addTo(map);
+                currentBaseLayer = newLayer;
+
+                // Re-add terrain overlay if 3D is active
+                if (is3DActive) {
+                    terrainOverlay.addTo(map);
+                }
+
+                // Update active button
+                document.querySelectorAll('.map-btn[data-layer]').forEach(b => b.classList.remove('active'));
+                this.classList.add('active');
+            }
+        });
+    });
+
+    // 3D toggle button
+    document.querySelector('.map-btn[data-toggle="terrain"]').addEventListener('click', function() {
+        if (is3DActive) {
+            map.removeLayer(terrainOverlay);
+            this.classList.remove('active');
+        } else {
+            terrainOverlay.addTo(map);
+            this.classList.add('active');
+        }
+        is3DActive = !is3DActive;
+    });
+}
+
+// Elevation Chart (v4.7.0)
+const elevationEl = document.getElementById('elevation-data');
+const elevationData = elevationEl ? JSON.parse(elevationEl.textContent) : [];
+if (elevationData.length > 0) {
+    const ctx = document.getElementById('elevationChart');
+    if (ctx) {
+        new Chart(ctx, {
+            type: 'line',
+            data: {
+                labels: elevationData.map((_, i) => ''),
+                datasets: [{
+                    label: 'Elevation (m)',
+                    data: elevationData,
+                    fill: true,
+                    backgroundColor: 'rgba(0, 212, 255, 0.2)',
+                    borderColor: '#00d4ff',
+                    borderWidth: 2,
+                    pointRadius: 0,
+                    tension: 0.4
+                }]
+            },
+            options: {
+                responsive: true,
+                maintainAspectRatio: false,
+                plugins: {
+                    legend: { display: false }
+                },
+                scales: {
+                    x: {
+                        display: false
+                    },
+                    y: {
+                        ticks: {
+                            color: '#888',
+                            callback: function(value) { return value + 'm'; }
+                        },
+                        grid: {
+                            color: 'rgba(255,255,255,0.1)'
+                        }
+                    }
+                }
+            }
+        });
+    }
+}
@@ -0,0 +1,187 @@
+"""Checkpointed backfills over the whole workouts collection.
+
+A backfill walks the workouts of its job's selection (see
+repositories.py) in `_id` order with WorkoutRepository.scan(), batch_size
+documents at a time, and hands each batch to a job. Up to `concurrency`
+batches run at once; the checkpoint (last `_id`, counters) is persisted in the
+`backfill_jobs` collection only once every batch up to it has finished,
+so a crashed or stopped run resumes without skipping anything. Batches
+after the checkpoint may run twice, so jobs must be idempotent.
+
+A job may keep per-run state (e.g. the users it has already handled) in
+the checkpoint's `state` dict, which it gets with every batch. The
+checkpoint is saved while later batches are still in flight, so a job
+records work in `state` only once that work is done. A fresh run (first,
+restarted, dry or after completion) starts with empty state; a resumed
+run gets the state saved with its checkpoint.
+
+`rate` caps documents per second across the run.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+STATUS_RUNNING = "running"
+STATUS_STOPPED = "stopped"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+
+
+@dataclass
+class BackfillJob:
+    name: str
+    # process(batch, dry_run, state) -> number of workouts changed
+    process: Callable[[list, bool, dict], Awaitable[int]]
+    description: str = ""
+    selection: Optional[str] = None  # repositories.INLINE_TRACKS etc.; None: every workout
+    fields: Optional[tuple] = None  # fields the job reads; None: all of them
+
+
+class BackfillRunner:
+    def __init__(self, db, workouts, jobs, collection: str = "backfill_jobs"):
+        self.db = db
+        self.workouts = workouts
+        self.jobs = {job.name: job for job in jobs}
+        self.collection = collection
+        self._tasks = {}
+        self._stop = set()
+        self._progress = {}
+
+    def running(self, name: str) -> bool:
+        task = self._tasks.get(name)
+        return task is not None and not task.done()
+
+    def start(self, name: str, **options) -> asyncio.Task:
+        """Run a job in the background (e.g. from the admin endpoint)"""
+        if self.running(name):
+            raise RuntimeError(f"Backfill {name} is already running")
+        self._tasks[name] = asyncio.create_task(self.run(name, **options), name=f"backfill-{name}")
+        return self._tasks[name]
+
+    def stop(self, name: str) -> bool:
+        """Ask a running job to stop after its in-flight batches; it resumes from the checkpoint"""
+        if not self.running(name):
+            return False
+        self._stop.add(name)
+        return True
+
+    async def shutdown(self):
+        """Stop every running job at its next batch boundary and wait for the checkpoints"""
+        tasks = [task for name, task in self._tasks.items() if self.stop(name)]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def run(self, name: str, batch_size: int = 500, concurrency: int = 2,
+                  rate: Optional[float] = None, dry_run: bool = False, restart: bool = False) -> dict:
+        """Run a job to completion (or until stopped); returns the final checkpoint"""
+        job = self.jobs[name]
+        checkpoints = self.db[self.collection]
+        checkpoint = None if restart or dry_run else await checkpoints.find_one({"_id": name})
+        if checkpoint is None or checkpoint.get("status") == STATUS_COMPLETED:
+            checkpoint = {"_id": name, "last_id": None, "scanned": 0, "updated": 0, "state": {}}
+        checkpoint.setdefault("state", {})
+        checkpoint.update({
+            "status": STATUS_RUNNING,
+            "dry_run": dry_run,
+            "started_at": datetime.now(timezone.utc),
+            "error": None,
+        })
+        remaining = await self.workouts.count(job.selection, after=checkpoint["last_id"])
+        progress = self._progress[name] = {
+            "run_started": time.time(),
+            "run_scanned": 0,
+            "total": checkpoint["scanned"] + remaining,
+        }
+        await self._save(checkpoint, dry_run)
+        logger.info(f"Backfill {name}: starting after {checkpoint['last_id']}, about {remaining} workouts to go"
+                    f"{' (dry run)' if dry_run else ''}")
+
+        in_flight = []  # (task, batch last _id, batch size), oldest first
+
+        async def settle_oldest():
+            task, last_id, size = in_flight.pop(0)
+            checkpoint["updated"] += await task
+            checkpoint["scanned"] += size
+            checkpoint["last_id"] = last_id
+            progress["run_scanned"] += size
+            await self._save(checkpoint, dry_run)
+
+        try:
+            last_id = checkpoint["last_id"]
+            while name not in self._stop:
+                batch = await self.workouts.scan(job.selection, after=last_id, limit=batch_size, fields=job.fields)
+                if not batch:
+                    break
+                last_id = batch[-1]["_id"]
+                process = job.process(batch, dry_run, checkpoint["state"])
+                in_flight.append((asyncio.create_task(process), last_id, len(batch)))
+                if len(in_flight) >= concurrency:
+                    await settle_oldest()
+                await self._throttle(name, rate, sum(size for _, _, size in in_flight))
+            while in_flight:
+                await settle_oldest()
+            checkpoint["status"] = STATUS_STOPPED if name in self._stop else STATUS_COMPLETED
+        except Exception as e:
+            # Checkpoint stays at the last fully finished batch
+            for task, _, _ in in_flight:
+                task.cancel()
+            checkpoint["status"] = STATUS_FAILED
+            checkpoint["error"] = str(e)
+            logger.exception(f"Backfill {name} failed after {checkpoint['last_id']}")
+        finally:
+            self._stop.discard(name)
+            checkpoint["finished_at"] = datetime.now(timezone.utc)
+            await self._save(checkpoint, dry_run)
+        logger.info(f"Backfill {name} {checkpoint['status']}: {checkpoint['scanned']} scanned, "
+                    f"{checkpoint['updated']} {'would change' if dry_run else 'changed'}")
+        return self._report(checkpoint)
+
+    async def _throttle(self, name: str, rate: Optional[float], pending: int):
+        """Sleep until this run's pace (settled plus in-flight) is back under rate docs/s"""
+        if not rate:
+            return
+        progress = self._progress[name]
+        ahead = (progress["run_scanned"] + pending) / rate - (time.time() - progress["run_started"])
+        if ahead > 0:
+            await asyncio.sleep(ahead)
+
+    async def _save(self, checkpoint: dict, dry_run: bool):
+        checkpoint["updated_at"] = datetime.now(timezone.utc)
+        self._progress[checkpoint["_id"]]["checkpoint"] = dict(checkpoint)
+        if not dry_run:  # a dry run never moves the real checkpoint
+            await self.db[self.collection].replace_one({"_id": checkpoint["_id"]}, checkpoint, upsert=True)
+
+    def _report(self, checkpoint: dict) -> dict:
+        """Checkpoint (without the job's state) plus throughput and ETA for the current run"""
+        name = checkpoint["_id"]
+        report = {key: value for key, value in checkpoint.items() if key not in ("_id", "state")}
+        report["job"] = name
+        report["last_id"] = str(checkpoint["last_id"]) if checkpoint.get("last_id") is not None else None
+        progress = self._progress.get(name)
+        if progress:
+            elapsed = time.time() - progress["run_started"]
+            per_sec = progress["run_scanned"] / elapsed if elapsed > 0 else 0.0
+            left = max(0, progress["total"] - checkpoint["scanned"])
+            report.update({
+                "total": progress["total"],
+                "docs_per_sec": round(per_sec, 1),
+                "eta_sec": round(left / per_sec) if per_sec and checkpoint.get("status") == STATUS_RUNNING else None,
+            })
+        return report
+
+    async def status(self) -> list:
+        """Report for every known job: live progress if running, else the saved checkpoint"""
+        saved = {c["_id"]: c for c in await self.db[self.collection].find({}).to_list(None)}
+        reports = []
+        for name, job in self.jobs.items():
+            live = self._progress.get(name, {}).get("checkpoint") if self.running(name) else None
+            checkpoint = live or saved.get(name) or {"_id": name, "status": None, "scanned": 0, "updated": 0}
+            report = self._report(checkpoint)
+            report["description"] = job.description
+            report["running"] = self.running(name)
+            reports.append(report)
+        return reports
@@ -0,0 +1,87 @@
+"""Microbenchmark for the HTML pages: render time per page, per language.
+
+Seeds an in-memory store (STORAGE_BACKEND=memory, nothing touches Mongo)
+with one user's workouts and times each page handler, so run it before
+and after a change to the page templates to compare. Each page is timed
+rendering every time (page cache off) and served from the page cache.
+
+Usage (from backend/):
+    python bench_pages.py [--workouts 300] [--points 500] [--repeat 200]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+
+os.environ["STORAGE_BACKEND"] = "memory"
+
+import server  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+
+USER_ID = "bench"
+# No Accept-Encoding: times the render alone, not compression
+PLAIN = Request({"type": "http", "headers": []})
+
+
+async def seed(workouts: int, points: int) -> str:
+    route = [{"lat": 32.0 + i * 1e-4, "lon": 34.8 + (i % 50) * 1e-5, "timestamp": 1700000000 + i * 5, "alt": 10 + i % 9}
+             for i in range(points)]
+    route_json = json.dumps(route)
+    workout_id = None
+    for i in range(workouts):
+        day = i % 700
+        result = await server.submit_workout(server.WorkoutSubmit(
+            user_id=USER_ID, user_name="Bench Runner", distance_cm=500000 + i * 100, duration_sec=1800 + i,
+            avg_hr=140, min_hr=95, max_hr=175, steps=6000, cadence=170, lang=0,
+            local_time=f"{2025 + day // 350}-{1 + day % 350 // 30:02d}-{1 + day % 28:02d}T07:30:00",
+            route_json=route_json, elevation_json=json.dumps([10 + i % 9 for i in range(100)]),
+        ))
+        workout_id = result["workout_id"]
+    return workout_id
+
+
+async def bench(name: str, render, repeat: int, rounds: int = 5):
+    """Best of `rounds` runs of `repeat` renders, like timeit, to keep noise out"""
+    await render()  # warm up
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            await render()
+        best = min(best, time.perf_counter() - started)
+    print(f"{name:<24} {best / repeat * 1000:8.3f} ms/page")
+
+
+async def main(args):
+    logging.disable(logging.WARNING)
+    workout_id = await seed(args.workouts, args.points)
+    workout = await server.load_track(await server.repo.workouts.get(workout_id))
+
+    async def workout_html(lang):
+        return server.generate_workout_html(workout, USER_ID, lang)
+
+    max_bytes = server.page_cache.max_bytes
+    for label, cache_bytes in (("render", 0), ("cached", max_bytes)):
+        server.page_cache.clear()
+        server.page_cache.max_bytes = cache_bytes
+        for lang in (0, 1):
+            print(f"{label}, lang={lang}")
+            await bench("welcome", lambda: server.welcome_page(lang), args.repeat)
+            await bench("dashboard", lambda: server.dashboard_page(PLAIN, USER_ID, None, lang), args.repeat)
+            await bench("year", lambda: server.year_page(PLAIN, USER_ID, "2025", lang), args.repeat)
+            await bench("month", lambda: server.month_page_view(PLAIN, USER_ID, "2025", "03", lang), args.repeat)
+            if label == "render":
+                await bench("workout (render only)", lambda: workout_html(lang), args.repeat)
+        print(f"{label}, he only")
+        await bench("monthly", lambda: server.monthly_page(PLAIN, USER_ID), args.repeat)
+    server.db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the HTML page handlers on an in-memory store")
+    parser.add_argument("--workouts", type=int, default=300)
+    parser.add_argument("--points", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,34 @@
+"""Build the content-hashed static files (see static_assets.py).
+
+The server also builds on startup, so this is for deploys: fetch the vendor
+files pinned in static_assets.VENDOR if they're missing, then build. A failed
+download, or a vendor file that is unpinned, missing or doesn't match its
+pinned sha256, fails the build (exit status 1).
+
+Usage (from backend/):
+    python build_assets.py [--fetch-vendor] [--force]
+"""
+import argparse
+import logging
+
+from static_assets import StaticAssets
+
+
+def main(args):
+    assets = StaticAssets.from_env()
+    if args.fetch_vendor:
+        for path in assets.fetch_vendor(force=args.force):
+            print(f"fetched {path}")
+    for path, name in assets.build().items():
+        print(f"{path:<40} {name}")
+    problems = assets.check_vendor()
+    if problems:
+        raise SystemExit("Vendor files not ready, pages would load them from the CDN:\n  " + "\n  ".join(problems))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build the content-hashed static files")
+    parser.add_argument("--fetch-vendor", action="store_true", help="download missing vendor files first")
+    parser.add_argument("--force", action="store_true", help="with --fetch-vendor, download every vendor file again")
+    main(parser.parse_args())
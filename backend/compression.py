@@ -0,0 +1,159 @@
+"""Negotiated gzip / Brotli compression of responses.
+
+CompressionMiddleware compresses text, JSON and script responses of at
+least COMPRESSION_MIN_BYTES with the best encoding the client's
+Accept-Encoding allows (br over gzip). Responses that already carry a
+Content-Encoding - pre-compressed static files, cached workout pages -
+pass through untouched, so work done once isn't redone per request.
+Compressible responses get Vary: Accept-Encoding, and a strong ETag on a
+compressed body is made weak, as the bytes differ per encoding.
+
+Bodies are buffered before compressing, which is fine for this app's
+pages and JSON; binary downloads (images, zips) stream through as they are.
+
+COMPRESSION_MIN_BYTES: smaller bodies are sent uncompressed (default 1024)
+COMPRESSION_GZIP_LEVEL: gzip level for responses (default 6)
+COMPRESSION_BROTLI_QUALITY: Brotli quality for responses (default 5;
+    static files are pre-compressed at the maximum, see static_assets.py)
+"""
+import gzip
+import os
+
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "image/svg+xml")
+SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def negotiate(accept_encoding: str):
+    """Best encoding allowed by an Accept-Encoding header: "br", "gzip" or None"""
+    allowed = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        allowed[name.strip()] = q
+    wildcard = allowed.get("*", 0.0)
+    best, best_q = None, 0.0
+    for encoding in ("br", "gzip"):
+        q = allowed.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compressible(content_type: str) -> bool:
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def compress(body: bytes, encoding: str, gzip_level: int = 6, brotli_quality: int = 5) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=brotli_quality)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=gzip_level, mtime=0)
+    raise ValueError(f"Unknown encoding: {encoding}")
+
+
+class Compressor:
+    def __init__(self, min_bytes: int = 1024, gzip_level: int = 6, brotli_quality: int = 5):
+        self.min_bytes = min_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.compressed = {"br": 0, "gzip": 0}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.too_small = 0
+
+    @classmethod
+    def from_env(cls) -> "Compressor":
+        return cls(
+            min_bytes=int(os.environ.get('COMPRESSION_MIN_BYTES', '1024')),
+            gzip_level=int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6')),
+            brotli_quality=int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '5')),
+        )
+
+    def encoding_for(self, accept_encoding: str, size: int):
+        """Encoding to send a body of `size` bytes in, None to send it as it is"""
+        if size < self.min_bytes:
+            return None
+        return negotiate(accept_encoding)
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        compressed = compress(body, encoding, self.gzip_level, self.brotli_quality)
+        self.compressed[encoding] += 1
+        self.bytes_in += len(body)
+        self.bytes_out += len(compressed)
+        return compressed
+
+    def stats(self) -> dict:
+        return {
+            "min_bytes": self.min_bytes,
+            "compressed": dict(self.compressed),
+            "too_small": self.too_small,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": round(self.bytes_out / self.bytes_in, 3) if self.bytes_in else None,
+        }
+
+
+def weak_etag(headers: MutableHeaders):
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        headers["etag"] = f"W/{etag}"
+
+
+class CompressionMiddleware:
+    def __init__(self, app, compressor: Compressor):
+        self.app = app
+        self.compressor = compressor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        start = None
+        chunks = []
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                if not compressible(headers.get("content-type", "")):
+                    start = False
+                    await send(message)
+                    return
+                headers.add_vary_header("Accept-Encoding")
+                if "content-encoding" in headers or not negotiate(accept_encoding):
+                    if "content-encoding" in headers:
+                        weak_etag(headers)
+                    start = False
+                    await send(message)
+                    return
+                start = message
+                return
+            if start is False:
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            body = b"".join(chunks)
+            headers = MutableHeaders(raw=start["headers"])
+            encoding = self.compressor.encoding_for(accept_encoding, len(body))
+            if encoding is None:
+                self.compressor.too_small += 1
+            else:
+                body = self.compressor.compress(body, encoding)
+                headers["content-encoding"] = encoding
+                headers["content-length"] = str(len(body))
+                weak_etag(headers)
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
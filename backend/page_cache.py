@@ -0,0 +1,89 @@
+"""LRU cache of rendered pages.
+
+Entries are keyed by (page id, lang, version, content encoding) and hold
+the page as sent: compressed once when it is cached, then served as it is
+to every client asking for that encoding. Workout pages use the workout id
+and its document `version`; the dashboard, year, month and monthly pages
+use their path and the user's data version. Writes that change what a page
+shows bump its version, so a stale entry is never looked up again;
+invalidate() just frees its memory early. The cache is bounded by total
+bytes, evicting least recently used entries first.
+
+PAGE_CACHE_MAX_BYTES: memory budget (0 disables the cache)
+"""
+import os
+from collections import OrderedDict
+
+
+class PageCache:
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> bytes, least recently used first
+        self._keys_by_page = {}  # page id -> set of keys
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls) -> "PageCache":
+        return cls(max_bytes=int(os.environ.get('PAGE_CACHE_MAX_BYTES', str(32 * 1024 * 1024))))
+
+    def get(self, page_id: str, lang: int, version: int, encoding: str = None):
+        key = (page_id, lang, version, encoding)
+        page = self._entries.get(key)
+        if page is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return page
+
+    def put(self, page_id: str, lang: int, version: int, page: bytes, encoding: str = None):
+        if len(page) > self.max_bytes:
+            return
+        key = (page_id, lang, version, encoding)
+        self._discard(key)
+        self._entries[key] = page
+        self._keys_by_page.setdefault(page_id, set()).add(key)
+        self.bytes += len(page)
+        while self.bytes > self.max_bytes:
+            self._discard(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, page_ids):
+        """Drop every cached copy (all langs, versions and encodings) of these pages"""
+        for page_id in page_ids:
+            for key in list(self._keys_by_page.get(page_id, ())):
+                self._discard(key)
+                self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_page.clear()
+        self.bytes = 0
+
+    def _discard(self, key):
+        page = self._entries.pop(key, None)
+        if page is None:
+            return
+        self.bytes -= len(page)
+        keys = self._keys_by_page.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_page[key[0]]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
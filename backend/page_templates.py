@@ -0,0 +1,86 @@
+"""Jinja2 templates for the HTML pages, compiled once at startup.
+
+Templates live in backend/templates: base.html is the document shell,
+card.html / empty.html / period.html are shared layouts, partials/ holds
+single rows, folder links and the load-more button used by several pages.
+Every template is compiled when PageTemplates is built and kept for the
+life of the process (no reload checks), so a request only runs the
+compiled code.
+
+Parts that depend on nothing but the language (the welcome page, the
+dashboard's app description) are rendered once per language with
+prerender() and served from memory by static().
+
+The dashboard, year, month and monthly pages and their rows go one step
+further: everything but the data is fixed per language, so fragment()
+renders a template once per language into a str.format() string, with
+{{ slot("name") }} left as a {name} field, and fill() only formats that.
+A page then costs what an f-string does, however much template logic
+(inheritance, loops over labels, translations) went into it. Slot values
+are inserted as given: callers escape user text with markupsafe.escape.
+Conditions on the data are template variables passed to fragment(), so
+each combination is compiled once (they must be hashable).
+"""
+import re
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
+from markupsafe import Markup
+
+TEMPLATE_DIR = Path(__file__).parent / "templates"
+SLOT_RE = re.compile("\x00([a-z_0-9]+)\x00")
+LANG_CODES = ("en", "he", "es", "fr", "de", "zh")
+
+
+def html_lang(lang: int) -> str:
+    return LANG_CODES[lang] if lang < len(LANG_CODES) else "en"
+
+
+def slot(name: str) -> Markup:
+    """Marks where fill() inserts a value; see fragment()"""
+    return Markup(f"\x00{name}\x00")
+
+
+class PageTemplates:
+    def __init__(self, template_dir: Path = TEMPLATE_DIR, globals: dict = None):
+        self.env = Environment(
+            loader=FileSystemLoader(str(template_dir)),
+            autoescape=select_autoescape(["html"]),
+            auto_reload=False,
+            cache_size=-1,
+            trim_blocks=True,
+            lstrip_blocks=True,
+            undefined=StrictUndefined,
+        )
+        self.env.policies["json.dumps_kwargs"] = {"ensure_ascii": False}
+        self.env.filters["html_lang"] = html_lang
+        self.env.globals["slot"] = slot
+        self.env.globals.update(globals or {})
+        self._templates = {name: self.env.get_template(name) for name in self.env.list_templates(extensions=["html"])}
+        self._static = {}
+        self._fragments = {}
+
+    def render(self, name: str, **context) -> str:
+        return self._templates[name].render(**context)
+
+    def prerender(self, name: str, langs, **context):
+        """Render a template that depends only on lang, once for each of langs"""
+        self._static[name] = {lang: Markup(self.render(name, lang=lang, **context)) for lang in langs}
+
+    def static(self, name: str, lang: int) -> Markup:
+        """A prerender()ed template; languages it wasn't rendered for get the first one"""
+        pages = self._static[name]
+        return pages.get(lang) or next(iter(pages.values()))
+
+    def fragment(self, name: str, lang: int, **context) -> str:
+        """A template rendered for one language (and context) as a str.format() string, compiled on first use"""
+        key = (name, lang, *sorted(context.items()))
+        fragment = self._fragments.get(key)
+        if fragment is None:
+            page = self.render(name, lang=lang, **context).replace("{", "{{").replace("}", "}}")
+            fragment = self._fragments[key] = SLOT_RE.sub(r"{\1}", page)
+        return fragment
+
+    def fill(self, name: str, lang: int, values: dict, **context) -> str:
+        """fragment() with its slots filled in from values"""
+        return self.fragment(name, lang, **context).format_map(values)
@@ -0,0 +1,22 @@
+"""Recompute the user_rollups collection from the workouts collection.
+
+Usage (from backend/, with the same .env as the server):
+    python rebuild_rollups.py            # every user
+    python rebuild_rollups.py <user_id>  # one user
+"""
+import asyncio
+import sys
+
+import server
+
+
+async def main(user_id=None):
+    try:
+        rows = await server.rebuild_user_rollups(user_id)
+        print(f"Rebuilt {rows} rollup rows for {user_id or 'all users'}")
+    finally:
+        server.db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else None))
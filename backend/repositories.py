@@ -0,0 +1,848 @@
+"""Repositories: the workout, user, status check and simulator state
+operations server.py performs, one method each.
+
+server.py never builds a query for these collections. It asks for "the next
+page of this user's workouts after this key" or "move this device's workouts
+to that user", and each backend answers in its own way:
+
+- MongoRepositories runs Motor queries on the indexes it declares.
+- MemoryRepositories keeps plain dicts in process (STORAGE_BACKEND=memory),
+  so pages, the pipeline and backfills run hermetically in tests and
+  benchmarks. It has no query language to get subtly wrong.
+
+tests/test_repositories.py runs the same cases against both. The other
+collections (workout_tracks, user_rollups, uploads, devices, ...) are still
+Storage collections; see storage.py.
+
+Workouts are the documents server.py builds, keyed by their `id`. Reads
+return copies without `_id`, and `fields` picks the top-level fields to
+return (None: all of them). Updates take $set, $unset and $inc. Only scan()
+returns `_id`: it is the key the backfill runner resumes from.
+"""
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+import bson
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+from route_columns import ROUTE_SCHEMA_VERSION
+
+# Collections owned by the repositories; Storage refuses to hand them out
+REPOSITORY_COLLECTIONS = ("workouts", "users", "status_checks", "fitbeat_state")
+
+PROCESSING_PENDING = "pending"
+PROCESSING_DONE = "processed"
+PROCESSING_FAILED = "failed"
+
+# Route and elevation fields, stored in workout_tracks once a track is moved out
+TRACK_FIELDS = ("route", "route_v", "route_packed", "route_levels", "elevation_json")
+
+# Listings are newest first on (timestamp, id); period pages on
+# (local_date, timestamp, id), which is the same order within a period
+TIME_SORT = [("timestamp", -1), ("id", -1)]
+PERIOD_SORT = [("local_date", -1), ("timestamp", -1), ("id", -1)]
+
+# Named subsets of the workouts for iterate(), scan() and count()
+INLINE_TRACKS = "inline_tracks"  # route or elevation still in the workout document
+STORED_TRACKS = "stored_tracks"  # track moved out (track_store set)
+LEGACY_ROUTES = "legacy_routes"  # a legacy route array inline, or a track in workout_tracks that may hold one
+LEGACY_TIMESTAMPS = "legacy_timestamps"  # ISO string timestamp, or no local_date
+
+# A legacy (route_v 1) route: one sub-document per point
+LEGACY_ROUTE_QUERY = {"route": {"$type": "array"}, "route_v": {"$ne": ROUTE_SCHEMA_VERSION}}
+
+# (timestamp, id) of the last row of a page; (start, end) local_date range
+PageKey = Tuple[datetime, str]
+Period = Tuple[str, str]
+
+# Per-month totals; the fields match server.ROLLUP_FIELDS plus max_hr
+MONTH_TOTAL_FIELDS = {
+    "distance_cm": "distance_cm",
+    "duration_sec": "duration_sec",
+    "hr_sum": "avg_hr",
+    "elevation_gain": "elevation_gain",
+    "elevation_loss": "elevation_loss",
+    "steps": "steps",
+}
+
+
+class WorkoutRepository(ABC):
+    # ─── Reads ───
+    @abstractmethod
+    async def get(self, workout_id: str, fields=None, user_id: Optional[str] = None,
+                  status: Optional[str] = None) -> Optional[dict]:
+        """A workout by id; None unless it belongs to user_id / has processing_status status (when given)"""
+
+    @abstractmethod
+    async def find_id_by_key(self, user_id: str, idempotency_key: str) -> Optional[str]:
+        """id of the workout a user saved under an idempotency key"""
+
+    @abstractmethod
+    async def find_ids_by_keys(self, keys: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], str]:
+        """{(user_id, idempotency_key): id} for the keys that are saved"""
+
+    @abstractmethod
+    async def latest(self, user_id: Optional[str], fields=None, period: Optional[Period] = None) -> Optional[dict]:
+        """A user's newest workout (in period, if given); any workout when user_id is None"""
+
+    @abstractmethod
+    async def recent(self, limit: int, fields=None) -> List[dict]:
+        """Newest workouts of all users"""
+
+    @abstractmethod
+    async def page(self, user_id: str, limit: int, fields=None, after: Optional[PageKey] = None,
+                   period: Optional[Period] = None) -> List[dict]:
+        """Up to limit of a user's workouts, newest first, after the row with key `after`"""
+
+    @abstractmethod
+    def iterate(self, user_id: Optional[str] = None, selection: Optional[str] = None, fields=None,
+                batch_size: int = 500) -> AsyncIterator[dict]:
+        """Stream the workouts of a user (everyone's if None) in a selection, batch_size per round trip"""
+
+    @abstractmethod
+    async def scan(self, selection: Optional[str] = None, after=None, limit: int = 500, fields=None) -> List[dict]:
+        """Up to limit workouts of a selection in _id order after _id `after`, with their _id"""
+
+    @abstractmethod
+    async def count(self, selection: Optional[str] = None, after=None) -> int:
+        """Number of workouts in a selection after _id `after`"""
+
+    @abstractmethod
+    async def count_with_status(self, status: str) -> int:
+        pass
+
+    @abstractmethod
+    async def ids_with_status(self, status: str) -> List[str]:
+        pass
+
+    @abstractmethod
+    async def duplicate_groups(self, user_id: Optional[str] = None) -> List[List[str]]:
+        """ids of workouts with the same user, device, time, distance and duration; first saved first"""
+
+    @abstractmethod
+    async def month_totals(self, user_id: str, period: Period, workouts_period: Optional[Period] = None,
+                           workouts_limit: int = 100) -> dict:
+        """A user's totals per month over period, in one read.
+
+        {"months": {"YYYY-MM": totals}, "user_name": of the newest workout in
+        period, "workouts": newest first in workouts_period (None without it)}
+        """
+
+    # ─── Writes ───
+    @abstractmethod
+    async def insert(self, workout: dict):
+        """Save a new workout; DuplicateKeyError if its id or (user_id, idempotency_key) is saved"""
+
+    @abstractmethod
+    async def insert_many(self, workouts: List[dict]) -> Dict[int, dict]:
+        """Save new workouts, unordered; {index: write error} for those not saved (code 11000: duplicate)"""
+
+    @abstractmethod
+    async def update(self, workout_id: str, update: dict, status: Optional[str] = None) -> bool:
+        """Apply an update to a workout (only while it has processing_status status, if given); True if changed"""
+
+    @abstractmethod
+    async def update_many(self, updates: List[Tuple[str, dict]]):
+        """Apply (workout_id, update) pairs in one unordered round trip"""
+
+    @abstractmethod
+    async def reset_failed(self) -> List[str]:
+        """Set failed workouts back to pending, clearing processing_error; returns their ids"""
+
+    @abstractmethod
+    async def move_device(self, device_id: str, user_id: str, fields=None) -> List[dict]:
+        """Move a device's workouts of other users to user_id (bumping their version); returns them as they were"""
+
+    @abstractmethod
+    async def delete(self, workout_id: str, fields=None) -> Optional[dict]:
+        """Delete a workout; returns it, or None if there was none"""
+
+    @abstractmethod
+    async def delete_ids(self, workout_ids: List[str], fields=None) -> List[dict]:
+        """Delete workouts by id; returns the deleted ones"""
+
+    @abstractmethod
+    async def delete_for_user(self, user_id: str, fields=None) -> List[dict]:
+        """Delete all of a user's workouts; returns the deleted ones"""
+
+    async def ensure_indexes(self) -> List[str]:
+        """Create the indexes the queries above need; returns the errors"""
+        return []
+
+
+class UserRepository(ABC):
+    @abstractmethod
+    async def get(self, user_id: str) -> Optional[dict]:
+        pass
+
+    @abstractmethod
+    async def insert(self, user: dict):
+        """Register a user; DuplicateKeyError if the user_id is taken"""
+
+    @abstractmethod
+    async def set_name(self, user_id: str, user_name: str):
+        pass
+
+    async def ensure_indexes(self) -> List[str]:
+        return []
+
+
+class StatusCheckRepository(ABC):
+    @abstractmethod
+    async def add(self, check: dict):
+        pass
+
+    @abstractmethod
+    async def list(self, limit: int = 1000) -> List[dict]:
+        pass
+
+    async def ensure_indexes(self) -> List[str]:
+        return []
+
+
+class SimulatorStateRepository(ABC):
+    @abstractmethod
+    async def get(self) -> Optional[dict]:
+        """The saved simulator state, None if it was never saved"""
+
+    @abstractmethod
+    async def save(self, state: dict):
+        pass
+
+    async def ensure_indexes(self) -> List[str]:
+        return []
+
+
+@dataclass
+class Repositories:
+    workouts: WorkoutRepository
+    users: UserRepository
+    status_checks: StatusCheckRepository
+    simulator_state: SimulatorStateRepository
+
+    async def ensure_indexes(self) -> List[str]:
+        errors = []
+        for repository in (self.workouts, self.users, self.status_checks, self.simulator_state):
+            errors += await repository.ensure_indexes()
+        return errors
+
+
+# ═══ MongoDB ═══
+def _projection(fields, with_id: bool = False) -> Optional[dict]:
+    if fields is None:
+        return None if with_id else {"_id": 0}
+    return {"_id": 1 if with_id else 0, **{field: 1 for field in fields}}
+
+def page_filter(user_id: str, after: Optional[PageKey] = None, period: Optional[Period] = None) -> dict:
+    """Filter of WorkoutRepository.page on MongoDB (also explained by /admin/query-plans)"""
+    query = {"user_id": user_id}
+    if period:
+        query["local_date"] = {"$gte": period[0], "$lt": period[1]}
+    if after:
+        timestamp, workout_id = after
+        # The $lte bounds the index scan; the $or only breaks ties on the same timestamp
+        query["timestamp"] = {"$lte": timestamp}
+        query["$or"] = [{"timestamp": {"$lt": timestamp}}, {"id": {"$lt": workout_id}}]
+    return query
+
+SELECTION_FILTERS = {
+    None: {},
+    INLINE_TRACKS: {
+        "track_store": {"$exists": False},
+        "$or": [{field: {"$exists": True}} for field in TRACK_FIELDS],
+    },
+    STORED_TRACKS: {"track_store": {"$exists": True}},
+    LEGACY_ROUTES: {"$or": [LEGACY_ROUTE_QUERY, {"track_store": "collection"}]},
+    LEGACY_TIMESTAMPS: {"$or": [{"timestamp": {"$type": "string"}}, {"local_date": {"$exists": False}}]},
+}
+
+MONTH_STATS_GROUP = {
+    "_id": {"$substrBytes": ["$local_date", 0, 7]},
+    "count": {"$sum": 1},
+    **{field: {"$sum": f"${source}"} for field, source in MONTH_TOTAL_FIELDS.items()},
+    "hr_count": {"$sum": {"$cond": [{"$gt": ["$avg_hr", 0]}, 1, 0]}},
+    "max_hr": {"$max": "$max_hr"},
+}
+
+async def _create_indexes(collection, indexes) -> List[str]:
+    errors = []
+    for index in indexes:
+        try:
+            await collection.create_indexes([index])
+        except OperationFailure as e:
+            # e.g. existing duplicates block a unique index - keep serving, fix the data
+            errors.append(f"Could not create index {index.document['name']} on {collection.name}: {e}")
+    return errors
+
+
+class MongoWorkoutRepository(WorkoutRepository):
+    INDEXES = [
+        # Every per-user page: find({"user_id"}).sort("timestamp", -1)
+        # id breaks timestamp ties for keyset pagination
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)], name="user_id_timestamp_id"),
+        # Year/month pages: local_date range per user, newest first
+        IndexModel(
+            [("user_id", ASCENDING), ("local_date", DESCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)],
+            name="user_id_local_date_timestamp_id"
+        ),
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("device_id", ASCENDING)], name="device_id", sparse=True),
+        # One document per submitted workout and user; documents without a key are not indexed
+        IndexModel(
+            [("user_id", ASCENDING), ("idempotency_key", ASCENDING)], name="user_id_idempotency_key", unique=True,
+            partialFilterExpression={"idempotency_key": {"$type": "string"}}
+        ),
+        # Startup re-queue of unprocessed workouts
+        IndexModel(
+            [("processing_status", ASCENDING)], name="processing_pending",
+            partialFilterExpression={"processing_status": PROCESSING_PENDING}
+        ),
+        # Failed workouts waiting for /admin/pipeline/retry-failed
+        IndexModel(
+            [("processing_status", ASCENDING)], name="processing_failed",
+            partialFilterExpression={"processing_status": PROCESSING_FAILED}
+        ),
+    ]
+
+    def __init__(self, database):
+        self.collection = database["workouts"]
+
+    @staticmethod
+    def _filter(selection: Optional[str], user_id: Optional[str] = None, after=None) -> dict:
+        query = dict(SELECTION_FILTERS[selection])
+        if user_id is not None:
+            query["user_id"] = user_id
+        if after is not None:
+            query["_id"] = {"$gt": after}
+        return query
+
+    async def get(self, workout_id, fields=None, user_id=None, status=None):
+        query = {"id": workout_id}
+        if user_id is not None:
+            query["user_id"] = user_id
+        if status is not None:
+            query["processing_status"] = status
+        return await self.collection.find_one(query, _projection(fields))
+
+    async def find_id_by_key(self, user_id, idempotency_key):
+        existing = await self.collection.find_one({"user_id": user_id, "idempotency_key": idempotency_key}, {"_id": 0, "id": 1})
+        return existing["id"] if existing else None
+
+    async def find_ids_by_keys(self, keys):
+        keys = set(keys)
+        if not keys:
+            return {}
+        saved = await self.collection.find(
+            {"user_id": {"$in": list({key[0] for key in keys})}, "idempotency_key": {"$in": list({key[1] for key in keys})}},
+            {"_id": 0, "id": 1, "user_id": 1, "idempotency_key": 1}
+        ).to_list(None)
+        return {(w["user_id"], w["idempotency_key"]): w["id"] for w in saved if (w["user_id"], w["idempotency_key"]) in keys}
+
+    async def latest(self, user_id, fields=None, period=None):
+        if user_id is None:
+            return await self.collection.find_one({}, _projection(fields))
+        return await self.collection.find_one(
+            page_filter(user_id, period=period), _projection(fields), sort=PERIOD_SORT if period else TIME_SORT
+        )
+
+    async def recent(self, limit, fields=None):
+        return await self.collection.find({}, _projection(fields)).sort("timestamp", -1).to_list(limit)
+
+    async def page(self, user_id, limit, fields=None, after=None, period=None):
+        cursor = self.collection.find(page_filter(user_id, after, period), _projection(fields))
+        return await cursor.sort(PERIOD_SORT if period else TIME_SORT).limit(limit).to_list(limit)
+
+    async def iterate(self, user_id=None, selection=None, fields=None, batch_size=500):
+        async for workout in self.collection.find(self._filter(selection, user_id), _projection(fields)).batch_size(batch_size):
+            yield workout
+
+    async def scan(self, selection=None, after=None, limit=500, fields=None):
+        cursor = self.collection.find(self._filter(selection, after=after), _projection(fields, with_id=True))
+        return await cursor.sort("_id", 1).limit(limit).to_list(limit)
+
+    async def count(self, selection=None, after=None):
+        return await self.collection.count_documents(self._filter(selection, after=after))
+
+    async def count_with_status(self, status):
+        return await self.collection.count_documents({"processing_status": status})
+
+    async def ids_with_status(self, status):
+        return [w["id"] async for w in self.collection.find({"processing_status": status}, {"_id": 0, "id": 1})]
+
+    async def duplicate_groups(self, user_id=None):
+        pipeline = [{"$match": {"user_id": user_id}}] if user_id else []
+        pipeline += [
+            {"$sort": {"_id": 1}},
+            {"$group": {
+                "_id": {
+                    "user_id": "$user_id",
+                    "device_id": "$device_id",
+                    "timestamp": "$timestamp",
+                    "distance_cm": "$distance_cm",
+                    "duration_sec": "$duration_sec"
+                },
+                "ids": {"$push": "$id"},
+                "count": {"$sum": 1}
+            }},
+            {"$match": {"count": {"$gt": 1}}}
+        ]
+        return [group["ids"] async for group in self.collection.aggregate(pipeline, allowDiskUse=True)]
+
+    async def month_totals(self, user_id, period, workouts_period=None, workouts_limit=100):
+        facets = {
+            "months": [{"$group": MONTH_STATS_GROUP}],
+            "latest": [{"$sort": {"timestamp": -1}}, {"$limit": 1}, {"$project": {"_id": 0, "user_name": 1}}],
+        }
+        if workouts_period:
+            # Tracks normally live in workout_tracks and unmigrated ones are packed,
+            # so 100 workout documents stay well under the 16 MB $facet result limit
+            facets["workouts"] = [
+                {"$match": {"local_date": {"$gte": workouts_period[0], "$lt": workouts_period[1]}}},
+                {"$sort": dict(PERIOD_SORT)}, {"$limit": workouts_limit}, {"$project": {"_id": 0}},
+            ]
+        pipeline = [{"$match": page_filter(user_id, period=period)}, {"$facet": facets}]
+        result = (await self.collection.aggregate(pipeline).to_list(1))[0]
+        return {
+            "months": {row.pop("_id"): row for row in result["months"]},
+            "user_name": result["latest"][0].get("user_name", "") if result["latest"] else "",
+            "workouts": result.get("workouts"),
+        }
+
+    async def insert(self, workout):
+        await self.collection.insert_one(dict(workout))
+
+    async def insert_many(self, workouts):
+        try:
+            await self.collection.insert_many([dict(w) for w in workouts], ordered=False)
+        except BulkWriteError as e:
+            return {error["index"]: error for error in e.details.get("writeErrors", [])}
+        return {}
+
+    async def update(self, workout_id, update, status=None):
+        query = {"id": workout_id}
+        if status is not None:
+            query["processing_status"] = status
+        return (await self.collection.update_one(query, update)).modified_count > 0
+
+    async def update_many(self, updates):
+        if updates:
+            await self.collection.bulk_write([UpdateOne({"id": workout_id}, update) for workout_id, update in updates],
+                                             ordered=False)
+
+    async def reset_failed(self):
+        ids = await self.ids_with_status(PROCESSING_FAILED)
+        if ids:
+            await self.collection.update_many(
+                {"id": {"$in": ids}, "processing_status": PROCESSING_FAILED},
+                {"$set": {"processing_status": PROCESSING_PENDING}, "$unset": {"processing_error": ""}}
+            )
+        return ids
+
+    async def move_device(self, device_id, user_id, fields=None):
+        moving = await self.collection.find(
+            {"device_id": device_id, "user_id": {"$ne": user_id}}, _projection(fields, with_id=True)
+        ).to_list(None)
+        if moving:
+            await self.collection.update_many(
+                {"_id": {"$in": [w["_id"] for w in moving]}, "user_id": {"$ne": user_id}},
+                {"$set": {"user_id": user_id}, "$inc": {"version": 1}}
+            )
+        for workout in moving:
+            del workout["_id"]
+        return moving
+
+    async def delete(self, workout_id, fields=None):
+        return await self.collection.find_one_and_delete({"id": workout_id}, projection=_projection(fields))
+
+    async def delete_ids(self, workout_ids, fields=None):
+        query = {"id": {"$in": list(workout_ids)}}
+        deleted = await self.collection.find(query, _projection(fields)).to_list(None)
+        await self.collection.delete_many(query)
+        return deleted
+
+    async def delete_for_user(self, user_id, fields=None):
+        deleted = await self.collection.find({"user_id": user_id}, _projection(fields)).to_list(None)
+        await self.collection.delete_many({"user_id": user_id})
+        return deleted
+
+    async def ensure_indexes(self):
+        return await _create_indexes(self.collection, self.INDEXES)
+
+
+class MongoUserRepository(UserRepository):
+    INDEXES = [IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True)]
+
+    def __init__(self, database):
+        self.collection = database["users"]
+
+    async def get(self, user_id):
+        return await self.collection.find_one({"user_id": user_id}, {"_id": 0})
+
+    async def insert(self, user):
+        await self.collection.insert_one(dict(user))
+
+    async def set_name(self, user_id, user_name):
+        await self.collection.update_one({"user_id": user_id}, {"$set": {"user_name": user_name}})
+
+    async def ensure_indexes(self):
+        return await _create_indexes(self.collection, self.INDEXES)
+
+
+class MongoStatusCheckRepository(StatusCheckRepository):
+    def __init__(self, database):
+        self.collection = database["status_checks"]
+
+    async def add(self, check):
+        await self.collection.insert_one(dict(check))
+
+    async def list(self, limit=1000):
+        return await self.collection.find({}, {"_id": 0}).to_list(limit)
+
+
+class MongoSimulatorStateRepository(SimulatorStateRepository):
+    def __init__(self, database):
+        self.collection = database["fitbeat_state"]
+
+    async def get(self):
+        return await self.collection.find_one({"_id": "simulator"}, {"_id": 0})
+
+    async def save(self, state):
+        await self.collection.update_one({"_id": "simulator"}, {"$set": state}, upsert=True)
+
+
+def mongo_repositories(database) -> Repositories:
+    return Repositories(
+        workouts=MongoWorkoutRepository(database),
+        users=MongoUserRepository(database),
+        status_checks=MongoStatusCheckRepository(database),
+        simulator_state=MongoSimulatorStateRepository(database),
+    )
+
+
+# ═══ In memory ═══
+def _bson(doc: dict) -> dict:
+    """A document as MongoDB would store it (tuples become lists, dates naive UTC at ms precision)"""
+    return bson.decode(bson.encode(doc))
+
+def _clone(value):
+    if isinstance(value, dict):
+        return {k: _clone(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_clone(v) for v in value]
+    return value
+
+def _project(doc: dict, fields=None, with_id: bool = False) -> dict:
+    if fields is None:
+        return {k: _clone(v) for k, v in doc.items() if with_id or k != "_id"}
+    projected = {"_id": doc["_id"]} if with_id else {}
+    projected.update((field, _clone(doc[field])) for field in fields if field in doc)
+    return projected
+
+def _sort_value(value):
+    """Sort key in BSON type order (null < numbers < strings < dates)"""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (3, value)
+    raise NotImplementedError(f"Sorting on {type(value).__name__} values is not supported")
+
+def _time_key(doc: dict):
+    return _sort_value(doc.get("timestamp")), _sort_value(doc.get("id"))
+
+def _period_key(doc: dict):
+    return (_sort_value(doc.get("local_date")),) + _time_key(doc)
+
+def _in_period(doc: dict, period: Period) -> bool:
+    local_date = doc.get("local_date")
+    return isinstance(local_date, str) and period[0] <= local_date < period[1]
+
+def _after(doc: dict, after: PageKey) -> bool:
+    """Row sorts after the page key in (timestamp, id) order; range operators only match dates"""
+    timestamp, workout_id = after
+    value = doc.get("timestamp")
+    return isinstance(value, datetime) and (value < timestamp or (value == timestamp and doc.get("id", "") < workout_id))
+
+def _number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _legacy_route(doc: dict) -> bool:
+    return isinstance(doc.get("route"), list) and doc.get("route_v") != ROUTE_SCHEMA_VERSION
+
+SELECTION_PREDICATES = {
+    None: lambda doc: True,
+    INLINE_TRACKS: lambda doc: "track_store" not in doc and any(field in doc for field in TRACK_FIELDS),
+    STORED_TRACKS: lambda doc: "track_store" in doc,
+    LEGACY_ROUTES: lambda doc: _legacy_route(doc) or doc.get("track_store") == "collection",
+    LEGACY_TIMESTAMPS: lambda doc: isinstance(doc.get("timestamp"), str) or "local_date" not in doc,
+}
+
+def _apply_update(doc: dict, update: dict) -> dict:
+    """Updated copy of a stored document ($set, $unset and $inc on top-level fields)"""
+    doc = dict(doc)
+    for operator, fields in update.items():
+        for field, value in fields.items():
+            if "." in field or field == "_id":
+                raise NotImplementedError(f"Updating {field} is not supported")
+            if operator == "$set":
+                doc[field] = _bson({"value": value})["value"]
+            elif operator == "$unset":
+                doc.pop(field, None)
+            elif operator == "$inc":
+                doc[field] = doc.get(field, 0) + value
+            else:
+                raise NotImplementedError(f"Update operator {operator} is not supported")
+    return doc
+
+def _duplicate_key(index: str, key) -> DuplicateKeyError:
+    return DuplicateKeyError(f"E11000 duplicate key error index: {index} dup key: {key!r}", 11000)
+
+
+class MemoryWorkoutRepository(WorkoutRepository):
+    def __init__(self):
+        self._docs = {}  # id -> stored document, in insertion (_id) order
+        self._by_user = {}  # user_id -> {id: stored document}
+        self._keys = {}  # (user_id, idempotency_key) -> id
+
+    @staticmethod
+    def _key(doc: dict):
+        key = doc.get("idempotency_key")
+        return (doc.get("user_id"), key) if isinstance(key, str) else None
+
+    def _store(self, doc: dict, previous: Optional[dict] = None):
+        """Put a stored document in place (replacing previous), keeping the unique keys unique"""
+        key = self._key(doc)
+        if key and self._keys.get(key, doc["id"]) != doc["id"]:
+            raise _duplicate_key("user_id_idempotency_key", key)
+        if previous is not None:
+            self._unindex(previous)
+        self._docs[doc["id"]] = doc
+        self._by_user.setdefault(doc.get("user_id"), {})[doc["id"]] = doc
+        if key:
+            self._keys[key] = doc["id"]
+
+    def _unindex(self, doc: dict):
+        user_docs = self._by_user.get(doc.get("user_id"), {})
+        user_docs.pop(doc["id"], None)
+        if not user_docs:
+            self._by_user.pop(doc.get("user_id"), None)
+        key = self._key(doc)
+        if key and self._keys.get(key) == doc["id"]:
+            del self._keys[key]
+
+    def _remove(self, doc: dict):
+        self._unindex(doc)
+        del self._docs[doc["id"]]
+
+    def _user_docs(self, user_id: Optional[str]):
+        return self._docs.values() if user_id is None else self._by_user.get(user_id, {}).values()
+
+    def _selected(self, selection: Optional[str], user_id: Optional[str] = None, after=None) -> list:
+        selected = SELECTION_PREDICATES[selection]
+        return [doc for doc in self._user_docs(user_id)
+                if selected(doc) and (after is None or doc["_id"] > after)]
+
+    async def get(self, workout_id, fields=None, user_id=None, status=None):
+        doc = self._docs.get(workout_id)
+        if doc is None or (user_id is not None and doc.get("user_id") != user_id) or \
+                (status is not None and doc.get("processing_status") != status):
+            return None
+        return _project(doc, fields)
+
+    async def find_id_by_key(self, user_id, idempotency_key):
+        return self._keys.get((user_id, idempotency_key))
+
+    async def find_ids_by_keys(self, keys):
+        return {key: self._keys[key] for key in set(keys) if key in self._keys}
+
+    async def latest(self, user_id, fields=None, period=None):
+        if user_id is None:
+            return _project(next(iter(self._docs.values())), fields) if self._docs else None
+        docs = [doc for doc in self._user_docs(user_id) if period is None or _in_period(doc, period)]
+        if not docs:
+            return None
+        return _project(max(docs, key=_period_key if period else _time_key), fields)
+
+    async def recent(self, limit, fields=None):
+        docs = sorted(self._docs.values(), key=lambda doc: _sort_value(doc.get("timestamp")), reverse=True)
+        return [_project(doc, fields) for doc in docs[:limit]]
+
+    async def page(self, user_id, limit, fields=None, after=None, period=None):
+        docs = [doc for doc in self._user_docs(user_id)
+                if (period is None or _in_period(doc, period)) and (after is None or _after(doc, after))]
+        docs.sort(key=_period_key if period else _time_key, reverse=True)
+        return [_project(doc, fields) for doc in docs[:limit]]
+
+    async def iterate(self, user_id=None, selection=None, fields=None, batch_size=500):
+        for doc in self._selected(selection, user_id):
+            # Like a cursor, a workout deleted before its turn is skipped
+            if self._docs.get(doc["id"]) is not None:
+                yield _project(self._docs[doc["id"]], fields)
+
+    async def scan(self, selection=None, after=None, limit=500, fields=None):
+        return [_project(doc, fields, with_id=True) for doc in self._selected(selection, after=after)[:limit]]
+
+    async def count(self, selection=None, after=None):
+        return len(self._selected(selection, after=after))
+
+    async def count_with_status(self, status):
+        return sum(1 for doc in self._docs.values() if doc.get("processing_status") == status)
+
+    async def ids_with_status(self, status):
+        return [doc["id"] for doc in self._docs.values() if doc.get("processing_status") == status]
+
+    async def duplicate_groups(self, user_id=None):
+        groups = {}
+        missing = object()
+        for doc in self._user_docs(user_id):
+            key = tuple(
+                _sort_value(doc[field]) if field in doc else missing
+                for field in ("user_id", "device_id", "timestamp", "distance_cm", "duration_sec")
+            )
+            groups.setdefault(key, []).append(doc)
+        return [[doc["id"] for doc in sorted(group, key=lambda doc: doc["_id"])]
+                for group in groups.values() if len(group) > 1]
+
+    async def month_totals(self, user_id, period, workouts_period=None, workouts_limit=100):
+        docs = [doc for doc in self._user_docs(user_id) if _in_period(doc, period)]
+        months = {}
+        for doc in docs:
+            row = months.setdefault(doc["local_date"][:7], {
+                "count": 0, **dict.fromkeys(MONTH_TOTAL_FIELDS, 0), "hr_count": 0, "max_hr": None,
+            })
+            row["count"] += 1
+            for field, source in MONTH_TOTAL_FIELDS.items():
+                if _number(doc.get(source)):
+                    row[field] += doc[source]
+            if _number(doc.get("avg_hr")) and doc["avg_hr"] > 0:
+                row["hr_count"] += 1
+            max_hr = doc.get("max_hr")
+            if _number(max_hr) and (row["max_hr"] is None or max_hr > row["max_hr"]):
+                row["max_hr"] = max_hr
+        latest = max(docs, key=lambda doc: _sort_value(doc.get("timestamp")), default=None)
+        workouts = None
+        if workouts_period:
+            in_period = sorted((doc for doc in docs if _in_period(doc, workouts_period)), key=_period_key, reverse=True)
+            workouts = [_project(doc) for doc in in_period[:workouts_limit]]
+        return {
+            "months": months,
+            "user_name": latest.get("user_name", "") if latest else "",
+            "workouts": workouts,
+        }
+
+    async def insert(self, workout):
+        self._insert(workout)
+
+    def _insert(self, workout: dict):
+        doc = _bson({"_id": ObjectId(), **workout})
+        if doc.get("id") in self._docs:
+            raise _duplicate_key("id_unique", doc.get("id"))
+        self._store(doc)
+
+    async def insert_many(self, workouts):
+        errors = {}
+        for index, workout in enumerate(workouts):
+            try:
+                self._insert(workout)
+            except DuplicateKeyError as e:
+                errors[index] = {"index": index, "code": e.code, "errmsg": str(e)}
+        return errors
+
+    async def update(self, workout_id, update, status=None):
+        doc = self._docs.get(workout_id)
+        if doc is None or (status is not None and doc.get("processing_status") != status):
+            return False
+        updated = _apply_update(doc, update)
+        if updated == doc:
+            return False
+        self._store(updated, previous=doc)
+        return True
+
+    async def update_many(self, updates):
+        for workout_id, update in updates:
+            await self.update(workout_id, update)
+
+    async def reset_failed(self):
+        ids = await self.ids_with_status(PROCESSING_FAILED)
+        for workout_id in ids:
+            await self.update(workout_id, {"$set": {"processing_status": PROCESSING_PENDING},
+                                           "$unset": {"processing_error": ""}})
+        return ids
+
+    async def move_device(self, device_id, user_id, fields=None):
+        moving = [doc for doc in self._docs.values() if doc.get("device_id") == device_id and doc.get("user_id") != user_id]
+        for doc in moving:
+            await self.update(doc["id"], {"$set": {"user_id": user_id}, "$inc": {"version": 1}})
+        return [_project(doc, fields) for doc in moving]
+
+    async def delete(self, workout_id, fields=None):
+        doc = self._docs.get(workout_id)
+        if doc is None:
+            return None
+        self._remove(doc)
+        return _project(doc, fields)
+
+    async def delete_ids(self, workout_ids, fields=None):
+        deleted = [self._docs[workout_id] for workout_id in dict.fromkeys(workout_ids) if workout_id in self._docs]
+        for doc in deleted:
+            self._remove(doc)
+        return [_project(doc, fields) for doc in deleted]
+
+    async def delete_for_user(self, user_id, fields=None):
+        return await self.delete_ids([doc["id"] for doc in self._user_docs(user_id)], fields)
+
+
+class MemoryUserRepository(UserRepository):
+    def __init__(self):
+        self._users = {}
+
+    async def get(self, user_id):
+        user = self._users.get(user_id)
+        return _clone(user) if user else None
+
+    async def insert(self, user):
+        if user["user_id"] in self._users:
+            raise _duplicate_key("user_id_unique", user["user_id"])
+        self._users[user["user_id"]] = _bson(user)
+
+    async def set_name(self, user_id, user_name):
+        if user_id in self._users:
+            self._users[user_id]["user_name"] = user_name
+
+
+class MemoryStatusCheckRepository(StatusCheckRepository):
+    def __init__(self):
+        self._checks = []
+
+    async def add(self, check):
+        self._checks.append(_bson(check))
+
+    async def list(self, limit=1000):
+        return [_clone(check) for check in self._checks[:limit]]
+
+
+class MemorySimulatorStateRepository(SimulatorStateRepository):
+    def __init__(self):
+        self._state = None
+
+    async def get(self):
+        return _clone(self._state) if self._state is not None else None
+
+    async def save(self, state):
+        self._state = {**(self._state or {}), **_bson(state)}
+
+
+def memory_repositories() -> Repositories:
+    return Repositories(
+        workouts=MemoryWorkoutRepository(),
+        users=MemoryUserRepository(),
+        status_checks=MemoryStatusCheckRepository(),
+        simulator_state=MemorySimulatorStateRepository(),
+    )
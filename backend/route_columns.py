@@ -0,0 +1,203 @@
+"""Columnar route representation for FitBeat workouts.
+
+The watch sends its GPS track either as a `route` list or, because of the
+Garmin array bug, as a `route_json` string. Both are turned into one typed
+array per field (lat, lon, timestamp, hr, alt), which is what the metrics,
+packing and rendering code work on. Missing values are NaN.
+"""
+import json
+import zlib
+from dataclasses import dataclass
+
+import numpy as np
+from bson import Binary
+
+ROUTE_FIELDS = ("lat", "lon", "timestamp", "hr", "alt")
+INT_FIELDS = ("timestamp", "hr")
+
+# bool is left out on purpose: numpy would read true as 1.0
+_NUMBER_TYPES = frozenset((int, float, type(None)))
+
+
+@dataclass
+class RouteColumns:
+    lat: np.ndarray
+    lon: np.ndarray
+    timestamp: np.ndarray
+    hr: np.ndarray
+    alt: np.ndarray
+
+    def __len__(self):
+        return int(self.lat.size)
+
+    @classmethod
+    def empty(cls, n: int = 0) -> "RouteColumns":
+        return cls(*(np.full(n, np.nan) for _ in ROUTE_FIELDS))
+
+    @classmethod
+    def concat(cls, parts) -> "RouteColumns":
+        """Join route pieces end to end (e.g. chunks of a resumable upload)"""
+        parts = list(parts)
+        if not parts:
+            return cls.empty()
+        return cls(*(np.concatenate([getattr(p, f) for p in parts]) for f in ROUTE_FIELDS))
+
+    @classmethod
+    def from_points(cls, points) -> "RouteColumns":
+        """Build columns from WorkoutPoint models or route point dicts.
+
+        WorkoutPoint carries altitude as `elevation`; stored route dicts
+        and route_json use `alt`. Both land in the alt column.
+        """
+        n = len(points)
+        nan = float("nan")
+
+        def column(getter):
+            values = (getter(p) for p in points)
+            return np.fromiter((nan if v is None else v for v in values), dtype=np.float64, count=n)
+
+        if n and isinstance(points[0], dict):
+            return cls(*(column(lambda p, f=f: p.get(f)) for f in ROUTE_FIELDS))
+        return cls(
+            lat=column(lambda p: p.lat),
+            lon=column(lambda p: p.lon),
+            timestamp=column(lambda p: p.timestamp),
+            hr=column(lambda p: p.hr),
+            alt=column(lambda p: p.elevation),
+        )
+
+    def take(self, indices) -> "RouteColumns":
+        """Subset of the points, in the order given"""
+        return RouteColumns(*(getattr(self, f)[indices] for f in ROUTE_FIELDS))
+
+    def latlon(self):
+        """[[lat, lon], ...] for the points that have GPS (Leaflet polyline shape)"""
+        has_gps = ~(np.isnan(self.lat) | np.isnan(self.lon))
+        return np.column_stack((self.lat[has_gps], self.lon[has_gps])).tolist()
+
+    def altitudes(self) -> np.ndarray:
+        """Altitude samples in route order, missing values dropped"""
+        return self.alt[~np.isnan(self.alt)]
+
+    def to_points(self):
+        """Expand back into a list of point dicts (only fields that are present)"""
+        columns = {}
+        for field in ROUTE_FIELDS:
+            values = getattr(self, field)
+            present = ~np.isnan(values)
+            if not present.any():
+                continue
+            if field in INT_FIELDS:
+                as_list = np.where(present, values, 0).astype(np.int64).tolist()
+            else:
+                as_list = values.tolist()
+            columns[field] = (as_list, present.tolist())
+
+        points = [{} for _ in range(len(self))]
+        for field, (values, present) in columns.items():
+            for point, value, ok in zip(points, values, present):
+                if ok:
+                    point[field] = value
+        return points
+
+
+def parse_route_json(text: str) -> RouteColumns:
+    """Parse a route_json string (JSON array of point objects) into columns.
+
+    The string is tokenized by json.loads; each field is then gathered into
+    a float64 array in one pass over the points. Raises ValueError for
+    invalid JSON, anything but an array of objects, or a field value that
+    is not a number or null.
+
+    json.loads still builds a dict per point, which is dropped once the
+    columns exist. An object_pairs_hook that writes each pair straight into
+    preallocated columns measured 10-45% slower on a 20,000-point route: one
+    Python call per object costs more than the C dict it saves. It cut peak
+    memory by only a quarter, so the C tokenizer stays.
+    """
+    points = json.loads(text)
+    if not isinstance(points, list):
+        raise ValueError("route_json is not a JSON array")
+    if not all(type(point) is dict for point in points):
+        raise ValueError("route_json array does not contain point objects")
+    columns = {}
+    for field in ROUTE_FIELDS:
+        values = [point.get(field) for point in points]
+        types = set(map(type, values))
+        if not types <= _NUMBER_TYPES:
+            raise ValueError(f"route_json field {field!r} has a value that is not a number")
+        if type(None) in types:
+            values = [np.nan if value is None else value for value in values]
+        columns[field] = np.fromiter(values, dtype=np.float64, count=len(values))
+    return RouteColumns(**columns)
+
+
+# ═══ Packed storage format ═══
+# Schema version 2 stores each column as delta-encoded integers
+# (microdegrees, seconds, BPM, decimetres), zlib-compressed into a BSON
+# Binary. Missing values are forward-filled so their delta is zero and a
+# packed presence bitmap is stored next to the column.
+ROUTE_SCHEMA_VERSION = 2
+_PACK_SCALES = {"lat": 1e6, "lon": 1e6, "timestamp": 1, "hr": 1, "alt": 10}
+_PACK_DTYPE = np.dtype("<i8")
+
+
+def _forward_fill(values: np.ndarray, present: np.ndarray) -> np.ndarray:
+    index = np.where(present, np.arange(values.size), 0)
+    np.maximum.accumulate(index, out=index)
+    filled = values[index]
+    first = int(np.argmax(present))
+    filled[:first] = values[first]
+    return filled
+
+
+def pack_route(columns: RouteColumns) -> dict:
+    """Encode route columns into the compact storage document"""
+    n = len(columns)
+    packed = {"n": n}
+    masks = {}
+    for field, scale in _PACK_SCALES.items():
+        values = getattr(columns, field)
+        present = ~np.isnan(values)
+        if not present.any():
+            continue
+        if not present.all():
+            values = _forward_fill(values, present)
+            masks[field] = Binary(np.packbits(present).tobytes())
+        ints = np.round(values * scale).astype(_PACK_DTYPE)
+        deltas = np.diff(ints, prepend=_PACK_DTYPE.type(0))
+        packed[field] = Binary(zlib.compress(deltas.tobytes()))
+    if masks:
+        packed["masks"] = masks
+    return packed
+
+
+def unpack_route(packed: dict) -> RouteColumns:
+    """Decode a packed storage document back into route columns"""
+    n = int(packed.get("n", 0))
+    masks = packed.get("masks") or {}
+    columns = {}
+    for field, scale in _PACK_SCALES.items():
+        blob = packed.get(field)
+        if blob is None:
+            columns[field] = np.full(n, np.nan)
+            continue
+        deltas = np.frombuffer(zlib.decompress(blob), dtype=_PACK_DTYPE)
+        values = np.cumsum(deltas).astype(np.float64)
+        if scale != 1:
+            values /= scale
+        if field in masks:
+            present = np.unpackbits(np.frombuffer(masks[field], dtype=np.uint8), count=n).astype(bool)
+            values[~present] = np.nan
+        columns[field] = values
+    return RouteColumns(**columns)
+
+
+def dump_columns(columns: RouteColumns) -> dict:
+    """Exact float64 copy of the columns, for short-lived documents such as upload chunks"""
+    return {field: Binary(getattr(columns, field).tobytes()) for field in ROUTE_FIELDS}
+
+
+def load_columns(raw: dict) -> RouteColumns:
+    """Inverse of dump_columns"""
+    return RouteColumns(*(np.frombuffer(raw[field], dtype=np.float64).copy() for field in ROUTE_FIELDS))
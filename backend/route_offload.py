@@ -0,0 +1,116 @@
+"""Run CPU-heavy route work off the event loop.
+
+Long routes (parsing route_json, Haversine/elevation/splits over tens of
+thousands of points) are handed to a thread or process pool so one big
+upload does not stall every other request in the worker. Short routes
+run inline - the hand-off costs more than the work. Arguments are
+NumPy arrays or strings, which pickle as flat buffers for the process
+pool.
+
+ROUTE_OFFLOAD_MODE: "thread" (default), "process" or "off"
+ROUTE_OFFLOAD_MIN_POINTS: routes with fewer points run inline
+ROUTE_OFFLOAD_WORKERS: pool size
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+LATENCY_SAMPLES = 256
+
+
+def _timed_call(fn, args):
+    """Runs in the pool; reports when the work actually started"""
+    return time.time(), fn(*args)
+
+
+class RouteOffload:
+    def __init__(self, mode: str = "thread", min_points: int = 5000, workers: int = 2):
+        if mode not in ("thread", "process", "off"):
+            raise ValueError(f"Unknown route offload mode: {mode}")
+        self.mode = mode
+        self.min_points = min_points
+        self.workers = workers
+        self._executor = None
+        self.inline = 0
+        self.offloaded = 0
+        self.failed = 0
+        self.in_flight = 0
+        self._queue_wait_ms = deque(maxlen=LATENCY_SAMPLES)
+        self._run_ms = deque(maxlen=LATENCY_SAMPLES)
+
+    @classmethod
+    def from_env(cls) -> "RouteOffload":
+        return cls(
+            mode=os.environ.get('ROUTE_OFFLOAD_MODE', 'thread'),
+            min_points=int(os.environ.get('ROUTE_OFFLOAD_MIN_POINTS', '5000')),
+            workers=int(os.environ.get('ROUTE_OFFLOAD_WORKERS', '2')),
+        )
+
+    def start(self):
+        if self._executor is not None or self.mode == "off":
+            return
+        if self.mode == "process":
+            # spawn, not fork: the parent has an event loop and DB client threads
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="route-offload")
+        logger.info(f"Route offload: {self.mode} pool with {self.workers} workers for routes >= {self.min_points} points")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def run(self, fn, *args, points: int):
+        """fn(*args), in the pool when the route has at least min_points points"""
+        if self._executor is None or points < self.min_points:
+            self.inline += 1
+            return fn(*args)
+
+        submitted = time.time()
+        self.in_flight += 1
+        try:
+            started, result = await asyncio.get_running_loop().run_in_executor(
+                self._executor, _timed_call, fn, args
+            )
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+        self.offloaded += 1
+        self._queue_wait_ms.append(max(0.0, started - submitted) * 1000)
+        self._run_ms.append((time.time() - started) * 1000)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "min_points": self.min_points,
+            "in_flight": self.in_flight,
+            "inline": self.inline,
+            "offloaded": self.offloaded,
+            "failed": self.failed,
+            "queue_wait_ms": _latency_summary(self._queue_wait_ms),
+            "run_ms": _latency_summary(self._run_ms),
+        }
+
+
+def _latency_summary(samples) -> dict:
+    """avg / p95 / max over the recent samples"""
+    if not samples:
+        return {"samples": 0}
+    ordered = sorted(samples)
+    return {
+        "samples": len(ordered),
+        "avg": round(sum(ordered) / len(ordered), 2),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+        "max": round(ordered[-1], 2),
+    }
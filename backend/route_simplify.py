@@ -0,0 +1,83 @@
+"""Multi-resolution route simplification (Douglas-Peucker).
+
+One Douglas-Peucker pass, down to the finest tolerance, records for every
+kept point the tolerance at which it would drop out. Each level is then a
+threshold on that array, so all levels cost the same as the finest one.
+Distances are measured in meters on a local equirectangular projection,
+which is accurate to well under a meter at workout scale.
+"""
+import numpy as np
+
+from route_metrics import EARTH_RADIUS_M
+
+# Tolerances in meters, finest first. 2 m follows the road, 32 m is a
+# thumbnail-sized outline.
+ROUTE_LEVEL_TOLERANCES_M = (2, 8, 32)
+# Routes this short are rendered raw; levels would barely be smaller
+ROUTE_LEVEL_MIN_POINTS = 500
+
+
+def _project_m(lat: np.ndarray, lon: np.ndarray):
+    """Local x/y in meters around the route's mean latitude"""
+    phi0 = np.radians(np.mean(lat))
+    x = np.radians(lon) * EARTH_RADIUS_M * np.cos(phi0)
+    y = np.radians(lat) * EARTH_RADIUS_M
+    return x, y
+
+
+def dp_importance(lat, lon, min_tolerance_m: float) -> np.ndarray:
+    """Tolerance (m) at which each point drops out of the simplified route.
+
+    Endpoints are inf. Points below min_tolerance_m are 0 - the recursion
+    stops there, so the cost is proportional to what the finest level keeps.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    n = lat.size
+    importance = np.zeros(n)
+    if n == 0:
+        return importance
+    importance[0] = importance[-1] = np.inf
+    if n < 3:
+        return importance
+
+    x, y = _project_m(lat, lon)
+    stack = [(0, n - 1, np.inf)]
+    while stack:
+        first, last, bound = stack.pop()
+        if last - first < 2:
+            continue
+        dx = x[last] - x[first]
+        dy = y[last] - y[first]
+        px = x[first + 1:last] - x[first]
+        py = y[first + 1:last] - y[first]
+        length = np.hypot(dx, dy)
+        if length > 0:
+            distances = np.abs(px * dy - py * dx) / length
+        else:
+            distances = np.hypot(px, py)  # closed loop: distance from the start point
+        offset = int(np.argmax(distances))
+        distance = float(distances[offset])
+        if distance <= min_tolerance_m:
+            continue
+        split = first + 1 + offset
+        # A point only survives a tolerance if every ancestor split did too
+        importance[split] = min(distance, bound)
+        stack.append((first, split, importance[split]))
+        stack.append((split, last, importance[split]))
+    return importance
+
+
+def simplify_levels(lat, lon, tolerances=ROUTE_LEVEL_TOLERANCES_M):
+    """[(tolerance_m, indices), ...] of kept points per tolerance, finest first.
+
+    Only points with GPS take part; indices refer to the full route.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    gps_index = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+    tolerances = sorted(tolerances)
+    if gps_index.size == 0 or not tolerances:
+        return []
+    importance = dp_importance(lat[gps_index], lon[gps_index], tolerances[0])
+    return [(tolerance, gps_index[importance > tolerance]) for tolerance in tolerances]
@@ -0,0 +1,60 @@
+"""Run a backfill job over every workout, resuming from its checkpoint.
+
+Usage (from backend/, with the same .env as the server):
+    python run_backfill.py                      # list jobs and their checkpoints
+    python run_backfill.py <job> [--batch-size 500] [--concurrency 2]
+                                 [--rate DOCS_PER_SEC] [--dry-run] [--restart]
+
+Jobs: distance, elevation, rollups, tracks. Ctrl-C stops after the
+in-flight batches; the next run picks up from the checkpoint.
+"""
+import argparse
+import asyncio
+
+import server
+
+
+def print_report(report):
+    eta = f", ETA {report['eta_sec']}s" if report.get("eta_sec") is not None else ""
+    print(f"{report['job']:<10} {report.get('status') or 'never run':<10} "
+          f"{report.get('scanned', 0)}/{report.get('total', '?')} scanned, {report.get('updated', 0)} changed"
+          f"{', ' + str(report['docs_per_sec']) + ' docs/s' if report.get('docs_per_sec') else ''}{eta}")
+
+
+async def watch(job):
+    while server.backfill_runner.running(job):
+        await asyncio.sleep(5)
+        for report in await server.backfill_runner.status():
+            if report["job"] == job:
+                print_report(report)
+
+
+async def main(args):
+    runner = server.backfill_runner
+    try:
+        if not args.job:
+            for report in await runner.status():
+                print_report(report)
+            return
+        task = runner.start(args.job, batch_size=args.batch_size, concurrency=args.concurrency,
+                            rate=args.rate, dry_run=args.dry_run, restart=args.restart)
+        progress = asyncio.create_task(watch(args.job))
+        try:
+            print_report(await asyncio.shield(task))
+        except asyncio.CancelledError:
+            runner.stop(args.job)
+            print_report(await task)
+        progress.cancel()
+    finally:
+        server.db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checkpointed backfill over the workouts collection")
+    parser.add_argument("job", nargs="?", choices=sorted(server.backfill_runner.jobs))
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--rate", type=float, default=None, help="max workouts per second")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start from the beginning")
+    asyncio.run(main(parser.parse_args()))
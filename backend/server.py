@@ -1,21 +1,48 @@
-from fastapi import FastAPI, APIRouter
-from fastapi.responses import FileResponse, JSONResponse, HTMLResponse
+from fastapi import FastAPI, APIRouter, Depends, Header, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, HTMLResponse, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
 from typing import List, Optional
 import uuid
-from datetime import datetime, timezone
+from datetime import date, datetime, timedelta, timezone
 import zipfile
 import io
+import asyncio
 import tempfile
 import shutil
 import hashlib
+import hmac
 import json
+import time
+import base64
+import functools
+
+import bson
+import numpy as np
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReplaceOne, ReturnDocument, UpdateOne
+from gridfs.errors import NoFile
+from pymongo.errors import DocumentTooLarge, DuplicateKeyError, OperationFailure
+
+from backfill import BackfillJob, BackfillRunner
+from compression import CompressionMiddleware, Compressor, negotiate
+from page_cache import PageCache
+from markupsafe import escape
+from page_templates import PageTemplates
+from static_assets import ImmutableStaticFiles, StaticAssets
+from route_columns import (ROUTE_SCHEMA_VERSION, RouteColumns, dump_columns, load_columns, pack_route,
+                           parse_route_json, unpack_route)
+from route_metrics import compute_route_metrics, summarize_route
+from repositories import (INLINE_TRACKS, LEGACY_ROUTE_QUERY, LEGACY_ROUTES, LEGACY_TIMESTAMPS, PERIOD_SORT,
+                          PROCESSING_DONE, PROCESSING_FAILED, PROCESSING_PENDING, STORED_TRACKS, TIME_SORT,
+                          TRACK_FIELDS, page_filter)
+from route_offload import RouteOffload
+from route_simplify import ROUTE_LEVEL_MIN_POINTS, simplify_levels
+from storage import storage_from_env
+from workout_pipeline import WorkoutPipeline
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -68,6 +95,8 @@ TRANSLATIONS = {
     "total_time": ["Total time", "זמן כולל", "Tiempo total", "Temps total", "Gesamtzeit", "总时间"],
     "per_workout": ["per workout", "לאימון", "por entrenamiento", "par entraînement", "pro Training", "每次训练"],
     "route": ["Route", "מסלול", "Ruta", "Parcours", "Strecke", "路线"],
+    "load_more": ["Load more", "טען עוד", "Cargar más", "Charger plus", "Mehr laden", "加载更多"],
+    "processing": ["Still processing - refresh in a moment for route stats", "עדיין בעיבוד - רעננו בעוד רגע לנתוני המסלול", "Procesando - actualiza en un momento para ver la ruta", "Traitement en cours - actualisez dans un instant", "Wird verarbeitet - gleich neu laden für Streckendaten", "处理中 - 稍后刷新查看路线数据"],
     "no_route": ["No GPS data", "אין נתוני GPS", "Sin datos GPS", "Pas de données GPS", "Keine GPS-Daten", "无GPS数据"],
     "meters": ["m", "מ'", "m", "m", "m", "米"],
     "spm": ["spm", "צ'/דק'", "ppm", "ppm", "spm", "步/分"],
@@ -133,10 +162,12 @@ def is_rtl(lang):
     """Check if language is right-to-left"""
     return lang == 1  # Hebrew
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Storage: MongoDB, or in memory with STORAGE_BACKEND=memory for hermetic
+# benchmarks and tests (see storage.py). Workouts, users, status checks and
+# simulator state go through repo (see repositories.py); the other
+# collections keep the Motor API.
+db = storage_from_env()
+repo = db.repositories()
 
 # Create the main app without a prefix
 app = FastAPI()
@@ -144,6 +175,18 @@ app = FastAPI()
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+# Admin, migration, dedupe and backfill endpoints need an X-Admin-Token
+# header matching ADMIN_TOKEN; with ADMIN_TOKEN unset they are disabled.
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+async def require_admin(x_admin_token: str = Header("")):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=503, detail="Admin endpoints are disabled (ADMIN_TOKEN is not set)")
+    if not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+admin_router = APIRouter(prefix="/api", dependencies=[Depends(require_admin)])
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -207,6 +250,7 @@ class WorkoutSubmit(BaseModel):
     route_json: Optional[str] = None  # JSON string from watch (Garmin array bug workaround)
     lang: Optional[int] = 0  # Language: 0=EN, 1=HE, 2=ES, 3=FR, 4=DE, 5=ZH
     local_time: Optional[str] = None  # Local time from watch (ISO format)
+    idempotency_key: Optional[str] = None  # Client key; replays return the original workout
 
 class WorkoutSummary(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -226,9 +270,248 @@ class WorkoutSummary(BaseModel):
     elevation_loss: Optional[float] = None  # Legacy
     steps: Optional[int] = None
     cadence: Optional[int] = None
-    route: Optional[List[dict]] = None
-    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    route: Optional[List[dict]] = None  # Legacy: route_v 1 (one sub-document per point)
+    route_v: Optional[int] = None  # Route storage schema version
+    route_packed: Optional[dict] = None  # route_v 2: packed delta-encoded columns
+    route_levels: Optional[List[dict]] = None  # Simplified copies of route_packed, finest first
+    track_store: Optional[str] = None  # Where route/elevation live: "collection", "gridfs", or inline when absent
+    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))  # Watch local time or server UTC, stored without offset (wall_clock)
+    local_date: Optional[str] = None  # YYYY-MM-DD of timestamp, for year/month range filters
     lang: int = 0  # Language preference
+    idempotency_key: Optional[str] = None  # Unique per user - one document per submitted workout
+    processing_status: Optional[str] = None  # pending until the pipeline fills in derived fields (then processed or failed); None on older workouts
+    splits: Optional[List[int]] = None  # Seconds per full km, from the route
+    version: int = 1  # Bumped by every write that changes the rendered page; 0 when absent
+
+# Leaflet on a phone can't show more distinct vertices than this
+ROUTE_RENDER_MAX_POINTS = 1000
+
+def pick_route_level(workout, max_points: int) -> Optional[dict]:
+    """Most detailed simplified level with at most max_points points (coarsest if none fit).
+
+    None when the raw route already fits or there are no levels.
+    """
+    levels = workout.get('route_levels')
+    if not levels or workout['route_packed']['n'] <= max_points:
+        return None
+    for level in levels:
+        if level['n'] <= max_points:
+            return level
+    return levels[-1]
+
+def workout_route_columns(workout, max_points: Optional[int] = None) -> Optional[RouteColumns]:
+    """Decode a stored workout's route into columns (packed or legacy format).
+
+    With max_points, a simplified level is decoded instead when the route is longer.
+    """
+    if not workout:
+        return None
+    if workout.get('route_v') == ROUTE_SCHEMA_VERSION and workout.get('route_packed'):
+        level = pick_route_level(workout, max_points) if max_points else None
+        return unpack_route(level['route_packed'] if level else workout['route_packed'])
+    if workout.get('route'):
+        return RouteColumns.from_points(workout['route'])
+    return None
+
+# List pages only sum and show these - never the route, its levels or elevation_json
+WORKOUT_SUMMARY_FIELDS = (
+    "id", "user_id", "user_name", "device_id",
+    "distance_cm", "duration_sec", "avg_hr", "min_hr", "max_hr",
+    "total_ascent", "total_descent", "elevation_gain", "elevation_loss",
+    "steps", "cadence", "timestamp", "local_date", "lang", "processing_status",
+)
+
+def wall_clock(timestamp: datetime) -> datetime:
+    """The stored form of a workout time: its clock reading, without the UTC offset.
+
+    An offset-aware watch time keeps the hour the watch showed (server UTC
+    times read the same either way). timestamp and local_date are both taken
+    from this value, so a workout near midnight lands in the same day and
+    month whichever of them a query reads.
+    """
+    return timestamp.replace(tzinfo=None)
+
+def workout_time_str(workout) -> str:
+    """Workout timestamp as an ISO string (BSON date, or a legacy ISO string before migration)"""
+    timestamp = workout.get('timestamp') or ''
+    if isinstance(timestamp, datetime):
+        return timestamp.isoformat()
+    return timestamp
+
+def local_date_period(year, month=None) -> Optional[tuple]:
+    """(start, end) local_date range of a calendar year or month; None if year/month are not valid"""
+    try:
+        year = int(year)
+        if month is None:
+            start, end = date(year, 1, 1), date(year + 1, 1, 1)
+        else:
+            month = int(month)
+            start = date(year, month, 1)
+            end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    except (TypeError, ValueError):
+        return None
+    return start.isoformat(), end.isoformat()
+
+# ═══ Keyset pagination ═══
+# Listings page newest first on (timestamp, id). The continuation token is the
+# last row's key, so each page is one bounded range read on the
+# (user_id, [local_date,] timestamp, id) index however long the history is.
+# Rows still carrying a legacy string timestamp need /workout/migrate-timestamps.
+WORKOUT_PAGE_SIZE = 50
+WORKOUT_PAGE_MAX = 200
+
+def encode_page_token(workout) -> str:
+    """Opaque continuation token for the rows after this one"""
+    key = json.dumps([workout_time_str(workout), workout.get('id', '')])
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip("=")
+
+def page_after(token: str) -> Optional[tuple]:
+    """(timestamp, id) key of the row a continuation token continues after; None if the token is invalid"""
+    try:
+        timestamp, workout_id = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        timestamp = datetime.fromisoformat(timestamp)
+    except (ValueError, TypeError):
+        return None
+    return timestamp, str(workout_id)
+
+async def fetch_workout_page(user_id: str, fields=WORKOUT_SUMMARY_FIELDS, after: Optional[tuple] = None,
+                             period: Optional[tuple] = None, limit: int = WORKOUT_PAGE_SIZE):
+    """(workouts, next_token) for one page; next_token is None on the last page"""
+    limit = max(1, min(limit, WORKOUT_PAGE_MAX))
+    workouts = await repo.workouts.page(user_id, limit + 1, fields, after=after, period=period)
+    if len(workouts) > limit:
+        return workouts[:limit], encode_page_token(workouts[limit - 1])
+    return workouts, None
+
+def workout_elevation_json(workout, columns=None) -> Optional[str]:
+    """Elevation history for the graph - stored value or decoded from route altitudes"""
+    if workout.get('elevation_json'):
+        return workout['elevation_json']
+    if columns is None:
+        columns = workout_route_columns(workout)
+    if columns is not None:
+        altitudes = columns.altitudes()
+        if altitudes.size > 1:
+            return json.dumps(altitudes.tolist())
+    return None
+
+def workout_for_api(workout, max_points: Optional[int] = None):
+    """Expand a packed route so JSON responses keep the route list shape"""
+    if not workout:
+        return workout
+    workout = dict(workout)
+    workout.pop('track_store', None)
+    if 'route_packed' not in workout:
+        return workout
+    columns = workout_route_columns(workout, max_points)
+    workout.pop('route_packed')
+    workout.pop('route_levels', None)
+    workout['route'] = columns.to_points() if columns is not None else None
+    workout['elevation_json'] = workout_elevation_json(workout, columns)
+    return workout
+
+# ═══ Track storage: route and elevation outside the workout summary ═══
+# The workouts collection keeps summary fields only; the route (packed and
+# simplified levels) and elevation graph live in workout_tracks under the
+# workout id, and packed routes of TRACK_GRIDFS_MIN_BYTES or more go to
+# GridFS. A workout's track_store field says where its track is - without
+# it the track is still inline (not migrated yet). Only the single-workout
+# page, the JSON export endpoints and the fix jobs load tracks.
+TRACK_GRIDFS_BUCKET = "workout_tracks"
+TRACK_GRIDFS_MIN_BYTES = 1024 * 1024
+
+def track_bucket():
+    return db.track_bucket(TRACK_GRIDFS_BUCKET)
+
+def split_track_fields(doc: dict):
+    """(summary fields, non-empty track fields) of a workout document"""
+    summary = {k: v for k, v in doc.items() if k not in TRACK_FIELDS}
+    track = {k: doc[k] for k in TRACK_FIELDS if doc.get(k) is not None}
+    return summary, track
+
+async def store_track(workout_id: str, track: dict) -> Optional[str]:
+    """Write a workout's track; returns its track_store value (None if there is no track)"""
+    if not track:
+        return None
+    track = dict(track)
+    store = "collection"
+    if track.get('route_packed') is not None:
+        encoded = bson.encode(track['route_packed'])
+        if len(encoded) >= TRACK_GRIDFS_MIN_BYTES:
+            bucket = track_bucket()
+            try:
+                await bucket.delete(workout_id)
+            except NoFile:
+                pass
+            await bucket.upload_from_stream_with_id(workout_id, f"{workout_id}.route", encoded)
+            del track['route_packed']
+            store = "gridfs"
+    await db.workout_tracks.replace_one({"_id": workout_id}, track, upsert=True)
+    return store
+
+async def store_new_workout_track(doc: dict) -> dict:
+    """Move a new workout document's track out to track storage; returns the summary document"""
+    doc, track = split_track_fields(doc)
+    doc['track_store'] = await store_track(doc['id'], track)
+    if doc['track_store'] is None:
+        del doc['track_store']
+    return doc
+
+async def load_tracks(workouts: list) -> list:
+    """Merge stored tracks back into workout dicts, one query for the whole list"""
+    ids = [w['id'] for w in workouts if w and w.get('track_store')]
+    if not ids:
+        return workouts
+    tracks = {t.pop('_id'): t for t in await db.workout_tracks.find({"_id": {"$in": ids}}).to_list(None)}
+    for workout in workouts:
+        if not workout or not workout.get('track_store'):
+            continue
+        track = tracks.get(workout['id'], {})
+        if workout['track_store'] == "gridfs":
+            try:
+                stream = await track_bucket().open_download_stream(workout['id'])
+                track['route_packed'] = bson.decode(await stream.read())
+            except NoFile:
+                logger.error(f"Track file missing from GridFS for workout {workout['id']}")
+        workout.update(track)
+    return workouts
+
+async def load_track(workout: Optional[dict]) -> Optional[dict]:
+    if workout:
+        await load_tracks([workout])
+    return workout
+
+async def delete_tracks(workouts: list):
+    """Remove the stored tracks of workouts (dicts with id and track_store)"""
+    stored = [w for w in workouts if w.get('track_store')]
+    if not stored:
+        return
+    await db.workout_tracks.delete_many({"_id": {"$in": [w['id'] for w in stored]}})
+    for workout in stored:
+        if workout['track_store'] == "gridfs":
+            try:
+                await track_bucket().delete(workout['id'])
+            except NoFile:
+                pass
+
+def split_workout_update(workout: dict, update: dict):
+    """(workouts update, workout_tracks update); track fields go to wherever the track is stored"""
+    if not workout.get('track_store'):
+        return update, {}
+    summary_update, track_update = {}, {}
+    for operator, fields in update.items():
+        for field, value in fields.items():
+            target = track_update if field in TRACK_FIELDS else summary_update
+            target.setdefault(operator, {})[field] = value
+    return summary_update, track_update
+
+async def update_workout_fields(workout: dict, update: dict):
+    """Apply an update to a workout, sending track fields to wherever its track is stored"""
+    summary_update, track_update = split_workout_update(workout, update)
+    if summary_update:
+        await repo.workouts.update(workout['id'], summary_update)
+    if track_update:
+        await db.workout_tracks.update_one({"_id": workout['id']}, track_update)
 
 def generate_user_id(device_id: str) -> str:
     """Generate a short unique user ID from device ID"""
@@ -249,12 +532,12 @@ async def create_status_check(input: StatusCheckCreate):
     status_obj = StatusCheck(**status_dict)
     doc = status_obj.model_dump()
     doc['timestamp'] = doc['timestamp'].isoformat()
-    _ = await db.status_checks.insert_one(doc)
+    await repo.status_checks.add(doc)
     return status_obj
 
 @api_router.get("/status", response_model=List[StatusCheck])
 async def get_status_checks():
-    status_checks = await db.status_checks.find({}, {"_id": 0}).to_list(1000)
+    status_checks = await repo.status_checks.list()
     for check in status_checks:
         if isinstance(check['timestamp'], str):
             check['timestamp'] = datetime.fromisoformat(check['timestamp'])
@@ -263,8 +546,8 @@ async def get_status_checks():
 @api_router.get("/workouts/recent")
 async def get_recent_workouts():
     """Get all recent workouts (for debugging)"""
-    workouts = await db.workouts.find({}, {"_id": 0}).sort("timestamp", -1).to_list(20)
-    return workouts
+    workouts = await repo.workouts.recent(20)
+    return [workout_for_api(w) for w in await load_tracks(workouts)]
 
 # FitBeat ZIP Download
 @api_router.get("/download/server-only")
@@ -380,7 +663,7 @@ async def download_insights_v474():
 @api_router.get("/fitbeat/state")
 async def get_fitbeat_state():
     """Get current FitBeat simulator state from DB"""
-    state = await db.fitbeat_state.find_one({"_id": "simulator"}, {"_id": 0})
+    state = await repo.simulator_state.get()
     if state is None:
         return FitBeatState().model_dump()
     return state
@@ -388,112 +671,134 @@ async def get_fitbeat_state():
 @api_router.post("/fitbeat/state")
 async def save_fitbeat_state(state: FitBeatState):
     """Save FitBeat simulator state to DB"""
-    await db.fitbeat_state.update_one(
-        {"_id": "simulator"},
-        {"$set": state.model_dump()},
-        upsert=True
-    )
+    await repo.simulator_state.save(state.model_dump())
     return {"status": "saved"}
 
 @api_router.post("/fitbeat/reset")
 async def reset_fitbeat_state():
     """Reset FitBeat simulator state"""
     default_state = FitBeatState()
-    await db.fitbeat_state.update_one(
-        {"_id": "simulator"},
-        {"$set": default_state.model_dump()},
-        upsert=True
-    )
+    await repo.simulator_state.save(default_state.model_dump())
     return {"status": "reset", "state": default_state.model_dump()}
 
 # ═══════════════════════════════════════════════════════════════
 # Workout Summary API - For sharing workouts via WhatsApp
 # ═══════════════════════════════════════════════════════════════
 
-@api_router.post("/workout")
-async def submit_workout(workout: WorkoutSubmit):
-    """Receive workout data from watch and save to DB"""
+class WorkoutBatchSubmit(BaseModel):
+    workouts: List[WorkoutSubmit] = Field(..., min_length=1, max_length=100)
+
+# ═══ Device registry: device_id -> current user_id ═══
+# The devices collection holds one document per device. Lookups are cached
+# in-process; an entry only short-circuits when it matches the incoming
+# user_id, so a stale entry costs one extra point read, never a missed move.
+DEVICE_CACHE_TTL_SEC = 300
+DEVICE_CACHE_MAX_ENTRIES = 10000
+_device_user_cache = {}  # device_id -> (user_id, expires_at)
+
+def _cache_device_user(device_id: str, user_id: str):
+    if len(_device_user_cache) >= DEVICE_CACHE_MAX_ENTRIES:
+        _device_user_cache.clear()
+    _device_user_cache[device_id] = (user_id, time.monotonic() + DEVICE_CACHE_TTL_SEC)
+
+async def migrate_device_workouts(device_id: str, user_id: str):
+    """v4.7.9: Move workouts recorded on a device to the device's current user_id.
     
-    # ═══ v4.7.9: DEVICE ID MIGRATION ═══
-    # If device_id is provided, check for old workouts from same device with different user_id
-    # and migrate them to the new user_id
-    if workout.device_id and workout.device_id.strip():
-        device_id = workout.device_id.strip()
-        
-        # Find workouts from this device with different user_id
-        old_workouts = await db.workouts.find({
-            "device_id": device_id,
-            "user_id": {"$ne": workout.user_id}
-        }).to_list(1000)
-        
-        if old_workouts:
-            old_user_ids = set(w.get('user_id') for w in old_workouts)
-            logger.info(f"Device migration: Found {len(old_workouts)} workouts from device {device_id} with old user_ids: {old_user_ids}")
-            
-            # Update all old workouts to new user_id
-            result = await db.workouts.update_many(
-                {"device_id": device_id},
-                {"$set": {"user_id": workout.user_id}}
-            )
-            logger.info(f"Device migration: Updated {result.modified_count} workouts to new user_id {workout.user_id}")
-    
-    # Parse route from either route array or route_json string
-    route_data = None
+    Workouts are only rewritten when the registered user for the device changes
+    (or the device is seen for the first time since the registry was added).
+    """
+    cached = _device_user_cache.get(device_id)
+    if cached and cached[0] == user_id and cached[1] > time.monotonic():
+        return
+    
+    mapping = await db.devices.find_one({"_id": device_id}, {"user_id": 1})
+    if mapping and mapping.get("user_id") == user_id:
+        _cache_device_user(device_id, user_id)
+        return
+    
+    old_user_id = mapping.get("user_id") if mapping else None
+    # Update all old workouts to new user_id, moving their rollup totals along
+    moving = await repo.workouts.move_device(device_id, user_id, ROLLUP_WORKOUT_FIELDS)
+    if moving:
+        await update_rollups([(w, -1) for w in moving] + [({**w, "user_id": user_id}, 1) for w in moving])
+        logger.info(f"Device migration: Updated {len(moving)} workouts from device {device_id} (old user_id: {old_user_id}) to new user_id {user_id}")
+    
+    await db.devices.update_one(
+        {"_id": device_id},
+        {"$set": {"user_id": user_id, "updated_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    _cache_device_user(device_id, user_id)
+
+def parse_submitted_route(workout) -> Optional[RouteColumns]:
+    """Read the route from either the route array or the route_json string"""
+    route_columns = None
     if workout.route:
-        route_data = [p.model_dump() for p in workout.route]
+        route_columns = RouteColumns.from_points(workout.route)
     elif workout.route_json and workout.route_json.strip():
         # Parse JSON string from watch (Garmin array bug workaround)
         try:
-            route_data = json.loads(workout.route_json)
-            logger.info(f"Parsed route_json with {len(route_data)} points")
+            route_columns = parse_route_json(workout.route_json)
+            logger.info(f"Parsed route_json with {len(route_columns)} points")
         except Exception as e:
             logger.warning(f"Failed to parse route_json: {e}")
-            route_data = None
-    
-    # ═══ v4.7.5: Extract elevation from route points ═══
-    elevation_json_from_route = None
-    total_ascent_calc = 0
-    total_descent_calc = 0
-    distance_from_route_cm = 0
-    
-    if route_data and len(route_data) > 0:
-        # Check if route has altitude data
-        altitudes = [p.get('alt') for p in route_data if p.get('alt') is not None]
-        if altitudes and len(altitudes) > 1:
-            elevation_json_from_route = json.dumps(altitudes)
-            logger.info(f"Extracted {len(altitudes)} altitude points from route")
-            
-            # Calculate ascent/descent from altitude data
-            for i in range(1, len(altitudes)):
-                diff = altitudes[i] - altitudes[i-1]
-                if diff > 0.5:  # Filter noise
-                    total_ascent_calc += diff
-                elif diff < -0.5:
-                    total_descent_calc += abs(diff)
-            logger.info(f"Calculated elevation: +{total_ascent_calc:.0f}m / -{total_descent_calc:.0f}m")
-        
-        # ═══ v4.7.6: Calculate distance from route using Haversine ═══
-        import math
-        def haversine(lat1, lon1, lat2, lon2):
-            R = 6371000  # Earth radius in meters
-            phi1, phi2 = math.radians(lat1), math.radians(lat2)
-            dphi = math.radians(lat2 - lat1)
-            dlambda = math.radians(lon2 - lon1)
-            a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
-            return 2 * R * math.atan2(math.sqrt(a), math.sqrt(1-a))
-        
-        for i in range(1, len(route_data)):
-            p1, p2 = route_data[i-1], route_data[i]
-            if 'lat' in p1 and 'lon' in p1 and 'lat' in p2 and 'lon' in p2:
-                segment_m = haversine(p1['lat'], p1['lon'], p2['lat'], p2['lon'])
-                distance_from_route_cm += int(segment_m * 100)
-        logger.info(f"Calculated distance from route: {distance_from_route_cm/100000:.2f} km")
-    
-    # Use route distance if provided distance seems wrong (less than 10% of route distance)
-    final_distance_cm = workout.distance_cm
-    if distance_from_route_cm > 0 and workout.distance_cm < distance_from_route_cm * 0.1:
-        logger.warning(f"Distance mismatch! Provided: {workout.distance_cm/100000:.2f}km, Route: {distance_from_route_cm/100000:.2f}km. Using route distance.")
-        final_distance_cm = distance_from_route_cm
+            route_columns = None
+    return route_columns
+
+async def read_submitted_route(workout) -> Optional[RouteColumns]:
+    """parse_submitted_route, with long route_json strings parsed in the route offload pool"""
+    text = workout.route_json
+    if workout.route or not (text and text.strip()):
+        return parse_submitted_route(workout)
+    try:
+        route_columns = await route_offload.run(parse_route_json, text, points=text.count("{"))
+        logger.info(f"Parsed route_json with {len(route_columns)} points")
+        return route_columns
+    except Exception as e:
+        logger.warning(f"Failed to parse route_json: {e}")
+        return None
+
+def workout_idempotency_key(workout: WorkoutSubmit) -> Optional[str]:
+    """Client idempotency key, or one derived from device_id plus the workout start time"""
+    if workout.idempotency_key and workout.idempotency_key.strip():
+        return f"client:{workout.idempotency_key.strip()}"
+    if not (workout.device_id and workout.device_id.strip() and workout.local_time and workout.local_time.strip()):
+        return None
+    try:
+        end_time = datetime.fromisoformat(workout.local_time)
+    except ValueError:
+        return None
+    start_time = end_time - timedelta(seconds=workout.duration_sec)
+    return f"device:{workout.device_id.strip()}:{start_time.isoformat()}"
+
+async def find_workout_by_key(user_id: str, idempotency_key: Optional[str]) -> Optional[str]:
+    """workout_id a user already saved under an idempotency key, if any (keys are per user)"""
+    if not idempotency_key:
+        return None
+    return await repo.workouts.find_id_by_key(user_id, idempotency_key)
+
+async def insert_workout_once(doc: dict) -> Optional[str]:
+    """Insert a workout document; returns the original workout_id if its key was already saved"""
+    try:
+        await repo.workouts.insert(doc)
+    except DuplicateKeyError:
+        # Lost a race with a concurrent replay of the same workout
+        existing_id = await find_workout_by_key(doc['user_id'], doc.get("idempotency_key"))
+        if existing_id:
+            return existing_id
+        raise
+    return None
+
+def build_workout_doc(workout: WorkoutSubmit, route_columns: Optional[RouteColumns] = None) -> dict:
+    """Turn a watch submission into a workout document as received (processing_status: pending).
+
+    The route is parsed and packed here so it is stored compactly; everything
+    derived from it is filled in later by the workout pipeline.
+    """
+    # Parse route from either route array or route_json string into columns
+    if route_columns is None:
+        route_columns = parse_submitted_route(workout)
+    route_point_count = len(route_columns) if route_columns is not None else 0
     
     # Use local time from watch if provided, otherwise use server time
     timestamp = datetime.now(timezone.utc)
@@ -506,221 +811,999 @@ async def submit_workout(workout: WorkoutSubmit):
             logger.warning(f"Failed to parse local_time '{workout.local_time}': {e}, using server time")
             timestamp = datetime.now(timezone.utc)
     
-    # v4.7.5: Use elevation from route if available, fallback to workout fields
-    elevation_json_final = workout.elevation_json or elevation_json_from_route
-    elevation_gain = workout.total_ascent or (int(total_ascent_calc) if total_ascent_calc > 0 else None) or workout.elevation_gain
-    elevation_loss = workout.total_descent or (int(total_descent_calc) if total_descent_calc > 0 else None) or workout.elevation_loss
-    
+    # Route altitudes are decoded from the packed route on read, so only an
+    # explicit elevation_json from the watch is stored
     workout_obj = WorkoutSummary(
         user_id=workout.user_id,
         user_name=workout.user_name,
         device_id=workout.device_id if workout.device_id else None,
-        distance_cm=final_distance_cm,
+        distance_cm=workout.distance_cm,
         duration_sec=workout.duration_sec,
         avg_hr=workout.avg_hr if workout.avg_hr and workout.avg_hr > 0 else None,
         min_hr=workout.min_hr if workout.min_hr and workout.min_hr > 0 else None,
         max_hr=workout.max_hr if workout.max_hr and workout.max_hr > 0 else None,
-        total_ascent=int(elevation_gain) if elevation_gain else None,
-        total_descent=int(elevation_loss) if elevation_loss else None,
-        elevation_json=elevation_json_final,
-        elevation_gain=elevation_gain,
-        elevation_loss=elevation_loss,
+        total_ascent=workout.total_ascent or None,
+        total_descent=workout.total_descent or None,
+        elevation_json=workout.elevation_json or None,
+        elevation_gain=workout.elevation_gain,
+        elevation_loss=workout.elevation_loss,
         steps=workout.steps if workout.steps and workout.steps > 0 else None,
         cadence=workout.cadence if workout.cadence and workout.cadence > 0 else None,
-        route=route_data,
-        timestamp=timestamp
+        route_v=ROUTE_SCHEMA_VERSION if route_point_count > 0 else None,
+        route_packed=pack_route(route_columns) if route_point_count > 0 else None,
+        processing_status=PROCESSING_PENDING,
+        timestamp=wall_clock(timestamp)
     )
     
     doc = workout_obj.model_dump()
-    doc['timestamp'] = doc['timestamp'].isoformat()
-    await db.workouts.insert_one(doc)
+    doc['local_date'] = doc['timestamp'].strftime("%Y-%m-%d")
+    doc['idempotency_key'] = workout_idempotency_key(workout)
+    if doc['idempotency_key'] is None:
+        # Keep the field absent so the partial unique index ignores it
+        del doc['idempotency_key']
+    return doc
+
+def derive_workout_fields(workout: dict, route_summary: Optional[dict] = None) -> dict:
+    """Compute the route-derived fields (distance, elevation, splits) for a stored workout.
+
+    route_summary is summarize_route() over the workout's route, or None without one.
+    """
+    # ═══ v4.7.5: Extract elevation from route points ═══
+    # ═══ v4.7.6: Calculate distance from route using Haversine ═══
+    total_ascent_calc = 0
+    total_descent_calc = 0
+    distance_from_route_cm = 0
+    splits = []
+    
+    if route_summary and route_summary["point_count"] > 0:
+        if route_summary["altitude_count"] > 1:
+            total_ascent_calc = route_summary["total_ascent"]
+            total_descent_calc = route_summary["total_descent"]
+            logger.info(f"Extracted {route_summary['altitude_count']} altitude points from route")
+            logger.info(f"Calculated elevation: +{total_ascent_calc:.0f}m / -{total_descent_calc:.0f}m")
+        
+        distance_from_route_cm = route_summary["distance_cm"]
+        logger.info(f"Calculated distance from route: {distance_from_route_cm/100000:.2f} km")
+        splits = route_summary["splits"]
+    
+    # Use route distance if provided distance seems wrong (less than 10% of route distance)
+    final_distance_cm = workout['distance_cm']
+    if distance_from_route_cm > 0 and final_distance_cm < distance_from_route_cm * 0.1:
+        logger.warning(f"Distance mismatch! Provided: {final_distance_cm/100000:.2f}km, Route: {distance_from_route_cm/100000:.2f}km. Using route distance.")
+        final_distance_cm = distance_from_route_cm
     
-    logger.info(f"Workout saved for user {workout.user_id} (device: {workout.device_id}): {workout.distance_cm}cm in {workout.duration_sec}s, route points: {len(route_data) if route_data else 0}, HR: {workout.min_hr}-{workout.max_hr}, elevation: +{workout.total_ascent}/-{workout.total_descent}")
+    # v4.7.5: Use elevation from route if available, fallback to workout fields
+    elevation_gain = workout.get('total_ascent') or (int(total_ascent_calc) if total_ascent_calc > 0 else None) or workout.get('elevation_gain')
+    elevation_loss = workout.get('total_descent') or (int(total_descent_calc) if total_descent_calc > 0 else None) or workout.get('elevation_loss')
+    
+    return {
+        "distance_cm": final_distance_cm,
+        "total_ascent": int(elevation_gain) if elevation_gain else None,
+        "total_descent": int(elevation_loss) if elevation_loss else None,
+        "elevation_gain": elevation_gain,
+        "elevation_loss": elevation_loss,
+        "splits": splits,
+    }
+
+# ═══ User rollups: per-user year and month totals ═══
+# One user_rollups document per (user, "YYYY") and (user, "YYYY-MM"). Every
+# write that adds, removes or changes a workout applies its difference with
+# $inc, so the dashboard and folder pages read a few rows instead of every
+# workout. rebuild_user_rollups() recomputes them from scratch.
+ROLLUP_FIELDS = ("count", "distance_cm", "duration_sec", "hr_sum", "hr_count", "elevation_gain", "elevation_loss", "steps")
+ROLLUP_WORKOUT_FIELDS = (
+    "user_id", "local_date", "timestamp", "distance_cm", "duration_sec",
+    "avg_hr", "elevation_gain", "elevation_loss", "steps",
+)
+
+def _rollup_values(workout: dict) -> dict:
+    avg_hr = workout.get('avg_hr') or 0
+    return {
+        "count": 1,
+        "distance_cm": workout.get('distance_cm') or 0,
+        "duration_sec": workout.get('duration_sec') or 0,
+        "hr_sum": avg_hr,
+        "hr_count": 1 if avg_hr else 0,
+        "elevation_gain": workout.get('elevation_gain') or 0,
+        "elevation_loss": workout.get('elevation_loss') or 0,
+        "steps": workout.get('steps') or 0,
+    }
+
+def _rollup_periods(workout: dict) -> List[str]:
+    local_date = workout.get('local_date') or workout_time_str(workout)[:10]
+    if len(local_date) < 7:
+        return []
+    return [local_date[:4], local_date[:7]]
+
+def _rollup_doc_fields(user_id: str, period: str) -> dict:
+    return {
+        "user_id": user_id,
+        "period": period,
+        "kind": "year" if len(period) == 4 else "month",
+        "year": int(period[:4]),
+        "month": int(period[5:7]) if len(period) > 4 else None,
+    }
+
+def accumulate_rollups(changes, totals: Optional[dict] = None) -> dict:
+    """Sum [(workout, +1 or -1), ...] into {(user_id, period): {field: delta}}"""
+    totals = {} if totals is None else totals
+    for workout, sign in changes:
+        values = _rollup_values(workout)
+        for period in _rollup_periods(workout):
+            bucket = totals.setdefault((workout.get('user_id'), period), dict.fromkeys(ROLLUP_FIELDS, 0))
+            for field, value in values.items():
+                bucket[field] += sign * value
+    return totals
+
+# ═══ User data versions ═══
+# One user_versions document per user, {_id: user_id, version}, bumped with
+# $inc after every workout insert, delete or fix has landed (all of which go
+# through update_rollups). Everything under /api/u/{user_id} is rendered from
+# that user's workouts and rollups, so the version is enough to validate an
+# ETag or a cached page.
+# Never reset or deleted: a recreated user must not reuse old ETags.
+async def user_data_version(user_id: str) -> int:
+    doc = await db.user_versions.find_one({"_id": user_id}, {"version": 1})
+    return doc.get("version", 0) if doc else 0
+
+async def bump_user_versions(user_ids):
+    ops = [UpdateOne({"_id": user_id}, {"$inc": {"version": 1}}, upsert=True) for user_id in set(user_ids) if user_id]
+    if ops:
+        await db.user_versions.bulk_write(ops, ordered=False)
+
+async def update_rollups(changes):
+    """Apply [(workout, +1 or -1), ...] to user_rollups in one unordered bulk write; bumps the users' data versions"""
+    ops = []
+    for (user_id, period), deltas in accumulate_rollups(changes).items():
+        deltas = {field: value for field, value in deltas.items() if value}
+        if not deltas:
+            continue
+        # New rows start every total at zero ($inc and $setOnInsert can't share a field)
+        zeros = {field: 0 for field in ROLLUP_FIELDS if field not in deltas}
+        ops.append(UpdateOne(
+            {"_id": f"{user_id}:{period}"},
+            {"$inc": deltas, "$setOnInsert": {**_rollup_doc_fields(user_id, period), **zeros}},
+            upsert=True
+        ))
+    if ops:
+        await db.user_rollups.bulk_write(ops, ordered=False)
+    # Last, so a version never covers less than what's stored
+    await bump_user_versions(workout.get('user_id') for workout, _ in changes)
+
+async def rebuild_user_rollups(user_id: Optional[str] = None) -> int:
+    """Recompute user_rollups from the workouts (one user or everyone); returns rows written.
+
+    Rows are replaced in place, so pages keep reading the old totals until
+    the new ones land. Each written row is tagged with the run's rebuild_id;
+    rows without it afterwards are periods no workout is left in, and are
+    deleted. Writes that race with a rebuild can be off until the next one.
+    """
+    totals = {}
+    async for workout in repo.workouts.iterate(user_id, fields=ROLLUP_WORKOUT_FIELDS, batch_size=1000):
+        accumulate_rollups([(workout, 1)], totals)
+    
+    rebuild_id = uuid.uuid4().hex
+    ops = []
+    for (rollup_user_id, period), values in totals.items():
+        ops.append(ReplaceOne(
+            {"_id": f"{rollup_user_id}:{period}"},
+            {**_rollup_doc_fields(rollup_user_id, period), **values, "rebuild_id": rebuild_id},
+            upsert=True
+        ))
+    for start in range(0, len(ops), 1000):
+        await db.user_rollups.bulk_write(ops[start:start + 1000], ordered=False)
+    await db.user_rollups.delete_many({**({"user_id": user_id} if user_id else {}), "rebuild_id": {"$ne": rebuild_id}})
+    if user_id:
+        await bump_user_versions([user_id])
+    else:
+        await db.user_versions.update_many({}, {"$inc": {"version": 1}})
+    logger.info(f"Rebuilt {len(ops)} rollup rows (user: {user_id or 'all'})")
+    return len(ops)
+
+def rollup_averages(rows) -> dict:
+    """Combine rollup rows into page totals"""
+    totals = dict.fromkeys(ROLLUP_FIELDS, 0)
+    for row in rows:
+        for field in ROLLUP_FIELDS:
+            totals[field] += row.get(field) or 0
+    totals["avg_hr"] = round(totals["hr_sum"] / totals["hr_count"]) if totals["hr_count"] else None
+    return totals
+
+# ═══ Workout pipeline: derived fields off the request path ═══
+# Submits store the workout as received and return; workers fill in the
+# route-derived fields and flip processing_status to processed, or to
+# failed (with processing_error) when that raises. Workouts still pending at
+# startup (e.g. after a crash) are queued again, as are ones turned away by a
+# full queue (checked every PIPELINE_SWEEP_SEC); failed ones are retried
+# through /admin/pipeline/retry-failed. (PROCESSING_* are in repositories.py.)
+PIPELINE_WORKERS = int(os.environ.get('WORKOUT_PIPELINE_WORKERS', '2'))
+PIPELINE_MAX_QUEUE = int(os.environ.get('WORKOUT_PIPELINE_MAX_QUEUE', '1000'))
+PIPELINE_DRAIN_TIMEOUT_SEC = 30
+PIPELINE_SWEEP_SEC = float(os.environ.get('WORKOUT_PIPELINE_SWEEP_SEC', '60'))
+
+# Long routes are summarized in a thread/process pool (see route_offload.py)
+route_offload = RouteOffload.from_env()
+
+async def summarize_route_columns(columns: Optional[RouteColumns]) -> Optional[dict]:
+    if columns is None or len(columns) == 0:
+        return None
+    return await route_offload.run(
+        summarize_route, columns.lat, columns.lon, columns.timestamp, columns.alt, points=len(columns)
+    )
+
+async def process_workout(workout_id: str, route_columns: Optional[RouteColumns] = None):
+    """Fill in the derived fields of a pending workout; marks it failed if that raises.
+
+    route_columns is the route as submitted, so results match the original
+    per-point loops exactly. Without it (re-queued after a restart, retried)
+    the stored route is decoded instead. Its coordinates are rounded to
+    microdegrees (about 0.1 m), so distance can drift by up to about 0.1% on
+    1 m GPS steps. Altitudes are rounded to decimetres, which only changes
+    ascent/descent for steps close to the 0.5 m noise threshold (see
+    tests/test_route_metrics.py).
+    """
+    workout = await repo.workouts.get(
+        workout_id,
+        ROLLUP_WORKOUT_FIELDS + ("id", "track_store", "route", "route_v", "route_packed", "total_ascent", "total_descent"),
+        status=PROCESSING_PENDING
+    )
+    if not workout:
+        return  # Already processed (re-queued twice) or deleted
+    try:
+        await _derive_workout(workout, route_columns)
+    except Exception as e:
+        failed = await repo.workouts.update(
+            workout_id,
+            {"$set": {"processing_status": PROCESSING_FAILED, "processing_error": f"{type(e).__name__}: {e}"[:500],
+                      "processed_at": datetime.now(timezone.utc).isoformat()},
+             "$inc": {"version": 1}},
+            status=PROCESSING_PENDING
+        )
+        if failed:
+            await bump_user_versions([workout.get('user_id')])
+        raise
+
+async def _derive_workout(workout: dict, columns: Optional[RouteColumns]):
+    workout_id = workout['id']
+    if columns is None:
+        await load_track(workout)
+        columns = workout_route_columns(workout)
+    fields = derive_workout_fields(workout, await summarize_route_columns(columns))
+    route_levels = await build_route_levels(columns)
+    if route_levels:
+        await update_workout_fields(workout, {"$set": {"route_levels": route_levels}})
+    fields["processing_status"] = PROCESSING_DONE
+    fields["processed_at"] = datetime.now(timezone.utc).isoformat()
+    if await repo.workouts.update(workout_id, {"$set": fields, "$inc": {"version": 1}}, status=PROCESSING_PENDING):
+        await update_rollups([(workout, -1), ({**workout, **fields}, 1)])
+
+async def build_route_levels(columns: Optional[RouteColumns]) -> Optional[List[dict]]:
+    """Douglas-Peucker simplified copies of a route for renderers (see route_simplify.py)"""
+    if columns is None or len(columns) < ROUTE_LEVEL_MIN_POINTS:
+        return None
+    levels = await route_offload.run(simplify_levels, columns.lat, columns.lon, points=len(columns))
+    route_levels = []
+    for tolerance_m, indices in levels:
+        if indices.size >= len(columns) or (route_levels and route_levels[-1]["n"] == indices.size):
+            continue
+        route_levels.append({
+            "tolerance_m": tolerance_m,
+            "n": int(indices.size),
+            "route_packed": pack_route(columns.take(indices))
+        })
+    return route_levels or None
+
+workout_pipeline = WorkoutPipeline(process_workout, workers=PIPELINE_WORKERS, max_queue=PIPELINE_MAX_QUEUE)
+
+async def schedule_workout_processing(workout_id: str, route_columns: Optional[RouteColumns] = None):
+    """Hand a saved workout (and its submitted route) to the pipeline.
+
+    When the pipeline is stopped or full the workout stays pending and the
+    pending sweep queues it later, so a burst (or retry-failed) never ends up
+    processing on the request path.
+    """
+    if not workout_pipeline.submit(workout_id, route_columns):
+        logger.warning(f"Workout pipeline unavailable or full, leaving {workout_id} pending for the sweep")
+
+async def requeue_pending_workouts() -> int:
+    """Queue every pending workout the pipeline doesn't already hold"""
+    count = 0
+    for workout_id in await repo.workouts.ids_with_status(PROCESSING_PENDING):
+        if workout_pipeline.holds(workout_id):
+            continue
+        await workout_pipeline.enqueue(workout_id)
+        count += 1
+    if count:
+        logger.info(f"Re-queued {count} pending workouts for processing")
+    return count
+
+pending_sweep: Optional[asyncio.Task] = None
+
+async def sweep_pending_workouts():
+    """Re-queue pending workouts at startup, then again whenever a full queue turned some away"""
+    workout_pipeline.overflowed = True
+    while workout_pipeline.running:
+        if workout_pipeline.overflowed:
+            workout_pipeline.overflowed = False
+            try:
+                await requeue_pending_workouts()
+            except Exception:
+                logger.exception("Pending workout sweep failed")
+        await asyncio.sleep(PIPELINE_SWEEP_SEC)
+
+def _route_point_count(doc: dict) -> int:
+    return doc['route_packed']['n'] if doc.get('route_packed') else 0
+
+def _log_workout_saved(workout: WorkoutSubmit, route_points: int):
+    logger.info(f"Workout saved for user {workout.user_id} (device: {workout.device_id}): {workout.distance_cm}cm in {workout.duration_sec}s, route points: {route_points}, HR: {workout.min_hr}-{workout.max_hr}, elevation: +{workout.total_ascent}/-{workout.total_descent}")
+
+@api_router.post("/workout")
+async def submit_workout(workout: WorkoutSubmit):
+    """Receive workout data from watch and save to DB"""
+    
+    # Replayed submit (watch retry or re-sync) - return the original, skip the route work
+    existing_id = await find_workout_by_key(workout.user_id, workout_idempotency_key(workout))
+    if existing_id:
+        logger.info(f"Duplicate submit for user {workout.user_id}, returning workout {existing_id}")
+        return {"status": "saved", "workout_id": existing_id, "user_id": workout.user_id, "duplicate": True}
+    
+    # ═══ v4.7.9: DEVICE ID MIGRATION ═══
+    # If device_id is provided, check for old workouts from same device with different user_id
+    # and migrate them to the new user_id
+    if workout.device_id and workout.device_id.strip():
+        await migrate_device_workouts(workout.device_id.strip(), workout.user_id)
+    
+    route_columns = await read_submitted_route(workout)
+    doc = build_workout_doc(workout, route_columns)
+    route_points = _route_point_count(doc)
+    doc = await store_new_workout_track(doc)
+    existing_id = await insert_workout_once(doc)
+    if existing_id:
+        await delete_tracks([doc])
+        return {"status": "saved", "workout_id": existing_id, "user_id": workout.user_id, "duplicate": True}
+    _log_workout_saved(workout, route_points)
+    await update_rollups([(doc, 1)])
+    await schedule_workout_processing(doc['id'], route_columns)
     
     return {
         "status": "saved",
-        "workout_id": workout_obj.id,
-        "user_id": workout.user_id
+        "workout_id": doc['id'],
+        "user_id": workout.user_id,
+        "processing_status": doc['processing_status']
+    }
+
+@api_router.post("/workouts/batch")
+async def submit_workouts_batch(batch: WorkoutBatchSubmit):
+    """Receive a backlog of workouts from the watch in one request and bulk insert them"""
+    results = [None] * len(batch.workouts)
+    # Keys are per user: (user_id, idempotency_key), None for workouts without one
+    keys = [(w.user_id, key) if key else None for w, key in zip(batch.workouts, map(workout_idempotency_key, batch.workouts))]
+    saved_ids = await repo.workouts.find_ids_by_keys(key for key in keys if key)
+    
+    docs = []
+    doc_points = []  # route point count for each doc
+    doc_routes = {}  # doc id -> submitted route, for the pipeline
+    doc_items = []  # index in batch.workouts for each doc
+    batch_keys = {}  # (user_id, idempotency_key) -> index of its first item in this batch
+    for index, workout in enumerate(batch.workouts):
+        key = keys[index]
+        if key in saved_ids:
+            results[index] = {"index": index, "status": "saved", "workout_id": saved_ids[key], "user_id": workout.user_id, "duplicate": True}
+            continue
+        if key and key in batch_keys:
+            continue  # Resolved after the insert, once the first copy has an id
+        if key:
+            batch_keys[key] = index
+        try:
+            route_columns = await read_submitted_route(workout)
+            doc = build_workout_doc(workout, route_columns)
+            doc_routes[doc['id']] = route_columns
+            doc_points.append(_route_point_count(doc))
+            docs.append(await store_new_workout_track(doc))
+            doc_items.append(index)
+        except Exception as e:
+            logger.warning(f"Batch item {index} failed processing: {e}")
+            results[index] = {"index": index, "status": "error", "error": str(e)}
+    
+    failed_docs = await repo.workouts.insert_many(docs) if docs else {}
+    
+    inserted_docs = []
+    for doc_index, (index, doc) in enumerate(zip(doc_items, docs)):
+        workout = batch.workouts[index]
+        write_error = failed_docs.get(doc_index)
+        if write_error:
+            await delete_tracks([doc])
+        if write_error and write_error.get("code") == 11000:
+            # Saved concurrently by another request with the same key
+            saved_ids[keys[index]] = await find_workout_by_key(*keys[index])
+            results[index] = {"index": index, "status": "saved", "workout_id": saved_ids[keys[index]], "user_id": workout.user_id, "duplicate": True}
+            continue
+        if write_error:
+            results[index] = {"index": index, "status": "error", "error": write_error.get("errmsg", "write failed")}
+            continue
+        _log_workout_saved(workout, doc_points[doc_index])
+        inserted_docs.append(doc)
+        saved_ids[keys[index]] = doc['id']
+        results[index] = {"index": index, "status": "saved", "workout_id": doc['id'], "user_id": workout.user_id}
+    
+    await update_rollups([(doc, 1) for doc in inserted_docs])
+    for doc in inserted_docs:
+        await schedule_workout_processing(doc['id'], doc_routes[doc['id']])
+    
+    # Repeats of a key inside the batch point at the copy that was saved
+    for index, workout in enumerate(batch.workouts):
+        if results[index] is None:
+            first = results[batch_keys[keys[index]]]
+            results[index] = dict(first, index=index, duplicate=True) if first["status"] == "saved" else dict(first, index=index)
+    
+    # ═══ v4.7.9: DEVICE ID MIGRATION ═══
+    # Once per device, after the insert, so the device's last user_id in the
+    # batch wins - the same end state as submitting the workouts one by one
+    device_users = {}
+    for workout in batch.workouts:
+        if workout.device_id and workout.device_id.strip():
+            device_users[workout.device_id.strip()] = workout.user_id
+    for device_id, user_id in device_users.items():
+        await migrate_device_workouts(device_id, user_id)
+    
+    saved_count = sum(1 for r in results if r["status"] == "saved")
+    logger.info(f"Batch upload: {saved_count}/{len(results)} workouts saved, {len(device_users)} devices")
+    return {
+        "status": "saved" if saved_count == len(results) else "partial",
+        "saved_count": saved_count,
+        "results": results
+    }
+
+@admin_router.post("/workout/dedupe")
+async def dedupe_workouts(user_id: Optional[str] = None, dry_run: bool = True):
+    """One-off cleanup of duplicate workouts saved before idempotency keys existed.
+    
+    Workouts with the same user, device, time, distance and duration are copies of
+    one upload; the first saved copy is kept.
+    """
+    duplicate_groups = await repo.workouts.duplicate_groups(user_id)
+    groups = len(duplicate_groups)
+    duplicate_ids = [workout_id for ids in duplicate_groups for workout_id in ids[1:]]
+    
+    deleted_count = 0
+    if duplicate_ids and not dry_run:
+        removed = await repo.workouts.delete_ids(duplicate_ids, ROLLUP_WORKOUT_FIELDS + ("id", "track_store"))
+        await update_rollups([(w, -1) for w in removed])
+        await delete_tracks(removed)
+        page_cache.invalidate([w.get("id") for w in removed])
+        deleted_count = len(removed)
+        logger.info(f"Dedupe: removed {deleted_count} duplicate workouts in {groups} groups (user: {user_id or 'all'})")
+    
+    return {
+        "status": "dry_run" if dry_run else "completed",
+        "user_id": user_id,
+        "duplicate_groups": groups,
+        "duplicates_found": len(duplicate_ids),
+        "deleted_count": deleted_count
     }
 
+# ═══════════════════════════════════════════════════════════════
+# Resumable route upload - open a session, send route chunks, commit
+# ═══════════════════════════════════════════════════════════════
+UPLOAD_MAX_CHUNK_POINTS = 500
+UPLOAD_MAX_CHUNK_JSON_BYTES = 64 * 1024
+# Sessions and chunks are removed this long after they were created (TTL indexes)
+UPLOAD_SESSION_TTL_SEC = int(os.environ.get('UPLOAD_SESSION_TTL_HOURS', '24')) * 3600
+# A commit that hasn't finished after this long is taken to have crashed
+UPLOAD_COMMIT_CLAIM_SEC = 300
+
+class RouteChunk(BaseModel):
+    route: Optional[List[WorkoutPoint]] = Field(None, max_length=UPLOAD_MAX_CHUNK_POINTS)
+    route_json: Optional[str] = Field(None, max_length=UPLOAD_MAX_CHUNK_JSON_BYTES)
+
+class UploadCommit(BaseModel):
+    total_chunks: Optional[int] = None  # If omitted, chunks 0..highest received must all be present
+
+@api_router.post("/workout/upload")
+async def open_upload_session(workout: WorkoutSubmit):
+    """Open an upload session with the workout summary; the route follows in chunks"""
+    if workout.route or (workout.route_json and workout.route_json.strip()):
+        return JSONResponse(status_code=400, content={"error": "Send the route in chunks, not with the session"})
+    
+    session_id = str(uuid.uuid4())
+    await db.upload_sessions.insert_one({
+        "_id": session_id,
+        "status": "open",
+        "workout": workout.model_dump(exclude={"route", "route_json"}),
+        "created_at": datetime.now(timezone.utc)
+    })
+    logger.info(f"Upload session {session_id} opened for user {workout.user_id}")
+    return {
+        "session_id": session_id,
+        "max_chunk_points": UPLOAD_MAX_CHUNK_POINTS,
+        "max_chunk_json_bytes": UPLOAD_MAX_CHUNK_JSON_BYTES
+    }
+
+async def _received_chunks(session_id: str) -> List[int]:
+    chunks = await db.upload_chunks.find({"session_id": session_id}, {"_id": 0, "seq": 1}).sort("seq", 1).to_list(None)
+    return [c["seq"] for c in chunks]
+
+@api_router.put("/workout/upload/{session_id}/chunk/{seq}")
+async def upload_route_chunk(session_id: str, seq: int, chunk: RouteChunk):
+    """Store one route chunk; re-sending a chunk replaces it"""
+    session = await db.upload_sessions.find_one({"_id": session_id}, {"status": 1})
+    if not session:
+        return JSONResponse(status_code=404, content={"error": "Upload session not found"})
+    if session["status"] != "open":
+        return JSONResponse(status_code=409, content={"error": f"Upload session already {session['status']}"})
+    if seq < 0:
+        return JSONResponse(status_code=400, content={"error": "Chunk sequence must be >= 0"})
+    
+    try:
+        route_columns = parse_submitted_route(chunk) if chunk.route else parse_route_json(chunk.route_json or "[]")
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": f"Invalid route chunk: {e}"})
+    if len(route_columns) > UPLOAD_MAX_CHUNK_POINTS:
+        return JSONResponse(status_code=413, content={"error": f"Chunk exceeds {UPLOAD_MAX_CHUNK_POINTS} points"})
+    
+    await db.upload_chunks.update_one(
+        {"_id": f"{session_id}:{seq}"},
+        {"$set": {
+            "session_id": session_id,
+            "seq": seq,
+            "route_raw": dump_columns(route_columns),
+            "created_at": datetime.now(timezone.utc)
+        }},
+        upsert=True
+    )
+    return {"session_id": session_id, "seq": seq, "points": len(route_columns)}
+
+@api_router.get("/workout/upload/{session_id}")
+async def get_upload_session(session_id: str):
+    """Report which chunks arrived so a client can resume with only the missing ones"""
+    session = await db.upload_sessions.find_one({"_id": session_id}, {"status": 1, "workout_id": 1})
+    if not session:
+        return JSONResponse(status_code=404, content={"error": "Upload session not found"})
+    return {
+        "session_id": session_id,
+        "status": session["status"],
+        "workout_id": session.get("workout_id"),
+        "received_chunks": await _received_chunks(session_id)
+    }
+
+@api_router.post("/workout/upload/{session_id}/commit")
+async def commit_upload_session(session_id: str, commit: Optional[UploadCommit] = None):
+    """Join the chunks in order and save them as a normal workout"""
+    # Claim the session first so concurrent commits can't both insert the workout;
+    # a claim left behind by a crashed commit can be taken over once it's stale
+    now = datetime.now(timezone.utc)
+    session = await db.upload_sessions.find_one_and_update(
+        {"_id": session_id, "$or": [
+            {"status": "open"},
+            {"status": "committing", "claimed_at": {"$lt": now - timedelta(seconds=UPLOAD_COMMIT_CLAIM_SEC)}},
+        ]},
+        {"$set": {"status": "committing", "claimed_at": now}},
+        return_document=ReturnDocument.AFTER
+    )
+    if not session:
+        session = await db.upload_sessions.find_one({"_id": session_id})
+        if not session:
+            return JSONResponse(status_code=404, content={"error": "Upload session not found"})
+        if session["status"] == "committed":
+            # Commit retry after a dropped response - same workout, nothing reprocessed
+            return {"status": "saved", "workout_id": session["workout_id"], "user_id": session["workout"]["user_id"]}
+        return JSONResponse(status_code=409, content={"error": "Upload session is already being committed"})
+    
+    try:
+        return await _commit_claimed_session(session_id, WorkoutSubmit(**session["workout"]), commit)
+    except BaseException:
+        await db.upload_sessions.update_one({"_id": session_id, "status": "committing"}, {"$set": {"status": "open"}})
+        raise
+
+async def _commit_claimed_session(session_id: str, workout: WorkoutSubmit, commit: Optional[UploadCommit]):
+    existing_id = await find_workout_by_key(workout.user_id, workout_idempotency_key(workout))
+    if existing_id:
+        await _finish_upload_session(session_id, existing_id)
+        return {"status": "saved", "workout_id": existing_id, "user_id": workout.user_id, "duplicate": True}
+    
+    received = await _received_chunks(session_id)
+    total_chunks = commit.total_chunks if commit and commit.total_chunks is not None else (received[-1] + 1 if received else 0)
+    missing = sorted(set(range(total_chunks)) - set(received))
+    if missing:
+        await db.upload_sessions.update_one({"_id": session_id, "status": "committing"}, {"$set": {"status": "open"}})
+        return JSONResponse(status_code=409, content={"error": "Missing route chunks", "missing_chunks": missing})
+    
+    chunks = await db.upload_chunks.find(
+        {"session_id": session_id, "seq": {"$lt": total_chunks}}, {"_id": 0, "route_raw": 1, "route_packed": 1}
+    ).sort("seq", 1).to_list(None)
+    # Chunks stored before route_raw carry the packed route
+    route_columns = RouteColumns.concat(
+        load_columns(c["route_raw"]) if "route_raw" in c else unpack_route(c["route_packed"]) for c in chunks
+    )
+    
+    if workout.device_id and workout.device_id.strip():
+        await migrate_device_workouts(workout.device_id.strip(), workout.user_id)
+    
+    doc = build_workout_doc(workout, route_columns)
+    route_points = _route_point_count(doc)
+    doc = await store_new_workout_track(doc)
+    workout_id = await insert_workout_once(doc) or doc["id"]
+    if workout_id != doc["id"]:
+        await delete_tracks([doc])
+    else:
+        _log_workout_saved(workout, route_points)
+        await update_rollups([(doc, 1)])
+        await schedule_workout_processing(workout_id, route_columns)
+    
+    await _finish_upload_session(session_id, workout_id)
+    return {"status": "saved", "workout_id": workout_id, "user_id": workout.user_id}
+
+async def _finish_upload_session(session_id: str, workout_id: str):
+    await db.upload_sessions.update_one(
+        {"_id": session_id},
+        {"$set": {"status": "committed", "workout_id": workout_id, "committed_at": datetime.now(timezone.utc)}}
+    )
+    await db.upload_chunks.delete_many({"session_id": session_id})
+
 # REMOVED: /workout/all endpoint - security risk (exposed all user data)
 # Was used for debugging only
 
 @api_router.delete("/workout/user/{user_id}/all")
 async def delete_all_user_workouts(user_id: str):
     """Delete all workouts for a user"""
-    result = await db.workouts.delete_many({"user_id": user_id})
+    workouts = await repo.workouts.delete_for_user(user_id, ("id", "track_store"))
+    await db.user_rollups.delete_many({"user_id": user_id})
+    await bump_user_versions([user_id])
+    await delete_tracks(workouts)
+    page_cache.invalidate([w.get("id") for w in workouts])
     return {
         "status": "deleted",
         "user_id": user_id,
-        "deleted_count": result.deleted_count
+        "deleted_count": len(workouts)
     }
 
 @api_router.delete("/workout/{workout_id}")
 async def delete_single_workout(workout_id: str):
     """Delete a single workout by ID"""
-    result = await db.workouts.delete_one({"id": workout_id})
-    if result.deleted_count == 0:
+    deleted = await repo.workouts.delete(workout_id, ROLLUP_WORKOUT_FIELDS + ("id", "track_store"))
+    if not deleted:
         return JSONResponse(status_code=404, content={"error": "Workout not found"})
+    await update_rollups([(deleted, -1)])
+    await delete_tracks([deleted])
+    page_cache.invalidate([workout_id])
     return {
         "status": "deleted",
         "workout_id": workout_id
     }
 
 @api_router.get("/workout/user/{user_id}")
-async def get_user_workouts(user_id: str, limit: int = 10):
-    """Get workouts for a specific user"""
-    workouts = await db.workouts.find(
-        {"user_id": user_id},
-        {"_id": 0}
-    ).sort("timestamp", -1).to_list(limit)
+async def get_user_workouts(user_id: str, limit: int = 10, cursor: Optional[str] = None,
+                            max_points: Optional[int] = None, summary: bool = False):
+    """Get workouts for a specific user, newest first (max_points: simplified routes for map rendering, summary: no routes)
+
+    Pass the returned next_cursor back as cursor for the next page; it is null on the last page.
+    """
+    after = None
+    if cursor:
+        after = page_after(cursor)
+        if after is None:
+            return JSONResponse(status_code=400, content={"error": "Invalid cursor"})
+    workouts, next_cursor = await fetch_workout_page(
+        user_id, WORKOUT_SUMMARY_FIELDS if summary else None, after=after, limit=limit
+    )
+    if not summary:
+        await load_tracks(workouts)
     
     return {
         "user_id": user_id,
-        "workouts": workouts,
-        "count": len(workouts)
+        "workouts": [workout_for_api(w, max_points) for w in workouts],
+        "count": len(workouts),
+        "next_cursor": next_cursor
     }
 
-@api_router.get("/workout/fix-elevation/{user_id}")
-async def fix_elevation_for_user(user_id: str):
-    """Fix elevation data for all workouts of a user by extracting from route points"""
-    workouts = await db.workouts.find({"user_id": user_id}).to_list(1000)
-    
-    updated_count = 0
-    for workout in workouts:
-        route = workout.get('route', [])
-        if not route or len(route) < 2:
-            continue
-            
-        # Extract altitude from route points
-        altitudes = [p.get('alt') for p in route if p.get('alt') is not None]
-        if not altitudes or len(altitudes) < 2:
+# ═══ Bulk fixes: stream, correct, flush ═══
+# A fix streams the user's workouts off one cursor, batch_size at a time,
+# computes each correction, and flushes the batch with unordered bulk writes
+# (workouts, workout_tracks, rollups). Memory is one batch whatever the
+# history size; dry_run computes everything and writes nothing.
+FIX_BATCH_SIZE = 200
+FIX_MAX_BATCH_SIZE = 1000
+
+async def _apply_fix_batch(batch: list, fix, dry_run: bool) -> dict:
+    started = time.time()
+    await load_tracks(batch)
+    summary_updates, track_ops, rollup_changes, changes = [], [], [], []
+    for workout in batch:
+        update = await fix(workout)
+        if not update:
             continue
-        
-        # Calculate ascent/descent
-        total_ascent = 0
-        total_descent = 0
-        for i in range(1, len(altitudes)):
-            diff = altitudes[i] - altitudes[i-1]
-            if diff > 0.5:
-                total_ascent += diff
-            elif diff < -0.5:
-                total_descent += abs(diff)
-        
-        # Create elevation JSON
-        elevation_json = json.dumps([int(a) for a in altitudes])
-        
-        # Update workout
-        await db.workouts.update_one(
-            {"id": workout.get("id")},
-            {"$set": {
-                "total_ascent": int(total_ascent) if total_ascent > 0 else None,
-                "total_descent": int(total_descent) if total_descent > 0 else None,
-                "elevation_json": elevation_json,
-                "elevation_gain": total_ascent if total_ascent > 0 else None,
-                "elevation_loss": total_descent if total_descent > 0 else None
-            }}
-        )
-        updated_count += 1
-        logger.info(f"Fixed elevation for workout {workout.get('id')}: +{total_ascent:.0f}m / -{total_descent:.0f}m")
-    
+        summary_update, track_update = split_workout_update(workout, update)
+        # Track-only fixes still change the page, so the version is always bumped
+        summary_updates.append((workout['id'], {**summary_update, "$inc": {"version": 1}}))
+        if track_update:
+            track_ops.append(UpdateOne({"_id": workout['id']}, track_update))
+        changed = {field: value for field, value in update.get("$set", {}).items() if field not in TRACK_FIELDS}
+        rollup_changes += [(workout, -1), ({**workout, **changed}, 1)]
+        changes.append({"workout_id": workout.get('id'), **changed})
+    if not dry_run:
+        await repo.workouts.update_many(summary_updates)
+        if track_ops:
+            await db.workout_tracks.bulk_write(track_ops, ordered=False)
+        await update_rollups(rollup_changes)
+        page_cache.invalidate([change["workout_id"] for change in changes])
     return {
-        "status": "completed",
+        "scanned": len(batch),
+        "updated": len(changes),
+        "elapsed_ms": round((time.time() - started) * 1000, 1),
+        "changes": changes,
+    }
+
+async def run_workout_fix(name: str, user_id: str, fix, dry_run: bool = False, batch_size: int = FIX_BATCH_SIZE) -> dict:
+    """Run fix(workout) -> update or None over all of a user's workouts; per-batch progress report"""
+    batch_size = max(1, min(batch_size, FIX_MAX_BATCH_SIZE))
+    batches = []
+    
+    async def flush(batch):
+        report = await _apply_fix_batch(batch, fix, dry_run)
+        batches.append(report)
+        logger.info(f"{name} {user_id}: batch {len(batches)} scanned {report['scanned']}, "
+                    f"{'would update' if dry_run else 'updated'} {report['updated']} in {report['elapsed_ms']}ms")
+    
+    batch = []
+    async for workout in repo.workouts.iterate(user_id, batch_size=batch_size):
+        batch.append(workout)
+        if len(batch) >= batch_size:
+            await flush(batch)
+            batch = []
+    if batch:
+        await flush(batch)
+    
+    changes = [change for report in batches for change in report.pop("changes")]
+    result = {
+        "status": "dry_run" if dry_run else "completed",
         "user_id": user_id,
-        "workouts_updated": updated_count
+        "workouts_scanned": sum(report["scanned"] for report in batches),
+        "workouts_updated": len(changes),
+        "batches": batches,
     }
+    if dry_run:
+        result["changes"] = changes
+    return result
+
+async def _elevation_fix(workout: dict) -> Optional[dict]:
+    route = workout_route_columns(workout)
+    if route is None or len(route) < 2:
+        return None
+    
+    # Extract altitude from route points and calculate ascent/descent
+    metrics = await route_offload.run(compute_route_metrics, route.lat, route.lon, route.alt, points=len(route))
+    if metrics.altitude_count < 2:
+        return None
+    total_ascent = metrics.total_ascent
+    total_descent = metrics.total_descent
+    
+    update = {"$set": {
+        "total_ascent": int(total_ascent) if total_ascent > 0 else None,
+        "total_descent": int(total_descent) if total_descent > 0 else None,
+        "elevation_gain": total_ascent if total_ascent > 0 else None,
+        "elevation_loss": total_descent if total_descent > 0 else None
+    }}
+    if workout.get('route_v') == ROUTE_SCHEMA_VERSION:
+        # Packed routes decode their elevation graph on read
+        update["$unset"] = {"elevation_json": ""}
+    else:
+        update["$set"]["elevation_json"] = json.dumps(metrics.altitudes.astype(int).tolist())
+    return update
 
-@api_router.get("/workout/fix-distance/{user_id}")
-async def fix_distance_for_user(user_id: str):
-    """Fix distance for workouts where distance seems wrong (calculated from route)"""
-    import math
+async def _distance_fix(workout: dict) -> Optional[dict]:
+    route = workout_route_columns(workout)
+    if route is None or len(route) < 2:
+        return None
     
-    def haversine(lat1, lon1, lat2, lon2):
-        R = 6371000  # Earth radius in meters
-        phi1, phi2 = math.radians(lat1), math.radians(lat2)
-        dphi = math.radians(lat2 - lat1)
-        dlambda = math.radians(lon2 - lon1)
-        a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
-        return 2 * R * math.atan2(math.sqrt(a), math.sqrt(1-a))
+    # Calculate distance from route
+    distance_from_route_cm = (await route_offload.run(compute_route_metrics, route.lat, route.lon, points=len(route))).distance_cm
     
-    workouts = await db.workouts.find({"user_id": user_id}).to_list(1000)
+    stored_distance = workout.get('distance_cm', 0)
     
-    updated_count = 0
-    for workout in workouts:
-        route = workout.get('route', [])
-        if not route or len(route) < 2:
+    # If stored distance is less than 10% of route distance, it's wrong
+    if distance_from_route_cm > 0 and stored_distance < distance_from_route_cm * 0.1:
+        return {"$set": {"distance_cm": distance_from_route_cm}}
+    return None
+
+@api_router.post("/workout/fix-elevation/{user_id}")
+async def fix_elevation_for_user(user_id: str, dry_run: bool = False, batch_size: int = FIX_BATCH_SIZE):
+    """Fix elevation data for all workouts of a user by extracting from route points"""
+    return await run_workout_fix("fix-elevation", user_id, _elevation_fix, dry_run, batch_size)
+
+@api_router.post("/workout/fix-distance/{user_id}")
+async def fix_distance_for_user(user_id: str, dry_run: bool = False, batch_size: int = FIX_BATCH_SIZE):
+    """Fix distance for workouts where distance seems wrong (calculated from route)"""
+    return await run_workout_fix("fix-distance", user_id, _distance_fix, dry_run, batch_size)
+
+def _elevation_json_from_route(elevation_json, columns) -> bool:
+    """True if a stored elevation_json is just a copy of the route altitudes"""
+    try:
+        stored = json.loads(elevation_json)
+    except Exception:
+        return False
+    altitudes = columns.altitudes()
+    if len(stored) != altitudes.size:
+        return False
+    stored = np.asarray(stored, dtype=np.float64)
+    # fix-elevation stored truncated ints, submit stored raw values
+    return bool(np.all(np.abs(stored - altitudes) < 1.0))
+
+# Legacy route arrays, inline in workouts or moved as-is to workout_tracks
+LEGACY_ROUTE_FIELDS = ("id", "track_store", "route", "route_v", "elevation_json")
+LEGACY_ROUTE_PROJECTION = {"_id": 1, "route": 1, "elevation_json": 1}
+
+async def packed_route_update(doc: dict) -> dict:
+    """Update converting a document's legacy route array to the packed route format"""
+    columns = RouteColumns.from_points(doc['route'])
+    update = {
+        "$set": {"route_v": ROUTE_SCHEMA_VERSION, "route_packed": pack_route(columns)},
+        "$unset": {"route": ""}
+    }
+    route_levels = await build_route_levels(columns)
+    if route_levels:
+        update["$set"]["route_levels"] = route_levels
+    elevation_json = doc.get('elevation_json')
+    if elevation_json and _elevation_json_from_route(elevation_json, columns):
+        update["$unset"]["elevation_json"] = ""
+    return update
+
+async def pack_legacy_routes(workouts: list, dry_run: bool = False) -> dict:
+    """Pack the legacy routes of workouts (LEGACY_ROUTE_FIELDS), inline or in workout_tracks"""
+    inline = [w for w in workouts if isinstance(w.get('route'), list) and w.get('route_v') != ROUTE_SCHEMA_VERSION]
+    tracked_ids = [w['id'] for w in workouts if w.get('track_store') == "collection"]
+    tracked = await db.workout_tracks.find(
+        {**LEGACY_ROUTE_QUERY, "_id": {"$in": tracked_ids}}, LEGACY_ROUTE_PROJECTION
+    ).to_list(None) if tracked_ids else []
+    totals = {"routes": len(inline) + len(tracked), "bytes_before": 0, "bytes_after": 0}
+    if dry_run:
+        return totals
+    for in_tracks, docs in ((False, inline), (True, tracked)):
+        for doc in docs:
+            update = await packed_route_update(doc)
+            if in_tracks:
+                await db.workout_tracks.update_one({"_id": doc["_id"]}, update)
+            else:
+                await repo.workouts.update(doc['id'], update)
+            totals["bytes_before"] += len(bson.encode({"route": doc['route'], "elevation_json": doc.get('elevation_json')}))
+            totals["bytes_after"] += len(bson.encode({"route_packed": update["$set"]["route_packed"]}))
+    return totals
+
+@admin_router.post("/workout/migrate-route-storage")
+async def migrate_route_storage(user_id: Optional[str] = None, batch_size: int = 200):
+    """Convert legacy route arrays into the packed route format (route_v 2)"""
+    totals = {"routes": 0, "bytes_before": 0, "bytes_after": 0}
+    
+    async def flush(batch):
+        for key, value in (await pack_legacy_routes(batch)).items():
+            totals[key] += value
+    
+    batch = []
+    async for workout in repo.workouts.iterate(user_id, LEGACY_ROUTES, LEGACY_ROUTE_FIELDS, batch_size):
+        batch.append(workout)
+        if len(batch) >= batch_size:
+            await flush(batch)
+            batch = []
+    if batch:
+        await flush(batch)
+    migrated_count, bytes_before, bytes_after = totals["routes"], totals["bytes_before"], totals["bytes_after"]
+    
+    logger.info(f"Route storage migration: {migrated_count} workouts, {bytes_before} -> {bytes_after} bytes")
+    return {
+        "status": "completed",
+        "user_id": user_id,
+        "workouts_migrated": migrated_count,
+        "bytes_before": bytes_before,
+        "bytes_after": bytes_after
+    }
+
+# What move_track_out reads of a workout whose route/elevation is still inline (INLINE_TRACKS)
+INLINE_TRACK_FIELDS = ("id",) + TRACK_FIELDS
+
+async def move_track_out(workout: dict):
+    """Move one workout's inline track fields to workout_tracks (or GridFS)"""
+    _, track = split_track_fields(workout)
+    track_store = await store_track(workout['id'], track)
+    update = {"$unset": {field: "" for field in TRACK_FIELDS if field in workout}}
+    if track_store:
+        update["$set"] = {"track_store": track_store}
+    await repo.workouts.update(workout['id'], update)
+
+@admin_router.post("/workout/migrate-tracks")
+async def migrate_tracks(user_id: Optional[str] = None, reverse: bool = False, batch_size: int = 200):
+    """Move inline routes/elevation out to workout_tracks (reverse=true moves them back inline)"""
+    moved_count = 0
+    failed_ids = []
+    if not reverse:
+        async for workout in repo.workouts.iterate(user_id, INLINE_TRACKS, INLINE_TRACK_FIELDS, batch_size):
+            await move_track_out(workout)
+            moved_count += 1
+    else:
+        async for workout in repo.workouts.iterate(user_id, STORED_TRACKS, ("id", "track_store"), batch_size):
+            stored = {"id": workout['id'], "track_store": workout['track_store']}
+            _, track = split_track_fields(await load_track(workout))
+            update = {"$unset": {"track_store": ""}}
+            if track:
+                update["$set"] = track
+            try:
+                await repo.workouts.update(workout['id'], update)
+            except DocumentTooLarge:
+                failed_ids.append(workout['id'])
+                continue
+            await delete_tracks([stored])
+            moved_count += 1
+    
+    logger.info(f"Track migration ({'to inline' if reverse else 'to workout_tracks'}): {moved_count} workouts, {len(failed_ids)} failed")
+    return {
+        "status": "completed",
+        "user_id": user_id,
+        "direction": "inline" if reverse else "workout_tracks",
+        "workouts_moved": moved_count,
+        "failed_workout_ids": failed_ids
+    }
+
+@admin_router.post("/workout/migrate-timestamps")
+async def migrate_timestamps(user_id: Optional[str] = None, batch_size: int = 500):
+    """Convert ISO string timestamps to BSON dates and add the local_date key"""
+    migrated_count = 0
+    failed_ids = []
+    updates = []
+    async for workout in repo.workouts.iterate(user_id, LEGACY_TIMESTAMPS, ("id", "timestamp"), batch_size):
+        timestamp = workout.get('timestamp')
+        try:
+            if isinstance(timestamp, str):
+                # Naive strings are the watch's local time, "+00:00" ones server UTC
+                timestamp = wall_clock(datetime.fromisoformat(timestamp))
+            local_date = timestamp.strftime("%Y-%m-%d")
+        except (TypeError, ValueError, AttributeError):
+            failed_ids.append(workout.get('id'))
             continue
-        
-        # Calculate distance from route
-        distance_from_route_cm = 0
-        for i in range(1, len(route)):
-            p1, p2 = route[i-1], route[i]
-            if 'lat' in p1 and 'lon' in p1 and 'lat' in p2 and 'lon' in p2:
-                segment_m = haversine(p1['lat'], p1['lon'], p2['lat'], p2['lon'])
-                distance_from_route_cm += int(segment_m * 100)
-        
-        stored_distance = workout.get('distance_cm', 0)
-        
-        # If stored distance is less than 10% of route distance, it's wrong
-        if distance_from_route_cm > 0 and stored_distance < distance_from_route_cm * 0.1:
-            await db.workouts.update_one(
-                {"id": workout.get("id")},
-                {"$set": {"distance_cm": distance_from_route_cm}}
-            )
-            updated_count += 1
-            logger.info(f"Fixed distance for workout {workout.get('id')}: {stored_distance/100000:.2f}km -> {distance_from_route_cm/100000:.2f}km")
-    
+        updates.append((workout['id'], {"$set": {"timestamp": timestamp, "local_date": local_date}}))
+        if len(updates) >= batch_size:
+            await repo.workouts.update_many(updates)
+            migrated_count += len(updates)
+            updates = []
+    if updates:
+        await repo.workouts.update_many(updates)
+        migrated_count += len(updates)
+    if migrated_count:
+        # Rollups are grouped by local_date; the rebuild also bumps the data versions cached pages are keyed by
+        await rebuild_user_rollups(user_id)
+    
+    logger.info(f"Timestamp migration: {migrated_count} workouts migrated, {len(failed_ids)} unparseable")
     return {
         "status": "completed",
         "user_id": user_id,
-        "workouts_fixed": updated_count
+        "workouts_migrated": migrated_count,
+        "unparseable_workout_ids": failed_ids
     }
 
 @api_router.get("/workout/latest/{user_id}")
-async def get_latest_workout(user_id: str):
+async def get_latest_workout(user_id: str, max_points: Optional[int] = None):
     """Get the latest workout for a user"""
-    workout = await db.workouts.find_one(
-        {"user_id": user_id},
-        {"_id": 0},
-        sort=[("timestamp", -1)]
-    )
+    workout = await repo.workouts.latest(user_id)
     
     if not workout:
         return JSONResponse(status_code=404, content={"error": "No workouts found for this user"})
     
-    return workout
+    return workout_for_api(await load_track(workout), max_points)
 
 @api_router.get("/workout/id/{workout_id}")
-async def get_workout_by_id(workout_id: str):
+async def get_workout_by_id(workout_id: str, max_points: Optional[int] = None):
     """Get a specific workout by ID"""
-    workout = await db.workouts.find_one(
-        {"id": workout_id},
-        {"_id": 0}
-    )
+    workout = await repo.workouts.get(workout_id)
     
     if not workout:
         return JSONResponse(status_code=404, content={"error": "Workout not found"})
     
-    return workout
+    return workout_for_api(await load_track(workout), max_points)
 
 @api_router.get("/user/{user_id}/stats")
 async def get_user_stats(user_id: str):
     """Get aggregated stats for a user"""
-    pipeline = [
-        {"$match": {"user_id": user_id}},
-        {"$group": {
-            "_id": "$user_id",
-            "total_workouts": {"$sum": 1},
-            "total_distance_cm": {"$sum": "$distance_cm"},
-            "total_duration_sec": {"$sum": "$duration_sec"},
-            "avg_hr": {"$avg": "$avg_hr"},
-            "user_name": {"$last": "$user_name"}
-        }}
-    ]
-    
-    result = await db.workouts.aggregate(pipeline).to_list(1)
+    year_rollups = await db.user_rollups.find({"user_id": user_id, "kind": "year"}, {"_id": 0}).to_list(None)
+    stats = rollup_averages(year_rollups)
     
-    if not result:
+    if not stats["count"]:
         return {
             "user_id": user_id,
             "total_workouts": 0,
@@ -728,21 +1811,62 @@ async def get_user_stats(user_id: str):
             "total_duration_min": 0
         }
     
-    stats = result[0]
+    latest = await repo.workouts.latest(user_id, ("user_name",))
     return {
         "user_id": user_id,
-        "user_name": stats.get("user_name", ""),
-        "total_workouts": stats["total_workouts"],
-        "total_distance_km": round(stats["total_distance_cm"] / 100000, 2),
-        "total_duration_min": round(stats["total_duration_sec"] / 60, 1),
-        "avg_hr": round(stats["avg_hr"]) if stats.get("avg_hr") else None
+        "user_name": latest.get("user_name", "") if latest else "",
+        "total_workouts": stats["count"],
+        "total_distance_km": round(stats["distance_cm"] / 100000, 2),
+        "total_duration_min": round(stats["duration_sec"] / 60, 1),
+        "avg_hr": stats["avg_hr"]
+    }
+
+# Monthly stats: one read (WorkoutRepository.month_totals) over the months
+# asked for plus the month before (for the comparison), with the latest
+# user_name and the month's workouts. Month totals match ROLLUP_FIELDS so
+# rollup_averages applies.
+MONTHLY_STATS_MAX_MONTHS = 24
+MONTH_NAMES_HE = ["", "ינואר", "פברואר", "מרץ", "אפריל", "מאי", "יוני",
+                  "יולי", "אוגוסט", "ספטמבר", "אוקטובר", "נובמבר", "דצמבר"]
+
+def _shift_month(year: int, month: int, delta: int):
+    index = year * 12 + (month - 1) + delta
+    return index // 12, index % 12 + 1
+
+def _month_stats(row: Optional[dict], prev_row: Optional[dict]) -> dict:
+    """Totals of one month's group row, with the change from the month before"""
+    stats = rollup_averages([row] if row else [])
+    comparison = None
+    if prev_row:
+        prev_dist = prev_row["distance_cm"] / 100000
+        curr_dist = stats["distance_cm"] / 100000
+        if prev_dist > 0:
+            dist_change = round(((curr_dist - prev_dist) / prev_dist) * 100, 1)
+            comparison = {
+                "distance_change_percent": dist_change,
+                "workouts_change": stats["count"] - prev_row["count"]
+            }
+    return {
+        "total_workouts": stats["count"],
+        "total_distance_km": round(stats["distance_cm"] / 100000, 2),
+        "total_duration_min": round(stats["duration_sec"] / 60, 1),
+        "avg_hr": stats["avg_hr"],
+        "max_hr": row.get("max_hr") if row else None,
+        "total_elevation_gain": round(stats["elevation_gain"], 1),
+        "total_elevation_loss": round(stats["elevation_loss"], 1),
+        "total_steps": stats["steps"],
+        "comparison": comparison
     }
 
 @api_router.get("/user/{user_id}/monthly")
-async def get_monthly_stats(user_id: str, year: int = None, month: int = None):
-    """Get monthly stats for a user"""
-    from datetime import datetime
-    
+async def get_monthly_stats(user_id: str, year: int = None, month: int = None, months: Optional[int] = None):
+    """Get monthly stats for a user
+
+    months=N returns the N months ending at year/month (oldest first), without workout lists.
+    One read gets the stats, the user name and the month's workouts;
+    workouts whose tracks were split out (see load_tracks) cost one more
+    workout_tracks read, plus a GridFS read per overflowed track.
+    """
     # Default to current month
     now = datetime.now(timezone.utc)
     if year is None:
@@ -750,86 +1874,48 @@ async def get_monthly_stats(user_id: str, year: int = None, month: int = None):
     if month is None:
         month = now.month
     
-    # Calculate date range for the month
-    start_date = datetime(year, month, 1, tzinfo=timezone.utc)
-    if month == 12:
-        end_date = datetime(year + 1, 1, 1, tzinfo=timezone.utc)
-    else:
-        end_date = datetime(year, month + 1, 1, tzinfo=timezone.utc)
-    
-    # Get previous month for comparison
-    if month == 1:
-        prev_year, prev_month = year - 1, 12
-    else:
-        prev_year, prev_month = year, month - 1
-    
-    prev_start = datetime(prev_year, prev_month, 1, tzinfo=timezone.utc)
-    prev_end = start_date
-    
-    # Aggregate current month
-    pipeline = [
-        {"$match": {
-            "user_id": user_id,
-            "timestamp": {
-                "$gte": start_date.isoformat(),
-                "$lt": end_date.isoformat()
-            }
-        }},
-        {"$group": {
-            "_id": "$user_id",
-            "total_workouts": {"$sum": 1},
-            "total_distance_cm": {"$sum": "$distance_cm"},
-            "total_duration_sec": {"$sum": "$duration_sec"},
-            "avg_hr": {"$avg": "$avg_hr"},
-            "max_hr": {"$max": "$max_hr"},
-            "total_elevation_gain": {"$sum": "$elevation_gain"},
-            "total_elevation_loss": {"$sum": "$elevation_loss"},
-            "total_steps": {"$sum": "$steps"},
-            "user_name": {"$last": "$user_name"}
-        }}
-    ]
-    
-    # Aggregate previous month for comparison
-    prev_pipeline = [
-        {"$match": {
-            "user_id": user_id,
-            "timestamp": {
-                "$gte": prev_start.isoformat(),
-                "$lt": prev_end.isoformat()
-            }
-        }},
-        {"$group": {
-            "_id": "$user_id",
-            "total_workouts": {"$sum": 1},
-            "total_distance_cm": {"$sum": "$distance_cm"},
-            "total_duration_sec": {"$sum": "$duration_sec"}
-        }}
-    ]
-    
-    result = await db.workouts.aggregate(pipeline).to_list(1)
-    prev_result = await db.workouts.aggregate(prev_pipeline).to_list(1)
-    
-    # Get list of workouts for this month
-    workouts = await db.workouts.find(
-        {
+    period = local_date_period(year, month)
+    if period is None:
+        return JSONResponse(status_code=400, content={"error": "Invalid year or month"})
+    if months is not None and not 1 <= months <= MONTHLY_STATS_MAX_MONTHS:
+        return JSONResponse(status_code=400, content={"error": f"months must be 1-{MONTHLY_STATS_MAX_MONTHS}"})
+    
+    # One indexed local_date range: the months asked for plus the one before
+    span = months or 1
+    first_year, first_month = _shift_month(year, month, -span)
+    range_start = local_date_period(first_year, first_month)[0]
+    result = await repo.workouts.month_totals(
+        user_id, (range_start, period[1]), workouts_period=period if months is None else None
+    )
+    by_month = result["months"]
+    user_name = result["user_name"]
+    
+    if months is not None:
+        month_list = []
+        for offset in range(span - 1, -1, -1):
+            y, m = _shift_month(year, month, -offset)
+            py, pm = _shift_month(y, m, -1)
+            month_list.append({
+                "year": y,
+                "month": m,
+                "month_name": MONTH_NAMES_HE[m],
+                **_month_stats(by_month.get(f"{y:04d}-{m:02d}"), by_month.get(f"{py:04d}-{pm:02d}"))
+            })
+        return {
             "user_id": user_id,
-            "timestamp": {
-                "$gte": start_date.isoformat(),
-                "$lt": end_date.isoformat()
-            }
-        },
-        {"_id": 0}
-    ).sort("timestamp", -1).to_list(100)
-    
-    month_names_he = ["", "ינואר", "פברואר", "מרץ", "אפריל", "מאי", "יוני", 
-                      "יולי", "אוגוסט", "ספטמבר", "אוקטובר", "נובמבר", "דצמבר"]
+            "user_name": user_name,
+            "from": f"{month_list[0]['year']:04d}-{month_list[0]['month']:02d}",
+            "to": f"{year:04d}-{month:02d}",
+            "months": month_list
+        }
     
-    if not result:
+    month_key = f"{year:04d}-{month:02d}"
+    if month_key not in by_month:
         return {
             "user_id": user_id,
             "year": year,
             "month": month,
-            "month_name": month_names_he[month],
+            "month_name": MONTH_NAMES_HE[month],
             "total_workouts": 0,
             "total_distance_km": 0,
             "total_duration_min": 0,
@@ -842,36 +1928,19 @@ async def get_monthly_stats(user_id: str, year: int = None, month: int = None):
             "comparison": None
         }
     
-    stats = result[0]
-    
-    # Calculate comparison with previous month
-    comparison = None
-    if prev_result:
-        prev_stats = prev_result[0]
-        prev_dist = prev_stats["total_distance_cm"] / 100000
-        curr_dist = stats["total_distance_cm"] / 100000
-        if prev_dist > 0:
-            dist_change = round(((curr_dist - prev_dist) / prev_dist) * 100, 1)
-            comparison = {
-                "distance_change_percent": dist_change,
-                "workouts_change": stats["total_workouts"] - prev_stats["total_workouts"]
-            }
+    workouts = await load_tracks(result["workouts"])
     
+    prev_year, prev_month = _shift_month(year, month, -1)
+    stats = _month_stats(by_month[month_key], by_month.get(f"{prev_year:04d}-{prev_month:02d}"))
+    comparison = stats.pop("comparison")
     return {
         "user_id": user_id,
-        "user_name": stats.get("user_name", ""),
+        "user_name": user_name,
         "year": year,
         "month": month,
-        "month_name": month_names_he[month],
-        "total_workouts": stats["total_workouts"],
-        "total_distance_km": round(stats["total_distance_cm"] / 100000, 2),
-        "total_duration_min": round(stats["total_duration_sec"] / 60, 1),
-        "avg_hr": round(stats["avg_hr"]) if stats.get("avg_hr") else None,
-        "max_hr": stats.get("max_hr"),
-        "total_elevation_gain": round(stats.get("total_elevation_gain") or 0, 1),
-        "total_elevation_loss": round(stats.get("total_elevation_loss") or 0, 1),
-        "total_steps": stats.get("total_steps") or 0,
-        "workouts": workouts,
+        "month_name": MONTH_NAMES_HE[month],
+        **stats,
+        "workouts": [workout_for_api(w) for w in workouts],
         "comparison": comparison
     }
 
@@ -885,22 +1954,26 @@ async def register_user(data: UserRegister):
     user_id = generate_user_id(data.device_id)
     
     # Check if user exists
-    existing = await db.users.find_one({"user_id": user_id})
+    existing = await repo.users.get(user_id)
     
     if not existing:
-        await db.users.insert_one({
-            "user_id": user_id,
-            "device_id": data.device_id,
-            "user_name": data.user_name,
-            "created_at": datetime.now(timezone.utc).isoformat()
-        })
-        logger.info(f"New user registered: {user_id}")
+        try:
+            await repo.users.insert({
+                "user_id": user_id,
+                "device_id": data.device_id,
+                "user_name": data.user_name,
+                "created_at": datetime.now(timezone.utc).isoformat()
+            })
+            logger.info(f"New user registered: {user_id}")
+        except DuplicateKeyError:
+            pass  # Registered concurrently by a retry of the same request
     elif data.user_name and data.user_name != existing.get("user_name"):
         # Update user name if changed
-        await db.users.update_one(
-            {"user_id": user_id},
-            {"$set": {"user_name": data.user_name}}
-        )
+        await repo.users.set_name(user_id, data.user_name)
+    
+    # Keep the device registry (and the device's workouts) on this user_id
+    if data.device_id.strip():
+        await migrate_device_workouts(data.device_id.strip(), user_id)
     
     return {"user_id": user_id}
 
@@ -908,40 +1981,29 @@ async def register_user(data: UserRegister):
 # HTML PAGES - Workout Summary Pages
 # ═══════════════════════════════════════════════════════════════
 
+# Page CSS/JS and vendored libraries under content-hashed URLs, built at startup; see static_assets.py
+static_assets = StaticAssets.from_env()
+static_assets.build()
+
+# Templates compiled once at startup; see page_templates.py and templates/
+templates = PageTemplates(globals={"t": t, "is_rtl": is_rtl, "asset": static_assets.url})
+PAGE_LANGS = range(6)
+GARMIN_STORE_URL = "https://apps.garmin.com/apps/c303ee47-1ecf-4487-91c9-3de4ca1a74d5"
+
+# Map button labels
+MAP_LABELS = {
+    0: {"standard": "Map", "satellite": "Satellite", "terrain": "3D"},
+    1: {"standard": "מפה", "satellite": "לוויין", "terrain": "3D"},
+    2: {"standard": "Mapa", "satellite": "Satélite", "terrain": "3D"},
+    3: {"standard": "Carte", "satellite": "Satellite", "terrain": "3D"},
+    4: {"standard": "Karte", "satellite": "Satellit", "terrain": "3D"},
+    5: {"standard": "地图", "satellite": "卫星", "terrain": "3D"},
+}
+
 def generate_workout_html(workout, user_id, lang=0):
     """Generate HTML page for workout summary with Leaflet map"""
-    # RTL support
-    dir_attr = 'dir="rtl"' if is_rtl(lang) else 'dir="ltr"'
-    lang_code = ["en", "he", "es", "fr", "de", "zh"][lang] if lang < 6 else "en"
-    
     if not workout:
-        return f"""
-        <!DOCTYPE html>
-        <html lang="{lang_code}" {dir_attr}>
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>FitBeat - {t('no_workouts', lang)}</title>
-            <style>
-                * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-                body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; background: linear-gradient(135deg, #1a1a2e 0%, #16213e 100%); min-height: 100vh; color: white; display: flex; align-items: center; justify-content: center; }}
-                .container {{ text-align: center; padding: 2rem; }}
-                .icon {{ font-size: 4rem; margin-bottom: 1rem; }}
-                h1 {{ color: #00d4ff; margin-bottom: 0.5rem; }}
-                p {{ color: #888; }}
-                .user-id {{ font-family: monospace; color: #00d4ff; opacity: 0.6; margin-top: 1rem; font-size: 0.8rem; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="icon">🏃‍♂️</div>
-                <h1>FitBeat</h1>
-                <p>{t('no_workouts', lang)}</p>
-                <p class="user-id">{t('user_id', lang)}: {user_id}</p>
-            </div>
-        </body>
-        </html>
-        """
+        return templates.render("workout_empty.html", lang=lang, user_id=user_id)
     
     dist_cm = workout['distance_cm']
     dist_km = dist_cm / 100000
@@ -994,14 +2056,14 @@ def generate_workout_html(workout, user_id, lang=0):
     # Use new fields with fallback to legacy
     elevation_gain = workout.get('total_ascent') or workout.get('elevation_gain', 0) or 0
     elevation_loss = workout.get('total_descent') or workout.get('elevation_loss', 0) or 0
-    elevation_json = workout.get('elevation_json', '')  # NEW v4.7.0
+    route_columns = workout_route_columns(workout, ROUTE_RENDER_MAX_POINTS)
+    elevation_json = workout_elevation_json(workout, route_columns) or ''  # NEW v4.7.0
     steps = workout.get('steps', 0) or 0
     cadence = workout.get('cadence', 0) or 0
     workout_id = workout.get('id', '')
-    route = workout.get('route', []) or []
     
     # Format date and time
-    timestamp = workout.get('timestamp', '')
+    timestamp = workout_time_str(workout)
     formatted_datetime = ''
     if timestamp:
         try:
@@ -1020,713 +2082,83 @@ def generate_workout_html(workout, user_id, lang=0):
         except Exception:
             formatted_datetime = timestamp[:16] if len(timestamp) > 16 else timestamp
     
-    # Get base URL
-    base_url = os.environ.get('APP_URL', 'https://fitbeat.it.com')
-    
-    # WhatsApp share text (translated)
-    share_texts = {
-        0: f"🏃‍♂️ {user_name} finished a workout!%0A%0A📍 Distance: {dist_km:.2f} km%0A⏱️ Time: {duration_str}%0A⚡ Pace: {pace_str}/km",
-        1: f"🏃‍♂️ {user_name} סיים אימון!%0A%0A📍 מרחק: {dist_km:.2f} ק״מ%0A⏱️ זמן: {duration_str}%0A⚡ קצב: {pace_str}/ק״מ",
-        2: f"🏃‍♂️ ¡{user_name} terminó un entrenamiento!%0A%0A📍 Distancia: {dist_km:.2f} km%0A⏱️ Tiempo: {duration_str}%0A⚡ Ritmo: {pace_str}/km",
-        3: f"🏃‍♂️ {user_name} a terminé un entraînement!%0A%0A📍 Distance: {dist_km:.2f} km%0A⏱️ Temps: {duration_str}%0A⚡ Allure: {pace_str}/km",
-        4: f"🏃‍♂️ {user_name} hat ein Training beendet!%0A%0A📍 Distanz: {dist_km:.2f} km%0A⏱️ Zeit: {duration_str}%0A⚡ Tempo: {pace_str}/km",
-        5: f"🏃‍♂️ {user_name}完成了训练!%0A%0A📍 距离: {dist_km:.2f} km%0A⏱️ 时间: {duration_str}%0A⚡ 配速: {pace_str}/km",
-    }
-    share_text = share_texts.get(lang, share_texts[0])
-    if avg_hr:
-        hr_texts = {0: f"%0A❤️ HR: {avg_hr} BPM", 1: f"%0A❤️ דופק: {avg_hr} BPM", 2: f"%0A❤️ FC: {avg_hr} LPM", 3: f"%0A❤️ FC: {avg_hr} BPM", 4: f"%0A❤️ HF: {avg_hr} SPM", 5: f"%0A❤️ 心率: {avg_hr} BPM"}
-        share_text += hr_texts.get(lang, hr_texts[0])
-    share_text += f"%0A%0A🔗 {base_url}/api/u/{user_id}?lang={lang}"
-    
     # Convert route to JSON for JavaScript
-    route_json = json.dumps([[p['lat'], p['lon']] for p in route]) if route else "[]"
-    has_route = len(route) > 0
-    
-    # Map button labels
-    map_labels = {
-        0: {"standard": "Map", "satellite": "Satellite", "terrain": "3D"},
-        1: {"standard": "מפה", "satellite": "לוויין", "terrain": "3D"},
-        2: {"standard": "Mapa", "satellite": "Satélite", "terrain": "3D"},
-        3: {"standard": "Carte", "satellite": "Satellite", "terrain": "3D"},
-        4: {"standard": "Karte", "satellite": "Satellit", "terrain": "3D"},
-        5: {"standard": "地图", "satellite": "卫星", "terrain": "3D"},
-    }
-    map_label = map_labels.get(lang, map_labels[0])
-    
-    # Generate map section - Leaflet if route exists, SVG fallback otherwise
-    if has_route:
-        map_section = f'''
-            <div class="map-container">
-                <div id="map"></div>
-                <div class="map-controls">
-                    <div class="map-controls-row">
-                        <button class="map-btn active" data-layer="standard">🗺️ {map_label["standard"]}</button>
-                        <button class="map-btn" data-layer="satellite">🛰️ {map_label["satellite"]}</button>
-                    </div>
-                    <button class="map-btn map-btn-3d" data-toggle="terrain">🏔️ {map_label["terrain"]}</button>
-                </div>
-                <div class="map-badge">
-                    <span class="value">{dist_display}</span>
-                    <span class="unit">{dist_unit}</span>
-                </div>
-            </div>
-        '''
-    else:
-        map_section = f'''
-            <div class="map">
-                <svg viewBox="0 0 400 200">
-                    <path d="M 40,160 Q 80,140 120,120 T 200,100 T 280,80 T 360,60" fill="none" stroke="#ff6666" stroke-width="6" stroke-linecap="round" opacity="0.3" style="filter: blur(3px);"/>
-                    <path d="M 40,160 Q 80,140 120,120 T 200,100 T 280,80 T 360,60" fill="none" stroke="#ff3333" stroke-width="3" stroke-linecap="round" style="filter: drop-shadow(0 0 4px rgba(255,50,50,0.8));"/>
-                    <circle cx="40" cy="160" r="6" fill="#22c55e"/>
-                    <circle cx="40" cy="160" r="3" fill="white"/>
-                    <circle cx="360" cy="60" r="6" fill="#ef4444" style="filter: drop-shadow(0 0 4px rgba(239,68,68,0.8));"/>
-                    <circle cx="360" cy="60" r="3" fill="white"/>
-                </svg>
-                <div class="map-badge">
-                    <span class="value">{dist_display}</span>
-                    <span class="unit">{dist_unit}</span>
-                </div>
-                <div class="no-gps">{t('no_route', lang)}</div>
-            </div>
-        '''
-    
-    # Build extra stats section with all parameters
-    extra_stats_html = ""
-    
-    # HR Stats - Show all three if we have min/max
-    if min_hr and max_hr:
-        extra_stats_html += f'''
-            <div class="extra-stat hr-full">
-                <span class="label">❤️ HR</span>
-                <span class="value">
-                    <span style="color:#22c55e;">{min_hr}</span> / 
-                    <span style="color:#00d4ff;">{avg_hr if avg_hr else '--'}</span> / 
-                    <span style="color:#ef4444;">{max_hr}</span>
-                    <span class="unit">min/avg/max</span>
-                </span>
-            </div>
-        '''
-    elif max_hr:
-        # Fallback to just max HR
-        extra_stats_html += f'''
-            <div class="extra-stat">
-                <span class="label">💓 {t('max_hr', lang)}</span>
-                <span class="value" style="color:#ef4444;">{max_hr} BPM</span>
-            </div>
-        '''
-    
-    # Elevation Gain
-    if elevation_gain > 0:
-        extra_stats_html += f'''
-            <div class="extra-stat">
-                <span class="label">📈 {t('elevation_gain', lang)}</span>
-                <span class="value" style="color:#22c55e;">+{elevation_gain:.0f} {t('meters', lang)}</span>
-            </div>
-        '''
-    
-    # Elevation Loss
-    if elevation_loss > 0:
-        extra_stats_html += f'''
-            <div class="extra-stat">
-                <span class="label">📉 {t('elevation_loss', lang)}</span>
-                <span class="value" style="color:#f97316;">-{elevation_loss:.0f} {t('meters', lang)}</span>
-            </div>
-        '''
-    
-    # Cadence
-    if cadence > 0:
-        extra_stats_html += f'''
-            <div class="extra-stat">
-                <span class="label">🦶 {t('cadence', lang)}</span>
-                <span class="value">{cadence} {t('spm', lang)}</span>
-            </div>
-        '''
-    
-    # Steps
-    if steps > 0:
-        extra_stats_html += f'''
-            <div class="extra-stat">
-                <span class="label">👟 {t('steps', lang)}</span>
-                <span class="value">{steps:,}</span>
-            </div>
-        '''
-    
-    # Elevation Chart Section (if we have elevation data)
-    elevation_chart_html = ""
-    if elevation_json and elevation_json.strip() and elevation_json != "[]":
-        elevation_chart_html = f'''
-            <div class="section">
-                <div class="section-title">⛰️ Elevation Profile</div>
-                <div class="chart-container" style="height: 100px; width: 100%;">
-                    <canvas id="elevationChart"></canvas>
-                </div>
-            </div>
-        '''
-    
-    return f"""
-    <!DOCTYPE html>
-    <html lang="{lang_code}" {dir_attr}>
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>FitBeat - {t('workout', lang)}</title>
-        <link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css" />
-        <script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
-        <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-        <style>
-            * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-            body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; background: linear-gradient(135deg, #1a1a2e 0%, #16213e 100%); min-height: 100vh; color: white; padding: 1rem; }}
-            .container {{ max-width: 480px; margin: 0 auto; }}
-            header {{ text-align: center; padding: 1.5rem 0; border-bottom: 1px solid rgba(255,255,255,0.1); margin-bottom: 1.5rem; }}
-            h1 {{ color: #00d4ff; font-size: 1.5rem; margin-bottom: 0.25rem; }}
-            .subtitle {{ color: #888; font-size: 0.9rem; }}
-            .user-name {{ font-size: 1.1rem; margin-top: 0.5rem; }}
-            
-            /* Leaflet Map Container */
-            .map-container {{ position: relative; border-radius: 1rem; height: 280px; margin-bottom: 1.5rem; overflow: hidden; }}
-            #map {{ width: 100%; height: 100%; border-radius: 1rem; z-index: 1; }}
-            .map-container .map-badge {{ position: absolute; top: 0.75rem; right: 0.75rem; background: rgba(0,0,0,0.85); padding: 0.5rem 1rem; border-radius: 0.75rem; border: 1px solid rgba(255,255,255,0.2); z-index: 1000; }}
-            .map-badge .value {{ font-size: 1.5rem; font-weight: bold; color: #00d4ff; }}
-            .map-badge .unit {{ font-size: 0.8rem; color: #888; }}
-            
-            /* Map Controls */
-            .map-controls {{ position: absolute; bottom: 0.75rem; left: 50%; transform: translateX(-50%); display: flex; flex-direction: column; align-items: center; gap: 0.4rem; z-index: 1000; }}
-            .map-controls-row {{ display: flex; gap: 0.5rem; }}
-            .map-btn {{ background: rgba(0,0,0,0.85); color: white; border: 1px solid rgba(255,255,255,0.2); padding: 0.5rem 0.75rem; border-radius: 0.5rem; font-size: 0.75rem; cursor: pointer; transition: all 0.2s; }}
-            .map-btn-3d {{ padding: 0.4rem 1.5rem; }}
-            .map-btn:hover {{ background: rgba(0,212,255,0.2); border-color: #00d4ff; }}
-            .map-btn.active {{ background: #00d4ff; color: black; border-color: #00d4ff; }}
-            
-            /* SVG Fallback Map */
-            .map {{ background: linear-gradient(135deg, #2d4a2d 0%, #1a2f1a 100%); border-radius: 1rem; height: 200px; margin-bottom: 1.5rem; position: relative; overflow: hidden; }}
-            .map svg {{ position: absolute; inset: 0; width: 100%; height: 100%; }}
-            .map .map-badge {{ position: absolute; top: 0.75rem; {"left" if is_rtl(lang) else "right"}: 0.75rem; background: rgba(0,0,0,0.8); padding: 0.5rem 1rem; border-radius: 0.75rem; border: 1px solid rgba(255,255,255,0.1); }}
-            .no-gps {{ position: absolute; bottom: 0.75rem; left: 50%; transform: translateX(-50%); background: rgba(0,0,0,0.7); padding: 0.25rem 0.75rem; border-radius: 0.5rem; font-size: 0.75rem; color: #888; }}
-            
-            .stats {{ display: grid; grid-template-columns: 1fr 1fr; gap: 0.75rem; margin-bottom: 1.5rem; }}
-            .stat {{ background: linear-gradient(135deg, #1e1e3f 0%, #151530 100%); border-radius: 0.75rem; padding: 1rem; border: 1px solid rgba(255,255,255,0.05); }}
-            .stat .icon {{ font-size: 1.25rem; margin-bottom: 0.5rem; }}
-            .stat .label {{ color: #888; font-size: 0.75rem; margin-bottom: 0.25rem; }}
-            .stat .value {{ font-size: 1.5rem; font-weight: bold; }}
-            .stat .value.highlight {{ color: #00d4ff; }}
-            .stat .unit {{ font-size: 0.8rem; color: #888; margin-right: 0.25rem; }}
-            
-            .section {{ background: linear-gradient(135deg, #1e1e3f 0%, #151530 100%); border-radius: 0.75rem; padding: 1rem; margin-bottom: 1rem; border: 1px solid rgba(255,255,255,0.05); }}
-            .section-title {{ color: #888; font-size: 0.8rem; margin-bottom: 0.75rem; display: flex; align-items: center; gap: 0.5rem; }}
-            .hr-stats {{ display: grid; grid-template-columns: 1fr 1fr; gap: 0.75rem; }}
-            .hr-stat {{ background: rgba(0,0,0,0.2); border-radius: 0.5rem; padding: 0.75rem; text-align: center; }}
-            .hr-stat .label {{ color: #888; font-size: 0.7rem; }}
-            .hr-stat .value {{ color: #ef4444; font-size: 1.25rem; font-weight: bold; }}
-            .hr-stat .value span {{ font-size: 0.7rem; color: #888; }}
-            
-            .extra-stats {{ display: flex; flex-direction: column; }}
-            .extra-stat {{ display: flex; justify-content: space-between; padding: 0.75rem 0; border-bottom: 1px solid rgba(255,255,255,0.05); }}
-            .extra-stat:last-child {{ border-bottom: none; }}
-            .extra-stat .label {{ color: #888; display: flex; align-items: center; gap: 0.5rem; }}
-            .extra-stat .value {{ font-weight: bold; }}
-            
-            .share-btn {{ display: flex; align-items: center; justify-content: center; gap: 0.75rem; background: linear-gradient(90deg, #00d4ff 0%, #0099cc 100%); color: white; border: none; padding: 1rem 2rem; border-radius: 9999px; font-size: 1.1rem; font-weight: bold; cursor: pointer; margin: 2rem auto; box-shadow: 0 4px 15px rgba(0, 212, 255, 0.3); text-decoration: none; transition: all 0.2s; }}
-            .share-btn:hover {{ transform: translateY(-2px); box-shadow: 0 6px 20px rgba(0, 212, 255, 0.4); }}
-            .share-btn.copied {{ background: linear-gradient(90deg, #22c55e 0%, #16a34a 100%); box-shadow: 0 4px 15px rgba(34, 197, 94, 0.3); }}
-            .share-btn svg {{ width: 1.5rem; height: 1.5rem; }}
-            .share-hint {{ text-align: center; color: #888; font-size: 0.8rem; margin-bottom: 1rem; }}
-            .delete-btn {{ display: flex; align-items: center; justify-content: center; gap: 0.5rem; background: transparent; color: #ef4444; border: 1px solid #ef4444; padding: 0.75rem 1.5rem; border-radius: 9999px; font-size: 0.85rem; cursor: pointer; margin: 1rem auto; }}
-            .delete-btn:hover {{ background: #ef4444; color: white; }}
-            footer {{ text-align: center; padding: 1.5rem 0; color: #888; font-size: 0.8rem; }}
-            footer .brand {{ color: #00d4ff; font-weight: bold; font-size: 1rem; }}
-            footer .user-id {{ font-family: monospace; color: #00d4ff; opacity: 0.6; margin-top: 0.5rem; font-size: 0.7rem; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <header>
-                <h1>🏃‍♂️ {t('workout', lang)}</h1>
-                <p class="subtitle">{formatted_datetime}</p>
-                {'<p class="user-name">' + user_name + '</p>' if user_name else ''}
-            </header>
-            
-            {map_section}
-            
-            <div class="stats">
-                <div class="stat">
-                    <div class="icon">📍</div>
-                    <div class="label">{t('distance', lang)}</div>
-                    <div class="value highlight">{dist_display}<span class="unit">{dist_unit}</span></div>
-                </div>
-                <div class="stat">
-                    <div class="icon">⏱️</div>
-                    <div class="label">{t('duration', lang)}</div>
-                    <div class="value">{duration_str}</div>
-                </div>
-                {f'<div class="stat"><div class="icon">⚡</div><div class="label">{t("pace", lang)}</div><div class="value">{pace_str}<span class="unit">/{t("km", lang)}</span></div></div>' if show_pace else f'<div class="stat"><div class="icon">🚀</div><div class="label">Speed</div><div class="value">{speed_kmh:.1f}<span class="unit">km/h</span></div></div>'}
-                {'<div class="stat"><div class="icon">❤️</div><div class="label">' + t("avg_hr", lang) + '</div><div class="value" style="color:#ef4444;">' + str(avg_hr) + '<span class="unit">BPM</span></div></div>' if avg_hr else ''}
-            </div>
-            
-            {f'<div class="section"><div class="section-title">📊 {t("workout", lang)}</div><div class="extra-stats">{extra_stats_html}</div></div>' if extra_stats_html else ''}
-            
-            {elevation_chart_html}
-            
-            <button onclick="copyWorkoutLink()" class="share-btn" id="copyLinkBtn">
-                <svg viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round" style="width:1.5rem;height:1.5rem;"><rect x="9" y="9" width="13" height="13" rx="2" ry="2"></rect><path d="M5 15H4a2 2 0 0 1-2-2V4a2 2 0 0 1 2-2h9a2 2 0 0 1 2 2v1"></path></svg>
-                <span id="copyLinkText">{t('copy_link', lang)}</span>
-            </button>
-            
-            <button onclick="deleteWorkout()" class="delete-btn">🗑️ {t('delete_workout', lang)}</button>
-            
-            <footer>
-                <div class="brand">FitBeat</div>
-                <div>{t('powered_by', lang)}</div>
-                <div class="user-id">{t('user_id', lang)}: {user_id}</div>
-            </footer>
-        </div>
-        
-        <script>
-            // Initialize Leaflet map if route data exists
-            const routeData = {route_json};
-            if (routeData.length > 0) {{
-                const map = L.map('map', {{
-                    zoomControl: true,
-                    attributionControl: false
-                }});
-                
-                // Define tile layers
-                const standardLayer = L.tileLayer('https://{{s}}.tile.openstreetmap.org/{{z}}/{{x}}/{{y}}.png', {{
-                    maxZoom: 19
-                }});
-                
-                const satelliteLayer = L.tileLayer('https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{{z}}/{{y}}/{{x}}', {{
-                    maxZoom: 19
-                }});
-                
-                const terrainOverlay = L.tileLayer('https://{{s}}.tile.opentopomap.org/{{z}}/{{x}}/{{y}}.png', {{
-                    maxZoom: 17,
-                    opacity: 0.6
-                }});
-                
-                // Add default layer
-                standardLayer.addTo(map);
-                let currentBaseLayer = standardLayer;
-                let is3DActive = false;
-                
-                // Create polyline from route
-                const polyline = L.polyline(routeData, {{
-                    color: '#ff3333',
-                    weight: 4,
-                    opacity: 0.9,
-                    lineCap: 'round',
-                    lineJoin: 'round'
-                }}).addTo(map);
-                
-                // Add start marker (green)
-                const startIcon = L.divIcon({{
-                    html: '<div style="background:#22c55e;width:16px;height:16px;border-radius:50%;border:3px solid white;box-shadow:0 2px 6px rgba(0,0,0,0.4);"></div>',
-                    className: '',
-                    iconSize: [16, 16],
-                    iconAnchor: [8, 8]
-                }});
-                L.marker(routeData[0], {{icon: startIcon}}).addTo(map);
-                
-                // Add end marker (red)
-                const endIcon = L.divIcon({{
-                    html: '<div style="background:#ef4444;width:16px;height:16px;border-radius:50%;border:3px solid white;box-shadow:0 2px 6px rgba(0,0,0,0.4);"></div>',
-                    className: '',
-                    iconSize: [16, 16],
-                    iconAnchor: [8, 8]
-                }});
-                L.marker(routeData[routeData.length - 1], {{icon: endIcon}}).addTo(map);
-                
-                // Fit map to route bounds with padding
-                map.fitBounds(polyline.getBounds(), {{
-                    padding: [30, 30]
-                }});
-                
-                // Base layer switching (Map / Satellite)
-                const baseLayers = {{
-                    'standard': standardLayer,
-                    'satellite': satelliteLayer
-                }};
-                
-                document.querySelectorAll('.map-btn[data-layer]').forEach(btn => {{
-                    btn.addEventListener('click', function() {{
-                        const layerName = this.dataset.layer;
-                        const newLayer = baseLayers[layerName];
-                        
-                        if (newLayer && newLayer !== currentBaseLayer) {{
-                            map.removeLayer(currentBaseLayer);
-                            newLayer.addTo(map);
-                            currentBaseLayer = newLayer;
-                            
-                            // Re-add terrain overlay if 3D is active
-                            if (is3DActive) {{
-                                terrainOverlay.addTo(map);
-                            }}
-                            
-                            // Update active button
-                            document.querySelectorAll('.map-btn[data-layer]').forEach(b => b.classList.remove('active'));
-                            this.classList.add('active');
-                        }}
-                    }});
-                }});
-                
-                // 3D toggle button
-                document.querySelector('.map-btn[data-toggle="terrain"]').addEventListener('click', function() {{
-                    if (is3DActive) {{
-                        map.removeLayer(terrainOverlay);
-                        this.classList.remove('active');
-                    }} else {{
-                        terrainOverlay.addTo(map);
-                        this.classList.add('active');
-                    }}
-                    is3DActive = !is3DActive;
-                }});
-            }}
-            
-            function copyWorkoutLink() {{
-                const url = window.location.href;
-                navigator.clipboard.writeText(url).then(() => {{
-                    const btn = document.getElementById('copyLinkBtn');
-                    const text = document.getElementById('copyLinkText');
-                    btn.classList.add('copied');
-                    text.textContent = '{t("link_copied", lang)}';
-                    setTimeout(() => {{
-                        btn.classList.remove('copied');
-                        text.textContent = '{t("copy_link", lang)}';
-                    }}, 2000);
-                }});
-            }}
-            
-            async function deleteWorkout() {{
-                if (confirm('{t("confirm_delete", lang)}')) {{
-                    try {{
-                        const response = await fetch('/api/workout/{workout_id}', {{ method: 'DELETE' }});
-                        if (response.ok) {{
-                            window.location.href = '/api/u/{user_id}?lang={lang}';
-                        }}
-                    }} catch (e) {{
-                        console.error(e);
-                    }}
-                }}
-            }}
-            
-            // Elevation Chart (v4.7.0)
-            const elevationData = {elevation_json if elevation_json else '[]'};
-            if (elevationData.length > 0) {{
-                const ctx = document.getElementById('elevationChart');
-                if (ctx) {{
-                    new Chart(ctx, {{
-                        type: 'line',
-                        data: {{
-                            labels: elevationData.map((_, i) => ''),
-                            datasets: [{{
-                                label: 'Elevation (m)',
-                                data: elevationData,
-                                fill: true,
-                                backgroundColor: 'rgba(0, 212, 255, 0.2)',
-                                borderColor: '#00d4ff',
-                                borderWidth: 2,
-                                pointRadius: 0,
-                                tension: 0.4
-                            }}]
-                        }},
-                        options: {{
-                            responsive: true,
-                            maintainAspectRatio: false,
-                            plugins: {{
-                                legend: {{ display: false }}
-                            }},
-                            scales: {{
-                                x: {{
-                                    display: false
-                                }},
-                                y: {{
-                                    ticks: {{
-                                        color: '#888',
-                                        callback: function(value) {{ return value + 'm'; }}
-                                    }},
-                                    grid: {{
-                                        color: 'rgba(255,255,255,0.1)'
-                                    }}
-                                }}
-                            }}
-                        }}
-                    }});
-                }}
-            }}
-        </script>
-    </body>
-    </html>
-    """
+    route_latlon = route_columns.latlon() if route_columns is not None else []
+    route_json = json.dumps(route_latlon)
+    has_route = len(route_latlon) > 0
+    
+    return templates.render(
+        "workout.html",
+        lang=lang,
+        user_id=user_id,
+        workout_id=workout_id,
+        user_name=user_name,
+        formatted_datetime=formatted_datetime,
+        processing=workout.get('processing_status') == PROCESSING_PENDING,
+        has_route=has_route,
+        route_json=route_json,
+        map_label=MAP_LABELS.get(lang, MAP_LABELS[0]),
+        dist_display=dist_display,
+        dist_unit=dist_unit,
+        duration_str=duration_str,
+        show_pace=show_pace,
+        pace_str=pace_str,
+        speed_kmh=speed_kmh,
+        avg_hr=avg_hr,
+        min_hr=min_hr,
+        max_hr=max_hr,
+        elevation_gain=elevation_gain,
+        elevation_loss=elevation_loss,
+        cadence=cadence,
+        steps=steps,
+        elevation_json=elevation_json,
+        show_elevation=bool(elevation_json and elevation_json.strip() and elevation_json != "[]"),
+    )
 
-@api_router.get("/welcome", response_class=HTMLResponse)
-async def welcome_page(lang: int = 0):
-    """Landing page - clean minimal design with working dashboard link"""
-    
-    # RTL support for Hebrew
-    dir_attr = 'dir="rtl"' if is_rtl(lang) else 'dir="ltr"'
-    lang_code = ["en", "he", "es", "fr", "de", "zh"][lang] if lang < 6 else "en"
-    
-    # Translations for this page
-    titles = ["Welcome to FitBeat", "ברוכים הבאים ל-FitBeat", "Bienvenido a FitBeat", "Bienvenue sur FitBeat", "Willkommen bei FitBeat", "欢迎使用FitBeat"]
-    slogans = ["Your Personal Fitness Tracker", "מעקב הכושר האישי שלך", "Tu Rastreador de Fitness", "Votre Tracker Fitness", "Dein Fitness Tracker", "您的健身追踪器"]
-    
-    desc_texts = [
+# Landing page strings, indexed by lang
+WELCOME_TEXTS = {
+    "title": ["Welcome to FitBeat", "ברוכים הבאים ל-FitBeat", "Bienvenido a FitBeat", "Bienvenue sur FitBeat", "Willkommen bei FitBeat", "欢迎使用FitBeat"],
+    "slogan": ["Your Personal Fitness Tracker", "מעקב הכושר האישי שלך", "Tu Rastreador de Fitness", "Votre Tracker Fitness", "Dein Fitness Tracker", "您的健身追踪器"],
+    "desc": [
         "FitBeat tracks your walks and runs on your Garmin watch, with heart rate monitoring, GPS routes, and a personal dashboard.",
         "FitBeat עוקבת אחרי ההליכות והריצות שלך בשעון Garmin, עם ניטור דופק, מסלולי GPS ודשבורד אישי.",
         "FitBeat rastrea tus caminatas y carreras en tu reloj Garmin, con monitoreo cardíaco, rutas GPS y panel personal.",
         "FitBeat suit vos marches et courses sur votre montre Garmin, avec suivi cardiaque, parcours GPS et tableau de bord.",
         "FitBeat verfolgt deine Walks und Läufe auf deiner Garmin-Uhr, mit Herzfrequenz, GPS-Routen und Dashboard.",
         "FitBeat在您的Garmin手表上追踪步行和跑步，包括心率监测、GPS路线和个人仪表板。"
-    ]
-    
-    dashboard_titles = ["Your Dashboard", "הדשבורד שלך", "Tu Panel", "Votre Tableau", "Dein Dashboard", "您的仪表板"]
-    dashboard_descs = [
+    ],
+    "dashboard_title": ["Your Dashboard", "הדשבורד שלך", "Tu Panel", "Votre Tableau", "Dein Dashboard", "您的仪表板"],
+    "dashboard_desc": [
         "After your first workout, your ID will appear on the watch. Access your dashboard at:",
         "אחרי האימון הראשון, המזהה שלך יופיע בשעון. גש לדשבורד שלך בכתובת:",
         "Después de tu primer entrenamiento, tu ID aparecerá en el reloj. Accede a tu panel en:",
         "Après votre premier entraînement, votre ID apparaîtra sur la montre. Accédez à:",
         "Nach deinem ersten Training erscheint deine ID auf der Uhr. Dein Dashboard:",
         "首次训练后，您的ID将显示在手表上。访问您的仪表板："
-    ]
-    
-    bookmark_tips = [
+    ],
+    "bookmark_tip": [
         "Save this link! Replace YOUR_ID with your personal ID from the watch.",
         "שמור את הלינק הזה! החלף YOUR_ID במזהה האישי שלך מהשעון.",
         "¡Guarda este enlace! Reemplaza YOUR_ID con tu ID personal del reloj.",
         "Sauvegardez ce lien! Remplacez YOUR_ID par votre ID sur la montre.",
         "Speichere diesen Link! Ersetze YOUR_ID mit deiner ID von der Uhr.",
         "保存此链接！将YOUR_ID替换为手表上的个人ID。"
-    ]
-    
-    download_texts = ["Download from Garmin Store", "הורד מחנות Garmin", "Descargar de Garmin Store", "Télécharger sur Garmin Store", "Im Garmin Store herunterladen", "从Garmin商店下载"]
-    
-    title = titles[lang] if lang < 6 else titles[0]
-    slogan = slogans[lang] if lang < 6 else slogans[0]
-    desc = desc_texts[lang] if lang < 6 else desc_texts[0]
-    dash_title = dashboard_titles[lang] if lang < 6 else dashboard_titles[0]
-    dash_desc = dashboard_descs[lang] if lang < 6 else dashboard_descs[0]
-    bookmark_tip = bookmark_tips[lang] if lang < 6 else bookmark_tips[0]
-    download_text = download_texts[lang] if lang < 6 else download_texts[0]
-    
-    # The working dashboard URL (production)
-    dashboard_url = "https://fitbeat.it.com/api/u/YOUR_ID"
-    
-    return f"""
-    <!DOCTYPE html>
-    <html lang="{lang_code}" {dir_attr}>
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>FitBeat - {title}</title>
-        <style>
-            * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-            body {{ 
-                font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; 
-                background: #0d0d14;
-                min-height: 100vh; 
-                color: #e0e0e0; 
-                display: flex;
-                flex-direction: column;
-                align-items: center;
-                padding: 2rem 1.5rem;
-            }}
-            
-            .container {{ 
-                max-width: 400px; 
-                width: 100%;
-                text-align: center;
-            }}
-            
-            /* Logo */
-            .logo {{ 
-                font-size: 4rem; 
-                margin-bottom: 0.5rem;
-            }}
-            
-            /* Title */
-            h1 {{ 
-                color: #00d4ff; 
-                font-size: 2rem; 
-                font-weight: 700;
-                margin-bottom: 0.25rem;
-            }}
-            
-            .slogan {{ 
-                color: #666; 
-                font-size: 0.95rem;
-                margin-bottom: 2rem;
-            }}
-            
-            /* Description */
-            .desc {{ 
-                color: #888; 
-                font-size: 0.9rem;
-                line-height: 1.6;
-                margin-bottom: 2.5rem;
-                padding: 0 0.5rem;
-            }}
-            
-            /* Dashboard Section */
-            .dashboard-section {{
-                background: linear-gradient(145deg, #151520 0%, #0f0f18 100%);
-                border: 1px solid #1a1a2a;
-                border-radius: 1rem;
-                padding: 1.5rem;
-                margin-bottom: 1.5rem;
-            }}
-            
-            .dash-title {{
-                color: #00d4ff;
-                font-size: 1.1rem;
-                font-weight: 600;
-                margin-bottom: 0.75rem;
-            }}
-            
-            .dash-desc {{
-                color: #777;
-                font-size: 0.85rem;
-                margin-bottom: 1rem;
-                line-height: 1.5;
-            }}
-            
-            /* URL Box */
-            .url-box {{
-                background: #0a0a10;
-                border: 1px solid #00d4ff40;
-                border-radius: 0.5rem;
-                padding: 1rem;
-                margin-bottom: 1rem;
-            }}
-            
-            .url-link {{
-                font-family: 'SF Mono', 'Monaco', 'Consolas', monospace;
-                color: #00d4ff;
-                font-size: 0.8rem;
-                word-break: break-all;
-                display: block;
-                text-decoration: none;
-            }}
-            
-            .url-link:hover {{
-                text-decoration: underline;
-            }}
-            
-            /* Tip */
-            .tip {{
-                color: #999;
-                font-size: 0.8rem;
-                font-style: italic;
-            }}
-            
-            /* Download Button */
-            .btn-download {{
-                display: block;
-                background: linear-gradient(135deg, #00d4ff 0%, #0099bb 100%);
-                color: #000;
-                font-weight: 700;
-                font-size: 1rem;
-                padding: 1rem 2rem;
-                border-radius: 2rem;
-                text-decoration: none;
-                margin-bottom: 1rem;
-                transition: transform 0.2s, box-shadow 0.2s;
-            }}
-            
-            .btn-download:hover {{
-                transform: translateY(-2px);
-                box-shadow: 0 8px 25px rgba(0, 212, 255, 0.3);
-            }}
-            
-            /* Footer */
-            .footer {{
-                margin-top: 2rem;
-                color: #333;
-                font-size: 0.75rem;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="logo">🏃‍♂️</div>
-            <h1>FitBeat</h1>
-            <p class="slogan">{slogan}</p>
-            
-            <p class="desc">{desc}</p>
-            
-            <div class="dashboard-section">
-                <div class="dash-title">📊 {dash_title}</div>
-                <p class="dash-desc">{dash_desc}</p>
-                <div class="url-box">
-                    <a href="{dashboard_url}" class="url-link" target="_blank">{dashboard_url}</a>
-                </div>
-                <p class="tip">💡 {bookmark_tip}</p>
-            </div>
-            
-            <a href="https://apps.garmin.com/apps/c303ee47-1ecf-4487-91c9-3de4ca1a74d5" target="_blank" class="btn-download">
-                ⬇️ {download_text}
-            </a>
-            
-            <div class="footer">FitBeat © 2026</div>
-        </div>
-    </body>
-    </html>
-    """
+    ],
+    "download": ["Download from Garmin Store", "הורד מחנות Garmin", "Descargar de Garmin Store", "Télécharger sur Garmin Store", "Im Garmin Store herunterladen", "从Garmin商店下载"],
+}
 
-@api_router.get("/u/{user_id}", response_class=HTMLResponse)
-async def dashboard_page(user_id: str, welcome: str = None, lang: int = None):
-    """Main dashboard - 50/50 layout: workout data on one side, app info on other"""
-    workouts = await db.workouts.find(
-        {"user_id": user_id},
-        {"_id": 0}
-    ).sort("timestamp", -1).to_list(500)
-    
-    # Get language from parameter, or from user's latest workout, or default to English
-    if lang is None:
-        lang = workouts[0].get('lang', 0) if workouts else 0
-    
-    # RTL support for Hebrew
-    is_rtl_lang = is_rtl(lang)
-    dir_attr = 'dir="rtl"' if is_rtl_lang else 'dir="ltr"'
-    lang_code = ["en", "he", "es", "fr", "de", "zh"][lang] if lang < 6 else "en"
-    
-    # Group workouts by year
-    from collections import defaultdict
-    years_data = defaultdict(list)
-    for w in workouts:
-        year = w.get('timestamp', '')[:4]
-        if year:
-            years_data[year].append(w)
-    
-    # Calculate total summary
-    total_dist = sum(w.get('distance_cm', 0) for w in workouts) if workouts else 0
-    total_km = total_dist / 100000
-    user_name = workouts[0].get('user_name', '') if workouts else ''
-    
-    # Build year folders
-    years_html = ""
-    for year in sorted(years_data.keys(), reverse=True):
-        year_workouts = years_data[year]
-        y_dist = sum(w.get('distance_cm', 0) for w in year_workouts) / 100000
-        y_count = len(year_workouts)
-        years_html += f"""
-        <a href="/api/u/{user_id}/year/{year}?lang={lang}" class="folder-row">
-            <div class="folder-icon">📁</div>
-            <div class="folder-info">
-                <div class="folder-name">{year}</div>
-                <div class="folder-meta">{y_count} {t('workouts', lang)}</div>
-            </div>
-            <div class="folder-stats">{y_dist:.1f} {t('km', lang)}</div>
-            <div class="folder-arrow">{'←' if is_rtl_lang else '→'}</div>
-        </a>
-        """
-    
-    # Get base URL
-    base_url = os.environ.get('APP_URL', 'https://fitbeat.it.com')
-    dashboard_url = f"{base_url}/api/u/{user_id}?lang={lang}"
-    share_text = f"📊 FitBeat%0A🏃 {len(workouts)} {t('workouts', lang)}%0A📍 {total_km:.1f} {t('km', lang)}%0A🔗 {dashboard_url}"
-    
-    # Detailed app descriptions per language
-    app_descriptions = {
-        0: """<b>How to use FitBeat:</b>
+# The landing page only depends on lang: rendered once per language
+templates.prerender("welcome.html", PAGE_LANGS, text=WELCOME_TEXTS, store_url=GARMIN_STORE_URL,
+                    dashboard_url="https://fitbeat.it.com/api/u/YOUR_ID")
+
+@api_router.get("/welcome", response_class=HTMLResponse)
+async def welcome_page(lang: int = 0):
+    """Landing page - clean minimal design with working dashboard link"""
+    return templates.static("welcome.html", lang)
+
+# Detailed app descriptions per language (dashboard info column)
+APP_DESCRIPTIONS = {
+    0: """<b>How to use FitBeat:</b>
 
 <b>Main Screen:</b>
 - Tap the <b>TIME</b> (top) → Opens Settings (language, name, 10 colors)
@@ -1757,7 +2189,7 @@ async def dashboard_page(user_id: str, welcome: str = None, lang: int = None):
 - Garmin Connect app must be open on your phone for sync
 - Turn OFF Focus/DND mode on your watch for vibration alerts""",
 
-        1: """<b>איך להשתמש ב-FitBeat:</b>
+    1: """<b>איך להשתמש ב-FitBeat:</b>
 
 <b>מסך ראשי:</b>
 - לחץ על <b>השעה</b> (למעלה) ← הגדרות (שפה, שם, 10 צבעים)
@@ -1788,7 +2220,7 @@ async def dashboard_page(user_id: str, welcome: str = None, lang: int = None):
 - אפליקציית Garmin Connect צריכה להיות פתוחה בטלפון לסנכרון
 - כבה מצב מיקוד (DND) בשעון כדי לקבל רטטים והתראות""",
 
-        2: """<b>Cómo usar FitBeat:</b>
+    2: """<b>Cómo usar FitBeat:</b>
 
 <b>Pantalla principal:</b>
 - Toca la <b>HORA</b> (arriba) → Ajustes (idioma, nombre, 10 colores)
@@ -1818,7 +2250,7 @@ async def dashboard_page(user_id: str, welcome: str = None, lang: int = None):
 <b>Importante:</b> Garmin Connect debe estar abierta en tu telefono.
 - Desactiva el modo No Molestar para recibir vibraciones.""",
 
-        3: """<b>Comment utiliser FitBeat:</b>
+    3: """<b>Comment utiliser FitBeat:</b>
 
 <b>Ecran principal:</b>
 - Touchez l'<b>HEURE</b> (haut) → Parametres (langue, nom, 10 couleurs)
@@ -1849,7 +2281,7 @@ async def dashboard_page(user_id: str, welcome: str = None, lang: int = None):
 - Garmin Connect doit etre ouverte sur votre telephone
 - Desactivez le mode Ne Pas Deranger pour les vibrations""",
 
-        4: """<b>So verwendest du FitBeat:</b>
+    4: """<b>So verwendest du FitBeat:</b>
 
 <b>Hauptbildschirm:</b>
 - Tippe auf die <b>UHRZEIT</b> (oben) → Einstellungen (Sprache, Name, 10 Farben)
@@ -1880,7 +2312,7 @@ async def dashboard_page(user_id: str, welcome: str = None, lang: int = None):
 - Garmin Connect muss auf deinem Handy geoffnet sein
 - Deaktiviere den Nicht-Storen-Modus fur Vibrationen""",
 
-        5: """<b>如何使用FitBeat：</b>
+    5: """<b>如何使用FitBeat：</b>
 
 <b>主屏幕：</b>
 - 点击<b>时间</b>（顶部）→ 设置（语言、名称、10种颜色）
@@ -1910,802 +2342,290 @@ async def dashboard_page(user_id: str, welcome: str = None, lang: int = None):
 <b>重要:</b>
 - Garmin Connect必须在手机上打开
 - 关闭勿扰模式以接收振动提醒"""
-    }
+}
+
+templates.prerender("partials/dashboard_info.html", PAGE_LANGS, app_descriptions=APP_DESCRIPTIONS, store_url=GARMIN_STORE_URL)
+
+# Rendered pages, see page_cache.py: single-workout pages keyed by workout id
+# and document version, user pages by path and the user's data version.
+page_cache = PageCache.from_env()
+
+# The dashboard, year, month and monthly pages show nothing the user's data
+# version doesn't cover, so a rendered page is reused until the next write.
+# The version is read before the page's data and bumped after a write lands,
+# so a page is never cached under a version newer than what it shows. A hit
+# costs one user_versions lookup instead of the page's queries and render.
+# Like the workout page, each entry is compressed once in the client's
+# preferred encoding, so a hit skips CompressionMiddleware's work too.
+async def cached_user_page(request: Request, user_id: str, path: str, lang: Optional[int], render) -> HTMLResponse:
+    version = await user_data_version(user_id)
+    page_id = f"/api/u/{user_id}{path}"
+    encoding = negotiate(request.headers.get("accept-encoding", ""))
+    page = page_cache.get(page_id, lang, version, encoding)
+    if page is None:
+        page = (await render()).encode()
+        if encoding:
+            page = compressor.compress(page, encoding)
+        page_cache.put(page_id, lang, version, page, encoding)
+    return HTMLResponse(content=page, headers={"Content-Encoding": encoding} if encoding else None)
+
+@api_router.get("/u/{user_id}", response_class=HTMLResponse)
+async def dashboard_page(request: Request, user_id: str, welcome: str = None, lang: int = None):
+    """Main dashboard - 50/50 layout: workout data on one side, app info on other"""
+    return await cached_user_page(request, user_id, "", lang, lambda: render_dashboard(user_id, lang))
+
+async def render_dashboard(user_id: str, lang: Optional[int]) -> str:
+    year_rollups = await db.user_rollups.find(
+        {"user_id": user_id, "kind": "year", "count": {"$gt": 0}}, {"_id": 0}
+    ).sort("period", -1).to_list(None)
+    latest = await repo.workouts.latest(user_id, ("lang", "user_name"))
     
-    app_desc = app_descriptions.get(lang, app_descriptions[0])
+    # Get language from parameter, or from user's latest workout, or default to English
+    if lang is None:
+        lang = latest.get('lang', 0) if latest else 0
     
-    # Bookmark instructions per language
-    bookmark_instructions = {
-        0: "iOS: Tap Share → Add to Home Screen\\nAndroid: Tap ⋮ → Add to Home screen\\nDesktop: Press Ctrl+D or Cmd+D",
-        1: "iOS: לחץ שיתוף ← הוסף למסך הבית\\nAndroid: לחץ ⋮ ← הוסף למסך הבית\\nמחשב: לחץ Ctrl+D או Cmd+D",
-        2: "iOS: Toca Compartir → Añadir a inicio\\nAndroid: Toca ⋮ → Añadir a inicio\\nPC: Ctrl+D o Cmd+D",
-        3: "iOS: Appuyez Partager → Ajouter à l'écran\\nAndroid: Appuyez ⋮ → Ajouter à l'écran\\nPC: Ctrl+D ou Cmd+D",
-        4: "iOS: Teilen → Zum Home-Bildschirm\\nAndroid: ⋮ → Zum Startbildschirm\\nPC: Strg+D oder Cmd+D",
-        5: "iOS: 点击分享 → 添加到主屏幕\\nAndroid: 点击 ⋮ → 添加到主屏幕\\n电脑: Ctrl+D 或 Cmd+D",
-    }
-    bookmark_alert = bookmark_instructions.get(lang, bookmark_instructions[0])
-    
-    return f"""
-    <!DOCTYPE html>
-    <html lang="{lang_code}" {dir_attr}>
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>FitBeat - {user_name or user_id}</title>
-        <style>
-            * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-            body {{ 
-                font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; 
-                background: #0a0a12;
-                min-height: 100vh; 
-                color: #e0e0e0; 
-            }}
-            
-            /* 50/50 Two column layout */
-            .page-container {{
-                display: flex;
-                flex-direction: {'row-reverse' if is_rtl_lang else 'row'};
-                min-height: 100vh;
-            }}
-            
-            /* Left side - Workout data (50%) */
-            .data-section {{
-                flex: 1;
-                padding: 2rem;
-                border-{'left' if is_rtl_lang else 'right'}: 1px solid #1a1a2a;
-                overflow-y: auto;
-            }}
-            
-            /* Right side - App info (50%) */
-            .info-section {{
-                flex: 1;
-                padding: 2rem;
-                background: linear-gradient(180deg, #0d0d18 0%, #0a0a12 100%);
-                overflow-y: auto;
-            }}
-            
-            /* Mobile: stack vertically */
-            @media (max-width: 900px) {{
-                .page-container {{
-                    flex-direction: column;
-                }}
-                .data-section {{
-                    border: none;
-                    border-bottom: 1px solid #1a1a2a;
-                }}
-            }}
-            
-            /* Header */
-            .section-header {{
-                text-align: center;
-                padding-bottom: 1.5rem;
-                margin-bottom: 1.5rem;
-                border-bottom: 1px solid #1a1a2a;
-            }}
-            .section-header h1 {{ color: #00d4ff; font-size: 1.8rem; }}
-            .section-header .subtitle {{ color: #666; font-size: 0.9rem; margin-top: 0.5rem; }}
-            .user-name {{ color: #888; font-size: 1rem; margin-top: 0.25rem; }}
-            
-            /* Summary card */
-            .summary {{
-                background: linear-gradient(145deg, #12121c 0%, #0d0d14 100%);
-                border: 1px solid #1a1a2a;
-                border-radius: 1rem;
-                padding: 1.25rem;
-                margin-bottom: 1.5rem;
-            }}
-            .summary-title {{ color: #555; font-size: 0.85rem; margin-bottom: 1rem; }}
-            .summary-grid {{
-                display: grid;
-                grid-template-columns: 1fr 1fr;
-                gap: 1rem;
-                text-align: center;
-            }}
-            .summary-value {{ font-size: 2.2rem; font-weight: bold; color: #00d4ff; }}
-            .summary-value.green {{ color: #22c55e; }}
-            .summary-label {{ color: #555; font-size: 0.8rem; margin-top: 0.25rem; }}
-            
-            /* Folders */
-            .folders {{
-                background: linear-gradient(145deg, #12121c 0%, #0d0d14 100%);
-                border: 1px solid #1a1a2a;
-                border-radius: 1rem;
-                padding: 1rem;
-                margin-bottom: 1.5rem;
-            }}
-            .folders-title {{ color: #555; font-size: 0.85rem; margin-bottom: 1rem; }}
-            
-            .folder-row {{
-                display: flex;
-                align-items: center;
-                padding: 0.875rem;
-                background: rgba(0,0,0,0.3);
-                border-radius: 0.75rem;
-                margin-bottom: 0.5rem;
-                text-decoration: none;
-                color: white;
-                transition: background 0.2s;
-            }}
-            .folder-row:hover {{ background: rgba(0,212,255,0.1); }}
-            .folder-icon {{ font-size: 1.5rem; margin-{'left' if is_rtl_lang else 'right'}: 0.75rem; }}
-            .folder-info {{ flex: 1; }}
-            .folder-name {{ font-weight: bold; font-size: 1.1rem; }}
-            .folder-meta {{ color: #555; font-size: 0.8rem; }}
-            .folder-stats {{ color: #22c55e; font-weight: bold; margin-{'right' if is_rtl_lang else 'left'}: 0.75rem; }}
-            .folder-arrow {{ color: #00d4ff; font-size: 1.2rem; }}
-            
-            .no-workouts {{ text-align: center; padding: 2rem 1rem; color: #555; }}
-            .no-workouts-icon {{ font-size: 3rem; margin-bottom: 0.75rem; }}
-            
-            /* Buttons */
-            .share-btn {{
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                gap: 0.5rem;
-                background: linear-gradient(90deg, #25D366 0%, #128C7E 100%);
-                color: white;
-                padding: 0.875rem 1.5rem;
-                border-radius: 2rem;
-                font-weight: 600;
-                text-decoration: none;
-                margin-bottom: 0.75rem;
-            }}
-            
-            .delete-btn {{
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                gap: 0.5rem;
-                background: transparent;
-                color: #ef4444;
-                border: 1px solid #ef4444;
-                padding: 0.6rem 1.25rem;
-                border-radius: 2rem;
-                font-size: 0.85rem;
-                cursor: pointer;
-            }}
-            .delete-btn:hover {{ background: #ef4444; color: white; }}
-            
-            /* Info section styles */
-            .info-header {{
-                text-align: center;
-                padding-bottom: 1.5rem;
-                margin-bottom: 1.5rem;
-                border-bottom: 1px solid #1a1a2a;
-            }}
-            .info-header .logo {{ font-size: 3.5rem; }}
-            .info-header h2 {{ color: #00d4ff; font-size: 2rem; margin-top: 0.5rem; }}
-            .info-header .tagline {{ color: #555; font-size: 0.9rem; margin-top: 0.25rem; }}
-            
-            .app-description {{
-                background: linear-gradient(145deg, #12121c 0%, #0d0d14 100%);
-                border: 1px solid #1a1a2a;
-                border-radius: 1rem;
-                padding: 1.5rem;
-                margin-bottom: 1.5rem;
-            }}
-            .app-description-text {{
-                color: #aaa;
-                font-size: 0.9rem;
-                line-height: 1.7;
-                white-space: pre-line;
-            }}
-            .app-description-text b {{
-                color: #00d4ff;
-                font-weight: 600;
-            }}
-            
-            .info-buttons {{
-                display: flex;
-                flex-direction: column;
-                gap: 0.75rem;
-                margin-bottom: 1.5rem;
-            }}
-            
-            .download-btn {{
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                gap: 0.5rem;
-                background: linear-gradient(135deg, #00d4ff 0%, #0099bb 100%);
-                color: #000;
-                font-weight: 700;
-                padding: 1rem 1.5rem;
-                border-radius: 2rem;
-                text-decoration: none;
-                font-size: 1rem;
-            }}
-            
-            /* Personal Link Box */
-            .personal-link-box {{
-                background: linear-gradient(145deg, #12121c 0%, #0d0d14 100%);
-                border: 1px solid #00d4ff40;
-                border-radius: 1rem;
-                padding: 1.25rem;
-                margin-bottom: 1rem;
-                text-align: center;
-            }}
-            .link-title {{
-                color: #00d4ff;
-                font-size: 0.9rem;
-                margin-bottom: 0.75rem;
-            }}
-            .link-url {{
-                background: #0a0a10;
-                border: 1px solid #1a1a2a;
-                border-radius: 0.5rem;
-                padding: 0.75rem;
-                font-family: monospace;
-                font-size: 0.75rem;
-                color: #00d4ff;
-                word-break: break-all;
-                margin-bottom: 0.75rem;
-            }}
-            .copy-btn {{
-                background: linear-gradient(135deg, #00d4ff 0%, #0099bb 100%);
-                color: #000;
-                border: none;
-                padding: 0.6rem 1.5rem;
-                border-radius: 2rem;
-                font-weight: 600;
-                cursor: pointer;
-                font-size: 0.9rem;
-            }}
-            .copy-btn:hover {{ opacity: 0.9; }}
-            .link-tip {{
-                color: #666;
-                font-size: 0.75rem;
-                margin-top: 0.75rem;
-            }}
-            
-            .footer {{
-                text-align: center;
-                padding-top: 1rem;
-                color: #333;
-                font-size: 0.75rem;
-            }}
-            .footer .user-id {{ color: #00d4ff; opacity: 0.5; font-family: monospace; margin-top: 0.25rem; }}
-        </style>
-    </head>
-    <body>
-        <div class="page-container">
-            <!-- Data Section - Workout Stats -->
-            <div class="data-section">
-                <div class="section-header">
-                    <h1>📊 {t('total_summary', lang)}</h1>
-                    {'<p class="user-name">' + user_name + '</p>' if user_name else ''}
-                </div>
-                
-                <div class="summary">
-                    <div class="summary-grid">
-                        <div>
-                            <div class="summary-value">{len(workouts)}</div>
-                            <div class="summary-label">{t('workouts', lang)}</div>
-                        </div>
-                        <div>
-                            <div class="summary-value green">{total_km:.1f}</div>
-                            <div class="summary-label">{t('km_total', lang)}</div>
-                        </div>
-                    </div>
-                </div>
-                
-                <div class="folders">
-                    <div class="folders-title">📁 {t('by_years', lang)}</div>
-                    {years_html if years_html else f'<div class="no-workouts"><div class="no-workouts-icon">🏃‍♂️</div><p>{t("no_workouts", lang)}</p><p style="font-size:0.8rem;margin-top:0.5rem;">{t("finish_goal", lang)}</p></div>'}
-                </div>
-                
-                <!-- Personal Link Box -->
-                <div class="personal-link-box">
-                    <div class="link-title">{t('your_personal_link', lang)}</div>
-                    <div class="link-url" id="dashboardUrl">{dashboard_url}</div>
-                    <button onclick="copyLink()" class="copy-btn">{t('copy_link', lang)}</button>
-                    <div class="link-tip">{t('save_this_link', lang)}</div>
-                </div>
-                
-                {f'<button onclick="deleteAll()" class="delete-btn">🗑️ {t("delete_all", lang)}</button>' if workouts else ''}
-            </div>
-            
-            <!-- Info Section - App Description -->
-            <div class="info-section">
-                <div class="info-header">
-                    <div class="logo">🏃‍♂️</div>
-                    <h2>FitBeat</h2>
-                    <p class="tagline">{t('about_app', lang)}</p>
-                </div>
-                
-                <div class="app-description">
-                    <div class="app-description-text">{app_desc}</div>
-                </div>
-                
-                <div class="info-buttons">
-                    <a href="https://apps.garmin.com/apps/c303ee47-1ecf-4487-91c9-3de4ca1a74d5" target="_blank" class="download-btn">⬇️ {t('download_app', lang)}</a>
-                </div>
-                
-                <div class="footer">
-                    <div>FitBeat © 2026</div>
-                    <div class="user-id">{t('user_id', lang)}: {user_id}</div>
-                </div>
-            </div>
-        </div>
-        
-        <script>
-            async function deleteAll() {{
-                if (confirm('{t("confirm_delete_all", lang)}')) {{
-                    await fetch('/api/workout/user/{user_id}/all', {{ method: 'DELETE' }});
-                    location.reload();
-                }}
-            }}
-            
-            function copyLink() {{
-                var linkText = document.getElementById('dashboardUrl').innerText;
-                navigator.clipboard.writeText(linkText).then(function() {{
-                    var btn = document.querySelector('.copy-btn');
-                    btn.innerText = '{t("link_copied", lang)}';
-                    btn.style.background = '#22c55e';
-                    setTimeout(function() {{
-                        btn.innerText = '{t("copy_link", lang)}';
-                        btn.style.background = '';
-                    }}, 2000);
-                }});
-            }}
-        </script>
-    </body>
-    </html>
-    """
+    # Calculate total summary from the per-year rollups
+    totals = rollup_averages(year_rollups)
+    base_url = os.environ.get('APP_URL', 'https://fitbeat.it.com')
+    user = escape(user_id)
+    user_name = escape(latest.get('user_name', '') if latest else '')
+    years = [
+        {"href": f"/api/u/{user}/year/{rollup['period']}", "name": rollup["period"], "count": rollup["count"],
+         "distance": f"{rollup['distance_cm'] / 100000:.1f}"}
+        for rollup in year_rollups
+    ]
+    return templates.fill(
+        "dashboard.html",
+        lang,
+        {
+            "user_id": user,
+            "user_name": user_name,
+            "workout_count": totals["count"],
+            "total_km": f"{totals['distance_cm'] / 100000:.1f}",
+            "rows": fill_rows("partials/folder_row.html", lang, years),
+            "dashboard_url": escape(f"{base_url}/api/u/{user_id}?lang={lang}"),
+        },
+        has_name=bool(user_name),
+        has_years=bool(years),
+        has_workouts=bool(totals["count"]),
+        app_info=templates.static("partials/dashboard_info.html", lang),
+    )
 
 @api_router.get("/u/{user_id}/year/{year}", response_class=HTMLResponse)
-async def year_page(user_id: str, year: str, lang: int = None):
+async def year_page(request: Request, user_id: str, year: str, lang: int = None):
     """Year page - shows months as folders"""
-    workouts = await db.workouts.find(
-        {"user_id": user_id, "timestamp": {"$regex": f"^{year}"}},
-        {"_id": 0}
-    ).sort("timestamp", -1).to_list(500)
+    return await cached_user_page(request, user_id, f"/year/{year}", lang, lambda: render_year(user_id, year, lang))
+
+async def render_year(user_id: str, year: str, lang: Optional[int]) -> str:
+    period = local_date_period(year)
+    month_rollups = await db.user_rollups.find(
+        {"user_id": user_id, "kind": "month", "year": int(year), "count": {"$gt": 0}}, {"_id": 0}
+    ).sort("period", -1).to_list(12) if period else []
     
     # Get language
     if lang is None:
-        lang = workouts[0].get('lang', 0) if workouts else 0
+        latest = await repo.workouts.latest(user_id, ("lang",), period) if period else None
+        lang = latest.get('lang', 0) if latest else 0
     
-    # RTL support
-    dir_attr = 'dir="rtl"' if is_rtl(lang) else 'dir="ltr"'
-    lang_code = ["en", "he", "es", "fr", "de", "zh"][lang] if lang < 6 else "en"
-    
-    from collections import defaultdict
-    months_data = defaultdict(list)
-    for w in workouts:
-        month = w.get('timestamp', '')[5:7]
-        if month:
-            months_data[month].append(w)
-    
-    total_dist = sum(w.get('distance_cm', 0) for w in workouts) / 100000
-    total_time = sum(w.get('duration_sec', 0) for w in workouts)
-    total_hrs = total_time // 3600
-    total_mins = (total_time % 3600) // 60
-    time_str = f"{total_hrs}:{total_mins:02d}"
-    avg_hr_list = [w.get('avg_hr') for w in workouts if w.get('avg_hr')]
-    avg_hr = round(sum(avg_hr_list) / len(avg_hr_list)) if avg_hr_list else 0
-    
-    months_html = ""
-    for month in sorted(months_data.keys(), reverse=True):
-        month_workouts = months_data[month]
-        m_dist = sum(w.get('distance_cm', 0) for w in month_workouts) / 100000
-        m_count = len(month_workouts)
-        month_name = get_month_name(int(month), lang)
-        
-        months_html += f"""
-        <a href="/api/u/{user_id}/year/{year}/month/{month}?lang={lang}" class="folder-row">
-            <div class="folder-icon">📁</div>
-            <div class="folder-info">
-                <div class="folder-name">{month_name}</div>
-                <div class="folder-meta">{m_count} {t('workouts', lang)}</div>
-            </div>
-            <div class="folder-stats">{m_dist:.1f} {t('km', lang)}</div>
-            <div class="folder-arrow">{'←' if is_rtl(lang) else '→'}</div>
-        </a>
-        """
-    
-    return f"""
-    <!DOCTYPE html>
-    <html lang="{lang_code}" {dir_attr}>
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>FitBeat - {year}</title>
-        <style>
-            * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-            body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; background: linear-gradient(135deg, #1a1a2e 0%, #16213e 100%); min-height: 100vh; color: white; padding: 1rem; }}
-            .container {{ max-width: 480px; margin: 0 auto; }}
-            .back {{ display: inline-flex; align-items: center; gap: 0.5rem; color: #00d4ff; text-decoration: none; margin-bottom: 1rem; font-size: 0.9rem; }}
-            header {{ text-align: center; padding: 1rem 0; border-bottom: 1px solid rgba(255,255,255,0.1); margin-bottom: 1.5rem; }}
-            h1 {{ color: #00d4ff; font-size: 1.5rem; }}
-            .subtitle {{ color: #888; margin-top: 0.25rem; }}
-            
-            .summary {{ background: linear-gradient(135deg, #1e1e3f 0%, #151530 100%); border-radius: 1rem; padding: 1.25rem; margin-bottom: 1.5rem; border: 1px solid rgba(0,212,255,0.2); }}
-            .summary-title {{ color: #888; font-size: 0.85rem; margin-bottom: 0.75rem; }}
-            .summary-row {{ display: flex; justify-content: space-around; text-align: center; }}
-            .summary-item {{ }}
-            .summary-value {{ font-size: 1.5rem; font-weight: bold; color: #00d4ff; }}
-            .summary-value.green {{ color: #22c55e; }}
-            .summary-label {{ color: #888; font-size: 0.75rem; }}
-            
-            .folders {{ background: linear-gradient(135deg, #1e1e3f 0%, #151530 100%); border-radius: 1rem; padding: 1rem; }}
-            .folders-title {{ color: #888; font-size: 0.85rem; margin-bottom: 1rem; }}
-            
-            .folder-row {{ display: flex; align-items: center; padding: 1rem; background: rgba(0,0,0,0.2); border-radius: 0.75rem; margin-bottom: 0.5rem; text-decoration: none; color: white; transition: all 0.2s; }}
-            .folder-row:hover {{ background: rgba(0,212,255,0.1); transform: translateX(-4px); }}
-            .folder-icon {{ font-size: 1.75rem; {"margin-left" if is_rtl(lang) else "margin-right"}: 0.75rem; }}
-            .folder-info {{ flex: 1; }}
-            .folder-name {{ font-weight: bold; font-size: 1.1rem; }}
-            .folder-meta {{ color: #888; font-size: 0.8rem; }}
-            .folder-stats {{ color: #22c55e; font-weight: bold; {"margin-left" if is_rtl(lang) else "margin-right"}: 0.75rem; }}
-            .folder-arrow {{ color: #00d4ff; font-size: 1.25rem; }}
-            
-            footer {{ text-align: center; padding: 1.5rem 0; color: #888; font-size: 0.8rem; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <a href="/api/u/{user_id}?lang={lang}" class="back">{'→' if is_rtl(lang) else '←'} {t('back', lang)}</a>
-            <header>
-                <h1>📁 {year}</h1>
-                <p class="subtitle">{len(workouts)} {t('workouts', lang)}</p>
-            </header>
-            
-            <div class="summary">
-                <div class="summary-title">📊 {t('yearly_summary', lang)} {year}</div>
-                <div class="summary-row">
-                    <div class="summary-item">
-                        <div class="summary-value">{len(workouts)}</div>
-                        <div class="summary-label">{t('workouts', lang)}</div>
-                    </div>
-                    <div class="summary-item">
-                        <div class="summary-value green">{total_dist:.1f}</div>
-                        <div class="summary-label">{t('km', lang)}</div>
-                    </div>
-                    <div class="summary-item">
-                        <div class="summary-value">{time_str}</div>
-                        <div class="summary-label">{t('hours', lang)}</div>
-                    </div>
-                    <div class="summary-item">
-                        <div class="summary-value" style="color:#ef4444;">{avg_hr}</div>
-                        <div class="summary-label">{t('avg_hr', lang)}</div>
-                    </div>
-                </div>
-            </div>
-            
-            <div class="folders">
-                {months_html}
-            </div>
-            
-            <footer>FitBeat</footer>
-        </div>
-    </body>
-    </html>
-    """
+    user, year = escape(user_id), escape(year)
+    months = [
+        {
+            "href": f"/api/u/{user}/year/{year}/month/{rollup['period'][5:7]}",
+            "name": get_month_name(int(rollup["period"][5:7]), lang),
+            "count": rollup["count"],
+            "distance": f"{rollup['distance_cm'] / 100000:.1f}",
+        }
+        for rollup in month_rollups
+    ]
+    return templates.fill(
+        "year.html",
+        lang,
+        {"user_id": user, "year": year, "rows": fill_rows("partials/folder_row.html", lang, months),
+         **period_summary(rollup_averages(month_rollups))},
+        stats=PERIOD_STATS,
+    )
+
+# Summary row of the year and month pages: (slot, label, css class) per item
+PERIOD_STATS = (("count", "workouts", ""), ("distance", "km", "green"), ("hours", "hours", ""), ("avg_hr", "avg_hr", "hr"))
+PERIOD_STATS_WITH_STEPS = PERIOD_STATS + (("steps", "steps", ""),)
+
+def period_summary(totals: dict) -> dict:
+    """Slot values of the year and month pages' summary row (see PERIOD_STATS)"""
+    total_time = totals["duration_sec"]
+    return {
+        "count": totals["count"],
+        "distance": f"{totals['distance_cm'] / 100000:.1f}",
+        "hours": f"{total_time // 3600}:{(total_time % 3600) // 60:02d}",
+        "avg_hr": totals["avg_hr"] or 0,
+        "steps": f"{totals['steps']:,}",
+    }
+
+def fill_rows(name: str, lang: int, rows) -> str:
+    """A row partial filled in for each row; the fragment is looked up once per list"""
+    fragment = templates.fragment(name, lang)
+    return "\n".join(map(fragment.format_map, rows))
+
+def load_more_button(url: str, next_token: Optional[str], lang: int) -> str:
+    """Button that fetches the rows after next_token (see partials/load_more.html); empty on the last page"""
+    if not next_token:
+        return ""
+    return "\n" + templates.fill("partials/load_more.html", lang,
+                                 {"url": escape(f"{url}{'&' if '?' in url else '?'}cursor={next_token}")})
+
+async def month_workouts_page(user_id: str, year: str, month: str, cursor: Optional[str] = None):
+    """(workouts, next_token) for a month page; None if the period or cursor is invalid"""
+    period = local_date_period(year, month)
+    if period is None:
+        return None
+    after = None
+    if cursor:
+        after = page_after(cursor)
+        if after is None:
+            return None
+    return await fetch_workout_page(user_id, after=after, period=period)
+
+def month_row(w: dict, user_id: str) -> dict:
+    """Slot values of a month page workout row; user_id comes escaped"""
+    dist_km = w.get('distance_cm', 0) / 100000
+    dur_sec = w.get('duration_sec', 0)
+    timestamp = workout_time_str(w)
+    if dist_km > 0:
+        pace_sec = dur_sec / dist_km
+        pace_str = f"{int(pace_sec//60)}:{int(pace_sec%60):02d}"
+    else:
+        pace_str = "--:--"
+    return {
+        "user_id": user_id,
+        "id": escape(w.get('id', '')),
+        "day": timestamp[8:10] if len(timestamp) >= 10 else '',
+        "time_of_day": timestamp[11:16] if len(timestamp) >= 16 else '',  # HH:MM
+        "distance": f"{dist_km:.2f}",
+        "pace": pace_str,
+        "duration": f"{dur_sec // 60}:{dur_sec % 60:02d}",
+        "hr": w.get('avg_hr', '--'),
+    }
+
+@api_router.get("/u/{user_id}/year/{year}/month/{month}/more", response_class=HTMLResponse)
+async def month_page_more(user_id: str, year: str, month: str, cursor: str, lang: int = 0):
+    """Next page of month page rows (HTML fragment for the load-more button)"""
+    page = await month_workouts_page(user_id, year, month, cursor)
+    if page is None:
+        return HTMLResponse("", status_code=400)
+    workouts, next_token = page
+    user = escape(user_id)
+    return fill_rows("partials/month_row.html", lang, [month_row(w, user) for w in workouts]) + load_more_button(
+        f"/api/u/{user_id}/year/{year}/month/{month}/more?lang={lang}", next_token, lang
+    )
 
 @api_router.get("/u/{user_id}/year/{year}/month/{month}", response_class=HTMLResponse)
-async def month_page_view(user_id: str, year: str, month: str, lang: int = None):
-    """Month page - shows workouts list"""
-    workouts = await db.workouts.find(
-        {"user_id": user_id, "timestamp": {"$regex": f"^{year}-{month}"}},
-        {"_id": 0}
-    ).sort("timestamp", -1).to_list(100)
+async def month_page_view(request: Request, user_id: str, year: str, month: str, lang: int = None):
+    """Month page - month totals from the rollup, first page of the workouts list"""
+    return await cached_user_page(request, user_id, f"/year/{year}/month/{month}", lang,
+                                  lambda: render_month(user_id, year, month, lang))
+
+async def render_month(user_id: str, year: str, month: str, lang: Optional[int]) -> str:
+    workouts, next_token = await month_workouts_page(user_id, year, month) or ([], None)
+    rollup = None
+    if workouts:
+        rollup = await db.user_rollups.find_one({"_id": f"{user_id}:{workouts[0]['local_date'][:7]}"}, {"_id": 0})
+    totals = rollup_averages([rollup] if rollup else [])
     
     # Get language
     if lang is None:
         lang = workouts[0].get('lang', 0) if workouts else 0
     
-    # RTL support
-    dir_attr = 'dir="rtl"' if is_rtl(lang) else 'dir="ltr"'
-    lang_code = ["en", "he", "es", "fr", "de", "zh"][lang] if lang < 6 else "en"
-    
-    month_name = get_month_name(int(month), lang)
-    
-    total_dist = sum(w.get('distance_cm', 0) for w in workouts) / 100000
-    total_time = sum(w.get('duration_sec', 0) for w in workouts)
-    total_hrs = total_time // 3600
-    total_mins = (total_time % 3600) // 60
-    time_str = f"{total_hrs}:{total_mins:02d}"
-    avg_hr_list = [w.get('avg_hr') for w in workouts if w.get('avg_hr')]
-    avg_hr = round(sum(avg_hr_list) / len(avg_hr_list)) if avg_hr_list else 0
-    total_steps = sum(w.get('steps', 0) or 0 for w in workouts)
-    
-    workouts_html = ""
-    for w in workouts:
-        dist_km = w.get('distance_cm', 0) / 100000
-        dur_sec = w.get('duration_sec', 0)
-        dur_min = dur_sec // 60
-        dur_s = dur_sec % 60
-        hr = w.get('avg_hr', '--')
-        timestamp = w.get('timestamp', '')
-        day = timestamp[8:10] if len(timestamp) >= 10 else ''
-        time_of_day = timestamp[11:16] if len(timestamp) >= 16 else ''  # HH:MM
-        workout_id = w.get('id', '')
-        
-        if dist_km > 0:
-            pace_sec = dur_sec / dist_km
-            pace_str = f"{int(pace_sec//60)}:{int(pace_sec%60):02d}"
-        else:
-            pace_str = "--:--"
-        
-        workouts_html += f"""
-        <a href="/api/u/{user_id}/workout/{workout_id}?lang={lang}" class="workout-row">
-            <div class="workout-day">{day}</div>
-            <div class="workout-info">
-                <div class="workout-dist">{dist_km:.2f} {t('km', lang)}</div>
-                <div class="workout-pace">🕐 {time_of_day} | ⚡ {pace_str}/{t('km', lang)}</div>
-            </div>
-            <div class="workout-time">{dur_min}:{dur_s:02d}</div>
-            <div class="workout-hr">❤️ {hr}</div>
-            <div class="workout-arrow">{'←' if is_rtl(lang) else '→'}</div>
-        </a>
-        """
-    
-    base_url = os.environ.get('APP_URL', 'https://fitbeat.it.com')
-    share_text = f"📅 {month_name} {year}%0A🏃 {len(workouts)} {t('workouts', lang)}%0A📍 {total_dist:.1f} {t('km', lang)}%0A⏱️ {time_str} {t('hours', lang)}%0A%0A🔗 {base_url}/api/u/{user_id}/year/{year}/month/{month}?lang={lang}"
-    
-    return f"""
-    <!DOCTYPE html>
-    <html lang="{lang_code}" {dir_attr}>
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>FitBeat - {month_name} {year}</title>
-        <style>
-            * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-            body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; background: linear-gradient(135deg, #1a1a2e 0%, #16213e 100%); min-height: 100vh; color: white; padding: 1rem; }}
-            .container {{ max-width: 480px; margin: 0 auto; }}
-            .back {{ display: inline-flex; align-items: center; gap: 0.5rem; color: #00d4ff; text-decoration: none; margin-bottom: 1rem; font-size: 0.9rem; }}
-            header {{ text-align: center; padding: 1rem 0; border-bottom: 1px solid rgba(255,255,255,0.1); margin-bottom: 1.5rem; }}
-            h1 {{ color: #00d4ff; font-size: 1.5rem; }}
-            .subtitle {{ color: #888; margin-top: 0.25rem; }}
-            
-            .summary {{ background: linear-gradient(135deg, #1e1e3f 0%, #151530 100%); border-radius: 1rem; padding: 1.25rem; margin-bottom: 1.5rem; border: 1px solid rgba(0,212,255,0.2); }}
-            .summary-title {{ color: #888; font-size: 0.85rem; margin-bottom: 0.75rem; }}
-            .summary-row {{ display: flex; justify-content: space-around; text-align: center; }}
-            .summary-item {{ }}
-            .summary-value {{ font-size: 1.3rem; font-weight: bold; color: #00d4ff; }}
-            .summary-value.green {{ color: #22c55e; }}
-            .summary-label {{ color: #888; font-size: 0.7rem; }}
-            
-            .workouts {{ background: linear-gradient(135deg, #1e1e3f 0%, #151530 100%); border-radius: 1rem; padding: 1rem; margin-bottom: 1.5rem; }}
-            .workouts-title {{ color: #888; font-size: 0.85rem; margin-bottom: 1rem; }}
-            
-            .workout-row {{ display: flex; align-items: center; padding: 0.75rem; background: rgba(0,0,0,0.2); border-radius: 0.5rem; margin-bottom: 0.4rem; text-decoration: none; color: white; transition: all 0.2s; }}
-            .workout-row:hover {{ background: rgba(0,212,255,0.1); transform: translateX(-4px); }}
-            .workout-day {{ background: #00d4ff; color: #1a1a2e; width: 2.25rem; height: 2.25rem; border-radius: 50%; display: flex; align-items: center; justify-content: center; font-weight: bold; font-size: 0.9rem; margin-left: 0.75rem; }}
-            .workout-info {{ flex: 1; }}
-            .workout-dist {{ font-weight: bold; }}
-            .workout-pace {{ color: #888; font-size: 0.75rem; }}
-            .workout-time {{ color: #00d4ff; font-weight: bold; font-size: 0.9rem; margin: 0 0.75rem; }}
-            .workout-hr {{ color: #ef4444; font-size: 0.85rem; }}
-            .workout-arrow {{ color: #00d4ff; font-size: 1rem; {"margin-right" if is_rtl(lang) else "margin-left"}: 0.25rem; }}
-            
-            .share-btn {{ display: flex; align-items: center; justify-content: center; gap: 0.75rem; background: linear-gradient(90deg, #25D366 0%, #128C7E 100%); color: white; border: none; padding: 1rem 2rem; border-radius: 9999px; font-size: 1rem; font-weight: bold; cursor: pointer; text-decoration: none; margin-bottom: 1.5rem; }}
-            
-            footer {{ text-align: center; padding: 1rem 0; color: #888; font-size: 0.8rem; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <a href="/api/u/{user_id}/year/{year}?lang={lang}" class="back">{'→' if is_rtl(lang) else '←'} {t('back', lang)} {year}</a>
-            <header>
-                <h1>📁 {month_name} {year}</h1>
-                <p class="subtitle">{len(workouts)} {t('workouts', lang)}</p>
-            </header>
-            
-            <div class="summary">
-                <div class="summary-title">📊 {t('monthly_summary', lang)}</div>
-                <div class="summary-row">
-                    <div class="summary-item">
-                        <div class="summary-value">{len(workouts)}</div>
-                        <div class="summary-label">{t('workouts', lang)}</div>
-                    </div>
-                    <div class="summary-item">
-                        <div class="summary-value green">{total_dist:.1f}</div>
-                        <div class="summary-label">{t('km', lang)}</div>
-                    </div>
-                    <div class="summary-item">
-                        <div class="summary-value">{time_str}</div>
-                        <div class="summary-label">{t('hours', lang)}</div>
-                    </div>
-                    <div class="summary-item">
-                        <div class="summary-value" style="color:#ef4444;">{avg_hr}</div>
-                        <div class="summary-label">{t('avg_hr', lang)}</div>
-                    </div>
-                    <div class="summary-item">
-                        <div class="summary-value">{total_steps:,}</div>
-                        <div class="summary-label">{t('steps', lang)}</div>
-                    </div>
-                </div>
-            </div>
-            
-            <div class="workouts">
-                {workouts_html}
-            </div>
-            
-            <footer>FitBeat</footer>
-        </div>
-    </body>
-    </html>
-    """
+    user = escape(user_id)
+    rows = fill_rows("partials/month_row.html", lang, [month_row(w, user) for w in workouts]) + load_more_button(
+        f"/api/u/{user_id}/year/{year}/month/{month}/more?lang={lang}", next_token, lang
+    )
+    return templates.fill(
+        "month.html",
+        lang,
+        {"user_id": user, "year": escape(year), "month_name": get_month_name(int(month), lang), "rows": rows,
+         **period_summary(totals)},
+        stats=PERIOD_STATS_WITH_STEPS,
+    )
 
 @api_router.get("/u/{user_id}/workout/{workout_id}", response_class=HTMLResponse)
-async def single_workout_page(user_id: str, workout_id: str, lang: int = None):
-    """Serve single workout HTML page"""
-    workout = await db.workouts.find_one(
-        {"id": workout_id, "user_id": user_id},
-        {"_id": 0}
-    )
+async def single_workout_page(request: Request, user_id: str, workout_id: str, lang: int = None):
+    """Serve single workout HTML page; a cache hit reads only the workout's lang and version"""
+    head = await repo.workouts.get(workout_id, ("lang", "version"), user_id=user_id)
     # Get language from parameter or workout
     if lang is None:
-        lang = workout.get('lang', 0) if workout else 0
-    return generate_workout_html(workout, user_id, lang)
+        lang = head.get('lang', 0) if head else 0
+    if not head:
+        return generate_workout_html(None, user_id, lang)
+    # Cached compressed in the client's preferred encoding, so each entry is compressed once
+    encoding = negotiate(request.headers.get("accept-encoding", ""))
+    page = page_cache.get(workout_id, lang, head.get('version', 0), encoding)
+    if page is None:
+        workout = await load_track(await repo.workouts.get(workout_id, user_id=user_id))
+        if not workout:
+            return generate_workout_html(None, user_id, lang)
+        page = generate_workout_html(workout, user_id, lang).encode()
+        if encoding:
+            page = compressor.compress(page, encoding)
+        # Keyed by the version actually rendered, in case a write landed in between
+        page_cache.put(workout_id, lang, workout.get('version', 0), page, encoding)
+    return HTMLResponse(content=page, headers={"Content-Encoding": encoding} if encoding else None)
+
+def monthly_row(w: dict, user_id: str) -> dict:
+    """Slot values of a monthly summary workout row; user_id comes escaped"""
+    return {
+        "user_id": user_id,
+        "id": escape(w.get('id', '')),
+        "distance": f"{w.get('distance_cm', 0) / 100000:.2f}",
+        "date": workout_time_str(w)[:10],
+        "minutes": w.get('duration_sec', 0) // 60,
+        "hr": w.get('avg_hr', '--'),
+    }
+
+@api_router.get("/u/{user_id}/monthly/more", response_class=HTMLResponse)
+async def monthly_page_more(user_id: str, cursor: str):
+    """Next page of monthly summary rows (HTML fragment for the load-more button)"""
+    after = page_after(cursor)
+    if after is None:
+        return HTMLResponse("", status_code=400)
+    workouts, next_token = await fetch_workout_page(user_id, after=after)
+    user = escape(user_id)
+    return fill_rows("partials/monthly_row.html", 1, [monthly_row(w, user) for w in workouts]) + load_more_button(
+        f"/api/u/{user_id}/monthly/more", next_token, 1
+    )
 
 @api_router.get("/u/{user_id}/monthly", response_class=HTMLResponse)
-async def monthly_page(user_id: str):
-    """Serve monthly summary HTML page with all workouts"""
-    workouts = await db.workouts.find(
-        {"user_id": user_id},
-        {"_id": 0}
-    ).sort("timestamp", -1).to_list(100)
+async def monthly_page(request: Request, user_id: str):
+    """Serve monthly summary HTML page: all-time totals, newest workouts first"""
+    return await cached_user_page(request, user_id, "/monthly", None, lambda: render_monthly(user_id))
+
+async def render_monthly(user_id: str) -> str:
+    workouts, next_token = await fetch_workout_page(user_id)
     
     if not workouts:
-        return f"""
-        <!DOCTYPE html>
-        <html lang="he" dir="rtl">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>FitBeat - סיכום חודשי</title>
-            <style>
-                * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-                body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; background: linear-gradient(135deg, #1a1a2e 0%, #16213e 100%); min-height: 100vh; color: white; display: flex; align-items: center; justify-content: center; }}
-                .container {{ text-align: center; padding: 2rem; }}
-                h1 {{ color: #00d4ff; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h1>📅 אין אימונים</h1>
-                <p>מזהה: {user_id}</p>
-            </div>
-        </body>
-        </html>
-        """
-    
-    # Calculate totals
-    total_dist = sum(w.get('distance_cm', 0) for w in workouts)
-    total_time = sum(w.get('duration_sec', 0) for w in workouts)
-    total_steps = sum(w.get('steps', 0) or 0 for w in workouts)
-    avg_hr_list = [w.get('avg_hr') for w in workouts if w.get('avg_hr')]
-    avg_hr = round(sum(avg_hr_list) / len(avg_hr_list)) if avg_hr_list else 0
-    
-    # Format totals
-    total_km = total_dist / 100000
+        return templates.render("monthly_empty.html", lang=1, user_id=user_id)
+    
+    # Totals over every workout, from the per-year rollups
+    totals = rollup_averages(await db.user_rollups.find({"user_id": user_id, "kind": "year"}, {"_id": 0}).to_list(None))
+    total_time = totals['duration_sec']
     total_hrs = total_time // 3600
     total_mins = (total_time % 3600) // 60
-    time_str = f"{total_hrs} שעות ו-{total_mins} דקות" if total_hrs > 0 else f"{total_mins} דקות"
-    
-    # Get base URL
-    base_url = os.environ.get('APP_URL', 'https://fitbeat.it.com')
     
-    # Build workout rows
-    workout_rows = ""
-    for w in workouts:
-        dist_km = w.get('distance_cm', 0) / 100000
-        dur_min = w.get('duration_sec', 0) // 60
-        hr = w.get('avg_hr', '--')
-        ts = w.get('timestamp', '')[:10]
-        workout_id = w.get('id', '')
-        workout_rows += f"""
-        <a href="/api/u/{user_id}/workout/{workout_id}" class="workout-row">
-            <div class="workout-icon">🏃</div>
-            <div class="workout-info">
-                <div class="workout-dist">{dist_km:.2f} ק"מ</div>
-                <div class="workout-date">{ts}</div>
-            </div>
-            <div class="workout-stats">
-                <div class="workout-time">{dur_min} דק'</div>
-                <div class="workout-hr">❤️ {hr}</div>
-            </div>
-            <div class="workout-arrow">←</div>
-        </a>
-        """
-    
-    user_name = workouts[0].get('user_name', '') if workouts else ''
-    
-    return f"""
-    <!DOCTYPE html>
-    <html lang="he" dir="rtl">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>FitBeat - סיכום חודשי</title>
-        <style>
-            * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-            body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; background: linear-gradient(135deg, #1a1a2e 0%, #16213e 100%); min-height: 100vh; color: white; padding: 1rem; }}
-            .container {{ max-width: 480px; margin: 0 auto; }}
-            header {{ text-align: center; padding: 1.5rem 0; border-bottom: 1px solid rgba(255,255,255,0.1); margin-bottom: 1.5rem; }}
-            h1 {{ color: #00d4ff; font-size: 1.5rem; }}
-            .subtitle {{ color: #888; margin-top: 0.5rem; }}
-            .totals {{ background: linear-gradient(135deg, #1e1e3f 0%, #151530 100%); border-radius: 1rem; padding: 1.5rem; margin-bottom: 1.5rem; }}
-            .totals-grid {{ display: grid; grid-template-columns: 1fr 1fr; gap: 1.5rem; text-align: center; }}
-            .total-value {{ font-size: 2.5rem; font-weight: bold; color: #00d4ff; }}
-            .total-value.green {{ color: #22c55e; }}
-            .total-label {{ color: #888; font-size: 0.9rem; margin-top: 0.25rem; }}
-            .stats-row {{ display: grid; grid-template-columns: repeat(4, 1fr); gap: 0.5rem; margin-top: 1.5rem; padding-top: 1.5rem; border-top: 1px solid rgba(255,255,255,0.1); }}
-            .stat-item {{ text-align: center; }}
-            .stat-value {{ font-size: 1.1rem; font-weight: bold; }}
-            .stat-label {{ color: #888; font-size: 0.7rem; }}
-            .workouts-section {{ background: linear-gradient(135deg, #1e1e3f 0%, #151530 100%); border-radius: 1rem; padding: 1rem; margin-bottom: 1.5rem; }}
-            .section-title {{ color: #888; font-size: 0.9rem; margin-bottom: 1rem; }}
-            .workout-row {{ display: flex; align-items: center; padding: 0.75rem; background: rgba(0,0,0,0.2); border-radius: 0.5rem; margin-bottom: 0.5rem; text-decoration: none; color: white; transition: background 0.2s; }}
-            .workout-row:hover {{ background: rgba(0,212,255,0.1); }}
-            .workout-icon {{ font-size: 1.5rem; margin-left: 0.75rem; }}
-            .workout-info {{ flex: 1; }}
-            .workout-dist {{ font-weight: bold; }}
-            .workout-date {{ color: #888; font-size: 0.75rem; }}
-            .workout-stats {{ text-align: left; margin-left: 1rem; }}
-            .workout-time {{ color: #00d4ff; font-weight: bold; }}
-            .workout-hr {{ color: #888; font-size: 0.75rem; }}
-            .workout-arrow {{ color: #00d4ff; font-size: 1.2rem; margin-right: 0.5rem; }}
-            .share-btn {{ display: flex; align-items: center; justify-content: center; gap: 0.75rem; background: linear-gradient(90deg, #25D366 0%, #128C7E 100%); color: white; border: none; padding: 1rem 2rem; border-radius: 9999px; font-size: 1.1rem; font-weight: bold; cursor: pointer; margin: 1.5rem auto; text-decoration: none; }}
-            footer {{ text-align: center; padding: 1rem 0; color: #888; font-size: 0.8rem; }}
-            footer .brand {{ color: #00d4ff; font-weight: bold; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <header>
-                <h1>📅 סיכום חודשי</h1>
-                <p class="subtitle">{user_name}</p>
-            </header>
-            
-            <div class="totals">
-                <div class="totals-grid">
-                    <div>
-                        <div class="total-value">{len(workouts)}</div>
-                        <div class="total-label">אימונים</div>
-                    </div>
-                    <div>
-                        <div class="total-value green">{total_km:.1f}</div>
-                        <div class="total-label">ק"מ סה"כ</div>
-                    </div>
-                </div>
-                <div class="stats-row">
-                    <div class="stat-item">
-                        <div class="stat-value">⏱️</div>
-                        <div class="stat-label">{time_str}</div>
-                    </div>
-                    <div class="stat-item">
-                        <div class="stat-value">❤️</div>
-                        <div class="stat-label">{avg_hr} BPM</div>
-                    </div>
-                    <div class="stat-item">
-                        <div class="stat-value">👟</div>
-                        <div class="stat-label">{total_steps:,}</div>
-                    </div>
-                    <div class="stat-item">
-                        <div class="stat-value">📍</div>
-                        <div class="stat-label">{total_km/len(workouts):.1f} ק"מ/אימון</div>
-                    </div>
-                </div>
-            </div>
-            
-            <div class="workouts-section">
-                <div class="section-title">🏃 כל האימונים</div>
-                {workout_rows}
-            </div>
-            
-            <footer>
-                <div class="brand">FitBeat</div>
-                <div>מזהה: {user_id}</div>
-            </footer>
-        </div>
-    </body>
-    </html>
-    """
+    workout_count = totals['count'] or len(workouts)
+    total_km = totals['distance_cm'] / 100000
+    user = escape(user_id)
+    rows = fill_rows("partials/monthly_row.html", 1, [monthly_row(w, user) for w in workouts]) + load_more_button(
+        f"/api/u/{user_id}/monthly/more", next_token, 1
+    )
+    return templates.fill("monthly.html", 1, {
+        "user_id": user,
+        "user_name": escape(workouts[0].get('user_name', '')),
+        "workout_count": workout_count,
+        "total_km": f"{total_km:.1f}",
+        "time_str": f"{total_hrs} שעות ו-{total_mins} דקות" if total_hrs > 0 else f"{total_mins} דקות",
+        "avg_hr": totals['avg_hr'] or 0,
+        "total_steps": f"{totals['steps']:,}",
+        "km_per_workout": f"{total_km / workout_count:.1f}",
+        "rows": rows,
+    })
 
 # Raw server.py download (no cache)
 @api_router.get("/raw-server")
@@ -2726,8 +2646,212 @@ async def get_server_code():
         return PlainTextResponse(content, headers={"Cache-Control": "no-store, max-age=0"})
     return PlainTextResponse("File not found", status_code=404)
 
-# Include the router in the main app
+@admin_router.get("/admin/pipeline")
+async def workout_pipeline_status():
+    """Workout pipeline queue depth and counters"""
+    stats = workout_pipeline.stats()
+    stats["pending_workouts"] = await repo.workouts.count_with_status(PROCESSING_PENDING)
+    stats["failed_workouts"] = await repo.workouts.count_with_status(PROCESSING_FAILED)
+    return stats
+
+@admin_router.post("/admin/pipeline/retry-failed")
+async def retry_failed_workouts():
+    """Queue every failed workout for processing again"""
+    ids = await repo.workouts.reset_failed()
+    for workout_id in ids:
+        await schedule_workout_processing(workout_id)
+    logger.info(f"Re-queued {len(ids)} failed workouts for processing")
+    return {"status": "queued", "workouts": len(ids)}
+
+# Query shapes the pages and APIs depend on, checked by /admin/query-plans.
+# Each takes a sample workout and returns (collection, filter, sort).
+QUERY_SHAPES = {
+    "user_workouts_by_time": lambda w: ("workouts", page_filter(w["user_id"]), TIME_SORT),
+    "user_workouts_next_page": lambda w: (
+        "workouts", page_filter(w["user_id"], after=page_after(encode_page_token(w))), TIME_SORT
+    ),
+    "user_month_workouts": lambda w: (
+        "workouts", page_filter(w["user_id"], period=local_date_period(*w.get("local_date", "2026-01").split("-")[:2])),
+        PERIOD_SORT
+    ),
+    "workout_by_id": lambda w: ("workouts", {"id": w["id"]}, None),
+    "workouts_by_device": lambda w: ("workouts", {"device_id": w.get("device_id") or ""}, None),
+    "user_by_user_id": lambda w: ("users", {"user_id": w["user_id"]}, None),
+    "pending_workouts": lambda w: ("workouts", {"processing_status": PROCESSING_PENDING}, None),
+    "failed_workouts": lambda w: ("workouts", {"processing_status": PROCESSING_FAILED}, None),
+}
+
+def _plan_stages(plan) -> List[str]:
+    """Flatten a winning plan into ["LIMIT", "FETCH", "IXSCAN user_id_timestamp_id", ...]"""
+    stages = []
+    while plan:
+        stage = plan.get("stage", "?")
+        stages.append(f"{stage} {plan['indexName']}" if plan.get("indexName") else stage)
+        inputs = plan.get("inputStages") or []
+        plan = plan.get("inputStage") or (inputs[0] if inputs else None)
+    return stages
+
+@admin_router.get("/admin/query-plans")
+async def query_plans(user_id: Optional[str] = None):
+    """Winning plan and keys/docs examined for each known query shape (spots collection scans)"""
+    sample = await repo.workouts.latest(user_id, ("id", "user_id", "device_id", "local_date", "timestamp"))
+    if not sample:
+        return JSONResponse(status_code=404, content={"error": "No workouts to sample query values from"})
+    
+    report = {}
+    for name, shape in QUERY_SHAPES.items():
+        collection, query_filter, sort = shape(sample)
+        find = {"find": collection, "filter": query_filter, "limit": 20}
+        if sort:
+            find["sort"] = dict(sort)
+        try:
+            explain = await db.command({"explain": find, "verbosity": "executionStats"})
+        except OperationFailure as e:
+            report[name] = {"error": str(e)}
+            continue
+        winning_plan = explain["queryPlanner"]["winningPlan"]
+        stages = _plan_stages(winning_plan.get("queryPlan", winning_plan))
+        stats = explain.get("executionStats", {})
+        report[name] = {
+            "collection": collection,
+            "winning_plan": stages,
+            "collection_scan": any(stage.startswith("COLLSCAN") for stage in stages),
+            "keys_examined": stats.get("totalKeysExamined"),
+            "docs_examined": stats.get("totalDocsExamined"),
+            "returned": stats.get("nReturned"),
+            "time_ms": stats.get("executionTimeMillis"),
+        }
+    return {"queries": report}
+
+@admin_router.post("/admin/rollups/rebuild")
+async def rebuild_rollups_endpoint(user_id: Optional[str] = None):
+    """Recompute user_rollups from the workouts collection"""
+    rows = await rebuild_user_rollups(user_id)
+    return {"status": "completed", "user_id": user_id, "rollup_rows": rows}
+
+# ═══ Backfills: checkpointed jobs over every workout (see backfill.py) ═══
+async def _backfill_fix(fix, batch: list, dry_run: bool, state: dict) -> int:
+    return (await _apply_fix_batch(batch, fix, dry_run))["updated"]
+
+async def _backfill_rollups(batch: list, dry_run: bool, state: dict) -> int:
+    """Rebuild the rollups of each user not yet rebuilt by this run"""
+    # Kept in the checkpoint, so a resumed run skips users it already rebuilt
+    rebuilt = state.setdefault("rebuilt_users", [])
+    user_ids = {w.get("user_id") for w in batch} - set(rebuilt) - {None}
+    for user_id in user_ids:
+        if not dry_run:
+            await rebuild_user_rollups(user_id)
+        rebuilt.append(user_id)
+    return len(user_ids)
+
+async def _backfill_tracks(batch: list, dry_run: bool, state: dict) -> int:
+    if not dry_run:
+        for workout in batch:
+            await move_track_out(workout)
+    return len(batch)
+
+async def _backfill_routes(batch: list, dry_run: bool, state: dict) -> int:
+    return (await pack_legacy_routes(batch, dry_run))["routes"]
+
+backfill_runner = BackfillRunner(db, repo.workouts, [
+    BackfillJob("distance", functools.partial(_backfill_fix, _distance_fix),
+                "Recompute distance_cm from the route where the stored value is under 10% of it"),
+    BackfillJob("elevation", functools.partial(_backfill_fix, _elevation_fix),
+                "Recompute ascent/descent from route altitudes"),
+    BackfillJob("rollups", _backfill_rollups, "Rebuild user_rollups per user", fields=("user_id",)),
+    BackfillJob("tracks", _backfill_tracks, "Move inline routes to workout_tracks",
+                selection=INLINE_TRACKS, fields=INLINE_TRACK_FIELDS),
+    BackfillJob("routes", _backfill_routes, "Convert legacy route arrays to the packed route format",
+                selection=LEGACY_ROUTES, fields=LEGACY_ROUTE_FIELDS),
+])
+
+@admin_router.get("/admin/backfill")
+async def backfill_status():
+    """Every backfill job: checkpoint, progress, throughput and ETA"""
+    return {"jobs": await backfill_runner.status()}
+
+@admin_router.post("/admin/backfill/{job}")
+async def start_backfill(job: str, batch_size: int = 500, concurrency: int = 2, rate: Optional[float] = None,
+                         dry_run: bool = False, restart: bool = False):
+    """Start (or resume from its checkpoint) a backfill in the background"""
+    if job not in backfill_runner.jobs:
+        return JSONResponse(status_code=404, content={"error": f"Unknown job. Available: {', '.join(backfill_runner.jobs)}"})
+    if backfill_runner.running(job):
+        return JSONResponse(status_code=409, content={"error": f"Backfill {job} is already running"})
+    backfill_runner.start(
+        job, batch_size=max(1, min(batch_size, 5000)), concurrency=max(1, min(concurrency, 8)),
+        rate=rate, dry_run=dry_run, restart=restart
+    )
+    return {"status": "started", "job": job}
+
+@admin_router.post("/admin/backfill/{job}/stop")
+async def stop_backfill(job: str):
+    """Stop a running backfill after its in-flight batches; the next start resumes"""
+    if not backfill_runner.stop(job):
+        return JSONResponse(status_code=404, content={"error": f"Backfill {job} is not running"})
+    return {"status": "stopping", "job": job}
+
+@admin_router.get("/admin/page-cache")
+async def page_cache_status():
+    """Rendered workout page cache: entries, bytes used, hit/miss counters"""
+    return page_cache.stats()
+
+@admin_router.get("/admin/compression")
+async def compression_status():
+    """Response compression: responses compressed per encoding, bytes in/out"""
+    return compressor.stats()
+
+@admin_router.get("/admin/static-assets")
+async def static_assets_status():
+    """Hashed static files: count, manifest version, vendor files still served from the CDN"""
+    return static_assets.stats()
+
+@admin_router.get("/admin/route-offload")
+async def route_offload_status():
+    """Route offload pool: inline vs offloaded counts, queue wait and run latency"""
+    return route_offload.stats()
+
+# ═══ Conditional GET for /api/u/ pages ═══
+# The ETag is the user's data version plus lang, PAGE_TEMPLATE_VERSION and
+# the static asset version the pages link to (lang "auto" when taken from
+# the data, which the version already pins).
+# A matching If-None-Match gets a 304 after one user_versions lookup,
+# before any workout is read or page rendered. The version is read before
+# rendering, so a write landing mid-render only costs one extra download.
+# The validator is always weak: the same version is served as br, gzip or
+# plain bytes, so 200s (compressed or not) and 304s all carry one value.
+PAGE_TEMPLATE_VERSION = "4"  # Bump with any change to the page templates; CSS/JS changes show in static_assets.version
+USER_PAGES_PREFIX = "/api/u/"
+
+def user_page_etag(version: int, lang: str) -> str:
+    return f'W/"v{version}-{lang}-t{PAGE_TEMPLATE_VERSION}.{static_assets.version}"'
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match uses weak comparison: W/ prefixes are ignored"""
+    if if_none_match.strip() == "*":
+        return True
+    etag = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+@app.middleware("http")
+async def user_page_conditional_get(request: Request, call_next):
+    path = request.url.path
+    if request.method not in ("GET", "HEAD") or not path.startswith(USER_PAGES_PREFIX):
+        return await call_next(request)
+    user_id = path[len(USER_PAGES_PREFIX):].split("/", 1)[0]
+    etag = user_page_etag(await user_data_version(user_id), request.query_params.get("lang", "auto"))
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers={**headers, "Vary": "Accept-Encoding"})
+    response = await call_next(request)
+    if response.status_code == 200:
+        response.headers.update(headers)
+    return response
+
+# Include the routers in the main app
 app.include_router(api_router)
+app.include_router(admin_router)
+app.mount(static_assets.url_prefix, ImmutableStaticFiles(directory=static_assets.static_dir), name="static")
 
 app.add_middleware(
     CORSMiddleware,
@@ -2737,6 +2861,50 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost: compresses what the handlers and middlewares above produced; see compression.py
+compressor = Compressor.from_env()
+app.add_middleware(CompressionMiddleware, compressor=compressor)
+
+# ═══ Indexes: declared once, ensured at startup ═══
+# The workouts and users indexes are declared by their repositories (see repositories.py)
+REQUIRED_INDEXES = {
+    "user_rollups": [
+        IndexModel([("user_id", ASCENDING), ("kind", ASCENDING), ("period", DESCENDING)], name="user_id_kind_period"),
+    ],
+    "upload_sessions": [
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=UPLOAD_SESSION_TTL_SEC),
+    ],
+    "upload_chunks": [
+        IndexModel([("session_id", ASCENDING), ("seq", ASCENDING)], name="session_id_seq"),
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=UPLOAD_SESSION_TTL_SEC),
+    ],
+}
+
+@app.on_event("startup")
+async def ensure_indexes():
+    for collection, indexes in REQUIRED_INDEXES.items():
+        for index in indexes:
+            try:
+                await db[collection].create_indexes([index])
+            except OperationFailure as e:
+                # e.g. existing duplicates block a unique index - keep serving, fix the data
+                logger.error(f"Could not create index {index.document['name']} on {collection}: {e}")
+    for error in await repo.ensure_indexes():
+        logger.error(error)
+
+@app.on_event("startup")
+async def start_workout_pipeline():
+    route_offload.start()
+    workout_pipeline.start()
+    global pending_sweep
+    pending_sweep = asyncio.create_task(sweep_pending_workouts())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    # Let queued workouts finish before the DB connection goes away
+    if pending_sweep:
+        pending_sweep.cancel()
+    await workout_pipeline.drain(PIPELINE_DRAIN_TIMEOUT_SEC)
+    await backfill_runner.shutdown()
+    route_offload.shutdown()
+    db.close()
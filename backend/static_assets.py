@@ -0,0 +1,220 @@
+"""Content-hashed static files for the HTML pages.
+
+Sources live in backend/assets: css/ and js/ for the pages, vendor/ for
+Leaflet and Chart.js. build() copies every source into backend/static as
+name.<hash>.ext (the first 12 hex digits of its sha256) and returns the
+manifest, source path -> hashed path. Relative url(...)s in stylesheets are
+rewritten to the hashed URLs of the files they point at first, so a changed
+image changes the stylesheet's name as well.
+
+A hashed name only ever holds one content, so the files are served with
+Cache-Control: immutable and a year's max-age, and pages pick up a new
+version through its new URL. Old hashed files are left in place for pages
+still cached by browsers.
+
+Text files are also pre-compressed at build time, next to the original as
+name.<hash>.ext.br and .gz at maximum quality; the static mount serves the
+variant the client's Accept-Encoding prefers, so nothing is compressed
+per request.
+
+The vendored libraries are pinned in VENDOR, each with the sha256 of its
+content, and committed under assets/vendor. `python build_assets.py
+--fetch-vendor` downloads any that are missing and refuses (raises) on a
+failed download or a hash mismatch. Files without a pinned hash are never
+downloaded. The deploy build then fails if check_vendor() finds a file
+unpinned, missing or altered, so no deploy serves pages that depend on a
+CDN. Elsewhere (tests, local runs) url() falls back to the CDN URL of a
+missing file and build() logs a warning.
+
+STATIC_URL: URL the static directory is mounted at (default /api/static)
+"""
+import hashlib
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+import urllib.request
+from pathlib import Path
+
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.staticfiles import StaticFiles
+
+from compression import SUFFIXES, compress, compressible, negotiate
+
+logger = logging.getLogger(__name__)
+
+ASSET_DIR = Path(__file__).parent / "assets"
+STATIC_DIR = Path(__file__).parent / "static"
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+LEAFLET = "https://unpkg.com/leaflet@1.9.4/dist"
+# source path -> (CDN URL, sha256 of the content or None if not pinned yet)
+VENDOR = {
+    "vendor/leaflet/leaflet.js": (f"{LEAFLET}/leaflet.js",
+                                  "db49d009c841f5ca34a888c96511ae936fd9f5533e90d8b2c4d57596f4e5641a"),
+    "vendor/leaflet/leaflet.css": (f"{LEAFLET}/leaflet.css",
+                                   "a7837102824184820dfa198d1ebcd109ff6d0ff9a2672a074b9a1b4d147d04c6"),
+    "vendor/leaflet/images/layers.png": (f"{LEAFLET}/images/layers.png",
+                                         "1dbbe9d028e292f36fcba8f8b3a28d5e8932754fc2215b9ac69e4cdecf5107c6"),
+    "vendor/leaflet/images/layers-2x.png": (f"{LEAFLET}/images/layers-2x.png",
+                                            "066daca850d8ffbef007af00b06eac0015728dee279c51f3cb6c716df7c42edf"),
+    "vendor/leaflet/images/marker-icon.png": (f"{LEAFLET}/images/marker-icon.png",
+                                              "574c3a5cca85f4114085b6841596d62f00d7c892c7b03f28cbfa301deb1dc437"),
+    "vendor/leaflet/images/marker-icon-2x.png": (f"{LEAFLET}/images/marker-icon-2x.png",
+                                                 "00179c4c1ee830d3a108412ae0d294f55776cfeb085c60129a39aa6fc4ae2528"),
+    "vendor/leaflet/images/marker-shadow.png": (f"{LEAFLET}/images/marker-shadow.png",
+                                                "264f5c640339f042dd729062cfc04c17f8ea0f29882b538e3848ed8f10edb4da"),
+    "vendor/chart.js/chart.umd.js": ("https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.js", None),
+}
+
+# Build-time compression runs once per file, so it can afford the maximum
+PRECOMPRESS_LEVELS = {"br": {"brotli_quality": 11}, "gzip": {"gzip_level": 9}}
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+def hashed_name(path: str, content: bytes) -> str:
+    stem, ext = posixpath.splitext(path)
+    return f"{stem}.{hashlib.sha256(content).hexdigest()[:12]}{ext}"
+
+
+class StaticAssets:
+    def __init__(self, source_dir: Path = ASSET_DIR, static_dir: Path = STATIC_DIR, url_prefix: str = "/api/static"):
+        self.source_dir = Path(source_dir)
+        self.static_dir = Path(static_dir)
+        self.url_prefix = url_prefix.rstrip("/")
+        self.manifest = {}
+        self.version = ""  # digest of every URL url() hands out, set by build()
+
+    @classmethod
+    def from_env(cls) -> "StaticAssets":
+        return cls(url_prefix=os.environ.get('STATIC_URL', '/api/static'))
+
+    def sources(self) -> list:
+        """Source paths relative to source_dir, stylesheets last so their url()s can be resolved"""
+        paths = [path.relative_to(self.source_dir).as_posix()
+                 for path in self.source_dir.rglob("*") if path.is_file() and not path.name.startswith(".")]
+        return sorted(paths, key=lambda path: (path.endswith(".css"), path))
+
+    def build(self) -> dict:
+        """Write every source to static_dir under its hashed name; returns the manifest"""
+        manifest = {}
+        for path in self.sources():
+            content = (self.source_dir / path).read_bytes()
+            if path.endswith(".css"):
+                content = self._rewrite_urls(path, content.decode("utf-8"), manifest).encode("utf-8")
+            name = hashed_name(path, content)
+            target = self.static_dir / name
+            if not target.exists():
+                target.parent.mkdir(parents=True, exist_ok=True)
+                target.write_bytes(content)
+            if compressible(mimetypes.guess_type(path)[0] or ""):
+                self._precompress(target, content)
+            manifest[path] = name
+        self.manifest = manifest
+        urls = "\n".join(f"{path}={self.url(path)}" for path in sorted({**VENDOR, **manifest}))
+        self.version = hashlib.sha256(urls.encode("utf-8")).hexdigest()[:8]
+        missing = [path for path in VENDOR if path not in manifest]
+        if missing:
+            logger.warning(f"Static assets: {len(missing)} vendor files missing, pages load them from the CDN "
+                           f"(run build_assets.py --fetch-vendor)")
+        logger.info(f"Static assets: {len(manifest)} files built into {self.static_dir}")
+        return manifest
+
+    def _precompress(self, target: Path, content: bytes):
+        """Write the .br / .gz variants of a built file, where they're smaller than it"""
+        for encoding, suffix in SUFFIXES.items():
+            variant = target.with_name(target.name + suffix)
+            if variant.exists():
+                continue
+            compressed = compress(content, encoding, **PRECOMPRESS_LEVELS[encoding])
+            if len(compressed) < len(content):
+                variant.write_bytes(compressed)
+
+    def _rewrite_urls(self, path: str, css: str, manifest: dict) -> str:
+        def replace(match):
+            ref = match.group(2).strip()
+            if ref.startswith(("data:", "http:", "https:", "/", "#")):
+                return match.group(0)
+            target = posixpath.normpath(posixpath.join(posixpath.dirname(path), ref.split("?")[0].split("#")[0]))
+            if target not in manifest:
+                return match.group(0)
+            return f'url("{self.url_prefix}/{manifest[target]}")'
+        return CSS_URL.sub(replace, css)
+
+    def url(self, path: str) -> str:
+        """Hashed URL of a source file; vendor files not fetched yet fall back to their CDN URL"""
+        name = self.manifest.get(path)
+        if name is not None:
+            return f"{self.url_prefix}/{name}"
+        if path in VENDOR:
+            return VENDOR[path][0]
+        raise KeyError(f"Unknown static asset: {path}")
+
+    def fetch_vendor(self, force: bool = False) -> list:
+        """Download the pinned vendor files that aren't in source_dir yet; returns the paths fetched.
+
+        A file already there with the wrong content is fetched again. A
+        download error or a hash mismatch raises before anything is written.
+        """
+        fetched = []
+        for path, (url, sha256) in VENDOR.items():
+            if sha256 is None:
+                logger.warning(f"Static assets: {path} has no pinned sha256, not fetching it")
+                continue
+            target = self.source_dir / path
+            if target.exists() and not force and hashlib.sha256(target.read_bytes()).hexdigest() == sha256:
+                continue
+            with urllib.request.urlopen(url, timeout=30) as response:
+                content = response.read()
+            digest = hashlib.sha256(content).hexdigest()
+            if digest != sha256:
+                raise ValueError(f"{url}: sha256 {digest} does not match the pinned {sha256}")
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(content)
+            fetched.append(path)
+        return fetched
+
+    def check_vendor(self) -> list:
+        """Vendor files a deploy must not go out with: unpinned, missing, or not matching their pin"""
+        problems = []
+        for path, (url, sha256) in VENDOR.items():
+            target = self.source_dir / path
+            if sha256 is None:
+                problems.append(f"{path}: no pinned sha256 in VENDOR")
+            elif not target.exists():
+                problems.append(f"{path}: missing (commit it or run build_assets.py --fetch-vendor)")
+            elif hashlib.sha256(target.read_bytes()).hexdigest() != sha256:
+                problems.append(f"{path}: does not match its pinned sha256")
+        return problems
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self.manifest),
+            "version": self.version,
+            "vendor_missing": [path for path in VENDOR if path not in self.manifest],
+            "url_prefix": self.url_prefix,
+        }
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """StaticFiles for content-hashed names: cacheable forever, pre-compressed variants preferred"""
+
+    async def get_response(self, path: str, scope):
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is not None:
+            try:
+                response = await super().get_response(path + SUFFIXES[encoding], scope)
+            except HTTPException:
+                pass
+            else:
+                # The type comes from the name without the suffix: mimetypes reads .br/.gz as encodings
+                response.headers["Content-Encoding"] = encoding
+                return response
+        return await super().get_response(path, scope)
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = IMMUTABLE
+        return response
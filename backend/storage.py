@@ -0,0 +1,757 @@
+"""Storage backends for the FitBeat server.
+
+A Storage hands out the repositories for workouts, users, status checks
+and simulator state (see repositories.py), plus Motor-API collections by
+name for the rest - workout_tracks, user_rollups, uploads, devices and
+backfill checkpoints - and the GridFS bucket for long tracks.
+
+MotorStorage is MongoDB. MemoryStorage keeps everything in process, so
+endpoints can be benchmarked and tested without a database. Its
+collections implement the query, update, sort and index shapes the server
+uses on them; anything outside those shapes raises NotImplementedError
+rather than silently answering differently from MongoDB.
+tests/test_memory_storage.py pins the shapes it does implement.
+
+STORAGE_BACKEND: "mongo" (default, needs MONGO_URL and DB_NAME) or "memory"
+"""
+import os
+import re
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from gridfs.errors import NoFile
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+from repositories import REPOSITORY_COLLECTIONS, Repositories, memory_repositories, mongo_repositories
+
+
+class Storage(ABC):
+    """Collections by attribute or item (storage.workout_tracks, storage["devices"])"""
+
+    _repositories = None
+
+    def repositories(self) -> Repositories:
+        """Workouts, users, status checks and simulator state"""
+        if self._repositories is None:
+            self._repositories = self._create_repositories()
+        return self._repositories
+
+    @abstractmethod
+    def _create_repositories(self) -> Repositories:
+        pass
+
+    def collection(self, name: str):
+        """Motor-compatible collection; the repository collections are only reached through repositories()"""
+        if name in REPOSITORY_COLLECTIONS:
+            raise AttributeError(f"{name} is reached through Storage.repositories()")
+        return self._collection(name)
+
+    @abstractmethod
+    def _collection(self, name: str):
+        pass
+
+    @abstractmethod
+    def track_bucket(self, name: str):
+        """Motor-compatible GridFS bucket for the tracks collection"""
+
+    @abstractmethod
+    async def command(self, command: dict):
+        """Database command; the server only runs explain"""
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.collection(name)
+
+    def __getitem__(self, name):
+        return self.collection(name)
+
+
+class MotorStorage(Storage):
+    def __init__(self, mongo_url: str, db_name: str):
+        from motor.motor_asyncio import AsyncIOMotorClient
+        self.client = AsyncIOMotorClient(mongo_url)
+        self.database = self.client[db_name]
+
+    def _create_repositories(self) -> Repositories:
+        return mongo_repositories(self.database)
+
+    def _collection(self, name: str):
+        return self.database[name]
+
+    def track_bucket(self, name: str):
+        from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+        return AsyncIOMotorGridFSBucket(self.database, bucket_name=name)
+
+    async def command(self, command: dict):
+        return await self.database.command(command)
+
+    def close(self):
+        self.client.close()
+
+
+class MemoryStorage(Storage):
+    def __init__(self):
+        self._collections = {}
+        self._buckets = {}
+
+    def _create_repositories(self) -> Repositories:
+        return memory_repositories()
+
+    def _collection(self, name: str) -> "MemoryCollection":
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(name)
+        return self._collections[name]
+
+    def track_bucket(self, name: str) -> "MemoryGridFSBucket":
+        if name not in self._buckets:
+            self._buckets[name] = MemoryGridFSBucket()
+        return self._buckets[name]
+
+    async def command(self, command: dict):
+        raise OperationFailure(f"{next(iter(command))} is not supported by the in-memory storage backend")
+
+
+def storage_from_env() -> Storage:
+    backend = os.environ.get('STORAGE_BACKEND', 'mongo')
+    if backend == "memory":
+        return MemoryStorage()
+    if backend != "mongo":
+        raise ValueError(f"Unknown storage backend: {backend}")
+    return MotorStorage(os.environ['MONGO_URL'], os.environ['DB_NAME'])
+
+
+# ═══ Values: stored the way BSON would round-trip them ═══
+def _stored(value):
+    """Copy a value for storage (tuples become lists, dates are naive UTC at ms precision)"""
+    if isinstance(value, dict):
+        return {k: _stored(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_stored(v) for v in value]
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.replace(microsecond=value.microsecond // 1000 * 1000)
+    return value
+
+
+def _clone(value):
+    if isinstance(value, dict):
+        return {k: _clone(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_clone(v) for v in value]
+    return value
+
+
+_MISSING = object()
+
+# BSON comparison order between types
+def _type_rank(value) -> int:
+    if value is None or value is _MISSING:
+        return 1
+    if isinstance(value, bool):
+        return 8
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, dict):
+        return 4
+    if isinstance(value, list):
+        return 5
+    if isinstance(value, bytes):
+        return 6
+    if isinstance(value, ObjectId):
+        return 7
+    if isinstance(value, datetime):
+        return 9
+    return 10
+
+
+class _SortKey:
+    __slots__ = ("rank", "value")
+
+    def __init__(self, value):
+        self.rank = _type_rank(value)
+        self.value = None if self.rank == 1 else value
+
+    def __lt__(self, other):
+        if self.rank != other.rank:
+            return self.rank < other.rank
+        if self.rank in (1, 4, 5):
+            return repr(self.value) < repr(other.value)
+        return self.value < other.value
+
+    def __eq__(self, other):
+        return self.rank == other.rank and self.value == other.value
+
+
+def _get(doc, path: str):
+    for part in path.split("."):
+        if not isinstance(doc, dict) or part not in doc:
+            return _MISSING
+        doc = doc[part]
+    return doc
+
+
+def _compare(value, op: str, target) -> bool:
+    if value is _MISSING or _type_rank(value) != _type_rank(target):
+        return False
+    if op == "$gt":
+        return value > target
+    if op == "$gte":
+        return value >= target
+    if op == "$lt":
+        return value < target
+    return value <= target
+
+
+_TYPE_NAMES = {
+    "string": (str,), "array": (list,), "date": (datetime,), "object": (dict,),
+    "bool": (bool,), "objectId": (ObjectId,), "binData": (bytes,),
+    "double": (float,), "int": (int,), "long": (int,), "number": (int, float),
+}
+
+
+def _equals(value, target) -> bool:
+    if target is None:
+        return value is None or value is _MISSING
+    if isinstance(value, list) and not isinstance(target, list):
+        return target in value
+    return value is not _MISSING and value == target
+
+
+def _match_value(value, condition) -> bool:
+    if not (isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition)):
+        if isinstance(condition, re.Pattern):
+            return isinstance(value, str) and bool(condition.search(value))
+        return _equals(value, condition)
+    for op, target in condition.items():
+        if op in ("$gt", "$gte", "$lt", "$lte"):
+            if isinstance(value, list):
+                if not any(_compare(v, op, target) for v in value):
+                    return False
+            elif not _compare(value, op, target):
+                return False
+        elif op == "$eq":
+            if not _equals(value, target):
+                return False
+        elif op == "$ne":
+            if _equals(value, target):
+                return False
+        elif op == "$in":
+            if not any(_equals(value, t) for t in target):
+                return False
+        elif op == "$nin":
+            if any(_equals(value, t) for t in target):
+                return False
+        elif op == "$exists":
+            if (value is not _MISSING) != bool(target):
+                return False
+        elif op == "$type":
+            names = target if isinstance(target, list) else [target]
+            if value is _MISSING:
+                return False
+            types = tuple(t for name in names for t in _TYPE_NAMES[name])
+            if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+                return False
+        elif op == "$not":
+            if _match_value(value, target):
+                return False
+        else:
+            raise NotImplementedError(f"Query operator {op} is not supported by the in-memory storage backend")
+    return True
+
+
+def matches(doc: dict, query: dict) -> bool:
+    """query's values must be in stored form: pass it through _stored() once, not per document"""
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(matches(doc, q) for q in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, q) for q in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(doc, q) for q in condition):
+                return False
+        elif key.startswith("$"):
+            raise NotImplementedError(f"Query operator {key} is not supported by the in-memory storage backend")
+        elif not _match_value(_get(doc, key), condition):
+            return False
+    return True
+
+
+def project(doc: dict, projection) -> dict:
+    if not projection:
+        return _clone(doc)
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    include = {k for k, v in projection.items() if v and k != "_id"}
+    if include or all(projection.values()):  # {"_id": 1} alone includes just _id
+        result = {k: _clone(doc[k]) for k in include if k in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            result = {"_id": doc["_id"], **result}
+        return result
+    exclude = {k for k, v in projection.items() if not v}
+    return {k: _clone(v) for k, v in doc.items() if k not in exclude}
+
+
+def _sort_spec(key_or_list, direction=None) -> list:
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return list(key_or_list)
+
+
+def sort_docs(docs: list, spec) -> list:
+    # Stable sorts applied last key first give a multi-key sort
+    for field, direction in reversed(spec):
+        docs.sort(key=lambda d, f=field: _SortKey(_get(d, f)), reverse=direction < 0)
+    return docs
+
+
+# ═══ Updates ═══
+def _set_path(doc: dict, path: str, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _unset_path(doc: dict, path: str):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+
+def apply_update(doc: dict, update: dict, inserting: bool = False):
+    for op, fields in update.items():
+        if op == "$set" or (op == "$setOnInsert" and inserting):
+            for path, value in fields.items():
+                _set_path(doc, path, _stored(value))
+        elif op == "$setOnInsert":
+            continue
+        elif op == "$unset":
+            for path in fields:
+                _unset_path(doc, path)
+        elif op == "$inc":
+            for path, value in fields.items():
+                current = _get(doc, path)
+                _set_path(doc, path, (0 if current is _MISSING or current is None else current) + value)
+        elif op == "$push":
+            for path, value in fields.items():
+                current = _get(doc, path)
+                _set_path(doc, path, ([] if current is _MISSING else current) + [_stored(value)])
+        else:
+            raise NotImplementedError(f"Update operator {op} is not supported by the in-memory storage backend")
+
+
+def _upsert_seed(query: dict) -> dict:
+    """Equality fields of a filter, which an upsert copies into the new document"""
+    seed = {}
+    for key, value in query.items():
+        if key.startswith("$"):
+            continue
+        if isinstance(value, dict) and any(k.startswith("$") for k in value):
+            if "$eq" in value:
+                seed[key] = value["$eq"]
+            continue
+        seed[key] = value
+    return _stored(seed)
+
+
+# ═══ Collections ═══
+class MemoryCursor:
+    def __init__(self, load, projection=None):
+        self._load = load  # () -> matching documents, unsorted
+        self._projection = projection
+        self._sort = []
+        self._skip = 0
+        self._limit = 0
+        self._results = None
+
+    def sort(self, key_or_list, direction=None) -> "MemoryCursor":
+        self._sort = _sort_spec(key_or_list, direction)
+        return self
+
+    def skip(self, n: int) -> "MemoryCursor":
+        self._skip = n
+        return self
+
+    def limit(self, n: int) -> "MemoryCursor":
+        self._limit = n
+        return self
+
+    def batch_size(self, n: int) -> "MemoryCursor":
+        return self
+
+    def _materialize(self) -> list:
+        if self._results is None:
+            docs = sort_docs(self._load(), self._sort) if self._sort else self._load()
+            docs = docs[self._skip:]
+            if self._limit:
+                docs = docs[:self._limit]
+            self._results = [project(d, self._projection) for d in docs]
+        return self._results
+
+    async def to_list(self, length=None) -> list:
+        results = self._materialize()
+        return list(results if length is None else results[:length])
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._materialize():
+            yield doc
+
+
+class _MemoryIndex:
+    def __init__(self, document: dict):
+        self.name = document["name"]
+        self.keys = list(document["key"].items())
+        self.unique = document.get("unique", False)
+        self.sparse = document.get("sparse", False)
+        self.partial = _stored(document.get("partialFilterExpression"))
+        self.document = document
+        self.entries = {}  # unique indexes: key -> _id
+
+    def entry(self, doc: dict):
+        """Index key of a document, or None if the index does not cover it"""
+        if self.partial is not None and not matches(doc, self.partial):
+            return None
+        values = [_get(doc, field) for field, _ in self.keys]
+        if self.sparse and all(v is _MISSING for v in values):
+            return None
+        return tuple(repr(_SortKey(v).rank) + repr(None if v is _MISSING else v) for v in values)
+
+
+def _lookup_key(value):
+    """Hash key for equality lookups; None for values that can't be looked up this way"""
+    if isinstance(value, (str, int, ObjectId)) and not isinstance(value, bool):
+        return (type(value) is str, value)
+    return None
+
+
+def _lookup_values(condition):
+    """Values a field must equal to match (plain value or $in), or None"""
+    if isinstance(condition, dict) and set(condition) == {"$in"}:
+        values = list(condition["$in"])
+    else:
+        values = [condition]
+    if all(_lookup_key(v) is not None for v in values):
+        return values
+    return None
+
+
+class MemoryCollection:
+    """One collection; equality lookups on the leading field of each index use a hash map"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._docs = {}  # _id -> document, in insertion order
+        self._indexes = {}
+        self._lookups = {}  # field -> {lookup key: {_id: None}}, plus None -> docs without a usable key
+
+    # ─── indexes ───
+    async def create_indexes(self, indexes) -> list:
+        for index in indexes:
+            spec = _MemoryIndex(index.document)
+            existing = self._indexes.get(spec.name)
+            if existing:
+                if existing.document != spec.document:
+                    raise OperationFailure(f"Index {spec.name} already exists with different options")
+                continue
+            if spec.unique:
+                for doc in self._docs.values():
+                    entry = spec.entry(doc)
+                    if entry is not None and spec.entries.setdefault(entry, doc["_id"]) != doc["_id"]:
+                        raise DuplicateKeyError(f"E11000 duplicate key error building index {spec.name}")
+            self._indexes[spec.name] = spec
+            field = spec.keys[0][0]
+            if field not in self._lookups:
+                self._lookups[field] = {}
+                for doc in self._docs.values():
+                    self._lookup_add(field, doc)
+        return [index.document["name"] for index in indexes]
+
+    async def create_index(self, keys, **kwargs) -> str:
+        from pymongo import IndexModel
+        return (await self.create_indexes([IndexModel(keys, **kwargs)]))[0]
+
+    async def index_information(self) -> dict:
+        info = {"_id_": {"key": [("_id", 1)]}}
+        for name, index in self._indexes.items():
+            info[name] = {"key": index.keys, **{k: v for k, v in index.document.items() if k not in ("key", "name")}}
+        return info
+
+    async def drop_index(self, name: str):
+        if name not in self._indexes:
+            raise OperationFailure(f"index not found with name [{name}]")
+        del self._indexes[name]
+        fields = {index.keys[0][0] for index in self._indexes.values()}
+        for field in list(self._lookups):
+            if field not in fields:
+                del self._lookups[field]
+
+    def _lookup_add(self, field: str, doc: dict):
+        key = _lookup_key(_get(doc, field))
+        self._lookups[field].setdefault(key, {})[doc["_id"]] = None
+
+    def _lookup_remove(self, field: str, doc: dict):
+        key = _lookup_key(_get(doc, field))
+        bucket = self._lookups[field].get(key)
+        if bucket is not None:
+            bucket.pop(doc["_id"], None)
+            if not bucket:
+                del self._lookups[field][key]
+
+    def _add(self, doc: dict, replacing: dict = None):
+        """Store a document (replacing the stored version of it), enforcing unique indexes"""
+        if replacing is None and doc["_id"] in self._docs:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_")
+        entries = []
+        for index in self._indexes.values():
+            if not index.unique:
+                continue
+            entry = index.entry(doc)
+            if entry is not None and index.entries.get(entry, doc["_id"]) != doc["_id"]:
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {index.name}")
+            entries.append((index, entry))
+        if replacing is not None:
+            self._remove(replacing)
+        for index, entry in entries:
+            if entry is not None:
+                index.entries[entry] = doc["_id"]
+        for field in self._lookups:
+            self._lookup_add(field, doc)
+        self._docs[doc["_id"]] = doc
+
+    def _remove(self, doc: dict):
+        for index in self._indexes.values():
+            if index.unique:
+                entry = index.entry(doc)
+                if entry is not None and index.entries.get(entry) == doc["_id"]:
+                    del index.entries[entry]
+        for field in self._lookups:
+            self._lookup_remove(field, doc)
+        del self._docs[doc["_id"]]
+
+    # ─── reads ───
+    def _candidates(self, query):
+        """Documents that can match: by _id, by a looked-up field (equality or $in), else all"""
+        if not query:
+            return self._docs.values()
+        values = _lookup_values(query.get("_id"))
+        if values is not None:
+            return [self._docs[v] for v in dict.fromkeys(values) if v in self._docs]
+        for field, lookup in self._lookups.items():
+            values = _lookup_values(query.get(field))
+            if values is not None:
+                ids = {}
+                for key in [_lookup_key(v) for v in values] + [None]:
+                    ids.update(lookup.get(key, {}))
+                return [self._docs[_id] for _id in ids]
+        return self._docs.values()
+
+    def _matching(self, query) -> list:
+        # Normalized once, so an aware datetime compares as the naive UTC one stored
+        stored = _stored(query)
+        return [doc for doc in self._candidates(query) if matches(doc, stored)]
+
+    def find(self, filter=None, projection=None, **kwargs) -> MemoryCursor:
+        cursor = MemoryCursor(lambda: self._matching(filter), projection)
+        if kwargs.get("sort"):
+            cursor.sort(kwargs["sort"])
+        if kwargs.get("limit"):
+            cursor.limit(kwargs["limit"])
+        return cursor
+
+    def _first(self, filter, sort):
+        docs = self._matching(filter)
+        if sort:
+            docs = sort_docs(docs, _sort_spec(sort))
+        return docs[0] if docs else None
+
+    async def find_one(self, filter=None, projection=None, sort=None, **kwargs):
+        doc = self._first(filter, sort)
+        return project(doc, projection) if doc is not None else None
+
+    async def count_documents(self, filter, **kwargs) -> int:
+        return len(self._matching(filter))
+
+    async def estimated_document_count(self) -> int:
+        return len(self._docs)
+
+    async def distinct(self, key: str, filter=None) -> list:
+        values = []
+        for doc in self._matching(filter):
+            value = _get(doc, key)
+            for v in (value if isinstance(value, list) else [value]):
+                if v is not _MISSING and v not in values:
+                    values.append(v)
+        return values
+
+    # ─── writes ───
+    def _insert(self, document: dict):
+        doc = _stored(document)
+        doc.setdefault("_id", ObjectId())
+        self._add(doc)
+        # Like pymongo, the caller's document gets its _id
+        document.setdefault("_id", doc["_id"])
+        return doc["_id"]
+
+    async def insert_one(self, document: dict) -> InsertOneResult:
+        return InsertOneResult(self._insert(document), True)
+
+    async def insert_many(self, documents, ordered: bool = True) -> InsertManyResult:
+        inserted, errors = [], []
+        for index, document in enumerate(documents):
+            try:
+                inserted.append(self._insert(document))
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e), "op": document})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted), "writeConcernErrors": [],
+                                  "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []})
+        return InsertManyResult(inserted, True)
+
+    def _update(self, filter, update, upsert=False, many=False, replace=False) -> dict:
+        targets = self._matching(filter)
+        if not many:
+            targets = targets[:1]
+        modified = 0
+        for doc in targets:
+            if replace:
+                new = {"_id": doc["_id"], **_stored(update)}
+            else:
+                new = _clone(doc)
+                apply_update(new, update)
+            if new != doc:
+                self._add(new, replacing=doc)
+                modified += 1
+        result = {"n": len(targets), "nModified": modified}
+        if not targets and upsert:
+            doc = _upsert_seed(filter or {})
+            if replace:
+                doc.update({k: v for k, v in _stored(update).items() if k != "_id"})
+            else:
+                apply_update(doc, update, inserting=True)
+            result["upserted"] = self._insert(doc)
+            result["n"] = 1
+        return result
+
+    async def update_one(self, filter, update, upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert), True)
+
+    async def update_many(self, filter, update, upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, many=True), True)
+
+    async def replace_one(self, filter, replacement, upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, replacement, upsert, replace=True), True)
+
+    def _delete(self, filter, many: bool) -> int:
+        targets = self._matching(filter)
+        if not many:
+            targets = targets[:1]
+        for doc in targets:
+            self._remove(doc)
+        return len(targets)
+
+    async def delete_one(self, filter) -> DeleteResult:
+        return DeleteResult({"n": self._delete(filter, many=False)}, True)
+
+    async def delete_many(self, filter) -> DeleteResult:
+        return DeleteResult({"n": self._delete(filter, many=True)}, True)
+
+    async def find_one_and_delete(self, filter, projection=None, sort=None, **kwargs):
+        doc = self._first(filter, sort)
+        if doc is None:
+            return None
+        self._remove(doc)
+        return project(doc, projection)
+
+    async def find_one_and_update(self, filter, update, projection=None, sort=None, upsert: bool = False,
+                                  return_document: bool = ReturnDocument.BEFORE, **kwargs):
+        doc = self._first(filter, sort)
+        if doc is None:
+            if not upsert:
+                return None
+            new = _upsert_seed(filter or {})
+            apply_update(new, update, inserting=True)
+            self._insert(new)
+            return project(new, projection) if return_document else None
+        new = _clone(doc)
+        apply_update(new, update)
+        if new != doc:
+            self._add(new, replacing=doc)
+        return project(new if return_document else doc, projection)
+
+    async def bulk_write(self, requests, ordered: bool = True) -> BulkWriteResult:
+        totals = {"nInserted": 0, "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0,
+                  "upserted": [], "writeErrors": [], "writeConcernErrors": []}
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    self._insert(request._doc)
+                    totals["nInserted"] += 1
+                elif isinstance(request, (DeleteOne, DeleteMany)):
+                    totals["nRemoved"] += self._delete(request._filter, many=isinstance(request, DeleteMany))
+                elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                    result = self._update(request._filter, request._doc, request._upsert,
+                                          many=isinstance(request, UpdateMany), replace=isinstance(request, ReplaceOne))
+                    if "upserted" in result:
+                        totals["nUpserted"] += 1
+                        totals["upserted"].append({"index": index, "_id": result["upserted"]})
+                    else:
+                        totals["nMatched"] += result["n"]
+                        totals["nModified"] += result["nModified"]
+                else:
+                    raise NotImplementedError(f"{type(request).__name__} is not supported by the in-memory storage backend")
+            except DuplicateKeyError as e:
+                totals["writeErrors"].append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if totals["writeErrors"]:
+            raise BulkWriteError(totals)
+        return BulkWriteResult(totals, True)
+
+
+class _MemoryDownload:
+    def __init__(self, data: bytes):
+        self._data = data
+
+    async def read(self, size: int = -1) -> bytes:
+        data, self._data = (self._data, b"") if size < 0 else (self._data[:size], self._data[size:])
+        return data
+
+
+class MemoryGridFSBucket:
+    def __init__(self):
+        self._files = {}
+
+    async def upload_from_stream_with_id(self, file_id, filename: str, source, metadata=None):
+        data = source if isinstance(source, (bytes, bytearray)) else source.read()
+        self._files[file_id] = bytes(data)
+
+    async def open_download_stream(self, file_id) -> _MemoryDownload:
+        if file_id not in self._files:
+            raise NoFile(f"no file in gridfs with _id {file_id!r}")
+        return _MemoryDownload(self._files[file_id])
+
+    async def delete(self, file_id):
+        if self._files.pop(file_id, None) is None:
+            raise NoFile(f"no file in gridfs with _id {file_id!r}")
@@ -0,0 +1,105 @@
+"""Background processing for ingested workouts.
+
+submit_workout stores the raw workout and acknowledges the watch right
+away; derived fields (route distance, elevation, splits) are computed by
+a small pool of asyncio workers fed from a bounded queue. A submit hands
+over the parsed route with the workout id, so workers compute from the
+values the watch sent rather than the packed copy in storage.
+
+When the queue is full a submit is turned away and the workout stays
+pending in storage; the server's pending sweep queues it once there is room.
+"""
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class WorkoutPipeline:
+    def __init__(self, process, workers: int = 2, max_queue: int = 1000):
+        self._process = process
+        self._worker_count = workers
+        self._queue = None  # Created in start() so it belongs to the running event loop
+        self._workers = []
+        self._held = set()  # ids queued or being processed, so a sweep doesn't queue them twice
+        self.max_queue = max_queue
+        self.processed = 0
+        self.failed = 0
+        self.turned_away = 0
+        self.overflowed = False  # Set when a submit was turned away; cleared by the sweep
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def start(self):
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"workout-pipeline-{i}")
+            for i in range(self._worker_count)
+        ]
+        logger.info(f"Workout pipeline started with {self._worker_count} workers (queue limit {self.max_queue})")
+
+    def holds(self, workout_id: str) -> bool:
+        return workout_id in self._held
+
+    def submit(self, workout_id: str, route=None) -> bool:
+        """Queue a workout (and its submitted route) without waiting; False if the pipeline is stopped or full"""
+        if not self._workers:
+            return False
+        if workout_id in self._held:
+            return True
+        try:
+            self._queue.put_nowait((workout_id, route))
+        except asyncio.QueueFull:
+            self.turned_away += 1
+            self.overflowed = True
+            return False
+        self._held.add(workout_id)
+        return True
+
+    async def enqueue(self, workout_id: str):
+        """Queue a workout, waiting for room (used by the pending sweep)"""
+        if not self._workers or workout_id in self._held:
+            return
+        self._held.add(workout_id)
+        await self._queue.put((workout_id, None))
+
+    async def drain(self, timeout: float = 30):
+        """Finish queued work, then stop the workers"""
+        if not self._workers:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Workout pipeline drain timed out with {self._queue.qsize()} workouts left pending")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "workers": self._worker_count,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_queue": self.max_queue,
+            "processed": self.processed,
+            "failed": self.failed,
+            "turned_away": self.turned_away,
+        }
+
+    async def _worker(self):
+        while True:
+            workout_id, route = await self._queue.get()
+            try:
+                await self._process(workout_id, route)
+                self.processed += 1
+            except Exception:
+                self.failed += 1
+                logger.exception(f"Workout pipeline failed to process {workout_id}")
+            finally:
+                self._held.discard(workout_id)
+                self._queue.task_done()
@@ -0,0 +1,27 @@
+"""Request payloads and waits shared by the endpoint tests"""
+import time
+
+
+def workout_payload(user_id, local_time="2026-05-01T10:00:00", **fields):
+    payload = {
+        "user_id": user_id, "user_name": "Tester", "distance_cm": 500000, "duration_sec": 1800,
+        "avg_hr": 140, "local_time": local_time,
+    }
+    payload.update(fields)
+    return payload
+
+
+def wait_processed(server, client, workout_id, timeout=5.0):
+    """Block until the workout pipeline has processed a workout; returns the stored document"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        doc = client.portal.call(server.repo.workouts.get, workout_id)
+        if doc and doc.get("processing_status") != server.PROCESSING_PENDING:
+            return doc
+        time.sleep(0.01)
+    raise AssertionError(f"workout {workout_id} was not processed within {timeout}s")
+
+
+def stored_workouts(server, client, user_id, fields=None):
+    """A user's stored workouts, newest first"""
+    return client.portal.call(server.repo.workouts.page, user_id, 1000, fields)
@@ -0,0 +1,172 @@
+import asyncio
+import functools
+import json
+
+import pytest
+
+from backfill import STATUS_COMPLETED, STATUS_FAILED, STATUS_STOPPED, BackfillJob, BackfillRunner
+from storage import MemoryStorage
+from tests.helpers import wait_processed, workout_payload
+from tests.test_workout_pipeline import walking_route
+
+
+class Recorder:
+    """A job that records the workout ids it processes; fails on fail_at, stops the run on stop_at"""
+
+    def __init__(self, storage, fail_at=None, stop_at=None):
+        self.storage = storage
+        self.fail_at = fail_at
+        self.stop_at = stop_at
+        self.runner = None
+        self.seen = []
+        self.states = []
+        self.checkpoints = []
+        self.workout_ids = {}  # str(_id) -> workout id, filled in by run_jobs
+
+    def last_workout(self, last_id):
+        """Workout id of a checkpoint's (or report's) last_id"""
+        return self.workout_ids.get(str(last_id))
+
+    async def process(self, batch, dry_run, state):
+        ids = [doc["id"] for doc in batch]
+        self.checkpoints.append(await self.storage.backfill_jobs.find_one({"_id": "job"}))
+        self.states.append(sorted(state.get("seen", [])))
+        if self.fail_at in ids:
+            raise RuntimeError("batch failed")
+        if self.stop_at in ids:
+            self.runner.stop("job")
+        self.seen += ids
+        state.setdefault("seen", []).extend(ids)
+        return len(ids)
+
+
+def run_jobs(count, *recorders, **options):
+    """Run the job once per recorder over `count` workouts; returns each run's report"""
+    async def scenario():
+        storage = recorders[0].storage
+        workouts = storage.repositories().workouts
+        await workouts.insert_many([{"id": i} for i in range(count)])
+        workout_ids = {str(w["_id"]): w["id"] for w in await workouts.scan(limit=count, fields=("id",))}
+        reports = []
+        for recorder in recorders:
+            recorder.workout_ids = workout_ids
+            runner = recorder.runner = BackfillRunner(storage, workouts, [BackfillJob("job", recorder.process)])
+            reports.append(await runner.start("job", **options))
+        return reports
+    return asyncio.run(scenario())
+
+
+def test_checkpoint_is_saved_after_each_batch():
+    recorder = Recorder(MemoryStorage())
+
+    [report] = run_jobs(10, recorder, batch_size=3, concurrency=1)
+
+    assert [c["scanned"] for c in recorder.checkpoints] == [0, 3, 6, 9]
+    assert [recorder.last_workout(c["last_id"]) for c in recorder.checkpoints] == [None, 2, 5, 8]
+    assert report["status"] == STATUS_COMPLETED
+    assert (report["scanned"], report["updated"], recorder.last_workout(report["last_id"])) == (10, 10, 9)
+    saved = asyncio.run(recorder.storage.backfill_jobs.find_one({"_id": "job"}))
+    assert saved["status"] == STATUS_COMPLETED and recorder.last_workout(saved["last_id"]) == 9
+
+
+@pytest.mark.parametrize("concurrency", [1, 3])
+def test_failed_run_resumes_after_its_last_finished_batch(concurrency):
+    storage = MemoryStorage()
+    failing, resumed = Recorder(storage, fail_at=5), Recorder(storage)
+
+    first, second = run_jobs(12, failing, resumed, batch_size=2, concurrency=concurrency)
+
+    assert first["status"] == STATUS_FAILED and first["error"] == "batch failed"
+    # The checkpoint stops before the failed batch, whatever ran after it
+    assert failing.last_workout(first["last_id"]) == 3 and first["scanned"] == 4
+    assert resumed.seen == list(range(4, 12))
+    assert second["status"] == STATUS_COMPLETED and second["scanned"] == 12
+
+
+def test_stopped_run_resumes_where_it_stopped():
+    storage = MemoryStorage()
+    stopping, resumed = Recorder(storage, stop_at=4), Recorder(storage)
+
+    first, second = run_jobs(10, stopping, resumed, batch_size=2, concurrency=1)
+
+    assert first["status"] == STATUS_STOPPED and stopping.last_workout(first["last_id"]) == 5
+    assert stopping.seen + resumed.seen == list(range(10))
+    assert second["status"] == STATUS_COMPLETED and second["updated"] == 10
+
+
+def test_job_state_is_kept_for_a_resumed_run_only():
+    storage = MemoryStorage()
+    failing, resumed, fresh = Recorder(storage, fail_at=4), Recorder(storage), Recorder(storage)
+
+    run_jobs(6, failing, resumed, fresh, batch_size=2, concurrency=1)
+
+    assert resumed.states[0] == [0, 1, 2, 3]
+    # The last run starts over after a completed one, with empty state
+    assert fresh.states[0] == []
+    status = asyncio.run(fresh.runner.status())
+    assert "state" not in status[0]
+
+
+def test_dry_run_leaves_the_checkpoint_alone():
+    storage = MemoryStorage()
+    failing, dry = Recorder(storage, fail_at=2), Recorder(storage)
+
+    run_jobs(4, failing, batch_size=2, concurrency=1)
+    saved = asyncio.run(storage.backfill_jobs.find_one({"_id": "job"}))
+    assert saved["status"] == STATUS_FAILED and failing.last_workout(saved["last_id"]) == 1
+    runner = BackfillRunner(storage, storage.repositories().workouts, [BackfillJob("job", dry.process)])
+    report = asyncio.run(runner.run("job", dry_run=True))
+
+    assert report["status"] == STATUS_COMPLETED and dry.seen == [0, 1, 2, 3]
+    assert asyncio.run(storage.backfill_jobs.find_one({"_id": "job"})) == saved
+
+
+def run_backfill(client, server, job, **options):
+    return client.portal.call(functools.partial(server.backfill_runner.run, job, **options))
+
+
+def test_rollups_backfill_keeps_rebuilt_users_in_its_checkpoint(server, client, user_id, monkeypatch):
+    client.post("/api/workout", json=workout_payload(user_id))
+    report = run_backfill(client, server, "rollups", restart=True)
+    saved = client.portal.call(server.db.backfill_jobs.find_one, {"_id": "rollups"})
+    assert report["status"] == STATUS_COMPLETED and user_id in saved["state"]["rebuilt_users"]
+
+    # An interrupted run that had rebuilt this user: resuming skips them
+    rebuilt = []
+
+    async def rebuild(user):
+        rebuilt.append(user)
+    monkeypatch.setattr(server, "rebuild_user_rollups", rebuild)
+    client.portal.call(server.db.backfill_jobs.update_one, {"_id": "rollups"}, {"$set": {
+        "status": STATUS_FAILED, "last_id": None, "scanned": 0, "state": {"rebuilt_users": [user_id]},
+    }})
+    run_backfill(client, server, "rollups")
+
+    assert user_id not in rebuilt and rebuilt
+
+
+def test_routes_backfill_packs_legacy_routes(server, client, user_id):
+    route = walking_route(50)
+    workout_ids = []
+    for day in (1, 2):
+        payload = workout_payload(user_id, local_time=f"2026-05-{day:02d}T10:00:00", route_json=json.dumps(route))
+        workout_ids.append(wait_processed(server, client, client.post("/api/workout", json=payload).json()["workout_id"])["id"])
+    inline_id, tracked_id = workout_ids
+    before = client.get(f"/api/workout/id/{inline_id}").json()["route"]
+    # Legacy shapes: a route array inline, and one moved as-is to workout_tracks
+    client.portal.call(server.db.workout_tracks.delete_one, {"_id": inline_id})
+    client.portal.call(server.repo.workouts.update, inline_id, {"$set": {"route": route}, "$unset": {"track_store": ""}})
+    client.portal.call(server.db.workout_tracks.replace_one, {"_id": tracked_id}, {"route": route})
+
+    assert run_backfill(client, server, "routes", dry_run=True)["updated"] >= 2
+    assert client.portal.call(server.repo.workouts.get, inline_id)["route"] == route
+    report = run_backfill(client, server, "routes", restart=True)
+
+    assert report["status"] == STATUS_COMPLETED
+    inline = client.portal.call(server.repo.workouts.get, inline_id)
+    tracked = client.portal.call(server.db.workout_tracks.find_one, {"_id": tracked_id})
+    for doc in (inline, tracked):
+        assert "route" not in doc and doc["route_v"] == server.ROUTE_SCHEMA_VERSION and doc["route_packed"]
+    for workout_id in workout_ids:
+        assert client.get(f"/api/workout/id/{workout_id}").json()["route"] == before
+    assert run_backfill(client, server, "routes", restart=True)["updated"] == 0
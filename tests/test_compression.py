@@ -0,0 +1,164 @@
+import gzip
+
+import brotli
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Mount, Route
+from starlette.testclient import TestClient
+
+from compression import CompressionMiddleware, Compressor, compress, negotiate
+from static_assets import IMMUTABLE, ImmutableStaticFiles
+from tests.helpers import workout_payload
+
+BIG = "fitbeat " * 500
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("br", "br"),
+    ("gzip, deflate, br", "br"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("br;q=0, gzip;q=0.1", "gzip"),
+    ("br;q=0, gzip;q=0", None),
+    ("*", "br"),
+    ("*;q=0.5, br;q=0", "gzip"),
+    ("*;q=0", None),
+    ("GZIP ; q=1", "gzip"),
+    ("br;q=oops, gzip", "gzip"),
+])
+def test_negotiate(header, expected):
+    assert negotiate(header) == expected
+
+
+def test_compressor_threshold():
+    compressor = Compressor(min_bytes=100)
+    assert compressor.encoding_for("br", 99) is None
+    assert compressor.encoding_for("br", 100) == "br"
+    assert compressor.encoding_for("identity", 5000) is None
+
+
+def test_compress_round_trips():
+    body = BIG.encode()
+    assert brotli.decompress(compress(body, "br")) == body
+    assert gzip.decompress(compress(body, "gzip")) == body
+    assert compress(body, "gzip") == compress(body, "gzip")  # mtime=0: same bytes every time
+    with pytest.raises(ValueError):
+        compress(body, "deflate")
+
+
+@pytest.fixture
+def static_dir(tmp_path):
+    css = b"body { color: red }\n" * 100
+    (tmp_path / "site.0123abcd.css").write_bytes(css)
+    (tmp_path / "site.0123abcd.css.br").write_bytes(compress(css, "br"))
+    (tmp_path / "site.0123abcd.css.gz").write_bytes(compress(css, "gzip"))
+    (tmp_path / "plain.css").write_bytes(css)
+    return tmp_path
+
+
+@pytest.fixture
+def app(static_dir):
+    compressor = Compressor(min_bytes=1024)
+    app = Starlette(routes=[
+        Route("/big", lambda request: PlainTextResponse(BIG, headers={"ETag": '"big"'})),
+        Route("/small", lambda request: PlainTextResponse("tiny", headers={"ETag": '"small"'})),
+        Route("/json", lambda request: JSONResponse({"text": BIG})),
+        Route("/png", lambda request: Response(b"\x89PNG" * 1000, media_type="image/png")),
+        Route("/encoded", lambda request: Response(compress(BIG.encode(), "gzip"), media_type="text/html",
+                                                   headers={"Content-Encoding": "gzip", "ETag": '"page"'})),
+        Mount("/static", ImmutableStaticFiles(directory=static_dir)),
+    ])
+    app.add_middleware(CompressionMiddleware, compressor=compressor)
+    app.state.compressor = compressor
+    return app
+
+
+@pytest.fixture
+def http(app):
+    with TestClient(app) as http:
+        yield http
+
+
+@pytest.mark.parametrize("accept, encoding", [("br", "br"), ("gzip", "gzip"), ("br;q=0.1, gzip", "gzip")])
+def test_large_text_is_compressed(http, accept, encoding):
+    response = http.get("/big", headers={"Accept-Encoding": accept})
+    assert response.headers["content-encoding"] == encoding
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == 'W/"big"'
+    assert int(response.headers["content-length"]) < len(BIG)
+    assert response.text == BIG
+
+
+def test_json_is_compressed(http):
+    response = http.get("/json", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.json() == {"text": BIG}
+
+
+def test_identity_gets_the_body_as_is(http):
+    response = http.get("/big", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == '"big"'
+    assert response.text == BIG
+
+
+def test_small_bodies_are_sent_uncompressed(app, http):
+    response = http.get("/small", headers={"Accept-Encoding": "br"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == '"small"'
+    assert app.state.compressor.too_small == 1
+
+
+def test_binary_responses_pass_through(http):
+    response = http.get("/png", headers={"Accept-Encoding": "br"})
+    assert "content-encoding" not in response.headers
+    assert "vary" not in response.headers
+
+
+def test_encoded_responses_are_not_compressed_again(app, http):
+    response = http.get("/encoded", headers={"Accept-Encoding": "br, gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == 'W/"page"'
+    assert response.text == BIG
+    assert app.state.compressor.stats()["compressed"] == {"br": 0, "gzip": 0}
+
+
+@pytest.mark.parametrize("accept, encoding", [("br", "br"), ("gzip", "gzip"), ("gzip, br", "br")])
+def test_static_files_are_served_precompressed(app, http, accept, encoding):
+    response = http.get("/static/site.0123abcd.css", headers={"Accept-Encoding": accept})
+    assert response.headers["content-encoding"] == encoding
+    assert response.headers["content-type"].startswith("text/css")
+    assert response.headers["cache-control"] == IMMUTABLE
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"].startswith("W/")
+    assert response.text == "body { color: red }\n" * 100
+    assert app.state.compressor.stats()["compressed"] == {"br": 0, "gzip": 0}
+
+
+def test_static_files_without_variants(http):
+    response = http.get("/static/plain.css", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["cache-control"] == IMMUTABLE
+
+    # No .br next to it: compressed per response instead
+    response = http.get("/static/plain.css", headers={"Accept-Encoding": "br"})
+    assert response.headers["content-encoding"] == "br"
+
+
+def test_server_pages_are_compressed(client, user_id):
+    client.post("/api/workout", json=workout_payload(user_id))
+    path = f"/api/u/{user_id}/year/2026"
+    plain = client.get(path, headers={"Accept-Encoding": "identity"})
+    assert int(plain.headers["content-length"]) >= 1024
+
+    response = client.get(path, headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == plain.headers["etag"]
+    assert response.text == plain.text
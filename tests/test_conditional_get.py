@@ -0,0 +1,111 @@
+import pytest
+
+from tests.helpers import workout_payload
+
+
+def page_etag(client, path, **headers):
+    response = client.get(path, headers=headers)
+    assert response.status_code == 200
+    return response.headers["etag"], response
+
+
+@pytest.mark.parametrize("page", ["", "/year/2026", "/year/2026/month/05", "/monthly"])
+def test_pages_revalidate_with_304(client, user_id, page):
+    client.post("/api/workout", json=workout_payload(user_id))
+    path = f"/api/u/{user_id}{page}"
+    etag, response = page_etag(client, path)
+    assert response.headers["cache-control"] == "no-cache"
+
+    response = client.get(path, headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+
+def test_etag_changes_with_the_users_data(client, user_id):
+    path = f"/api/u/{user_id}"
+    before, _ = page_etag(client, path)
+
+    client.post("/api/workout", json=workout_payload(user_id))
+
+    after, response = page_etag(client, path, **{"If-None-Match": before})
+    assert after != before
+    assert "Tester" in response.text
+
+
+def test_another_users_write_keeps_the_etag(client, user_id):
+    path = f"/api/u/{user_id}"
+    client.post("/api/workout", json=workout_payload(user_id))
+    etag, _ = page_etag(client, path)
+
+    client.post("/api/workout", json=workout_payload(f"{user_id}-other"))
+
+    assert client.get(path, headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_etag_depends_on_lang(client, user_id):
+    path = f"/api/u/{user_id}"
+    auto, _ = page_etag(client, path)
+    italian, _ = page_etag(client, f"{path}?lang=1")
+    assert auto != italian
+    assert client.get(f"{path}?lang=1", headers={"If-None-Match": auto}).status_code == 200
+
+
+@pytest.mark.parametrize("if_none_match", [
+    "{etag}",
+    "W/{etag}",
+    '"stale", {etag}',
+    "*",
+])
+def test_if_none_match_forms(client, user_id, if_none_match):
+    path = f"/api/u/{user_id}"
+    etag, _ = page_etag(client, path)
+    strong = etag.removeprefix("W/")
+    response = client.get(path, headers={"If-None-Match": if_none_match.format(etag=strong)})
+    assert response.status_code == 304
+
+
+@pytest.mark.parametrize("accept", ["identity", "gzip", "br"])
+def test_same_validator_for_every_encoding(client, user_id, accept):
+    client.post("/api/workout", json=workout_payload(user_id))
+    path = f"/api/u/{user_id}/year/2026"
+    etag, response = page_etag(client, path, **{"Accept-Encoding": accept})
+    assert etag.startswith("W/")
+
+    revalidated = client.get(path, headers={"Accept-Encoding": accept, "If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == etag
+    assert client.get(path, headers={"Accept-Encoding": "identity"}).headers["etag"] == etag
+
+
+def test_stale_etag_gets_the_page(client, user_id):
+    response = client.get(f"/api/u/{user_id}", headers={"If-None-Match": '"v0-auto-t0.stale"'})
+    assert response.status_code == 200
+    assert response.text
+
+
+def test_other_requests_are_untouched(client, user_id):
+    response = client.post("/api/workout", json=workout_payload(user_id), headers={"If-None-Match": "*"})
+    assert response.status_code == 200
+    assert "etag" not in response.headers
+
+    response = client.get(f"/api/workout/user/{user_id}", headers={"If-None-Match": "*"})
+    assert response.status_code == 200
+    assert "etag" not in response.headers
+
+
+def test_errors_carry_no_etag(client, user_id):
+    response = client.get(f"/api/u/{user_id}?lang=en")
+    assert response.status_code == 422
+    assert "etag" not in response.headers
+
+
+def test_etag_matches():
+    from server import etag_matches
+    assert etag_matches('"a"', '"a"')
+    assert etag_matches('W/"a"', '"a"')
+    assert etag_matches(' "b" , W/"a" ', '"a"')
+    assert etag_matches("*", '"a"')
+    assert not etag_matches("", '"a"')
+    assert not etag_matches('"ab"', '"a"')
@@ -0,0 +1,94 @@
+import pytest
+
+from tests.helpers import wait_processed, workout_payload
+
+
+@pytest.fixture
+def device_id(user_id):
+    return f"device-{user_id}"
+
+
+@pytest.fixture
+def calls(server, monkeypatch):
+    """Counts of the registry's reads and the workout rewrites a migration does"""
+    counts = {"find_one": 0, "move_device": 0}
+
+    def count(collection, name):
+        original = getattr(collection, name)
+
+        async def counted(*args, **kwargs):
+            counts[name] += 1
+            return await original(*args, **kwargs)
+        monkeypatch.setattr(collection, name, counted)
+
+    count(server.db.devices, "find_one")
+    count(server.repo.workouts, "move_device")
+    return counts
+
+
+def submit(client, user_id, device_id, day=1):
+    payload = workout_payload(user_id, local_time=f"2026-05-{day:02d}T10:00:00", device_id=device_id)
+    return client.post("/api/workout", json=payload).json()["workout_id"]
+
+
+def registered(server, client, device_id):
+    return client.portal.call(server.db.devices.find_one, {"_id": device_id})
+
+
+def test_new_device_is_registered_once(server, client, user_id, device_id, calls):
+    for day in (1, 2, 3):
+        submit(client, user_id, device_id, day)
+
+    # Only the first submit reads the registry and migrates; the rest hit the cache
+    assert calls == {"find_one": 1, "move_device": 1}
+    assert registered(server, client, device_id)["user_id"] == user_id
+    assert client.portal.call(server.db.devices.count_documents, {"_id": device_id}) == 1
+
+
+def test_known_device_skips_the_migration(server, client, user_id, device_id, calls):
+    submit(client, user_id, device_id)
+    server._device_user_cache.clear()
+
+    submit(client, user_id, device_id, day=2)
+
+    # Registered to this user already: one point read, no workouts rewritten
+    assert calls == {"find_one": 2, "move_device": 1}
+
+
+def test_device_moves_to_its_new_user(server, client, user_id, device_id):
+    old_user = f"{user_id}-old"
+    workout_ids = [wait_processed(server, client, submit(client, old_user, device_id, day))["id"] for day in (1, 2)]
+    versions = [client.portal.call(server.repo.workouts.get, w)["version"] for w in workout_ids]
+
+    submit(client, user_id, device_id, day=3)
+
+    assert registered(server, client, device_id)["user_id"] == user_id
+    for workout_id, version in zip(workout_ids, versions):
+        doc = client.portal.call(server.repo.workouts.get, workout_id)
+        # Moved workouts change their pages, so their version is bumped
+        assert doc["user_id"] == user_id and doc["version"] == version + 1
+    assert client.get(f"/api/user/{old_user}/stats").json()["total_workouts"] == 0
+    assert client.get(f"/api/user/{user_id}/stats").json()["total_workouts"] == 3
+
+
+def test_stale_or_expired_cache_entries_read_the_registry(server, client, user_id, device_id, calls):
+    submit(client, user_id, device_id)
+
+    # Cached for another user (moved by another process): not trusted
+    server._cache_device_user(device_id, "someone-else")
+    submit(client, user_id, device_id, day=2)
+    assert calls["find_one"] == 2 and calls["move_device"] == 1
+    assert server._device_user_cache[device_id][0] == user_id
+
+    # Past its TTL: read again
+    server._device_user_cache[device_id] = (user_id, 0)
+    submit(client, user_id, device_id, day=3)
+    assert calls["find_one"] == 3 and calls["move_device"] == 1
+
+
+def test_cache_is_bounded(server, monkeypatch):
+    monkeypatch.setattr(server, "_device_user_cache", {})
+    monkeypatch.setattr(server, "DEVICE_CACHE_MAX_ENTRIES", 2)
+    for device in ("a", "b", "c"):
+        server._cache_device_user(device, "user")
+    assert list(server._device_user_cache) == ["c"]
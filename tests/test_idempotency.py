@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from tests.helpers import stored_workouts, workout_payload
+
+
+def count_workouts(server, client, user_id):
+    return len(stored_workouts(server, client, user_id, ("id",)))
+
+
+def test_replay_with_client_key_returns_original(server, client, user_id):
+    payload = workout_payload(user_id, idempotency_key="watch-42")
+    first = client.post("/api/workout", json=payload).json()
+    replay = client.post("/api/workout", json=payload).json()
+
+    assert replay["workout_id"] == first["workout_id"]
+    assert replay["duplicate"] is True
+    assert "duplicate" not in first
+    assert count_workouts(server, client, user_id) == 1
+
+
+def test_replay_keyed_by_device_and_start_time(server, client, user_id):
+    payload = workout_payload(user_id, device_id="fenix-1")
+    first = client.post("/api/workout", json=payload).json()
+    assert client.post("/api/workout", json=payload).json()["workout_id"] == first["workout_id"]
+
+    # Another workout on the same device is a new workout
+    later = client.post("/api/workout", json=workout_payload(user_id, device_id="fenix-1", local_time="2026-05-01T18:00:00")).json()
+    assert later["workout_id"] != first["workout_id"]
+    assert count_workouts(server, client, user_id) == 2
+
+
+def test_without_a_key_every_submit_is_saved(server, client, user_id):
+    payload = workout_payload(user_id)
+    client.post("/api/workout", json=payload)
+    client.post("/api/workout", json=payload)
+    assert count_workouts(server, client, user_id) == 2
+
+
+def test_concurrent_replays_insert_once(server, client, user_id):
+    payload = workout_payload(user_id, idempotency_key="retry-storm")
+    with ThreadPoolExecutor(4) as pool:
+        responses = list(pool.map(lambda _: client.post("/api/workout", json=payload).json(), range(8)))
+
+    assert len({r["workout_id"] for r in responses}) == 1
+    assert count_workouts(server, client, user_id) == 1
+
+
+def test_batch_replays_and_repeats(server, client, user_id):
+    saved = client.post("/api/workout", json=workout_payload(user_id, idempotency_key="a")).json()
+    batch = [
+        workout_payload(user_id, idempotency_key="a"),
+        workout_payload(user_id, idempotency_key="b", local_time="2026-05-02T10:00:00"),
+        workout_payload(user_id, idempotency_key="b", local_time="2026-05-02T10:00:00"),
+    ]
+    results = client.post("/api/workouts/batch", json={"workouts": batch}).json()["results"]
+
+    assert results[0]["workout_id"] == saved["workout_id"] and results[0]["duplicate"] is True
+    assert results[2]["workout_id"] == results[1]["workout_id"] and results[2]["duplicate"] is True
+    assert count_workouts(server, client, user_id) == 2
+
+    again = client.post("/api/workouts/batch", json={"workouts": batch}).json()["results"]
+    assert [r["workout_id"] for r in again] == [r["workout_id"] for r in results]
+    assert count_workouts(server, client, user_id) == 2
+
+
+def test_keys_are_scoped_to_the_user(server, client, user_id):
+    other = f"{user_id}-other"
+    mine = client.post("/api/workout", json=workout_payload(user_id, idempotency_key="1")).json()
+    theirs = client.post("/api/workout", json=workout_payload(other, idempotency_key="1")).json()
+
+    assert theirs["workout_id"] != mine["workout_id"]
+    assert "duplicate" not in theirs
+    assert count_workouts(server, client, user_id) == 1
+    assert count_workouts(server, client, other) == 1
+
+    batch = [workout_payload(user_id, idempotency_key="2"), workout_payload(other, idempotency_key="2")]
+    results = client.post("/api/workouts/batch", json={"workouts": batch}).json()["results"]
+    assert results[0]["workout_id"] != results[1]["workout_id"]
+    assert not any(r.get("duplicate") for r in results)
+    assert count_workouts(server, client, other) == 2
@@ -0,0 +1,255 @@
+"""The in-memory backend against the query, update and index shapes
+server.py sends to MongoDB collections."""
+import asyncio
+import re
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from gridfs.errors import NoFile
+from pymongo import ASCENDING, DESCENDING, DeleteOne, IndexModel, InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+from storage import MemoryStorage, Storage
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+@pytest.fixture
+def storage():
+    return MemoryStorage()
+
+
+@pytest.fixture
+def activities(storage):
+    collection = storage.activities
+    run(collection.insert_many([
+        {"_id": "w1", "user_id": "a", "timestamp": datetime(2026, 1, 5, 7), "distance_cm": 500000,
+         "avg_hr": 140, "tags": ["run"], "route": {"points": 10}},
+        {"_id": "w2", "user_id": "a", "timestamp": datetime(2026, 1, 20, 7), "distance_cm": 800000,
+         "avg_hr": None, "tags": ["run", "race"]},
+        {"_id": "w3", "user_id": "a", "timestamp": datetime(2026, 2, 2, 7), "distance_cm": 300000,
+         "avg_hr": 160, "tags": []},
+        {"_id": "w4", "user_id": "b", "timestamp": datetime(2026, 1, 9, 7), "distance_cm": 1000000,
+         "avg_hr": 150, "tags": ["ride"]},
+    ]))
+    return collection
+
+
+def find_ids(collection, query, **kwargs):
+    return [doc["_id"] for doc in run(collection.find(query, {"_id": 1}, **kwargs).to_list(None))]
+
+
+def test_storage_interface_is_abstract(storage):
+    with pytest.raises(TypeError):
+        Storage()
+    assert storage.activities is storage["activities"]
+    assert storage.track_bucket("tracks") is storage.track_bucket("tracks")
+    with pytest.raises(AttributeError):
+        storage._private
+    assert storage.repositories() is storage.repositories()
+    with pytest.raises(AttributeError):
+        storage.workouts
+
+
+@pytest.mark.parametrize("query, expected", [
+    ({"user_id": "a"}, {"w1", "w2", "w3"}),
+    ({"user_id": {"$in": ["a", "b"]}, "distance_cm": {"$gte": 800000}}, {"w2", "w4"}),
+    ({"user_id": {"$nin": ["a"]}}, {"w4"}),
+    ({"user_id": "a", "avg_hr": None}, {"w2"}),
+    ({"user_id": "a", "avg_hr": {"$ne": None}}, {"w1", "w3"}),
+    ({"route": {"$exists": True}}, {"w1"}),
+    ({"route.points": {"$gt": 5}}, {"w1"}),
+    ({"tags": "race"}, {"w2"}),
+    ({"avg_hr": {"$type": "number"}}, {"w1", "w3", "w4"}),
+    ({"avg_hr": {"$not": {"$gt": 145}}}, {"w1", "w2"}),
+    ({"$or": [{"user_id": "b"}, {"distance_cm": {"$lt": 400000}}]}, {"w3", "w4"}),
+    ({"$and": [{"user_id": "a"}, {"timestamp": {"$lt": datetime(2026, 2, 1)}}]}, {"w1", "w2"}),
+    ({"$nor": [{"user_id": "a"}]}, {"w4"}),
+    ({"user_id": re.compile("^b")}, {"w4"}),
+])
+def test_query_operators(activities, query, expected):
+    assert set(find_ids(activities, query)) == expected
+
+
+def test_aware_datetimes_compare_as_utc(activities):
+    cutoff = datetime(2026, 1, 20, 9, tzinfo=timezone(timedelta(hours=2)))
+    assert set(find_ids(activities, {"timestamp": {"$lt": cutoff}})) == {"w1", "w4"}
+    assert set(find_ids(activities, {"timestamp": {"$lte": cutoff}})) == {"w1", "w2", "w4"}
+
+
+def test_values_of_other_types_never_compare(activities):
+    assert find_ids(activities, {"distance_cm": {"$gt": "0"}}) == []
+
+
+def test_sort_skip_limit_and_projection(activities):
+    cursor = activities.find({"user_id": "a"}, {"_id": 0, "distance_cm": 1}).sort(
+        [("timestamp", DESCENDING)]).skip(1).limit(1)
+    assert run(cursor.to_list(None)) == [{"distance_cm": 800000}]
+
+    ids = find_ids(activities, {}, sort=[("user_id", ASCENDING), ("distance_cm", DESCENDING)])
+    assert ids == ["w2", "w1", "w3", "w4"]
+
+    doc = run(activities.find_one({"_id": "w1"}, {"route": 0, "tags": 0}))
+    assert set(doc) == {"_id", "user_id", "timestamp", "distance_cm", "avg_hr"}
+
+
+def test_returned_documents_are_copies(activities):
+    doc = run(activities.find_one({"_id": "w1"}))
+    doc["tags"].append("changed")
+    assert run(activities.find_one({"_id": "w1"}))["tags"] == ["run"]
+
+
+def test_update_operators(activities):
+    run(activities.update_one({"_id": "w1"}, {
+        "$set": {"route.points": 12, "name": "Morning"},
+        "$inc": {"distance_cm": 100, "version": 1},
+        "$unset": {"avg_hr": ""},
+        "$push": {"tags": "tempo"},
+    }))
+    doc = run(activities.find_one({"_id": "w1"}))
+    assert doc["route"] == {"points": 12}
+    assert doc["name"] == "Morning"
+    assert doc["distance_cm"] == 500100
+    assert doc["version"] == 1
+    assert "avg_hr" not in doc
+    assert doc["tags"] == ["run", "tempo"]
+
+    result = run(activities.update_many({"user_id": "a"}, {"$set": {"checked": True}}))
+    assert (result.matched_count, result.modified_count) == (3, 3)
+
+
+def test_upsert_seeds_from_the_filter(storage):
+    rollups = storage.user_rollups
+    for _ in range(2):
+        run(rollups.update_one({"_id": "a:2026", "user_id": "a"},
+                               {"$inc": {"count": 1}, "$setOnInsert": {"kind": "year"}}, upsert=True))
+    assert run(rollups.find_one({"_id": "a:2026"})) == {"_id": "a:2026", "user_id": "a", "count": 2, "kind": "year"}
+
+
+def test_unique_indexes(storage):
+    users = storage.members
+    run(users.create_indexes([
+        IndexModel([("email", ASCENDING)], name="email", unique=True, partialFilterExpression={"email": {"$type": "string"}}),
+    ]))
+    run(users.insert_one({"_id": 1, "email": "a@example.com"}))
+    run(users.insert_one({"_id": 2}))
+    run(users.insert_one({"_id": 3}))  # outside the partial index
+    with pytest.raises(DuplicateKeyError):
+        run(users.insert_one({"_id": 4, "email": "a@example.com"}))
+    with pytest.raises(DuplicateKeyError):
+        run(users.update_one({"_id": 2}, {"$set": {"email": "a@example.com"}}))
+    with pytest.raises(DuplicateKeyError):
+        run(users.insert_one({"_id": 1}))
+
+    run(users.delete_one({"_id": 1}))
+    run(users.update_one({"_id": 2}, {"$set": {"email": "a@example.com"}}))
+    assert set(run(users.index_information())) == {"_id_", "email"}
+
+
+def test_index_options_must_match(storage):
+    run(storage.members.create_index([("name", ASCENDING)], name="name"))
+    with pytest.raises(OperationFailure):
+        run(storage.members.create_index([("name", ASCENDING)], name="name", unique=True))
+    run(storage.members.drop_index("name"))
+    with pytest.raises(OperationFailure):
+        run(storage.members.drop_index("name"))
+
+
+def test_indexed_lookups_see_updates(storage):
+    collection = storage.activities
+    run(collection.create_index([("user_id", ASCENDING)], name="user"))
+    run(collection.insert_many([{"_id": n, "user_id": "a"} for n in range(3)]))
+    run(collection.update_one({"_id": 1}, {"$set": {"user_id": "b"}}))
+    assert find_ids(collection, {"user_id": "a"}) == [0, 2]
+    assert find_ids(collection, {"user_id": {"$in": ["b"]}}) == [1]
+
+
+def test_bulk_write(storage):
+    collection = storage.activities
+    result = run(collection.bulk_write([
+        InsertOne({"_id": 1, "n": 1}),
+        InsertOne({"_id": 2, "n": 2}),
+        UpdateOne({"_id": 1}, {"$inc": {"n": 10}}),
+        UpdateOne({"_id": 3}, {"$set": {"n": 3}}, upsert=True),
+        DeleteOne({"_id": 2}),
+    ]))
+    assert (result.inserted_count, result.modified_count, result.upserted_count, result.deleted_count) == (2, 1, 1, 1)
+    assert run(collection.find({}).sort("_id").to_list(None)) == [{"_id": 1, "n": 11}, {"_id": 3, "n": 3}]
+
+
+@pytest.mark.parametrize("ordered, inserted", [(True, [1]), (False, [1, 3])])
+def test_bulk_write_errors(storage, ordered, inserted):
+    collection = storage.activities
+    with pytest.raises(BulkWriteError) as error:
+        run(collection.bulk_write([InsertOne({"_id": 1}), InsertOne({"_id": 1}), InsertOne({"_id": 3})],
+                                  ordered=ordered))
+    assert [e["index"] for e in error.value.details["writeErrors"]] == [1]
+    assert find_ids(collection, {}) == inserted
+
+
+def test_find_one_and_update_claims_once(storage):
+    sessions = storage.upload_sessions
+    run(sessions.insert_one({"_id": "s", "status": "open"}))
+    claim = {"_id": "s", "status": "open"}, {"$set": {"status": "committing"}}
+
+    before = run(sessions.find_one_and_update(*claim))
+    assert before["status"] == "open"
+    assert run(sessions.find_one_and_update(*claim)) is None
+
+    after = run(sessions.find_one_and_update({"_id": "s"}, {"$set": {"status": "committed"}},
+                                             projection={"_id": 0}, return_document=ReturnDocument.AFTER))
+    assert after == {"status": "committed"}
+
+    created = run(sessions.find_one_and_update({"_id": "t"}, {"$setOnInsert": {"status": "open"}},
+                                               upsert=True, return_document=ReturnDocument.AFTER))
+    assert created == {"_id": "t", "status": "open"}
+
+
+def test_find_one_and_delete(storage):
+    queue = storage.jobs
+    run(queue.insert_many([{"_id": 1, "at": 2}, {"_id": 2, "at": 1}]))
+    assert run(queue.find_one_and_delete({}, sort=[("at", ASCENDING)])) == {"_id": 2, "at": 1}
+    assert run(queue.count_documents({})) == 1
+    assert run(queue.find_one_and_delete({"_id": 5})) is None
+
+
+def test_count_and_distinct(activities):
+    assert run(activities.count_documents({"user_id": "a"})) == 3
+    assert run(activities.estimated_document_count()) == 4
+    assert run(activities.distinct("user_id")) == ["a", "b"]
+    assert run(activities.distinct("tags", {"user_id": "a"})) == ["run", "race"]
+
+
+def test_gridfs_bucket(storage):
+    bucket = storage.track_bucket("tracks")
+    run(bucket.upload_from_stream_with_id("t1", "t1.bin", b"0123456789"))
+
+    async def read():
+        stream = await bucket.open_download_stream("t1")
+        return await stream.read(4), await stream.read()
+
+    assert run(read()) == (b"0123", b"456789")
+    run(bucket.delete("t1"))
+    with pytest.raises(NoFile):
+        run(bucket.open_download_stream("t1"))
+    with pytest.raises(NoFile):
+        run(bucket.delete("t1"))
+
+
+@pytest.mark.parametrize("operation", [
+    lambda c: c.find({"name": {"$regex": "x"}}).to_list(None),
+    lambda c: c.find({"$where": "true"}).to_list(None),
+    lambda c: c.update_one({}, {"$addToSet": {"tags": "x"}}, upsert=True),
+])
+def test_unsupported_shapes_raise(storage, operation):
+    collection = storage.activities
+    run(collection.insert_one({"_id": 1, "name": "x", "n": 1}))
+    with pytest.raises(NotImplementedError):
+        run(operation(collection))
+
+
+def test_commands_are_refused(storage):
+    with pytest.raises(OperationFailure):
+        run(storage.command({"explain": {"find": "activities"}}))
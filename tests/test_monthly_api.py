@@ -0,0 +1,28 @@
+import json
+
+from tests.helpers import workout_payload
+
+ROUTE = [{"lat": 32.0 + i * 1e-4, "lon": 34.0, "timestamp": 1700000000 + i, "alt": 10.0 + i} for i in range(5)]
+
+
+def test_monthly_workouts_keep_route_and_elevation(client, user_id):
+    client.post("/api/workout", json=workout_payload(user_id, route_json=json.dumps(ROUTE)))
+    client.post("/api/workout", json=workout_payload(user_id, local_time="2026-05-02T10:00:00",
+                                                     elevation_json="[1, 2, 3]"))
+
+    response = client.get(f"/api/user/{user_id}/monthly", params={"year": 2026, "month": 5}).json()
+
+    assert response["total_workouts"] == 2
+    latest, first = response["workouts"]
+    assert latest["elevation_json"] == "[1, 2, 3]"
+    assert [(p["lat"], p["lon"]) for p in first["route"]] == [(p["lat"], p["lon"]) for p in ROUTE]
+    assert json.loads(first["elevation_json"]) == [p["alt"] for p in ROUTE]
+    for workout in response["workouts"]:
+        assert "route_packed" not in workout and "track_store" not in workout
+
+
+def test_monthly_range_has_no_workout_list(client, user_id):
+    client.post("/api/workout", json=workout_payload(user_id))
+    response = client.get(f"/api/user/{user_id}/monthly", params={"year": 2026, "month": 5, "months": 3}).json()
+    assert [m["month"] for m in response["months"]] == [3, 4, 5]
+    assert response["months"][-1]["total_workouts"] == 1
@@ -0,0 +1,85 @@
+from page_cache import PageCache
+from tests.helpers import wait_processed, workout_payload
+
+
+def test_lru_eviction_by_bytes():
+    cache = PageCache(max_bytes=10)
+    cache.put("a", 0, 1, b"aaaa")
+    cache.put("b", 0, 1, b"bbbb")
+    assert cache.get("a", 0, 1) == b"aaaa"  # b is now least recently used
+    cache.put("c", 0, 1, b"cccc")
+
+    assert cache.get("b", 0, 1) is None
+    assert cache.get("a", 0, 1) == b"aaaa"
+    assert cache.bytes == 8
+    assert cache.stats()["evictions"] == 1
+
+
+def test_keys_and_invalidation():
+    cache = PageCache()
+    cache.put("a", 0, 1, b"page")
+    cache.put("a", 1, 1, b"page")
+    cache.put("a", 0, 1, b"br", "br")
+    cache.put("b", 0, 1, b"page")
+    assert cache.get("a", 0, 2) is None
+    assert cache.get("a", 0, 1, "br") == b"br"
+
+    cache.invalidate(["a"])
+
+    assert cache.get("a", 0, 1) is None
+    assert cache.get("a", 0, 1, "br") is None
+    assert cache.get("b", 0, 1) == b"page"
+    assert cache.bytes == 4
+
+
+def test_oversized_pages_are_not_cached():
+    cache = PageCache(max_bytes=3)
+    cache.put("a", 0, 1, b"toolong")
+    assert cache.get("a", 0, 1) is None
+    assert cache.bytes == 0
+
+
+def test_user_pages_are_reused_until_the_next_write(server, client, user_id):
+    pages = [f"/api/u/{user_id}", f"/api/u/{user_id}/year/2026", f"/api/u/{user_id}/year/2026/month/05",
+             f"/api/u/{user_id}/monthly"]
+    workout_id = client.post("/api/workout", json=workout_payload(user_id, distance_cm=500000)).json()["workout_id"]
+    wait_processed(server, client, workout_id)
+    first = [client.get(page).text for page in pages]
+    hits = server.page_cache.hits
+
+    assert [client.get(page).text for page in pages] == first
+    assert server.page_cache.hits == hits + len(pages)
+
+    workout_id = client.post("/api/workout", json=workout_payload(user_id, local_time="2026-05-02T10:00:00",
+                                                                  distance_cm=700000)).json()["workout_id"]
+    wait_processed(server, client, workout_id)
+    after = [client.get(page).text for page in pages]
+
+    for before, page in zip(first, after):
+        assert page != before
+    assert "12.0" in after[0] and "12.0" in after[1]
+
+
+def test_lang_is_part_of_the_key(client, user_id):
+    client.post("/api/workout", json=workout_payload(user_id))
+    path = f"/api/u/{user_id}/year/2026"
+    english = client.get(f"{path}?lang=0").text
+    assert client.get(f"{path}?lang=1").text != english
+    assert client.get(f"{path}?lang=0").text == english
+
+
+def test_user_pages_are_cached_per_encoding(server, client, user_id):
+    client.post("/api/workout", json=workout_payload(user_id))
+    path = f"/api/u/{user_id}/year/2026"
+    plain = client.get(path, headers={"Accept-Encoding": "identity"}).text
+    before = dict(server.compressor.compressed)
+
+    for _ in range(3):
+        for encoding in ("br", "gzip"):
+            response = client.get(path, headers={"Accept-Encoding": encoding})
+            assert response.headers["content-encoding"] == encoding
+            assert response.text == plain
+
+    # One compression per encoding; the hits are served from the cache as they are
+    assert server.compressor.compressed["br"] == before["br"] + 1
+    assert server.compressor.compressed["gzip"] == before["gzip"] + 1
@@ -0,0 +1,30 @@
+from page_templates import PageTemplates
+from tests.helpers import workout_payload
+
+
+def templates(tmp_path, **files):
+    for name, source in files.items():
+        (tmp_path / name).write_text(source)
+    return PageTemplates(tmp_path, globals={"t": lambda key, lang: f"{key}-{lang}"})
+
+
+def test_fragment_keeps_slots_and_escapes_braces(tmp_path):
+    pages = templates(tmp_path, **{"row.html": "<b style=\"a{x}\">{{ t('km', lang) }} {{ slot('distance') }}</b>"})
+    assert pages.fragment("row.html", 1) == "<b style=\"a{{x}}\">km-1 {distance}</b>"
+    assert pages.fill("row.html", 2, {"distance": "3.50"}) == "<b style=\"a{x}\">km-2 3.50</b>"
+
+
+def test_fragment_variants_are_compiled_once(tmp_path):
+    pages = templates(tmp_path, **{"page.html": "{% if named %}{{ slot('name') }}{% else %}anon{% endif %}"})
+    assert pages.fill("page.html", 0, {"name": "Dana"}, named=True) == "Dana"
+    assert pages.fill("page.html", 0, {"name": "Dana"}, named=False) == "anon"
+    assert pages.fragment("page.html", 0, named=True) is pages.fragment("page.html", 0, named=True)
+
+
+def test_user_text_is_escaped_on_the_pages(client):
+    user_id = "test-<b>&'\""
+    client.post("/api/workout", json=workout_payload(user_id, user_name="<script>x</script>"))
+    for path in ("", "/year/2026", "/year/2026/month/05", "/monthly"):
+        page = client.get(f"/api/u/{user_id}{path}").text
+        assert "<script>x" not in page and "test-<b>" not in page
+        assert "test-&lt;b&gt;&amp;" in page
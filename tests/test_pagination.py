@@ -0,0 +1,66 @@
+from tests.helpers import stored_workouts, workout_payload
+
+
+def submit_workouts(client, user_id, times):
+    return [client.post("/api/workout", json=workout_payload(user_id, local_time=t)).json()["workout_id"] for t in times]
+
+
+def all_pages(client, user_id, limit):
+    ids, cursor = [], None
+    while True:
+        params = {"limit": limit, "summary": True, **({"cursor": cursor} if cursor else {})}
+        page = client.get(f"/api/workout/user/{user_id}", params=params).json()
+        ids += [w["id"] for w in page["workouts"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+def test_pages_cover_every_workout_once_in_order(server, client, user_id):
+    # Several workouts share a timestamp, so id has to break the ties
+    times = [f"2026-03-{day:02d}T08:00:00" for day in range(1, 11)] + ["2026-03-05T08:00:00"] * 6
+    ids = submit_workouts(client, user_id, times)
+
+    paged = all_pages(client, user_id, limit=4)
+
+    docs = stored_workouts(server, client, user_id, ("id", "timestamp"))
+    expected = [d["id"] for d in sorted(docs, key=lambda d: (d["timestamp"], d["id"]), reverse=True)]
+    assert paged == expected
+    assert sorted(paged) == sorted(ids)
+
+
+def test_exact_multiple_of_the_page_size_ends_without_a_cursor(client, user_id):
+    submit_workouts(client, user_id, [f"2026-03-{day:02d}T08:00:00" for day in range(1, 7)])
+    first = client.get(f"/api/workout/user/{user_id}", params={"limit": 3}).json()
+    second = client.get(f"/api/workout/user/{user_id}", params={"limit": 3, "cursor": first["next_cursor"]}).json()
+    assert second["count"] == 3
+    assert second["next_cursor"] is None
+
+
+def test_new_workouts_do_not_shift_later_pages(client, user_id):
+    submit_workouts(client, user_id, [f"2026-03-{day:02d}T08:00:00" for day in range(1, 7)])
+    first = client.get(f"/api/workout/user/{user_id}", params={"limit": 3}).json()
+    submit_workouts(client, user_id, ["2026-04-01T08:00:00"])
+
+    second = client.get(f"/api/workout/user/{user_id}", params={"limit": 3, "cursor": first["next_cursor"]}).json()
+
+    assert [w["timestamp"][:10] for w in second["workouts"]] == ["2026-03-03", "2026-03-02", "2026-03-01"]
+
+
+def test_invalid_cursor_is_rejected(client, user_id):
+    assert client.get(f"/api/workout/user/{user_id}", params={"cursor": "not-a-cursor"}).status_code == 400
+    assert client.get(f"/api/u/{user_id}/monthly/more", params={"cursor": "!!"}).status_code == 400
+
+
+def test_month_page_load_more(client, user_id):
+    ids = submit_workouts(client, user_id, [f"2026-03-{day:02d}T08:00:00" for day in range(1, 29)] * 2)
+    page = client.get(f"/api/u/{user_id}/year/2026/month/3")
+    assert page.status_code == 200
+
+    seen = sum(page.text.count(f"/workout/{workout_id}") > 0 for workout_id in ids)
+    cursor = page.text.split("cursor=")[1].split('"')[0] if "cursor=" in page.text else None
+    while cursor:
+        more = client.get(f"/api/u/{user_id}/year/2026/month/3/more", params={"cursor": cursor})
+        seen += sum(more.text.count(f"/workout/{workout_id}") > 0 for workout_id in ids)
+        cursor = more.text.split("cursor=")[1].split('"')[0] if "cursor=" in more.text else None
+    assert seen == len(ids)
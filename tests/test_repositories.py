@@ -0,0 +1,308 @@
+"""The repositories, the same cases against each backend.
+
+The MongoDB run needs a server: set TEST_MONGO_URL (e.g.
+mongodb://localhost:27017) to include it; each test gets a throwaway
+database.
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from repositories import (INLINE_TRACKS, LEGACY_ROUTES, LEGACY_TIMESTAMPS, PROCESSING_DONE, PROCESSING_FAILED,
+                          PROCESSING_PENDING, STORED_TRACKS)
+from route_columns import ROUTE_SCHEMA_VERSION
+from storage import MemoryStorage, MotorStorage
+
+
+@pytest.fixture(params=["memory", "mongo"])
+def check(request):
+    """Runs scenario(repositories) on an empty store of the backend, in one event loop"""
+    mongo_url = os.environ.get("TEST_MONGO_URL")
+    if request.param == "mongo" and not mongo_url:
+        pytest.skip("TEST_MONGO_URL is not set")
+
+    def check(scenario):
+        async def main():
+            db_name = f"fitbeat_test_{uuid.uuid4().hex[:12]}"
+            storage = MotorStorage(mongo_url, db_name) if request.param == "mongo" else MemoryStorage()
+            try:
+                repositories = storage.repositories()
+                assert await repositories.ensure_indexes() == []
+                return await scenario(repositories)
+            finally:
+                if request.param == "mongo":
+                    await storage.client.drop_database(db_name)
+                storage.close()
+        return asyncio.run(main())
+    return check
+
+
+def workout(workout_id, user_id="a", day=1, hour=8, **fields):
+    return {
+        "id": workout_id, "user_id": user_id, "timestamp": datetime(2026, 5, day, hour),
+        "local_date": f"2026-05-{day:02d}", "distance_cm": 100000, "duration_sec": 600, **fields,
+    }
+
+
+def ids(workouts):
+    return [w["id"] for w in workouts]
+
+
+def test_get_returns_copies_of_the_stored_fields(check):
+    async def scenario(repo):
+        doc = workout("w1", tags=("run",))
+        await repo.workouts.insert(doc)
+        assert "_id" not in doc
+
+        stored = await repo.workouts.get("w1")
+        assert stored == {**doc, "tags": ["run"]}
+        stored["tags"].append("race")
+        assert (await repo.workouts.get("w1"))["tags"] == ["run"]
+        assert await repo.workouts.get("w1", ("distance_cm", "missing")) == {"distance_cm": 100000}
+        assert await repo.workouts.get("w1", user_id="b") is None
+        assert await repo.workouts.get("w1", status=PROCESSING_PENDING) is None
+        assert await repo.workouts.get("w2") is None
+    check(scenario)
+
+
+def test_ids_and_idempotency_keys_are_unique(check):
+    async def scenario(repo):
+        await repo.workouts.insert(workout("w1", idempotency_key="k1"))
+        await repo.workouts.insert(workout("w2", user_id="b", idempotency_key="k1"))
+        await repo.workouts.insert(workout("w3"))
+        await repo.workouts.insert(workout("w4"))  # no key: never a duplicate
+        for duplicate in (workout("w1"), workout("w5", idempotency_key="k1")):
+            with pytest.raises(DuplicateKeyError):
+                await repo.workouts.insert(duplicate)
+
+        assert await repo.workouts.find_id_by_key("a", "k1") == "w1"
+        assert await repo.workouts.find_id_by_key("a", "k2") is None
+        assert await repo.workouts.find_ids_by_keys([("a", "k1"), ("b", "k1"), ("a", "k2"), ("b", "k2")]) == {
+            ("a", "k1"): "w1", ("b", "k1"): "w2",
+        }
+        errors = await repo.workouts.insert_many([
+            workout("w6", idempotency_key="k2"), workout("w7", idempotency_key="k1"), workout("w6"),
+        ])
+        assert sorted(errors) == [1, 2] and {e["code"] for e in errors.values()} == {11000}
+        assert await repo.workouts.get("w6")
+    check(scenario)
+
+
+def test_pages_are_newest_first_with_id_breaking_ties(check):
+    async def scenario(repo):
+        await repo.workouts.insert_many(
+            [workout(f"w{day}", day=day) for day in range(1, 6)]
+            + [workout(f"t{n}", day=3) for n in range(3)]
+            + [workout("other", user_id="b", day=9)]
+        )
+        order = ["w5", "w4", "w3", "t2", "t1", "t0", "w2", "w1"]
+
+        pages, after = [], None
+        while True:
+            page = await repo.workouts.page("a", 3, ("id", "timestamp"), after=after)
+            if not page:
+                break
+            pages += ids(page)
+            after = (page[-1]["timestamp"], page[-1]["id"])
+        assert pages == order
+
+        may = ("2026-05-02", "2026-05-04")
+        assert ids(await repo.workouts.page("a", 10, period=may)) == ["w3", "t2", "t1", "t0", "w2"]
+        assert ids(await repo.workouts.page("a", 10, period=may, after=(datetime(2026, 5, 3, 8), "t2"))) == ["t1", "t0", "w2"]
+        assert (await repo.workouts.latest("a", ("id",))) == {"id": "w5"}
+        assert (await repo.workouts.latest("a", ("id",), may)) == {"id": "w3"}
+        assert await repo.workouts.latest("c") is None
+        assert (await repo.workouts.latest(None))["id"]
+        assert ids(await repo.workouts.recent(2, ("id",))) == ["other", "w5"]
+    check(scenario)
+
+
+def test_pages_skip_legacy_string_timestamps_after_a_key(check):
+    async def scenario(repo):
+        await repo.workouts.insert_many([workout("w1", day=1), workout("w2", day=2),
+                                         workout("old", timestamp="2026-05-01T07:00:00")])
+        # Range reads only match dates; the string sorts before every date in newest-first order
+        assert ids(await repo.workouts.page("a", 10)) == ["w2", "w1", "old"]
+        assert ids(await repo.workouts.page("a", 10, after=(datetime(2026, 5, 2, 8), "w2"))) == ["w1"]
+    check(scenario)
+
+
+def test_updates(check):
+    async def scenario(repo):
+        await repo.workouts.insert(workout("w1", idempotency_key="k1", version=1, processing_status=PROCESSING_PENDING))
+        await repo.workouts.insert(workout("w2", idempotency_key="k2"))
+
+        assert await repo.workouts.update("w1", {"$set": {"avg_hr": 140}, "$unset": {"local_date": ""},
+                                                 "$inc": {"version": 1}})
+        assert await repo.workouts.get("w1", ("avg_hr", "local_date", "version")) == {"avg_hr": 140, "version": 2}
+        assert not await repo.workouts.update("w1", {"$set": {"avg_hr": 140}})
+        assert not await repo.workouts.update("w9", {"$set": {"avg_hr": 140}})
+        assert not await repo.workouts.update("w1", {"$set": {"avg_hr": 1}}, status=PROCESSING_DONE)
+        assert await repo.workouts.update("w1", {"$set": {"processing_status": PROCESSING_DONE}}, status=PROCESSING_PENDING)
+
+        await repo.workouts.update_many([("w1", {"$set": {"steps": 1}}), ("w2", {"$set": {"steps": 2}})])
+        assert [(await repo.workouts.get(w, ("steps",)))["steps"] for w in ("w1", "w2")] == [1, 2]
+
+        # Keys follow the document
+        with pytest.raises(DuplicateKeyError):
+            await repo.workouts.update("w2", {"$set": {"idempotency_key": "k1"}})
+        await repo.workouts.update("w1", {"$set": {"user_id": "b"}})
+        assert await repo.workouts.find_id_by_key("b", "k1") == "w1"
+        assert await repo.workouts.find_id_by_key("a", "k1") is None
+        assert ids(await repo.workouts.page("b", 10)) == ["w1"]
+    check(scenario)
+
+
+def test_processing_status(check):
+    async def scenario(repo):
+        await repo.workouts.insert_many([
+            workout("w1", processing_status=PROCESSING_PENDING),
+            workout("w2", processing_status=PROCESSING_FAILED, processing_error="boom"),
+            workout("w3", processing_status=PROCESSING_FAILED, processing_error="boom"),
+            workout("w4", processing_status=PROCESSING_DONE),
+        ])
+        assert await repo.workouts.count_with_status(PROCESSING_FAILED) == 2
+        assert await repo.workouts.ids_with_status(PROCESSING_PENDING) == ["w1"]
+
+        assert sorted(await repo.workouts.reset_failed()) == ["w2", "w3"]
+        assert await repo.workouts.count_with_status(PROCESSING_PENDING) == 3
+        assert await repo.workouts.get("w2", ("processing_status", "processing_error")) == {
+            "processing_status": PROCESSING_PENDING,
+        }
+        assert await repo.workouts.reset_failed() == []
+    check(scenario)
+
+
+def test_move_device(check):
+    async def scenario(repo):
+        await repo.workouts.insert_many([
+            workout("w1", device_id="d", version=1), workout("w2", user_id="b", device_id="d", version=3),
+            workout("w3", device_id="e", version=1),
+        ])
+        moved = await repo.workouts.move_device("d", "b", ("id", "user_id", "version"))
+
+        # As they were before the move
+        assert moved == [{"id": "w1", "user_id": "a", "version": 1}]
+        assert await repo.workouts.get("w1", ("user_id", "version")) == {"user_id": "b", "version": 2}
+        assert await repo.workouts.get("w2", ("version",)) == {"version": 3}
+        assert ids(await repo.workouts.page("a", 10)) == ["w3"]
+        assert await repo.workouts.move_device("d", "b") == []
+    check(scenario)
+
+
+def test_deletes_return_the_deleted_workouts(check):
+    async def scenario(repo):
+        await repo.workouts.insert_many([workout(f"w{n}", day=n, idempotency_key=f"k{n}") for n in range(1, 5)]
+                                        + [workout("b1", user_id="b")])
+
+        assert await repo.workouts.delete("w1", ("id", "track_store")) == {"id": "w1"}
+        assert await repo.workouts.delete("w1") is None
+        assert sorted(ids(await repo.workouts.delete_ids(["w2", "w9", "b1"], ("id",)))) == ["b1", "w2"]
+        assert sorted(ids(await repo.workouts.delete_for_user("a", ("id",)))) == ["w3", "w4"]
+        assert await repo.workouts.count() == 0
+        # The keys are free again
+        await repo.workouts.insert(workout("w5", idempotency_key="k1"))
+    check(scenario)
+
+
+def test_selections(check):
+    async def scenario(repo):
+        legacy_route = [{"lat": 32.0, "lon": 34.8}]
+        await repo.workouts.insert_many([
+            workout("plain"),
+            workout("inline", route_v=ROUTE_SCHEMA_VERSION, route_packed={"n": 1}),
+            workout("legacy", user_id="b", route=legacy_route, elevation_json="[1]"),
+            workout("stored", track_store="collection"),
+            workout("gridfs", track_store="gridfs"),
+            workout("string_time", timestamp="2026-05-01T08:00:00"),
+            {"id": "no_date", "user_id": "a", "timestamp": datetime(2026, 5, 1)},
+        ])
+        expected = {
+            None: ["plain", "inline", "legacy", "stored", "gridfs", "string_time", "no_date"],
+            INLINE_TRACKS: ["inline", "legacy"],
+            STORED_TRACKS: ["stored", "gridfs"],
+            LEGACY_ROUTES: ["legacy", "stored"],
+            LEGACY_TIMESTAMPS: ["string_time", "no_date"],
+        }
+        for selection, selected in expected.items():
+            assert sorted(ids([w async for w in repo.workouts.iterate(selection=selection, fields=("id",))])) == sorted(selected)
+            assert await repo.workouts.count(selection) == len(selected)
+        assert [w async for w in repo.workouts.iterate("b", INLINE_TRACKS, ("id", "route"), batch_size=1)] == [
+            {"id": "legacy", "route": legacy_route},
+        ]
+
+        # scan walks in _id (insertion) order and resumes after an _id
+        first = await repo.workouts.scan(limit=3, fields=("id",))
+        assert ids(first) == ["plain", "inline", "legacy"] and all("_id" in w for w in first)
+        rest = await repo.workouts.scan(after=first[-1]["_id"], fields=("id",))
+        assert ids(rest) == ["stored", "gridfs", "string_time", "no_date"]
+        assert ids(await repo.workouts.scan(INLINE_TRACKS, after=first[1]["_id"])) == ["legacy"]
+        assert await repo.workouts.count(STORED_TRACKS, after=rest[0]["_id"]) == 1
+    check(scenario)
+
+
+def test_duplicate_groups_keep_the_first_saved_copy_first(check):
+    async def scenario(repo):
+        await repo.workouts.insert_many([
+            workout("c", device_id="d"), workout("a", device_id="d"), workout("b", device_id="d"),
+            workout("other_device", device_id="e"),
+            workout("x"), workout("y"),  # no device_id on either: still the same upload
+            workout("longer", device_id="d", duration_sec=601),
+            workout("other_user", user_id="b", device_id="d"),
+        ])
+        assert sorted(await repo.workouts.duplicate_groups()) == [["c", "a", "b"], ["x", "y"]]
+        assert await repo.workouts.duplicate_groups("b") == []
+    check(scenario)
+
+
+def test_month_totals(check):
+    async def scenario(repo):
+        await repo.workouts.insert_many([
+            workout("m4", day=20, user_name="Old", avg_hr=150, max_hr=170, steps=10, elevation_gain=1.5),
+            workout("m5a", day=2, user_name="New", avg_hr=0, max_hr=150),
+            workout("m5b", day=3, hour=9, avg_hr=140, max_hr=160, steps=5, elevation_gain=2.5, elevation_loss=1),
+            workout("b", user_id="b", day=2),
+        ])
+        await repo.workouts.update("m4", {"$set": {"local_date": "2026-04-20", "timestamp": datetime(2026, 4, 20)}})
+
+        result = await repo.workouts.month_totals("a", ("2026-04-01", "2026-06-01"), ("2026-05-01", "2026-06-01"))
+        assert result["months"] == {
+            "2026-04": {"count": 1, "distance_cm": 100000, "duration_sec": 600, "hr_sum": 150, "hr_count": 1,
+                        "elevation_gain": 1.5, "elevation_loss": 0, "steps": 10, "max_hr": 170},
+            "2026-05": {"count": 2, "distance_cm": 200000, "duration_sec": 1200, "hr_sum": 140, "hr_count": 1,
+                        "elevation_gain": 2.5, "elevation_loss": 1, "steps": 5, "max_hr": 160},
+        }
+        # The newest workout's user_name, even when that workout has none
+        assert result["user_name"] == ""
+        assert ids(result["workouts"]) == ["m5b", "m5a"] and "_id" not in result["workouts"][0]
+
+        months_only = await repo.workouts.month_totals("a", ("2026-04-01", "2026-05-01"))
+        assert list(months_only["months"]) == ["2026-04"] and months_only["user_name"] == "Old"
+        assert months_only["workouts"] is None
+        empty = await repo.workouts.month_totals("c", ("2026-04-01", "2026-05-01"), ("2026-04-01", "2026-05-01"))
+        assert empty == {"months": {}, "user_name": "", "workouts": []}
+    check(scenario)
+
+
+def test_users_status_checks_and_simulator_state(check):
+    async def scenario(repo):
+        await repo.users.insert({"user_id": "u1", "user_name": "A"})
+        with pytest.raises(DuplicateKeyError):
+            await repo.users.insert({"user_id": "u1", "user_name": "B"})
+        await repo.users.set_name("u1", "C")
+        assert await repo.users.get("u1") == {"user_id": "u1", "user_name": "C"}
+        assert await repo.users.get("u2") is None
+
+        for n in range(3):
+            await repo.status_checks.add({"id": str(n), "client_name": "probe"})
+        assert [c["id"] for c in await repo.status_checks.list(limit=2)] == ["0", "1"]
+
+        assert await repo.simulator_state.get() is None
+        await repo.simulator_state.save({"hr": 120, "zones": [1, 2]})
+        await repo.simulator_state.save({"hr": 130})
+        assert await repo.simulator_state.get() == {"hr": 130, "zones": [1, 2]}
+    check(scenario)
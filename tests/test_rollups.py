@@ -0,0 +1,57 @@
+from tests.helpers import wait_processed, workout_payload
+
+
+def rollup_totals(server, client, user_id):
+    rows = client.portal.call(server.db.user_rollups.find({"user_id": user_id}).to_list, None)
+    return {row["_id"]: {field: row[field] for field in server.ROLLUP_FIELDS} for row in rows}
+
+
+def rebuild(server, client, user_id=None):
+    return client.portal.call(server.rebuild_user_rollups, user_id)
+
+
+def test_incremental_rollups_match_a_rebuild(server, client, user_id):
+    ids = []
+    for local_time, distance_cm, avg_hr in [
+        ("2025-12-31T22:00:00", 300000, 150),
+        ("2026-01-05T07:00:00", 500000, 140),
+        ("2026-01-20T07:00:00", 800000, None),
+        ("2026-02-02T07:00:00", 1000000, 160),
+    ]:
+        payload = workout_payload(user_id, local_time=local_time, distance_cm=distance_cm, avg_hr=avg_hr,
+                                  steps=4000, elevation_gain=12)
+        ids.append(client.post("/api/workout", json=payload).json()["workout_id"])
+    for workout_id in ids:
+        wait_processed(server, client, workout_id)
+    client.delete(f"/api/workout/{ids[2]}")
+
+    incremental = rollup_totals(server, client, user_id)
+    rebuild(server, client, user_id)
+    rebuilt = rollup_totals(server, client, user_id)
+
+    assert incremental == rebuilt
+    assert rebuilt[f"{user_id}:2026-01"]["count"] == 1
+    assert rebuilt[f"{user_id}:2026"]["distance_cm"] == 1500000
+    assert rebuilt[f"{user_id}:2026"]["hr_count"] == 2
+    assert rebuilt[f"{user_id}:2025"]["count"] == 1
+
+
+def test_rebuild_removes_periods_without_workouts(server, client, user_id):
+    client.post("/api/workout", json=workout_payload(user_id, local_time="2026-04-01T10:00:00"))
+    stale = {"_id": f"{user_id}:2019-07", "user_id": user_id, "period": "2019-07", "kind": "month", "count": 3}
+    client.portal.call(server.db.user_rollups.insert_one, stale)
+
+    rebuild(server, client, user_id)
+
+    assert set(rollup_totals(server, client, user_id)) == {f"{user_id}:2026", f"{user_id}:2026-04"}
+
+
+def test_full_rebuild_keeps_every_user(server, client, user_id):
+    other = f"{user_id}-other"
+    client.post("/api/workout", json=workout_payload(user_id, local_time="2026-04-01T10:00:00"))
+    client.post("/api/workout", json=workout_payload(other, local_time="2026-05-01T10:00:00"))
+    before = {**rollup_totals(server, client, user_id), **rollup_totals(server, client, other)}
+
+    rebuild(server, client)
+
+    assert {**rollup_totals(server, client, user_id), **rollup_totals(server, client, other)} == before
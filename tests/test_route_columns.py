@@ -0,0 +1,97 @@
+import json
+import math
+
+import numpy as np
+import pytest
+
+from route_columns import RouteColumns, pack_route, parse_route_json, unpack_route
+
+
+def assert_columns_equal(columns, expected):
+    for field in ("lat", "lon", "timestamp", "hr", "alt"):
+        np.testing.assert_array_equal(getattr(columns, field), getattr(expected, field))
+
+
+def test_matches_json_loads():
+    points = [
+        {"lat": 32.0801, "lon": 34.7812, "timestamp": 1700000000, "hr": 120, "alt": 12.5},
+        {"lat": 32.0802, "lon": 34.7813, "timestamp": 1700000001, "hr": 121},
+        {"timestamp": 1700000002, "hr": None, "alt": -3},
+    ]
+    columns = parse_route_json(json.dumps(points))
+    assert_columns_equal(columns, RouteColumns.from_points(points))
+    assert len(columns) == 3
+    assert math.isnan(columns.hr[2])
+
+
+@pytest.mark.parametrize("text", [
+    '[{"lat" : 32.1, "lon" :34.2}]',
+    '[{"lat":32.1,"lon":34.2}]',
+    '[\n  {\n    "lat":\t32.1,\n    "lon":\n34.2\n  }\n]',
+])
+def test_whitespace_around_colons(text):
+    columns = parse_route_json(text)
+    assert columns.lat.tolist() == [32.1]
+    assert columns.lon.tolist() == [34.2]
+
+
+def test_nested_objects_and_unknown_keys_do_not_add_points():
+    text = '[{"lat": 1.5, "lon": 2.5, "meta": {"lat": 9, "src": "gps"}, "note_null": "null"}, {"lat": 3, "lon": 4}]'
+    columns = parse_route_json(text)
+    assert len(columns) == 2
+    assert columns.lat.tolist() == [1.5, 3.0]
+
+
+def test_empty_array():
+    assert len(parse_route_json("[]")) == 0
+    assert len(parse_route_json("  [ ]  ")) == 0
+
+
+@pytest.mark.parametrize("text", [
+    '[{"lat": 1,}]',
+    '[{"lat": -.5}]',
+    '[{"lat": 1}',
+    '{"lat": 1}',
+    '[1, 2]',
+    '[{"lat": 1}, [2]]',
+    '[{"lat": "32.1"}]',
+    '[{"lat": true}]',
+    '[{"hr": {"bpm": 120}}]',
+    '[{"alt": [1]}]',
+])
+def test_rejects_invalid_routes(text):
+    with pytest.raises(ValueError):
+        parse_route_json(text)
+
+
+def test_pack_round_trip():
+    n = 1000
+    rng = np.random.default_rng(7)
+    columns = RouteColumns(
+        lat=np.round(32.08 + np.cumsum(rng.uniform(-1e-4, 1e-4, n)), 6),
+        lon=np.round(34.78 + np.cumsum(rng.uniform(-1e-4, 1e-4, n)), 6),
+        timestamp=np.arange(1700000000, 1700000000 + n, dtype=np.float64),
+        hr=rng.integers(80, 180, n).astype(np.float64),
+        alt=np.round(20 + np.cumsum(rng.uniform(-1, 1, n)), 1),
+    )
+    columns.lat[[0, 10, 11, 999]] = np.nan
+    columns.lon[[0, 10, 11, 999]] = np.nan
+    columns.hr[::7] = np.nan
+
+    unpacked = unpack_route(pack_route(columns))
+
+    for field in ("timestamp", "hr"):
+        np.testing.assert_array_equal(getattr(unpacked, field), getattr(columns, field))
+    # Packing quantizes to microdegrees and decimetres
+    np.testing.assert_allclose(unpacked.lat, columns.lat, atol=5e-7, equal_nan=True)
+    np.testing.assert_allclose(unpacked.lon, columns.lon, atol=5e-7, equal_nan=True)
+    np.testing.assert_allclose(unpacked.alt, columns.alt, atol=0.05, equal_nan=True)
+
+
+def test_pack_round_trip_missing_and_empty_columns():
+    columns = RouteColumns.from_points([{"lat": 1.5, "lon": 2.5}, {"lat": 1.6, "lon": 2.6}])
+    packed = pack_route(columns)
+    assert "hr" not in packed and "alt" not in packed
+    unpacked = unpack_route(packed)
+    assert unpacked.to_points() == columns.to_points()
+    assert len(unpack_route(pack_route(RouteColumns.empty()))) == 0
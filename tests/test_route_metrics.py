@@ -0,0 +1,108 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from route_columns import RouteColumns, pack_route, unpack_route
+from route_metrics import compute_route_metrics, route_arrays, route_metrics_from_points
+
+
+def reference_metrics(route_data):
+    """The per-point loops submit_workout and fix-distance/fix-elevation ran before route_metrics"""
+    def haversine(lat1, lon1, lat2, lon2):
+        R = 6371000
+        phi1, phi2 = math.radians(lat1), math.radians(lat2)
+        dphi = math.radians(lat2 - lat1)
+        dlambda = math.radians(lon2 - lon1)
+        a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+        return 2 * R * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+    total_ascent = 0
+    total_descent = 0
+    altitudes = [p.get('alt') for p in route_data if p.get('alt') is not None]
+    if len(altitudes) > 1:
+        for i in range(1, len(altitudes)):
+            diff = altitudes[i] - altitudes[i - 1]
+            if diff > 0.5:
+                total_ascent += diff
+            elif diff < -0.5:
+                total_descent += abs(diff)
+
+    distance_cm = 0
+    for i in range(1, len(route_data)):
+        p1, p2 = route_data[i - 1], route_data[i]
+        if 'lat' in p1 and 'lon' in p1 and 'lat' in p2 and 'lon' in p2:
+            distance_cm += int(haversine(p1['lat'], p1['lon'], p2['lat'], p2['lon']) * 100)
+    return distance_cm, total_ascent, total_descent, altitudes
+
+
+def random_route(seed, n, gaps=False):
+    rng = random.Random(seed)
+    lat, lon, alt = 32.08, 34.78, 20.0
+    route = []
+    for i in range(n):
+        lat += rng.uniform(-0.0002, 0.0002)
+        lon += rng.uniform(-0.0002, 0.0002)
+        alt += rng.uniform(-2, 2)
+        point = {"lat": lat, "lon": lon, "timestamp": 1700000000 + i, "hr": rng.randint(90, 170), "alt": round(alt, 1)}
+        if gaps and rng.random() < 0.1:
+            del point["lat"], point["lon"]
+        if gaps and rng.random() < 0.1:
+            del point["alt"]
+        route.append(point)
+    return route
+
+
+@pytest.mark.parametrize("seed,n,gaps", [(1, 2, False), (2, 500, False), (3, 5000, False), (4, 500, True), (5, 3000, True)])
+def test_metrics_match_reference_loops(seed, n, gaps):
+    route = random_route(seed, n, gaps)
+    distance_cm, ascent, descent, altitudes = reference_metrics(route)
+
+    metrics = route_metrics_from_points(route)
+
+    assert metrics.distance_cm == distance_cm
+    assert metrics.total_ascent == pytest.approx(ascent, abs=1e-6)
+    assert metrics.total_descent == pytest.approx(descent, abs=1e-6)
+    assert metrics.altitudes.tolist() == altitudes
+    assert metrics.point_count == n
+
+
+def test_empty_and_single_point_routes():
+    for route in ([], [{"lat": 32.0, "lon": 34.0, "alt": 10}]):
+        metrics = route_metrics_from_points(route)
+        assert metrics.distance_cm == 0
+        assert metrics.total_ascent == 0
+        assert metrics.total_descent == 0
+
+
+def test_noise_threshold_is_exclusive():
+    metrics = compute_route_metrics([32.0] * 4, [34.0] * 4, [10.0, 10.5, 10.0, 11.0])
+    assert metrics.total_ascent == 1.0
+    assert metrics.total_descent == 0
+
+
+def test_segments_touching_a_point_without_gps_are_skipped():
+    route = [{"lat": 32.0, "lon": 34.0}, {"alt": 5}, {"lat": 32.01, "lon": 34.0}, {"lat": 32.02, "lon": 34.0}]
+    lat, lon, _ = route_arrays(route)
+    assert compute_route_metrics(lat, lon).distance_cm == reference_metrics(route)[0]
+
+
+def test_stored_route_tolerance():
+    """Metrics from a packed (quantized) route, as used when the submitted route is gone"""
+    rng = np.random.default_rng(0)
+    n = 3600
+    # Walking pace: about 1 m between fixes, the worst case for microdegree rounding
+    lat = 32 + np.cumsum(rng.normal(0, 3e-6, n))
+    lon = 34 + np.cumsum(1e-5 + rng.normal(0, 3e-6, n))
+    alt = np.round(20 + np.cumsum(rng.normal(0, 2, n)), 1)
+    columns = RouteColumns(lat, lon, np.arange(n, dtype=np.float64), np.full(n, np.nan), alt)
+    stored = unpack_route(pack_route(columns))
+
+    exact = compute_route_metrics(columns.lat, columns.lon, columns.alt)
+    quantized = compute_route_metrics(stored.lat, stored.lon, stored.alt)
+
+    assert quantized.distance_cm == pytest.approx(exact.distance_cm, rel=2e-3)
+    # Altitudes already on the decimetre grid come back unchanged
+    assert quantized.total_ascent == pytest.approx(exact.total_ascent)
+    assert quantized.total_descent == pytest.approx(exact.total_descent)
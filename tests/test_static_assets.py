@@ -0,0 +1,124 @@
+import hashlib
+import io
+import urllib.error
+
+import pytest
+
+import static_assets
+from static_assets import StaticAssets
+
+LIB = b"console.log('lib')"
+STYLE = b".map { background: url(images/tile.png) }"
+TILE = b"\x89PNG tile"
+
+
+@pytest.fixture
+def vendor(monkeypatch):
+    """Three vendor files, the last one without a pinned hash; returns the bytes each URL serves"""
+    served = {"https://cdn.test/lib.js": LIB, "https://cdn.test/lib.css": STYLE, "https://cdn.test/chart.js": b"chart"}
+    monkeypatch.setattr(static_assets, "VENDOR", {
+        "vendor/lib/lib.js": ("https://cdn.test/lib.js", hashlib.sha256(LIB).hexdigest()),
+        "vendor/lib/lib.css": ("https://cdn.test/lib.css", hashlib.sha256(STYLE).hexdigest()),
+        "vendor/chart/chart.js": ("https://cdn.test/chart.js", None),
+    })
+    requested = []
+
+    def urlopen(url, timeout):
+        requested.append(url)
+        if url not in served:
+            raise urllib.error.URLError("unreachable")
+        return io.BytesIO(served[url])
+
+    monkeypatch.setattr(static_assets.urllib.request, "urlopen", urlopen)
+    served["requested"] = requested
+    return served
+
+
+@pytest.fixture
+def assets(tmp_path):
+    return StaticAssets(tmp_path / "assets", tmp_path / "static", url_prefix="/static")
+
+
+def test_fetch_writes_pinned_files_only(assets, vendor):
+    assert assets.fetch_vendor() == ["vendor/lib/lib.js", "vendor/lib/lib.css"]
+    assert (assets.source_dir / "vendor/lib/lib.js").read_bytes() == LIB
+    assert not (assets.source_dir / "vendor/chart").exists()
+    assert "https://cdn.test/chart.js" not in vendor["requested"]
+
+
+def test_fetch_skips_files_already_verified(assets, vendor):
+    assets.fetch_vendor()
+    vendor["requested"].clear()
+    assert assets.fetch_vendor() == []
+    assert vendor["requested"] == []
+
+
+def test_fetch_replaces_a_file_with_the_wrong_content(assets, vendor):
+    target = assets.source_dir / "vendor/lib/lib.js"
+    target.parent.mkdir(parents=True)
+    target.write_bytes(b"tampered")
+    assert "vendor/lib/lib.js" in assets.fetch_vendor()
+    assert target.read_bytes() == LIB
+
+
+def test_hash_mismatch_raises_before_writing(assets, vendor):
+    vendor["https://cdn.test/lib.js"] = b"console.log('something else')"
+    with pytest.raises(ValueError, match="sha256"):
+        assets.fetch_vendor()
+    assert not (assets.source_dir / "vendor/lib/lib.js").exists()
+
+
+def test_failed_download_raises(assets, vendor):
+    del vendor["https://cdn.test/lib.css"]
+    with pytest.raises(urllib.error.URLError):
+        assets.fetch_vendor()
+
+
+def test_build_serves_fetched_files_and_falls_back_for_the_rest(assets, vendor):
+    (assets.source_dir / "css").mkdir(parents=True)
+    (assets.source_dir / "css/page.css").write_bytes(b"body { color: red }")
+    assets.fetch_vendor()
+    manifest = assets.build()
+
+    assert assets.url("vendor/lib/lib.js") == f"/static/{manifest['vendor/lib/lib.js']}"
+    assert assets.url("vendor/chart/chart.js") == "https://cdn.test/chart.js"
+    assert assets.stats()["vendor_missing"] == ["vendor/chart/chart.js"]
+    assert (assets.static_dir / manifest["css/page.css"]).read_bytes() == b"body { color: red }"
+    with pytest.raises(KeyError):
+        assets.url("css/missing.css")
+
+
+def test_stylesheet_urls_point_at_hashed_files(assets, vendor):
+    assets.fetch_vendor()
+    (assets.source_dir / "vendor/lib/images").mkdir()
+    (assets.source_dir / "vendor/lib/images/tile.png").write_bytes(TILE)
+    manifest = assets.build()
+
+    css = (assets.static_dir / manifest["vendor/lib/lib.css"]).read_text()
+    assert f'url("/static/{manifest["vendor/lib/images/tile.png"]}")' in css
+
+
+def test_pinned_vendor_files_are_hashes():
+    for path, (url, sha256) in static_assets.VENDOR.items():
+        assert url.startswith("https://")
+        assert sha256 is None or (len(sha256) == 64 and int(sha256, 16) >= 0)
+
+
+def test_check_vendor_reports_what_a_deploy_must_not_ship(assets, vendor):
+    assert assets.check_vendor() == [
+        "vendor/lib/lib.js: missing (commit it or run build_assets.py --fetch-vendor)",
+        "vendor/lib/lib.css: missing (commit it or run build_assets.py --fetch-vendor)",
+        "vendor/chart/chart.js: no pinned sha256 in VENDOR",
+    ]
+    assets.fetch_vendor()
+    (assets.source_dir / "vendor/lib/lib.js").write_bytes(b"tampered")
+    assert assets.check_vendor() == [
+        "vendor/lib/lib.js: does not match its pinned sha256",
+        "vendor/chart/chart.js: no pinned sha256 in VENDOR",
+    ]
+
+
+def test_committed_vendor_files_match_their_pins():
+    # Only files still waiting for a pin may be reported
+    unpinned = [f"{path}: no pinned sha256 in VENDOR" for path, (_, sha256) in static_assets.VENDOR.items() if sha256 is None]
+    assert StaticAssets().check_vendor() == unpinned
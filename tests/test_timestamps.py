@@ -0,0 +1,43 @@
+from datetime import datetime
+
+from tests.helpers import workout_payload
+
+
+def test_offset_time_near_midnight_lands_in_one_month(server, client, user_id):
+    # 01:30 on June 1st in UTC+3 is still May 31st in UTC
+    payload = workout_payload(user_id, local_time="2026-06-01T01:30:00+03:00")
+    workout_id = client.post("/api/workout", json=payload).json()["workout_id"]
+
+    doc = client.portal.call(server.repo.workouts.get, workout_id)
+    assert doc["timestamp"] == datetime(2026, 6, 1, 1, 30)
+    assert doc["local_date"] == "2026-06-01"
+    assert server.workout_time_str(doc)[:10] == doc["local_date"]
+
+    june = client.get(f"/api/user/{user_id}/monthly", params={"year": 2026, "month": 6}).json()
+    may = client.get(f"/api/user/{user_id}/monthly", params={"year": 2026, "month": 5}).json()
+    assert [w["id"] for w in june["workouts"]] == [workout_id]
+    assert june["workouts"][0]["timestamp"].startswith("2026-06-01")
+    assert may["total_workouts"] == 0
+
+    rollups = client.portal.call(server.db.user_rollups.find({"user_id": user_id}, {"_id": 1}).to_list, None)
+    assert {r["_id"] for r in rollups} == {f"{user_id}:2026", f"{user_id}:2026-06"}
+
+
+def test_naive_watch_time_is_stored_as_sent(server, client, user_id):
+    workout_id = client.post("/api/workout", json=workout_payload(user_id, local_time="2026-12-31T23:59:00")).json()["workout_id"]
+    doc = client.portal.call(server.repo.workouts.get, workout_id)
+    assert doc["timestamp"] == datetime(2026, 12, 31, 23, 59)
+    assert doc["local_date"] == "2026-12-31"
+
+
+def test_migration_uses_the_same_clock(server, client, admin_headers, user_id):
+    client.portal.call(server.repo.workouts.insert, {
+        "id": f"{user_id}-legacy", "user_id": user_id, "distance_cm": 100, "duration_sec": 60,
+        "timestamp": "2026-03-01T00:15:00+02:00",
+    })
+    response = client.post("/api/workout/migrate-timestamps", params={"user_id": user_id}, headers=admin_headers)
+    assert response.json()["workouts_migrated"] == 1
+
+    doc = client.portal.call(server.repo.workouts.get, f"{user_id}-legacy")
+    assert doc["timestamp"] == datetime(2026, 3, 1, 0, 15)
+    assert doc["local_date"] == "2026-03-01"
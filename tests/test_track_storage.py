@@ -0,0 +1,94 @@
+import json
+
+import pytest
+from gridfs.errors import NoFile
+
+from tests.helpers import wait_processed, workout_payload
+from tests.test_workout_pipeline import walking_route
+
+
+def post_workout(server, client, user_id, points=200, day=1):
+    payload = workout_payload(user_id, local_time=f"2026-05-{day:02d}T10:00:00",
+                              route_json=json.dumps(walking_route(points)))
+    return wait_processed(server, client, client.post("/api/workout", json=payload).json()["workout_id"])
+
+
+def stored_track(server, client, workout_id):
+    return client.portal.call(server.db.workout_tracks.find_one, {"_id": workout_id})
+
+
+def gridfs_file(server, client, workout_id):
+    async def read():
+        try:
+            return await (await server.track_bucket().open_download_stream(workout_id)).read()
+        except NoFile:
+            return None
+    return client.portal.call(read)
+
+
+def test_new_workouts_keep_their_track_out_of_the_summary(server, client, user_id):
+    doc = post_workout(server, client, user_id)
+
+    assert doc["track_store"] == "collection"
+    assert not any(field in doc for field in server.TRACK_FIELDS)
+    assert stored_track(server, client, doc["id"])["route_packed"]
+    assert gridfs_file(server, client, doc["id"]) is None
+    route = client.get(f"/api/workout/id/{doc['id']}").json()["route"]
+    assert len(route) == 200
+    assert route[0]["lat"] == pytest.approx(walking_route(200)[0]["lat"], abs=1e-6)
+
+
+def test_large_routes_overflow_to_gridfs(server, client, user_id, monkeypatch):
+    monkeypatch.setattr(server, "TRACK_GRIDFS_MIN_BYTES", 1)
+    doc = post_workout(server, client, user_id)
+
+    assert doc["track_store"] == "gridfs"
+    assert "route_packed" not in stored_track(server, client, doc["id"])
+    assert gridfs_file(server, client, doc["id"])
+    assert len(client.get(f"/api/workout/id/{doc['id']}").json()["route"]) == 200
+
+    client.portal.call(server.delete_tracks, [doc])
+    assert stored_track(server, client, doc["id"]) is None
+    assert gridfs_file(server, client, doc["id"]) is None
+
+
+def test_load_tracks_leaves_inline_routes_as_they_are(server, client, user_id):
+    stored = post_workout(server, client, user_id)
+    inline = {"id": "inline", "route": [{"lat": 32.0, "lon": 34.0}], "elevation_json": "[1, 2]"}
+    workouts = [dict(stored), dict(inline), None]
+
+    client.portal.call(server.load_tracks, workouts)
+
+    assert workouts[0]["route_packed"] == stored_track(server, client, stored["id"])["route_packed"]
+    assert workouts[1] == inline
+    assert workouts[2] is None
+
+
+def test_track_migration_round_trips(server, client, admin_headers, user_id, monkeypatch):
+    small = post_workout(server, client, user_id, day=1)
+    monkeypatch.setattr(server, "TRACK_GRIDFS_MIN_BYTES", 1)
+    large = post_workout(server, client, user_id, day=2)
+    monkeypatch.undo()
+    ids = [small["id"], large["id"]]
+    before = [client.get(f"/api/workout/id/{workout_id}").json() for workout_id in ids]
+
+    result = client.post("/api/workout/migrate-tracks", params={"user_id": user_id, "reverse": "true"},
+                         headers=admin_headers).json()
+
+    assert result["direction"] == "inline" and result["workouts_moved"] == 2
+    for workout_id in ids:
+        doc = client.portal.call(server.repo.workouts.get, workout_id)
+        assert "track_store" not in doc and doc["route_packed"]
+        assert stored_track(server, client, workout_id) is None
+        assert gridfs_file(server, client, workout_id) is None
+    assert [client.get(f"/api/workout/id/{workout_id}").json() for workout_id in ids] == before
+
+    result = client.post("/api/workout/migrate-tracks", params={"user_id": user_id}, headers=admin_headers).json()
+
+    assert result["direction"] == "workout_tracks" and result["workouts_moved"] == 2
+    for workout_id in ids:
+        doc = client.portal.call(server.repo.workouts.get, workout_id)
+        # Back under the default threshold, so neither route needs GridFS now
+        assert doc["track_store"] == "collection"
+        assert not any(field in doc for field in server.TRACK_FIELDS)
+    assert [client.get(f"/api/workout/id/{workout_id}").json() for workout_id in ids] == before
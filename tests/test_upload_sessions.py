@@ -0,0 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from tests.helpers import stored_workouts, workout_payload
+
+ROUTE_CHUNK = '[{"lat": 32.0, "lon": 34.0}, {"lat": 32.01, "lon": 34.0}]'
+
+
+def open_session(client, user_id, **fields):
+    response = client.post("/api/workout/upload", json=workout_payload(user_id, **fields))
+    assert response.status_code == 200
+    session_id = response.json()["session_id"]
+    assert client.put(f"/api/workout/upload/{session_id}/chunk/0", json={"route_json": ROUTE_CHUNK}).status_code == 200
+    return session_id
+
+
+def test_concurrent_commits_save_one_workout(server, client, user_id):
+    session_id = open_session(client, user_id)
+
+    with ThreadPoolExecutor(4) as pool:
+        responses = list(pool.map(lambda _: client.post(f"/api/workout/upload/{session_id}/commit", json={}), range(4)))
+
+    saved = {r.json()["workout_id"] for r in responses if r.status_code == 200}
+    assert len(saved) == 1
+    assert all(r.status_code in (200, 409) for r in responses)
+    assert len(stored_workouts(server, client, user_id, ("id",))) == 1
+    # A retry after the commit returns the same workout
+    retry = client.post(f"/api/workout/upload/{session_id}/commit", json={})
+    assert retry.json()["workout_id"] in saved
+
+
+def test_commit_in_progress_is_refused_until_stale(server, client, user_id):
+    session_id = open_session(client, user_id)
+    claimed_at = datetime.now(timezone.utc)
+    client.portal.call(server.db.upload_sessions.update_one, {"_id": session_id},
+                       {"$set": {"status": "committing", "claimed_at": claimed_at}})
+
+    assert client.post(f"/api/workout/upload/{session_id}/commit", json={}).status_code == 409
+    assert client.put(f"/api/workout/upload/{session_id}/chunk/1", json={"route_json": ROUTE_CHUNK}).status_code == 409
+
+    stale = claimed_at - timedelta(seconds=server.UPLOAD_COMMIT_CLAIM_SEC + 1)
+    client.portal.call(server.db.upload_sessions.update_one, {"_id": session_id}, {"$set": {"claimed_at": stale}})
+    response = client.post(f"/api/workout/upload/{session_id}/commit", json={})
+    assert response.status_code == 200
+    assert response.json()["status"] == "saved"
+
+
+def test_missing_chunks_release_the_claim(client, user_id):
+    session_id = open_session(client, user_id)
+
+    response = client.post(f"/api/workout/upload/{session_id}/commit", json={"total_chunks": 2})
+    assert response.status_code == 409
+    assert response.json()["missing_chunks"] == [1]
+    assert client.get(f"/api/workout/upload/{session_id}").json()["status"] == "open"
+
+    assert client.put(f"/api/workout/upload/{session_id}/chunk/1", json={"route_json": ROUTE_CHUNK}).status_code == 200
+    assert client.post(f"/api/workout/upload/{session_id}/commit", json={"total_chunks": 2}).status_code == 200
+
+
+def test_sessions_and_chunks_expire(server, client):
+    for collection in ("upload_sessions", "upload_chunks"):
+        indexes = client.portal.call(server.db[collection].index_information)
+        ttl = [index for index in indexes.values() if "expireAfterSeconds" in index]
+        assert ttl and ttl[0]["key"] == [("created_at", 1)]
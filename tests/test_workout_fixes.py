@@ -0,0 +1,79 @@
+import json
+
+from route_columns import RouteColumns, pack_route, unpack_route
+from route_metrics import compute_route_metrics
+from tests.helpers import stored_workouts, wait_processed, workout_payload
+from tests.test_workout_pipeline import walking_route
+
+FIXED_FIELDS = ("distance_cm", "total_ascent", "total_descent", "elevation_gain", "elevation_loss", "version")
+
+
+def seed_broken(server, client, user_id, count=5):
+    """Processed workouts whose distance and elevation were then lost, as the fixes find them"""
+    routes = [walking_route(100 + 50 * i) for i in range(count)]
+    for day, route in enumerate(routes, start=1):
+        payload = workout_payload(user_id, local_time=f"2026-05-{day:02d}T10:00:00", route_json=json.dumps(route))
+        wait_processed(server, client, client.post("/api/workout", json=payload).json()["workout_id"])
+    broken = {"distance_cm": 1, "total_ascent": None, "total_descent": None, "elevation_gain": None, "elevation_loss": None}
+    client.portal.call(server.repo.workouts.update_many,
+                       [(w["id"], {"$set": broken}) for w in stored_workouts(server, client, user_id, ("id",))])
+    return routes
+
+
+def stored(server, client, user_id):
+    """The user's workouts by day, fixed fields only"""
+    workouts = sorted(stored_workouts(server, client, user_id), key=lambda w: w["local_date"])
+    return [{field: w.get(field) for field in FIXED_FIELDS} for w in workouts]
+
+
+def expected(routes):
+    """Metrics of the routes as stored: packing rounds the coordinates"""
+    results = []
+    for route in routes:
+        columns = unpack_route(pack_route(RouteColumns.from_points(route)))
+        metrics = compute_route_metrics(columns.lat, columns.lon, columns.alt)
+        results.append((metrics.distance_cm, int(metrics.total_ascent), int(metrics.total_descent)))
+    return results
+
+
+def test_dry_run_writes_nothing(server, client, user_id):
+    routes = seed_broken(server, client, user_id)
+    before = stored(server, client, user_id)
+    tracks_before = client.portal.call(server.db.workout_tracks.count_documents, {})
+
+    for fix in ("fix-elevation", "fix-distance"):
+        result = client.post(f"/api/workout/{fix}/{user_id}?dry_run=true&batch_size=2").json()
+        assert result["status"] == "dry_run"
+        assert result["workouts_scanned"] == result["workouts_updated"] == len(routes)
+        assert len(result["batches"]) == 3
+        assert len(result["changes"]) == len(routes)
+
+    assert stored(server, client, user_id) == before
+    assert client.portal.call(server.db.workout_tracks.count_documents, {}) == tracks_before
+
+
+def test_dry_run_reports_the_changes_it_would_write(server, client, user_id):
+    routes = seed_broken(server, client, user_id, count=3)
+    preview = client.post(f"/api/workout/fix-distance/{user_id}?dry_run=true").json()["changes"]
+
+    result = client.post(f"/api/workout/fix-distance/{user_id}").json()
+
+    assert result["status"] == "completed" and "changes" not in result
+    assert sorted(change["distance_cm"] for change in preview) == sorted(d for d, _, _ in expected(routes))
+    assert client.post(f"/api/workout/fix-distance/{user_id}").json()["workouts_updated"] == 0
+
+
+def test_batched_fixes_match_per_document_fixes(server, client, user_id):
+    per_document, batched = f"{user_id}-single", f"{user_id}-batched"
+    results = {}
+    for user_id, batch_size in ((per_document, 1), (batched, 1000)):
+        routes = seed_broken(server, client, user_id)
+        for fix in ("fix-elevation", "fix-distance"):
+            result = client.post(f"/api/workout/{fix}/{user_id}?batch_size={batch_size}").json()
+            assert result["status"] == "completed"
+            assert result["workouts_updated"] == len(routes)
+            assert len(result["batches"]) == (len(routes) if batch_size == 1 else 1)
+        results[user_id] = stored(server, client, user_id)
+
+    assert results[per_document] == results[batched]
+    assert [(w["distance_cm"], w["total_ascent"], w["total_descent"]) for w in results[batched]] == expected(routes)
@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+import numpy as np
+
+from route_columns import RouteColumns
+from route_metrics import compute_route_metrics
+from workout_pipeline import WorkoutPipeline
+from tests.helpers import wait_processed, workout_payload
+
+
+def walking_route(n=300):
+    rng = np.random.default_rng(3)
+    lat = 32 + np.cumsum(rng.normal(0, 3e-6, n))
+    lon = 34 + np.cumsum(1e-5 + rng.normal(0, 3e-6, n))
+    alt = 20 + np.cumsum(rng.normal(0, 0.4, n))
+    return [{"lat": float(a), "lon": float(b), "timestamp": 1700000000 + i, "alt": float(c)}
+            for i, (a, b, c) in enumerate(zip(lat, lon, alt))]
+
+
+def test_metrics_come_from_the_submitted_route(server, client, user_id):
+    route = walking_route()
+    # A distance under 10% of the route's is replaced by the route distance
+    payload = workout_payload(user_id, distance_cm=1, route_json=json.dumps(route))
+    workout_id = client.post("/api/workout", json=payload).json()["workout_id"]
+
+    doc = wait_processed(server, client, workout_id)
+
+    columns = RouteColumns.from_points(route)
+    expected = compute_route_metrics(columns.lat, columns.lon, columns.alt)
+    assert doc["processing_status"] == server.PROCESSING_DONE
+    assert doc["distance_cm"] == expected.distance_cm
+    assert doc["total_ascent"] == int(expected.total_ascent)
+    assert doc["total_descent"] == int(expected.total_descent)
+
+
+def test_failed_processing_is_marked_and_retried(server, client, admin_headers, user_id, monkeypatch):
+    async def broken(columns):
+        raise RuntimeError("summary failed")
+
+    monkeypatch.setattr(server, "summarize_route_columns", broken)
+    payload = workout_payload(user_id, route_json=json.dumps(walking_route(20)))
+    workout_id = client.post("/api/workout", json=payload).json()["workout_id"]
+
+    doc = wait_processed(server, client, workout_id)
+    assert doc["processing_status"] == server.PROCESSING_FAILED
+    assert "summary failed" in doc["processing_error"]
+    assert client.get("/api/admin/pipeline", headers=admin_headers).json()["failed_workouts"] >= 1
+
+    monkeypatch.undo()
+    assert client.post("/api/admin/pipeline/retry-failed", headers=admin_headers).json()["workouts"] >= 1
+    doc = wait_processed(server, client, workout_id)
+    assert doc["processing_status"] == server.PROCESSING_DONE
+    assert "processing_error" not in doc
+
+
+def test_full_queue_turns_submits_away():
+    async def scenario():
+        release = asyncio.Event()
+        done = []
+
+        async def process(workout_id, route):
+            await release.wait()
+            done.append(workout_id)
+
+        pipeline = WorkoutPipeline(process, workers=1, max_queue=1)
+        pipeline.start()
+        assert pipeline.submit("a")
+        await asyncio.sleep(0)  # the worker takes "a"
+        assert pipeline.submit("b")
+        assert pipeline.submit("b")  # already held: not queued twice
+        assert not pipeline.submit("c")
+        assert pipeline.overflowed and pipeline.stats()["turned_away"] == 1
+
+        release.set()
+        await pipeline.drain()
+        return done
+
+    assert asyncio.run(scenario()) == ["a", "b"]
+
+
+def test_full_queue_leaves_the_workout_pending_for_the_sweep(server, client, user_id, monkeypatch):
+    monkeypatch.setattr(server.workout_pipeline, "submit", lambda workout_id, route=None: False)
+    workout_id = client.post("/api/workout", json=workout_payload(user_id)).json()["workout_id"]
+    doc = client.portal.call(server.repo.workouts.get, workout_id)
+    assert doc["processing_status"] == server.PROCESSING_PENDING
+
+    monkeypatch.undo()
+    assert client.portal.call(server.requeue_pending_workouts) >= 1
+    assert wait_processed(server, client, workout_id)["processing_status"] == server.PROCESSING_DONE